@@ -0,0 +1,375 @@
+"""
+Motor de agenda compartido para validar solapamientos de citas.
+
+Mantiene, por dentista y día, una lista ordenada de intervalos [inicio, fin)
+construida con una sola consulta. Las vistas de creación, edición y
+reagendamiento lo usan en lugar de recorrer las citas del día una por una.
+
+La agenda de un dentista incluye también las citas de su sala asignada: una
+sala (sillón) solo puede atender una cita a la vez, aunque la comparta con
+otros dentistas.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from citas.estadisticas_service import registrar_cambios_citas, valores_cita
+from citas.models import Cita
+
+# Duración usada cuando la cita no tiene servicio o el servicio no define duración
+DURACION_POR_DEFECTO = 30
+
+# Estados en los que una cita ocupa el horario del dentista
+ESTADOS_OCUPAN_AGENDA = [
+    'disponible',
+    'reservada',
+    'confirmada',
+    'en_espera',
+    'listo_para_atender',
+    'en_progreso',
+]
+
+
+def duracion_servicio(tipo_servicio):
+    """Retorna la duración en minutos de un servicio (o la duración por defecto)"""
+    if tipo_servicio and tipo_servicio.duracion_estimada:
+        return tipo_servicio.duracion_estimada
+    return DURACION_POR_DEFECTO
+
+
+def limites_dia(fecha):
+    """
+    Retorna el inicio (inclusive) y fin (exclusivo) de un día en la zona horaria local.
+
+    Args:
+        fecha: date del día
+
+    Returns:
+        tuple: (inicio_dia, fin_dia) como datetimes timezone-aware
+    """
+    inicio_dia = timezone.make_aware(datetime.combine(fecha, dt_time.min))
+    return inicio_dia, inicio_dia + timedelta(days=1)
+
+
+class IntervaloAgenda:
+    """Intervalo ocupado [inicio, fin) asociado a una cita existente"""
+    __slots__ = ('inicio', 'fin', 'cita')
+
+    def __init__(self, inicio, fin, cita=None):
+        self.inicio = inicio
+        self.fin = fin
+        self.cita = cita
+
+    def __lt__(self, otro):
+        return self.inicio < otro.inicio
+
+
+class AgendaDentista:
+    """
+    Índice de intervalos ordenado por hora de inicio para un dentista en un día.
+
+    La búsqueda de conflictos es O(log n): solo pueden solapar [inicio, fin) los
+    intervalos cuyo inicio está entre (inicio - duración máxima) y fin, y ese
+    rango se localiza con búsqueda binaria sobre la lista ordenada.
+    """
+
+    def __init__(self, intervalos=()):
+        self._intervalos = sorted(intervalos)
+        self._inicios = [i.inicio for i in self._intervalos]
+        self._duracion_maxima = max(
+            (i.fin - i.inicio for i in self._intervalos),
+            default=timedelta(0)
+        )
+
+    def __len__(self):
+        return len(self._intervalos)
+
+    def __iter__(self):
+        return iter(self._intervalos)
+
+    def buscar_conflicto(self, inicio, fin):
+        """
+        Busca un intervalo ocupado que se solape con [inicio, fin).
+
+        Returns:
+            IntervaloAgenda en conflicto o None si el rango está libre
+        """
+        desde = bisect_right(self._inicios, inicio - self._duracion_maxima)
+        hasta = bisect_left(self._inicios, fin)
+        for intervalo in self._intervalos[desde:hasta]:
+            if intervalo.fin > inicio:
+                return intervalo
+        return None
+
+    def esta_libre(self, inicio, fin):
+        """Indica si el rango [inicio, fin) no se solapa con ninguna cita"""
+        return self.buscar_conflicto(inicio, fin) is None
+
+    def agregar(self, inicio, fin, cita=None):
+        """
+        Registra un nuevo intervalo ocupado manteniendo el orden.
+        Útil para validar varias citas nuevas contra la misma agenda.
+        """
+        intervalo = IntervaloAgenda(inicio, fin, cita)
+        posicion = bisect_right(self._inicios, inicio)
+        self._inicios.insert(posicion, inicio)
+        self._intervalos.insert(posicion, intervalo)
+        if fin - inicio > self._duracion_maxima:
+            self._duracion_maxima = fin - inicio
+        return intervalo
+
+
+def sala_de_dentista(dentista):
+    """Retorna el ID de la sala asignada al dentista (o None)"""
+    return getattr(dentista, 'sala_asignada_id', None) if dentista else None
+
+
+def _intervalo_de_cita(cita):
+    return IntervaloAgenda(
+        cita.fecha_hora,
+        cita.fecha_hora + timedelta(minutes=duracion_servicio(cita.tipo_servicio)),
+        cita
+    )
+
+
+def obtener_agenda_dentista(dentista, fecha, excluir_cita_id=None, sala_id=None):
+    """
+    Construye la agenda de un dentista para un día con una sola consulta.
+
+    Args:
+        dentista: Perfil del dentista
+        fecha: date del día a cargar
+        excluir_cita_id: ID de una cita a ignorar (la que se está editando/reagendando)
+        sala_id: ID de la sala cuyas citas también ocupan la agenda (opcional)
+
+    Returns:
+        AgendaDentista con los intervalos ocupados del día
+    """
+    inicio_dia, fin_dia = limites_dia(fecha)
+    recursos = Q(dentista=dentista)
+    if sala_id:
+        recursos |= Q(sala_id=sala_id)
+    citas = Cita.objects.filter(
+        recursos,
+        fecha_hora__gte=inicio_dia,
+        fecha_hora__lt=fin_dia,
+        estado__in=ESTADOS_OCUPAN_AGENDA,
+    ).select_related('tipo_servicio', 'cliente')
+    if excluir_cita_id:
+        citas = citas.exclude(id=excluir_cita_id)
+
+    return AgendaDentista(_intervalo_de_cita(cita) for cita in citas)
+
+
+def buscar_solapamiento(dentista, fecha_hora, duracion_minutos, excluir_cita_id=None, sala_id=None):
+    """
+    Verifica si una cita nueva [fecha_hora, fecha_hora + duración) choca con la agenda
+    del dentista o con otra cita de la misma sala.
+
+    Args:
+        dentista: Perfil del dentista
+        fecha_hora: Inicio de la cita (timezone-aware)
+        duracion_minutos: Duración de la cita en minutos
+        excluir_cita_id: ID de la cita a ignorar (opcional)
+        sala_id: Sala de la cita; por defecto la sala asignada al dentista
+
+    Returns:
+        IntervaloAgenda en conflicto (con la cita existente en .cita) o None
+    """
+    if not dentista:
+        return None
+    if sala_id is None:
+        sala_id = sala_de_dentista(dentista)
+    fecha_local = timezone.localtime(fecha_hora).date()
+    agenda = obtener_agenda_dentista(dentista, fecha_local, excluir_cita_id=excluir_cita_id, sala_id=sala_id)
+    return agenda.buscar_conflicto(fecha_hora, fecha_hora + timedelta(minutes=duracion_minutos))
+
+
+def reasignar_citas(citas, dentista):
+    """
+    Cambia el dentista (y su sala) de varias citas validando cada una contra la agenda.
+
+    Las citas que ocupan agenda se validan con buscar_solapamiento contra la agenda
+    del nuevo dentista y de su sala. Las que chocan, o que violan la unicidad por
+    dentista/sala y fecha_hora, se dejan como estaban y se retornan como conflictos.
+
+    Args:
+        citas: QuerySet de Cita
+        dentista: Perfil del nuevo dentista, o None para quitar el dentista
+
+    Returns:
+        tuple: (cantidad de citas reasignadas, lista de citas en conflicto)
+    """
+    dentista_id = dentista.id if dentista else None
+    sala_id = sala_de_dentista(dentista)
+    reasignadas = 0
+    conflictos = []
+    for cita in citas.select_related('tipo_servicio').order_by('fecha_hora'):
+        if cita.dentista_id == dentista_id and cita.sala_id == sala_id:
+            continue
+        if dentista and cita.estado in ESTADOS_OCUPAN_AGENDA and buscar_solapamiento(
+            dentista,
+            cita.fecha_hora,
+            duracion_servicio(cita.tipo_servicio),
+            excluir_cita_id=cita.id,
+            sala_id=sala_id
+        ):
+            conflictos.append(cita)
+            continue
+
+        anteriores = (cita.dentista_id, cita.sala_id)
+        cita.dentista = dentista
+        cita.sala_id = sala_id
+        try:
+            # Punto de guardado por cita: un conflicto no revierte las demás
+            with transaction.atomic():
+                cita.save(update_fields=['dentista', 'sala'])
+        except IntegrityError:
+            cita.dentista_id, cita.sala_id = anteriores
+            conflictos.append(cita)
+            continue
+        reasignadas += 1
+    return reasignadas, conflictos
+
+
+def obtener_agendas_rango(dentistas, fecha_desde, fecha_hasta):
+    """
+    Carga las agendas de varios dentistas y de sus salas para un rango de días
+    con una sola consulta.
+
+    Args:
+        dentistas: Iterable de Perfil
+        fecha_desde: date inicial (inclusive)
+        fecha_hasta: date final (inclusive)
+
+    Returns:
+        tuple: (agendas_dentistas, agendas_salas), dos defaultdict
+        {(dentista_id | sala_id, fecha): AgendaDentista}; los días sin citas
+        entregan una agenda vacía al accederlos
+    """
+    dentistas = list(dentistas)
+    sala_ids = {sala_de_dentista(d) for d in dentistas} - {None}
+    inicio_rango, _ = limites_dia(fecha_desde)
+    _, fin_rango = limites_dia(fecha_hasta)
+    citas = Cita.objects.filter(
+        Q(dentista__in=dentistas) | Q(sala_id__in=sala_ids),
+        fecha_hora__gte=inicio_rango,
+        fecha_hora__lt=fin_rango,
+        estado__in=ESTADOS_OCUPAN_AGENDA,
+    ).select_related('tipo_servicio')
+
+    dentista_ids = {d.id for d in dentistas}
+    por_dentista = defaultdict(list)
+    por_sala = defaultdict(list)
+    for cita in citas:
+        fecha = timezone.localtime(cita.fecha_hora).date()
+        intervalo = _intervalo_de_cita(cita)
+        if cita.dentista_id in dentista_ids:
+            por_dentista[(cita.dentista_id, fecha)].append(intervalo)
+        if cita.sala_id in sala_ids:
+            por_sala[(cita.sala_id, fecha)].append(intervalo)
+
+    agendas_dentistas = defaultdict(AgendaDentista)
+    for clave, lista in por_dentista.items():
+        agendas_dentistas[clave] = AgendaDentista(lista)
+    agendas_salas = defaultdict(AgendaDentista)
+    for clave, lista in por_sala.items():
+        agendas_salas[clave] = AgendaDentista(lista)
+    return agendas_dentistas, agendas_salas
+
+
+def generar_horas_disponibles(dentistas, fecha_desde, fecha_hasta, tipo_servicio=None,
+                              duracion_minutos=None, creada_por=None, dry_run=False,
+                              tamano_lote=500):
+    """
+    Genera citas 'disponible' a partir de los bloques de HorarioDentista de cada dentista.
+
+    Recorre cada día del rango, divide los bloques activos del día en horas del tamaño
+    de la duración del servicio y omite las que ya pasaron o chocan con citas existentes
+    del dentista o de su sala.
+    Las citas se insertan con bulk_create por lotes dentro de una sola transacción.
+
+    Args:
+        dentistas: Iterable de Perfil (dentistas)
+        fecha_desde: date inicial (inclusive)
+        fecha_hasta: date final (inclusive)
+        tipo_servicio: TipoServicio para las horas generadas (opcional)
+        duracion_minutos: Duración de cada hora; por defecto la del servicio
+        creada_por: Perfil que genera las horas (opcional)
+        dry_run: Si True, solo calcula el reporte sin insertar nada
+        tamano_lote: Cantidad de filas por cada bulk_create
+
+    Returns:
+        dict con el reporte: {'creadas', 'omitidas_conflicto', 'omitidas_pasado',
+        'por_dentista': {nombre: cantidad}, 'horas': [datetime, ...]}
+    """
+    from citas.models import HorarioDentista
+
+    dentistas = list(dentistas)
+    if duracion_minutos is None:
+        duracion_minutos = duracion_servicio(tipo_servicio)
+    duracion = timedelta(minutes=duracion_minutos)
+
+    horarios_por_dentista = defaultdict(lambda: defaultdict(list))
+    for horario in HorarioDentista.objects.filter(dentista__in=dentistas, activo=True):
+        horarios_por_dentista[horario.dentista_id][horario.dia_semana].append(horario)
+
+    agendas, agendas_salas = obtener_agendas_rango(dentistas, fecha_desde, fecha_hasta)
+    ahora = timezone.now()
+
+    reporte = {
+        'creadas': 0,
+        'omitidas_conflicto': 0,
+        'omitidas_pasado': 0,
+        'por_dentista': {},
+        'horas': [],
+    }
+    nuevas = []
+
+    for dentista in dentistas:
+        creadas_dentista = 0
+        sala_id = sala_de_dentista(dentista)
+        fecha = fecha_desde
+        while fecha <= fecha_hasta:
+            agenda = agendas[(dentista.id, fecha)]
+            agenda_sala = agendas_salas[(sala_id, fecha)] if sala_id else None
+            for horario in horarios_por_dentista[dentista.id][fecha.weekday()]:
+                inicio = timezone.make_aware(datetime.combine(fecha, horario.hora_inicio))
+                fin_bloque = timezone.make_aware(datetime.combine(fecha, horario.hora_fin))
+                while inicio + duracion <= fin_bloque:
+                    fin = inicio + duracion
+                    if inicio < ahora:
+                        reporte['omitidas_pasado'] += 1
+                    elif not agenda.esta_libre(inicio, fin) or (agenda_sala is not None and not agenda_sala.esta_libre(inicio, fin)):
+                        reporte['omitidas_conflicto'] += 1
+                    else:
+                        agenda.agregar(inicio, fin)
+                        if agenda_sala is not None:
+                            agenda_sala.agregar(inicio, fin)
+                        nuevas.append(Cita(
+                            fecha_hora=inicio,
+                            estado='disponible',
+                            dentista=dentista,
+                            sala_id=sala_id,
+                            tipo_servicio=tipo_servicio,
+                            tipo_consulta=tipo_servicio.nombre if tipo_servicio else None,
+                            precio_cobrado=tipo_servicio.precio_base if tipo_servicio else None,
+                            creada_por=creada_por,
+                        ))
+                        reporte['horas'].append(inicio)
+                        creadas_dentista += 1
+                    inicio = fin
+            fecha += timedelta(days=1)
+        reporte['por_dentista'][dentista.nombre_completo] = creadas_dentista
+
+    reporte['creadas'] = len(nuevas)
+    if not dry_run and nuevas:
+        with transaction.atomic():
+            Cita.objects.bulk_create(nuevas, batch_size=tamano_lote)
+            # bulk_create no dispara post_save: sumar las horas generadas a las estadísticas
+            registrar_cambios_citas((None, valores_cita(cita)) for cita in nuevas)
+    return reporte
@@ -0,0 +1,254 @@
+"""
+Almacenamiento de media direccionado por contenido, con deduplicación.
+
+Una misma radiografía o PDF suele guardarse varias veces (reenviada como adjunto
+de correo, regenerada como documento del paciente, vuelta a subir), y cada copia
+ocupaba espacio en disco y en los respaldos de MEDIA_ROOT.
+
+AlmacenamientoDeduplicado guarda el contenido una sola vez en
+MEDIA_ROOT/.contenido/<sha256[:2]>/<sha256> y deja cada archivo con su nombre de
+siempre (radiografias/2026/01/15/x.png, consentimientos/..., etc.) como un enlace
+duro a ese contenido. Así:
+
+- Los FileField siguen guardando el mismo nombre, por lo que las reglas de acceso
+  de media_service, X-Accel-Redirect/X-Sendfile y las carpetas de upload_to no
+  cambian.
+- El contador de enlaces del sistema de archivos es el conteo de referencias:
+  borrar un archivo (storage.delete, os.remove o FieldFile.delete) solo quita un
+  enlace, y el contenido queda sin referencias cuando su contador vuelve a 1.
+- El comando deduplicar_media elimina el contenido sin referencias y puede
+  convertir en enlaces los archivos guardados antes de activar este almacenamiento.
+
+Como los archivos con el mismo contenido comparten el inodo, nunca se deben
+modificar en el lugar: el sistema siempre guarda versiones nuevas con otro nombre
+(anotaciones, teselas, documentos). Los respaldos deben preservar enlaces duros
+(rsync -H, tar) para aprovechar el ahorro.
+
+Si el sistema de archivos no admite enlaces duros, se guarda una copia normal.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+
+# Carpeta del contenido dentro de MEDIA_ROOT (media_service la niega por no ser de ningún modelo)
+CARPETA_CONTENIDO = '.contenido'
+
+# Bloque de lectura al calcular el hash
+BLOQUE_LECTURA = 256 * 1024
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def hash_archivo(ruta):
+    """SHA-256 de un archivo en disco"""
+    hasher = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(BLOQUE_LECTURA), b''):
+            hasher.update(bloque)
+    return hasher.hexdigest()
+
+
+class AlmacenamientoDeduplicado(FileSystemStorage):
+    """FileSystemStorage que guarda cada contenido una sola vez (ver docstring del módulo)"""
+
+    def ruta_contenido(self, sha256):
+        """Ruta absoluta del contenido con ese SHA-256"""
+        return os.path.join(self.location, CARPETA_CONTENIDO, sha256[:2], sha256)
+
+    def _carpeta_temporal(self):
+        carpeta = os.path.join(self.location, CARPETA_CONTENIDO, 'tmp')
+        os.makedirs(carpeta, exist_ok=True)
+        return carpeta
+
+    def _publicar_contenido(self, ruta_temporal, sha256, mover):
+        """
+        Deja el archivo temporal como contenido con ese hash, salvo que ya exista.
+
+        Returns:
+            Ruta del contenido
+        """
+        destino = self.ruta_contenido(sha256)
+        if os.path.exists(destino):
+            if not mover:
+                os.remove(ruta_temporal)
+            if os.stat(destino).st_nlink == 1:
+                # Contenido sin referencias que vuelve a usarse: renovar la gracia de recolectar_contenido
+                os.utime(destino)
+            return destino
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if mover:
+            file_move_safe(ruta_temporal, destino, allow_overwrite=True)
+        else:
+            # Si otro proceso publicó el mismo contenido en paralelo, el reemplazo deja bytes idénticos
+            os.replace(ruta_temporal, destino)
+        if self.file_permissions_mode is not None:
+            os.chmod(destino, self.file_permissions_mode)
+        return destino
+
+    def guardar_contenido(self, content):
+        """
+        Guarda el contenido en la carpeta de contenido si no estaba.
+
+        Los archivos subidos a disco (temporary_file_path) se mueven; si traen su
+        SHA-256 ya calculado (atributo sha256, las subidas fragmentadas verificadas)
+        no se vuelven a leer. El resto se copia por bloques a un temporal mientras
+        se calcula el hash.
+
+        Returns:
+            (sha256, ruta del contenido)
+        """
+        if hasattr(content, 'temporary_file_path'):
+            ruta = content.temporary_file_path()
+            sha256 = getattr(content, 'sha256', '')
+            if not SHA256_RE.match(sha256 or ''):
+                sha256 = hash_archivo(ruta)
+            return sha256, self._publicar_contenido(ruta, sha256, mover=True)
+
+        hasher = hashlib.sha256()
+        ruta = os.path.join(self._carpeta_temporal(), uuid.uuid4().hex)
+        try:
+            with open(ruta, 'wb') as temporal:
+                for bloque in content.chunks():
+                    hasher.update(bloque)
+                    temporal.write(bloque)
+            sha256 = hasher.hexdigest()
+            return sha256, self._publicar_contenido(ruta, sha256, mover=False)
+        except BaseException:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            raise
+
+    def _save(self, name, content):
+        sha256, contenido = self.guardar_contenido(content)
+
+        while True:
+            full_path = self.path(name)
+            directorio = os.path.dirname(full_path)
+            try:
+                if self.directory_permissions_mode is not None:
+                    old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+                    try:
+                        os.makedirs(directorio, self.directory_permissions_mode, exist_ok=True)
+                    finally:
+                        os.umask(old_umask)
+                else:
+                    os.makedirs(directorio, exist_ok=True)
+                os.link(contenido, full_path)
+            except FileExistsError:
+                # Otro archivo tomó el nombre entre get_available_name y el enlace
+                name = self.get_available_name(name)
+                continue
+            except OSError as e:
+                # Sistema de archivos sin enlaces duros: guardar una copia normal
+                logger.warning(f"No se pudo enlazar {name} al contenido {sha256[:12]}: {e}; se guarda una copia")
+                with open(contenido, 'rb') as archivo:
+                    return super()._save(name, File(archivo, name))
+            break
+
+        return str(name).replace('\\', '/')
+
+    def referencias(self, sha256):
+        """Cantidad de archivos de media que apuntan al contenido (0 si no existe)"""
+        try:
+            return os.stat(self.ruta_contenido(sha256)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+
+# ========== MANTENCIÓN ==========
+
+def recolectar_contenido(almacenamiento, gracia_segundos=3600, simular=False):
+    """
+    Elimina el contenido que ya no tiene archivos que lo referencien.
+
+    Un contenido recién guardado queda sin enlaces por un instante antes de que
+    _save cree el archivo, por eso solo se eliminan los que llevan más de
+    gracia_segundos sin referencias ni cambios. También borra temporales abandonados.
+
+    Args:
+        almacenamiento: AlmacenamientoDeduplicado
+        gracia_segundos: Antigüedad mínima para eliminar
+        simular: Solo contar, sin eliminar
+
+    Returns:
+        (cantidad eliminada, bytes liberados)
+    """
+    raiz = os.path.join(almacenamiento.location, CARPETA_CONTENIDO)
+    limite = time.time() - gracia_segundos
+    eliminados = 0
+    liberados = 0
+    for directorio, _, archivos in os.walk(raiz):
+        temporales = os.path.basename(directorio) == 'tmp'
+        for nombre in archivos:
+            ruta = os.path.join(directorio, nombre)
+            try:
+                estado = os.stat(ruta)
+                # ctime cambia al quitar o agregar enlaces: es el momento en que quedó sin referencias
+                if (temporales or estado.st_nlink == 1) and max(estado.st_mtime, estado.st_ctime) < limite:
+                    if not simular:
+                        os.remove(ruta)
+                    eliminados += 1
+                    liberados += estado.st_size
+            except OSError as e:
+                logger.warning(f"No se pudo revisar el contenido {ruta}: {e}")
+    return eliminados, liberados
+
+
+def deduplicar_existentes(almacenamiento, excluir=(), simular=False):
+    """
+    Convierte en enlaces al contenido los archivos guardados antes de activar la deduplicación.
+
+    Cada archivo se reemplaza de forma atómica (enlace temporal + os.replace), así
+    que los archivos se pueden seguir sirviendo mientras corre.
+
+    Args:
+        almacenamiento: AlmacenamientoDeduplicado
+        excluir: Rutas absolutas de carpetas que no se tocan (por ejemplo SUBIDAS_DIRECTORIO)
+        simular: Solo contar, sin modificar
+
+    Returns:
+        (archivos revisados, archivos duplicados, bytes ahorrados)
+    """
+    raiz = os.path.abspath(almacenamiento.location)
+    excluir = {os.path.abspath(os.path.join(raiz, CARPETA_CONTENIDO))} | {os.path.abspath(str(c)) for c in excluir}
+    revisados = 0
+    duplicados = 0
+    ahorrados = 0
+    vistos = set()
+    for directorio, carpetas, archivos in os.walk(raiz):
+        carpetas[:] = [c for c in carpetas if os.path.join(directorio, c) not in excluir]
+        for nombre in archivos:
+            ruta = os.path.join(directorio, nombre)
+            try:
+                estado = os.lstat(ruta)
+                if not os.path.isfile(ruta) or os.path.islink(ruta) or estado.st_nlink > 1:
+                    # Enlaces simbólicos o archivos que ya son enlaces al contenido
+                    continue
+                revisados += 1
+                sha256 = hash_archivo(ruta)
+                contenido = almacenamiento.ruta_contenido(sha256)
+                if sha256 not in vistos and not os.path.exists(contenido):
+                    # Primera copia: pasa a ser el contenido
+                    vistos.add(sha256)
+                    if not simular:
+                        os.makedirs(os.path.dirname(contenido), exist_ok=True)
+                        os.link(ruta, contenido)
+                    continue
+                duplicados += 1
+                ahorrados += estado.st_size
+                if not simular:
+                    temporal = f'{ruta}.{uuid.uuid4().hex}.enlace'
+                    os.link(contenido, temporal)
+                    os.replace(temporal, ruta)
+            except OSError as e:
+                logger.warning(f"No se pudo deduplicar {ruta}: {e}")
+    return revisados, duplicados, ahorrados
@@ -0,0 +1,328 @@
+"""
+Servicio de anotaciones vectoriales de las radiografías.
+
+Antes el visualizador enviaba el lienzo completo como PNG en base64 y cada
+guardado reescribía imagen_anotada (varios MB de subida y un archivo nuevo por
+cada trazo). Ahora las anotaciones se guardan como figuras en
+Radiografia.anotaciones:
+
+    {"id": "k3f9a1", "tipo": "trazo", "color": "#ff0000", "grosor": 0.0015,
+     "puntos": [[0.12, 0.40], [0.13, 0.41], ...]}
+
+- Los puntos son relativos a la imagen (0 a 1), así sirven igual sobre la
+  vista previa, el original o una copia reducida.
+- El grosor es relativo al lado mayor de la imagen.
+- Tipos: 'trazo' (dibujo libre), 'flecha' y 'medicion' (dos puntos) y 'texto'
+  (un punto y el texto).
+
+El visualizador envía solo los cambios (figuras agregadas, ids eliminados o
+limpiar todo) junto con la versión sobre la que trabajó. Si otra persona guardó
+antes, la versión no coincide y se devuelve el estado actual para recargarlo.
+
+imagen_anotada ya no se escribe al guardar: obtener_imagen_anotada() la genera
+con Pillow la primera vez que se necesita (descarga, PDF, correo) y la reutiliza
+mientras imagen_anotada_version sea la versión vigente de las anotaciones.
+
+Uso:
+    aplicado, radiografia = aplicar_cambios(radiografia.id, version, agregar=[...], eliminar=[...])
+    nombre = obtener_imagen_anotada(radiografia)
+"""
+import logging
+import math
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageDraw, ImageFont
+
+from citas.teselas_service import CALIDAD_JPEG, LADO_VISTA_PREVIA, abrir_imagen
+
+logger = logging.getLogger(__name__)
+
+TIPOS_FIGURA = ('trazo', 'flecha', 'medicion', 'texto')
+
+# Límites para que un cliente no pueda guardar anotaciones desmedidas
+MAX_FIGURAS = 500
+MAX_PUNTOS_TRAZO = 5000
+MAX_LARGO_TEXTO = 200
+
+# Grosor por defecto (relativo al lado mayor) y límites permitidos
+GROSOR_POR_DEFECTO = 0.002
+GROSOR_MINIMO = 0.0002
+GROSOR_MAXIMO = 0.05
+
+# Decimales de las coordenadas relativas (0.00001 ≈ 0.2 px en una imagen de 20.000 px)
+DECIMALES_COORDENADAS = 5
+
+ID_FIGURA_RE = re.compile(r'^[A-Za-z0-9_-]{1,40}$')
+COLOR_RE = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+
+# ========== VALIDACIÓN ==========
+
+def _punto(valor):
+    """Convierte [x, y] en un punto relativo dentro de la imagen"""
+    if not isinstance(valor, (list, tuple)) or len(valor) != 2:
+        raise ValueError('Cada punto debe ser [x, y].')
+    try:
+        x, y = float(valor[0]), float(valor[1])
+    except (TypeError, ValueError):
+        raise ValueError('Las coordenadas deben ser números.')
+    if not (math.isfinite(x) and math.isfinite(y)):
+        raise ValueError('Las coordenadas deben ser números.')
+    return [
+        round(min(max(x, 0.0), 1.0), DECIMALES_COORDENADAS),
+        round(min(max(y, 0.0), 1.0), DECIMALES_COORDENADAS),
+    ]
+
+
+def validar_figura(datos):
+    """
+    Valida y normaliza una figura enviada por el visualizador.
+
+    Args:
+        datos: dict con id, tipo, color, grosor, puntos y (para 'texto') texto
+
+    Returns:
+        dict normalizado listo para guardar
+
+    Raises:
+        ValueError: Si la figura no es válida
+    """
+    if not isinstance(datos, dict):
+        raise ValueError('Figura inválida.')
+
+    id_figura = str(datos.get('id', ''))
+    if not ID_FIGURA_RE.match(id_figura):
+        raise ValueError('La figura no tiene un id válido.')
+
+    tipo = datos.get('tipo')
+    if tipo not in TIPOS_FIGURA:
+        raise ValueError(f'Tipo de figura no soportado: {tipo}.')
+
+    color = str(datos.get('color') or '#ff0000')
+    if not COLOR_RE.match(color):
+        raise ValueError('Color inválido.')
+
+    try:
+        grosor = float(datos.get('grosor') or GROSOR_POR_DEFECTO)
+    except (TypeError, ValueError):
+        raise ValueError('Grosor inválido.')
+    if not math.isfinite(grosor):
+        raise ValueError('Grosor inválido.')
+    grosor = round(min(max(grosor, GROSOR_MINIMO), GROSOR_MAXIMO), 6)
+
+    puntos = datos.get('puntos')
+    if not isinstance(puntos, list) or not puntos:
+        raise ValueError('La figura no tiene puntos.')
+    if len(puntos) > MAX_PUNTOS_TRAZO:
+        raise ValueError(f'Un trazo no puede tener más de {MAX_PUNTOS_TRAZO} puntos.')
+    puntos = [_punto(punto) for punto in puntos]
+
+    figura = {'id': id_figura, 'tipo': tipo, 'color': color.lower(), 'grosor': grosor}
+    if tipo in ('flecha', 'medicion'):
+        if len(puntos) != 2:
+            raise ValueError('Las flechas y mediciones tienen exactamente dos puntos.')
+    elif tipo == 'texto':
+        texto = str(datos.get('texto') or '').strip()
+        if not texto:
+            raise ValueError('El texto está vacío.')
+        figura['texto'] = texto[:MAX_LARGO_TEXTO]
+        puntos = puntos[:1]
+    figura['puntos'] = puntos
+    return figura
+
+
+# ========== CAMBIOS ==========
+
+def aplicar_cambios(radiografia_id, version_base, agregar=(), eliminar=(), limpiar=False):
+    """
+    Aplica los cambios enviados por el visualizador sobre las anotaciones guardadas.
+
+    El orden es: limpiar, eliminar y agregar. Una figura agregada con un id que
+    ya existe reemplaza a la anterior.
+
+    Args:
+        radiografia_id: ID de la Radiografia
+        version_base: Versión de las anotaciones sobre la que trabajó el visualizador
+        agregar: Figuras nuevas (se validan con validar_figura)
+        eliminar: IDs de figuras a eliminar
+        limpiar: Eliminar todas las figuras antes de agregar
+
+    Returns:
+        tuple: (aplicado: bool, radiografia). aplicado es False si version_base
+        no es la versión vigente; la radiografía trae entonces el estado actual.
+
+    Raises:
+        ValueError: Si alguna figura no es válida o se supera MAX_FIGURAS
+        Radiografia.DoesNotExist: Si la radiografía no existe
+    """
+    from historial_clinico.models import Radiografia
+
+    figuras_nuevas = [validar_figura(figura) for figura in agregar]
+    ids_eliminar = {str(id_figura) for id_figura in eliminar}
+
+    with transaction.atomic():
+        radiografia = Radiografia.objects.select_for_update().get(id=radiografia_id)
+        if version_base != radiografia.version_anotaciones:
+            return False, radiografia
+
+        figuras = [] if limpiar else [
+            figura for figura in (radiografia.anotaciones or [])
+            if figura.get('id') not in ids_eliminar
+        ]
+        posiciones = {figura['id']: indice for indice, figura in enumerate(figuras)}
+        for figura in figuras_nuevas:
+            if figura['id'] in posiciones:
+                figuras[posiciones[figura['id']]] = figura
+            else:
+                posiciones[figura['id']] = len(figuras)
+                figuras.append(figura)
+        if len(figuras) > MAX_FIGURAS:
+            raise ValueError(f'Una radiografía no puede tener más de {MAX_FIGURAS} anotaciones.')
+
+        radiografia.anotaciones = figuras
+        radiografia.version_anotaciones += 1
+        radiografia.save(update_fields=['anotaciones', 'version_anotaciones', 'fecha_actualizacion'])
+    return True, radiografia
+
+
+# ========== RASTERIZADO ==========
+
+def _fuente(tamano):
+    """Fuente escalable de Pillow; sin FreeType se usa la fuente bitmap por defecto"""
+    try:
+        return ImageFont.load_default(size=tamano)
+    except (TypeError, OSError, ImportError):
+        return ImageFont.load_default()
+
+
+def _texto_medicion(figura, ancho_original, alto_original):
+    """Largo de una medición en píxeles de la imagen original"""
+    (x1, y1), (x2, y2) = figura['puntos']
+    largo = math.hypot((x2 - x1) * ancho_original, (y2 - y1) * alto_original)
+    return f'{round(largo)} px'
+
+
+def dibujar_figuras(imagen, figuras, ancho_original=None, alto_original=None):
+    """
+    Dibuja las figuras sobre una imagen PIL en modo RGB.
+
+    Args:
+        imagen: Imagen PIL (se modifica)
+        figuras: Lista de figuras de Radiografia.anotaciones
+        ancho_original, alto_original: Tamaño de la imagen original, para el
+            largo de las mediciones (por defecto el de la imagen recibida)
+    """
+    ancho, alto = imagen.size
+    lado = max(ancho, alto)
+    ancho_original = ancho_original or ancho
+    alto_original = alto_original or alto
+    dibujo = ImageDraw.Draw(imagen)
+
+    for figura in figuras:
+        puntos = [(x * ancho, y * alto) for x, y in figura['puntos']]
+        color = figura['color']
+        grosor = max(1, round(figura['grosor'] * lado))
+        tipo = figura['tipo']
+
+        if tipo == 'trazo':
+            if len(puntos) == 1:
+                x, y = puntos[0]
+                radio = grosor / 2
+                dibujo.ellipse((x - radio, y - radio, x + radio, y + radio), fill=color)
+            else:
+                dibujo.line(puntos, fill=color, width=grosor, joint='curve')
+        elif tipo in ('flecha', 'medicion'):
+            (x1, y1), (x2, y2) = puntos
+            dibujo.line(puntos, fill=color, width=grosor)
+            if tipo == 'flecha':
+                angulo = math.atan2(y2 - y1, x2 - x1)
+                largo_punta = grosor * 5
+                dibujo.polygon([
+                    (x2, y2),
+                    (x2 - largo_punta * math.cos(angulo - math.pi / 6), y2 - largo_punta * math.sin(angulo - math.pi / 6)),
+                    (x2 - largo_punta * math.cos(angulo + math.pi / 6), y2 - largo_punta * math.sin(angulo + math.pi / 6)),
+                ], fill=color)
+            else:
+                fuente = _fuente(max(12, grosor * 6))
+                dibujo.text(
+                    ((x1 + x2) / 2, (y1 + y2) / 2 - grosor * 2),
+                    _texto_medicion(figura, ancho_original, alto_original),
+                    fill=color, font=fuente, anchor='mb', stroke_width=1, stroke_fill='black',
+                )
+        elif tipo == 'texto':
+            fuente = _fuente(max(12, grosor * 8))
+            dibujo.text(puntos[0], figura['texto'], fill=color, font=fuente, anchor='ls', stroke_width=1, stroke_fill='black')
+
+
+def renderizar_anotaciones(radiografia):
+    """
+    Imagen PIL de la radiografía con sus anotaciones dibujadas.
+
+    Se dibuja sobre la vista previa (o sobre el original reducido al mismo
+    tamaño), que alcanza para PDF, correo y pantalla.
+
+    Returns:
+        Imagen PIL en modo RGB
+    """
+    base = radiografia.vista_previa if radiografia.derivados_vigentes and radiografia.vista_previa else radiografia.imagen
+    with base.open('rb') as archivo:
+        imagen = abrir_imagen(archivo)
+    imagen.thumbnail((LADO_VISTA_PREVIA, LADO_VISTA_PREVIA), Image.Resampling.LANCZOS)
+    imagen = imagen.convert('RGB')
+    dibujar_figuras(imagen, radiografia.anotaciones or [], radiografia.ancho, radiografia.alto)
+    return imagen
+
+
+def _imagen_anotada_vigente(radiografia):
+    """True si imagen_anotada corresponde a la versión actual y sigue en el storage"""
+    if not radiografia.imagen_anotada or radiografia.imagen_anotada_version != radiografia.version_anotaciones:
+        return False
+    return radiografia.imagen_anotada.storage.exists(radiografia.imagen_anotada.name)
+
+
+def obtener_imagen_anotada(radiografia):
+    """
+    Nombre en el storage de la imagen con anotaciones, generándola si hace falta.
+
+    Las imágenes anotadas guardadas antes de las anotaciones vectoriales
+    (version_anotaciones = 0) se siguen sirviendo tal cual.
+
+    Args:
+        radiografia: historial_clinico.Radiografia
+
+    Returns:
+        str con el nombre del archivo, o None si la radiografía no tiene anotaciones
+    """
+    from historial_clinico.models import Radiografia
+
+    if not radiografia.tiene_anotaciones:
+        return None
+    if _imagen_anotada_vigente(radiografia):
+        return radiografia.imagen_anotada.name
+    if not radiografia.anotaciones:
+        return None
+
+    version = radiografia.version_anotaciones
+    salida = BytesIO()
+    renderizar_anotaciones(radiografia).save(salida, format='JPEG', quality=CALIDAD_JPEG, optimize=True)
+
+    nombre_anterior = radiografia.imagen_anotada.name if radiografia.imagen_anotada else ''
+    nombre = default_storage.save(
+        radiografia.imagen_anotada.field.generate_filename(radiografia, f'radiografia_{radiografia.id}_anotada_v{version}.jpg'),
+        ContentFile(salida.getvalue()),
+    )
+    Radiografia.objects.filter(id=radiografia.id).update(imagen_anotada=nombre, imagen_anotada_version=version)
+    radiografia.imagen_anotada = nombre
+    radiografia.imagen_anotada_version = version
+
+    if nombre_anterior and nombre_anterior != nombre:
+        try:
+            default_storage.delete(nombre_anterior)
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar la imagen anotada anterior de la radiografía {radiografia.id}: {str(e)}")
+    logger.info(f"Imagen anotada de la radiografía {radiografia.id} generada (versión {version})")
+    return nombre
@@ -2,6 +2,8 @@ from django.urls import path
 from .api_views import (
     api_citas_disponibles, 
     api_reservar_cita,
+    api_horas_disponibles,
+    api_reservar_hora,
     api_verificar_cliente,
     api_historial_citas,
     api_odontogramas_cliente,
@@ -12,6 +14,8 @@ urlpatterns = [
     # Endpoints de citas
     path('citas_disponibles/', api_citas_disponibles, name='api_citas_disponibles'),
     path('reservar/', api_reservar_cita, name='api_reservar_cita'),
+    path('horas_disponibles/', api_horas_disponibles, name='api_horas_disponibles'),
+    path('reservar_hora/', api_reservar_hora, name='api_reservar_hora'),
     path('citas/historial/', api_historial_citas, name='api_historial_citas'),
     
     # Endpoints de clientes
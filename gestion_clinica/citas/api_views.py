@@ -8,6 +8,7 @@ from pacientes.models import Cliente
 from historial_clinico.models import Odontograma, Radiografia
 # EvaluacionSerializer eliminado
 from .serializers import CitaSerializer, ClienteSerializer, OdontogramaSerializer, RadiografiaSerializer
+from .reserva_service import reservar_cita_disponible, CitaNoDisponible
 
 
 @api_view(['GET'])
@@ -42,14 +43,6 @@ def api_reservar_cita(request):
     - 400: Error (cita no disponible, datos inválidos, etc.)
     """
     data = request.data
-    try:
-        cita = Cita.objects.get(id=data.get('cita_id'), estado='disponible')
-    except Cita.DoesNotExist:
-        return Response(
-            {"success": False, "detail": "Cita no disponible"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
     nombre = data.get('nombre')
     email = data.get('email')
     telefono = data.get('telefono')
@@ -60,30 +53,15 @@ def api_reservar_cita(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Buscar o crear el cliente
-    cliente, created = Cliente.objects.get_or_create(
-        email=email,
-        defaults={
-            'nombre_completo': nombre,
-            'telefono': telefono
-        }
-    )
-    
-    # Si el cliente ya existe, actualizar su información si es necesario
-    if not created:
-        if nombre and nombre != cliente.nombre_completo:
-            cliente.nombre_completo = nombre
-        if telefono and telefono != cliente.telefono:
-            cliente.telefono = telefono
-        cliente.save()
-    
-    # Asignar el cliente a la cita
-    cita.cliente = cliente
-    cita.paciente_nombre = nombre
-    cita.paciente_email = email
-    cita.paciente_telefono = telefono
-    cita.estado = 'reservada'
-    cita.save()
+    # Crear/actualizar el cliente y tomar la hora en una sola transacción
+    # (UPDATE condicional: solo una reserva concurrente puede ganar la hora)
+    try:
+        cita = reservar_cita_disponible(data.get('cita_id'), nombre, email, telefono=telefono)
+    except CitaNoDisponible:
+        return Response(
+            {"success": False, "detail": "Cita no disponible"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     return Response({
         "success": True,
@@ -435,6 +413,7 @@ from pacientes.models import Cliente
 from historial_clinico.models import Odontograma, Radiografia
 # EvaluacionSerializer eliminado
 from .serializers import CitaSerializer, ClienteSerializer, OdontogramaSerializer, RadiografiaSerializer
+from .reserva_service import reservar_cita_disponible, CitaNoDisponible
 
 
 @api_view(['GET'])
@@ -469,14 +448,6 @@ def api_reservar_cita(request):
     - 400: Error (cita no disponible, datos inválidos, etc.)
     """
     data = request.data
-    try:
-        cita = Cita.objects.get(id=data.get('cita_id'), estado='disponible')
-    except Cita.DoesNotExist:
-        return Response(
-            {"success": False, "detail": "Cita no disponible"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
     nombre = data.get('nombre')
     email = data.get('email')
     telefono = data.get('telefono')
@@ -487,30 +458,15 @@ def api_reservar_cita(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Buscar o crear el cliente
-    cliente, created = Cliente.objects.get_or_create(
-        email=email,
-        defaults={
-            'nombre_completo': nombre,
-            'telefono': telefono
-        }
-    )
-    
-    # Si el cliente ya existe, actualizar su información si es necesario
-    if not created:
-        if nombre and nombre != cliente.nombre_completo:
-            cliente.nombre_completo = nombre
-        if telefono and telefono != cliente.telefono:
-            cliente.telefono = telefono
-        cliente.save()
-    
-    # Asignar el cliente a la cita
-    cita.cliente = cliente
-    cita.paciente_nombre = nombre
-    cita.paciente_email = email
-    cita.paciente_telefono = telefono
-    cita.estado = 'reservada'
-    cita.save()
+    # Crear/actualizar el cliente y tomar la hora en una sola transacción
+    # (UPDATE condicional: solo una reserva concurrente puede ganar la hora)
+    try:
+        cita = reservar_cita_disponible(data.get('cita_id'), nombre, email, telefono=telefono)
+    except CitaNoDisponible:
+        return Response(
+            {"success": False, "detail": "Cita no disponible"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     return Response({
         "success": True,
@@ -862,6 +818,7 @@ from pacientes.models import Cliente
 from historial_clinico.models import Odontograma, Radiografia
 # EvaluacionSerializer eliminado
 from .serializers import CitaSerializer, ClienteSerializer, OdontogramaSerializer, RadiografiaSerializer
+from .reserva_service import reservar_cita_disponible, CitaNoDisponible
 
 
 @api_view(['GET'])
@@ -896,14 +853,6 @@ def api_reservar_cita(request):
     - 400: Error (cita no disponible, datos inválidos, etc.)
     """
     data = request.data
-    try:
-        cita = Cita.objects.get(id=data.get('cita_id'), estado='disponible')
-    except Cita.DoesNotExist:
-        return Response(
-            {"success": False, "detail": "Cita no disponible"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
     nombre = data.get('nombre')
     email = data.get('email')
     telefono = data.get('telefono')
@@ -914,30 +863,15 @@ def api_reservar_cita(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Buscar o crear el cliente
-    cliente, created = Cliente.objects.get_or_create(
-        email=email,
-        defaults={
-            'nombre_completo': nombre,
-            'telefono': telefono
-        }
-    )
-    
-    # Si el cliente ya existe, actualizar su información si es necesario
-    if not created:
-        if nombre and nombre != cliente.nombre_completo:
-            cliente.nombre_completo = nombre
-        if telefono and telefono != cliente.telefono:
-            cliente.telefono = telefono
-        cliente.save()
-    
-    # Asignar el cliente a la cita
-    cita.cliente = cliente
-    cita.paciente_nombre = nombre
-    cita.paciente_email = email
-    cita.paciente_telefono = telefono
-    cita.estado = 'reservada'
-    cita.save()
+    # Crear/actualizar el cliente y tomar la hora en una sola transacción
+    # (UPDATE condicional: solo una reserva concurrente puede ganar la hora)
+    try:
+        cita = reservar_cita_disponible(data.get('cita_id'), nombre, email, telefono=telefono)
+    except CitaNoDisponible:
+        return Response(
+            {"success": False, "detail": "Cita no disponible"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     return Response({
         "success": True,
@@ -1289,6 +1223,7 @@ from pacientes.models import Cliente
 from historial_clinico.models import Odontograma, Radiografia
 # EvaluacionSerializer eliminado
 from .serializers import CitaSerializer, ClienteSerializer, OdontogramaSerializer, RadiografiaSerializer
+from .reserva_service import reservar_cita_disponible, CitaNoDisponible
 
 
 @api_view(['GET'])
@@ -1323,14 +1258,6 @@ def api_reservar_cita(request):
     - 400: Error (cita no disponible, datos inválidos, etc.)
     """
     data = request.data
-    try:
-        cita = Cita.objects.get(id=data.get('cita_id'), estado='disponible')
-    except Cita.DoesNotExist:
-        return Response(
-            {"success": False, "detail": "Cita no disponible"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
     nombre = data.get('nombre')
     email = data.get('email')
     telefono = data.get('telefono')
@@ -1341,30 +1268,15 @@ def api_reservar_cita(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Buscar o crear el cliente
-    cliente, created = Cliente.objects.get_or_create(
-        email=email,
-        defaults={
-            'nombre_completo': nombre,
-            'telefono': telefono
-        }
-    )
-    
-    # Si el cliente ya existe, actualizar su información si es necesario
-    if not created:
-        if nombre and nombre != cliente.nombre_completo:
-            cliente.nombre_completo = nombre
-        if telefono and telefono != cliente.telefono:
-            cliente.telefono = telefono
-        cliente.save()
-    
-    # Asignar el cliente a la cita
-    cita.cliente = cliente
-    cita.paciente_nombre = nombre
-    cita.paciente_email = email
-    cita.paciente_telefono = telefono
-    cita.estado = 'reservada'
-    cita.save()
+    # Crear/actualizar el cliente y tomar la hora en una sola transacción
+    # (UPDATE condicional: solo una reserva concurrente puede ganar la hora)
+    try:
+        cita = reservar_cita_disponible(data.get('cita_id'), nombre, email, telefono=telefono)
+    except CitaNoDisponible:
+        return Response(
+            {"success": False, "detail": "Cita no disponible"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     return Response({
         "success": True,
@@ -1716,6 +1628,8 @@ from pacientes.models import Cliente
 from historial_clinico.models import Odontograma, Radiografia
 # EvaluacionSerializer eliminado
 from .serializers import CitaSerializer, ClienteSerializer, OdontogramaSerializer, RadiografiaSerializer
+from .reserva_service import reservar_cita_disponible, reservar_hora_calculada, CitaNoDisponible
+from .disponibilidad_service import buscar_horas_disponibles, DIAS_MAXIMOS_BUSQUEDA
 
 
 @api_view(['GET'])
@@ -1724,6 +1638,11 @@ def api_citas_disponibles(request):
     """
     Retorna todas las citas disponibles.
     
+    Solo incluye las citas 'disponible' publicadas a mano; las horas calculadas
+    desde los horarios de los dentistas se consultan en api_horas_disponibles y
+    se reservan con api_reservar_hora (esta vista conserva su formato, una lista
+    de citas existentes, para los clientes de la API que ya lo usan).
+    
     Retorna:
     - 200: Lista de citas disponibles
     """
@@ -1750,14 +1669,6 @@ def api_reservar_cita(request):
     - 400: Error (cita no disponible, datos inválidos, etc.)
     """
     data = request.data
-    try:
-        cita = Cita.objects.get(id=data.get('cita_id'), estado='disponible')
-    except Cita.DoesNotExist:
-        return Response(
-            {"success": False, "detail": "Cita no disponible"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
     nombre = data.get('nombre')
     email = data.get('email')
     telefono = data.get('telefono')
@@ -1768,30 +1679,15 @@ def api_reservar_cita(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Buscar o crear el cliente
-    cliente, created = Cliente.objects.get_or_create(
-        email=email,
-        defaults={
-            'nombre_completo': nombre,
-            'telefono': telefono
-        }
-    )
-    
-    # Si el cliente ya existe, actualizar su información si es necesario
-    if not created:
-        if nombre and nombre != cliente.nombre_completo:
-            cliente.nombre_completo = nombre
-        if telefono and telefono != cliente.telefono:
-            cliente.telefono = telefono
-        cliente.save()
-    
-    # Asignar el cliente a la cita
-    cita.cliente = cliente
-    cita.paciente_nombre = nombre
-    cita.paciente_email = email
-    cita.paciente_telefono = telefono
-    cita.estado = 'reservada'
-    cita.save()
+    # Crear/actualizar el cliente y tomar la hora en una sola transacción
+    # (UPDATE condicional: solo una reserva concurrente puede ganar la hora)
+    try:
+        cita = reservar_cita_disponible(data.get('cita_id'), nombre, email, telefono=telefono)
+    except CitaNoDisponible:
+        return Response(
+            {"success": False, "detail": "Cita no disponible"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     return Response({
         "success": True,
@@ -2134,3 +2030,191 @@ def api_estadisticas_evaluaciones(request):
         "total_evaluaciones": total,
         "distribucion": distribucion
     })
+
+
+def _parsear_fecha_api(valor):
+    """Convierte un parámetro YYYY-MM-DD en date (None si falta o es inválido)"""
+    from datetime import datetime
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def api_horas_disponibles(request):
+    """
+    Busca horas libres calculadas desde los horarios de los dentistas, sin
+    depender de citas 'disponible' insertadas de antemano.
+    
+    Parámetros GET:
+    - desde: Fecha inicial YYYY-MM-DD (opcional, por defecto hoy)
+    - hasta: Fecha final YYYY-MM-DD (opcional, por defecto 60 días después de 'desde')
+    - servicio: ID del tipo de servicio; define la duración (opcional)
+    - duracion: Duración en minutos (opcional, reemplaza la del servicio)
+    - dentista: ID del dentista; se puede repetir (opcional, por defecto todos)
+    - limite: Cantidad de horas a retornar (opcional, por defecto 20, máximo 100)
+    - cursor: Valor 'siguiente_cursor' de la respuesta anterior para ver más horas
+    
+    Retorna:
+    - 200: Lista de horas libres y cursor de la página siguiente (null si no hay más)
+    - 400: Parámetros inválidos
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from personal.models import Perfil
+    from .models import TipoServicio
+
+    hoy = timezone.localdate()
+    fecha_desde = _parsear_fecha_api(request.query_params.get('desde')) if request.query_params.get('desde') else hoy
+    if fecha_desde is None:
+        return Response({"success": False, "detail": "Fecha 'desde' inválida (use YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+    fecha_hasta = _parsear_fecha_api(request.query_params.get('hasta')) if request.query_params.get('hasta') else fecha_desde + timedelta(days=60)
+    if fecha_hasta is None:
+        return Response({"success": False, "detail": "Fecha 'hasta' inválida (use YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+    if fecha_hasta < fecha_desde:
+        return Response({"success": False, "detail": "La fecha 'hasta' debe ser posterior a 'desde'"}, status=status.HTTP_400_BAD_REQUEST)
+    if (fecha_hasta - fecha_desde).days > DIAS_MAXIMOS_BUSQUEDA:
+        return Response({"success": False, "detail": f"El rango máximo de búsqueda es de {DIAS_MAXIMOS_BUSQUEDA} días"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        limite = min(int(request.query_params.get('limite', 20)), 100)
+        duracion = request.query_params.get('duracion')
+        duracion = int(duracion) if duracion else None
+        dentista_ids = [int(d) for d in request.query_params.getlist('dentista') if d]
+        servicio_id = request.query_params.get('servicio')
+        servicio_id = int(servicio_id) if servicio_id else None
+    except ValueError:
+        return Response({"success": False, "detail": "Parámetros numéricos inválidos"}, status=status.HTTP_400_BAD_REQUEST)
+    if limite <= 0 or (duracion is not None and duracion <= 0):
+        return Response({"success": False, "detail": "El límite y la duración deben ser mayores que 0"}, status=status.HTTP_400_BAD_REQUEST)
+
+    tipo_servicio = None
+    if servicio_id:
+        tipo_servicio = TipoServicio.objects.filter(id=servicio_id, activo=True).first()
+        if not tipo_servicio:
+            return Response({"success": False, "detail": "Servicio no encontrado"}, status=status.HTTP_400_BAD_REQUEST)
+
+    dentistas = Perfil.objects.filter(rol='dentista', activo=True).only('id', 'nombre_completo', 'especialidad', 'sala_asignada_id')
+    if dentista_ids:
+        dentistas = dentistas.filter(id__in=dentista_ids)
+
+    try:
+        resultado = buscar_horas_disponibles(
+            fecha_desde,
+            fecha_hasta,
+            tipo_servicio=tipo_servicio,
+            duracion_minutos=duracion,
+            dentistas=dentistas,
+            limite=limite,
+            cursor=request.query_params.get('cursor'),
+        )
+    except ValueError as e:
+        return Response({"success": False, "detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "success": True,
+        "horas": [
+            {
+                "inicio": timezone.localtime(hora['inicio']).isoformat(),
+                "fin": timezone.localtime(hora['fin']).isoformat(),
+                "dentista_id": hora['dentista'].id,
+                "dentista_nombre": hora['dentista'].nombre_completo,
+                "especialidad": hora['dentista'].especialidad,
+            }
+            for hora in resultado['horas']
+        ],
+        "siguiente_cursor": resultado['siguiente_cursor'],
+    })
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def api_reservar_hora(request):
+    """
+    Reserva una hora entregada por api_horas_disponibles.
+    
+    Espera JSON:
+    {
+      "dentista_id": 3,
+      "inicio": "2025-12-01T09:30:00-03:00",
+      "servicio": 2,
+      "nombre": "Juan Perez",
+      "email": "juan@x.com",
+      "telefono": "912345678"
+    }
+    
+    Retorna:
+    - 200: Cita reservada exitosamente
+    - 400: Error (hora no disponible, datos inválidos, etc.)
+    """
+    from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
+    from personal.models import Perfil
+    from .models import TipoServicio
+
+    data = request.data
+    nombre = data.get('nombre')
+    email = data.get('email')
+
+    if not nombre or not email:
+        return Response(
+            {"success": False, "detail": "Nombre y email son requeridos"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    inicio = parse_datetime(str(data.get('inicio') or ''))
+    if inicio is None:
+        return Response(
+            {"success": False, "detail": "Fecha y hora de inicio inválidas"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if timezone.is_naive(inicio):
+        inicio = timezone.make_aware(inicio)
+
+    try:
+        dentista_id = int(data.get('dentista_id'))
+        servicio_id = int(data.get('servicio')) if data.get('servicio') else None
+    except (TypeError, ValueError):
+        return Response(
+            {"success": False, "detail": "Parámetros numéricos inválidos"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    dentista = Perfil.objects.filter(id=dentista_id, rol='dentista', activo=True).first()
+    if not dentista:
+        return Response(
+            {"success": False, "detail": "Dentista no encontrado"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    tipo_servicio = None
+    if servicio_id:
+        tipo_servicio = TipoServicio.objects.filter(id=servicio_id, activo=True).first()
+        if not tipo_servicio:
+            return Response(
+                {"success": False, "detail": "Servicio no encontrado"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    try:
+        cita = reservar_hora_calculada(
+            dentista,
+            inicio,
+            nombre,
+            email,
+            telefono=data.get('telefono'),
+            tipo_servicio=tipo_servicio,
+        )
+    except CitaNoDisponible as e:
+        return Response(
+            {"success": False, "detail": str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({
+        "success": True,
+        "message": "Cita reservada exitosamente",
+        "data": CitaSerializer(cita).data
+    }, status=status.HTTP_200_OK)
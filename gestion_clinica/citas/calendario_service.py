@@ -0,0 +1,124 @@
+"""
+Servicio del calendario general de citas.
+
+Entrega solo las citas de la ventana visible del calendario, con campos compactos
+leídos con values() (sin instanciar modelos), y calcula una versión de la ventana
+para responder 304 cuando el navegador ya tiene los mismos datos.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from citas.agenda_service import DURACION_POR_DEFECTO
+from citas.models import Cita
+
+# Ventana máxima que se puede pedir de una vez (la vista mensual muestra hasta 6 semanas)
+DIAS_MAXIMOS_VENTANA = 62
+
+# Estados que se consideran cerrados (una cita pasada en estos estados no se marca como atrasada)
+ESTADOS_CERRADOS = ['completada', 'cancelada', 'no_show', 'finalizada']
+
+CAMPOS_EVENTO = (
+    'id',
+    'fecha_hora',
+    'estado',
+    'cliente__nombre_completo',
+    'cliente__telefono',
+    'paciente_nombre',
+    'paciente_telefono',
+    'tipo_servicio__nombre',
+    'tipo_servicio__duracion_estimada',
+    'tipo_servicio__precio_base',
+    'tipo_consulta',
+    'dentista__nombre_completo',
+    'precio_cobrado',
+    'notas',
+)
+
+def filtro_busqueda_citas(busqueda):
+    """Q con la búsqueda del calendario por cliente, servicio, dentista o notas"""
+    return (
+        Q(cliente__nombre_completo__icontains=busqueda) |
+        Q(cliente__email__icontains=busqueda) |
+        Q(cliente__telefono__icontains=busqueda) |
+        Q(paciente_nombre__icontains=busqueda) |
+        Q(paciente_email__icontains=busqueda) |
+        Q(tipo_servicio__nombre__icontains=busqueda) |
+        Q(tipo_consulta__icontains=busqueda) |
+        Q(dentista__nombre_completo__icontains=busqueda) |
+        Q(notas__icontains=busqueda)
+    )
+
+
+def citas_ventana(inicio, fin, busqueda=''):
+    """
+    QuerySet de las citas con fecha_hora en [inicio, fin), filtrado por la búsqueda.
+
+    Args:
+        inicio: datetime timezone-aware del inicio de la ventana
+        fin: datetime timezone-aware del fin de la ventana (exclusivo)
+        busqueda: Texto de búsqueda (opcional)
+    """
+    citas = Cita.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+    if busqueda:
+        citas = citas.filter(filtro_busqueda_citas(busqueda))
+    return citas
+
+
+def version_ventana(citas, inicio, fin, busqueda=''):
+    """
+    Calcula la versión (ETag) de una ventana del calendario con una sola consulta agregada.
+
+    Cambia si se crea, modifica o elimina una cita de la ventana (cantidad, última
+    actualizada_el y mayor ID) y cuando una cita pasa a estar atrasada ('pas'
+    depende de la hora actual). Editar un cliente, dentista o servicio actualiza
+    actualizada_el de sus citas (ver citas/signals.py), así que también cambia.
+    """
+    resumen = citas.aggregate(
+        total=Count('id'),
+        ultima=Max('actualizada_el'),
+        mayor_id=Max('id'),
+        atrasadas=Count('id', filter=Q(fecha_hora__lt=timezone.now()) & ~Q(estado__in=ESTADOS_CERRADOS)),
+    )
+    base = '|'.join(str(valor) for valor in (
+        inicio.isoformat(),
+        fin.isoformat(),
+        busqueda,
+        resumen['total'],
+        resumen['ultima'].isoformat() if resumen['ultima'] else '',
+        resumen['mayor_id'] or '',
+        resumen['atrasadas'],
+    ))
+    return hashlib.md5(base.encode('utf-8')).hexdigest()
+
+
+def eventos_ventana(citas):
+    """
+    Lista de eventos compactos para el calendario.
+
+    Claves: id, s (inicio), e (fin), st (estado), p (paciente), tel, sv (servicio),
+    d (dentista), pr (precio), dur (minutos o null), n (notas), pas (cita pasada sin cerrar)
+    """
+    ahora = timezone.now()
+    eventos = []
+    for fila in citas.order_by('fecha_hora').values(*CAMPOS_EVENTO):
+        inicio = timezone.localtime(fila['fecha_hora'])
+        duracion = fila['tipo_servicio__duracion_estimada']
+        precio = fila['precio_cobrado'] or fila['tipo_servicio__precio_base']
+        eventos.append({
+            'id': fila['id'],
+            's': inicio.strftime('%Y-%m-%dT%H:%M:%S'),
+            'e': (inicio + timedelta(minutes=duracion or DURACION_POR_DEFECTO)).strftime('%Y-%m-%dT%H:%M:%S'),
+            'st': fila['estado'],
+            'p': fila['cliente__nombre_completo'] or fila['paciente_nombre'] or '',
+            'tel': fila['cliente__telefono'] or fila['paciente_telefono'] or '',
+            'sv': fila['tipo_servicio__nombre'] or fila['tipo_consulta'] or '',
+            'd': fila['dentista__nombre_completo'] or '',
+            'pr': int(precio) if precio else None,
+            'dur': duracion,
+            'n': fila['notas'] or '',
+            'pas': fila['fecha_hora'] < ahora and fila['estado'] not in ESTADOS_CERRADOS,
+        })
+    return eventos
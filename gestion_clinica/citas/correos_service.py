@@ -0,0 +1,256 @@
+"""
+Servicio de la bandeja de salida de correos (CorreoSaliente).
+
+Enviar un correo por SMTP dentro de la petición obliga al usuario a esperar el
+saludo TLS y la autenticación con Gmail, que a veces tarda varios segundos, y si
+el servidor SMTP falla el correo se pierde. En su lugar las vistas y servicios
+arman el mensaje como siempre (EmailMessage / EmailMultiAlternatives) y lo
+guardan en la base de datos con encolar_correo(). El comando procesar_correos
+los envía en lotes reutilizando una sola conexión SMTP y reintenta los que
+fallan con espera exponencial.
+
+La entrega es "al menos una vez": si el worker se detiene justo después de
+entregar un correo y antes de marcarlo como enviado, ese correo se vuelve a
+enviar cuando se recupera.
+
+Uso:
+    email = EmailMultiAlternatives(asunto, texto, remitente, [destinatario])
+    email.attach_alternative(html, "text/html")
+    encolar_correo(email, origen='confirmacion_cita')
+    # ... en el worker:
+    correos = tomar_lote(50)
+    enviar_lote(correos)
+"""
+import logging
+import mimetypes
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from citas.models import AdjuntoCorreo, CorreoSaliente
+
+logger = logging.getLogger(__name__)
+
+# Espera antes del primer reintento; se duplica en cada intento fallido
+SEGUNDOS_ESPERA_BASE = 60
+
+# Espera máxima entre reintentos
+SEGUNDOS_ESPERA_MAXIMA = 6 * 60 * 60
+
+# Minutos tras los cuales un correo en 'enviando' se devuelve a la cola (el worker se cayó)
+MINUTOS_CORREO_INTERRUMPIDO = 10
+
+# Días que se conservan los correos enviados (con sus adjuntos) antes de eliminarlos
+DIAS_CONSERVAR_ENVIADOS = 30
+
+
+# ========== ENCOLAR ==========
+
+def encolar_correo(mensaje, origen=''):
+    """
+    Guarda un correo en la bandeja de salida para que lo envíe el worker.
+
+    Acepta el mismo EmailMessage o EmailMultiAlternatives que antes se enviaba con
+    .send(): se conservan el cuerpo de texto, la alternativa HTML (o el cuerpo
+    HTML si content_subtype es 'html') y los adjuntos.
+
+    Args:
+        mensaje: EmailMessage o EmailMultiAlternatives ya armado
+        origen: Texto corto que identifica qué generó el correo (opcional)
+
+    Returns:
+        CorreoSaliente pendiente
+    """
+    cuerpo_texto = mensaje.body or ''
+    cuerpo_html = ''
+    if getattr(mensaje, 'content_subtype', 'plain') == 'html':
+        cuerpo_texto, cuerpo_html = '', mensaje.body or ''
+    for contenido, tipo_mime in getattr(mensaje, 'alternatives', []):
+        if tipo_mime == 'text/html':
+            cuerpo_html = contenido
+
+    with transaction.atomic():
+        correo = CorreoSaliente.objects.create(
+            asunto=(mensaje.subject or '')[:255],
+            remitente=mensaje.from_email or '',
+            destinatarios=list(mensaje.to),
+            cc=list(mensaje.cc),
+            cco=list(mensaje.bcc),
+            responder_a=list(mensaje.reply_to),
+            cuerpo_texto=cuerpo_texto,
+            cuerpo_html=cuerpo_html,
+            origen=origen,
+        )
+        for nombre, contenido, tipo_mime in mensaje.attachments:
+            if isinstance(contenido, str):
+                contenido = contenido.encode('utf-8')
+            nombre = nombre or 'adjunto'
+            adjunto = AdjuntoCorreo(
+                correo=correo,
+                nombre=nombre,
+                tipo_mime=tipo_mime or mimetypes.guess_type(nombre)[0] or 'application/octet-stream',
+            )
+            adjunto.archivo.save(nombre, ContentFile(contenido), save=False)
+            adjunto.save()
+
+    logger.info(f"Correo #{correo.id} ({origen or 'sin origen'}) encolado para {', '.join(correo.destinatarios)}")
+    return correo
+
+
+# ========== WORKER ==========
+
+def tomar_lote(tamano):
+    """
+    Reserva para este worker hasta `tamano` correos pendientes cuyo reintento ya venció.
+
+    Igual que las exportaciones, cada correo pasa de 'pendiente' a 'enviando' con un
+    UPDATE condicional, así dos workers nunca envían el mismo correo.
+
+    Returns:
+        Lista de CorreoSaliente en estado 'enviando' (vacía si no hay pendientes)
+    """
+    ahora = timezone.now()
+    candidatos = CorreoSaliente.objects.filter(
+        estado='pendiente',
+        proximo_intento_el__lte=ahora,
+    ).order_by('proximo_intento_el', 'id').values_list('id', flat=True)[:tamano]
+
+    tomados = []
+    for correo_id in candidatos:
+        if CorreoSaliente.objects.filter(id=correo_id, estado='pendiente').update(estado='enviando', tomado_el=ahora):
+            tomados.append(correo_id)
+    if not tomados:
+        return []
+    return list(CorreoSaliente.objects.filter(id__in=tomados).prefetch_related('adjuntos').order_by('id'))
+
+
+def construir_mensaje(correo, conexion=None):
+    """
+    Vuelve a armar el EmailMultiAlternatives de un CorreoSaliente.
+
+    Args:
+        correo: CorreoSaliente con sus adjuntos
+        conexion: Conexión de correo a usar al enviar (opcional)
+
+    Returns:
+        EmailMultiAlternatives listo para .send()
+    """
+    mensaje = EmailMultiAlternatives(
+        subject=correo.asunto,
+        body=correo.cuerpo_texto or correo.cuerpo_html,
+        from_email=correo.remitente or None,
+        to=correo.destinatarios,
+        cc=correo.cc,
+        bcc=correo.cco,
+        reply_to=correo.responder_a,
+        connection=conexion,
+    )
+    if correo.cuerpo_html:
+        if correo.cuerpo_texto:
+            mensaje.attach_alternative(correo.cuerpo_html, 'text/html')
+        else:
+            mensaje.content_subtype = 'html'
+    for adjunto in correo.adjuntos.all():
+        with adjunto.archivo.open('rb') as archivo:
+            mensaje.attach(adjunto.nombre, archivo.read(), adjunto.tipo_mime or None)
+    return mensaje
+
+
+def _registrar_fallo(correo, error):
+    """Devuelve el correo a la cola con espera exponencial, o lo marca como error si agotó los intentos"""
+    correo.intentos += 1
+    correo.ultimo_error = str(error)[:2000]
+    correo.tomado_el = None
+    if correo.intentos >= correo.max_intentos:
+        correo.estado = 'error'
+        logger.error(f"Correo #{correo.id} descartado tras {correo.intentos} intentos: {error}")
+    else:
+        espera = min(SEGUNDOS_ESPERA_BASE * 2 ** (correo.intentos - 1), SEGUNDOS_ESPERA_MAXIMA)
+        correo.estado = 'pendiente'
+        correo.proximo_intento_el = timezone.now() + timedelta(seconds=espera)
+        logger.warning(f"Correo #{correo.id} falló (intento {correo.intentos}), se reintenta en {espera}s: {error}")
+    correo.save(update_fields=['intentos', 'ultimo_error', 'tomado_el', 'estado', 'proximo_intento_el'])
+
+
+def enviar_lote(correos):
+    """
+    Envía un lote de correos ya tomados por una sola conexión SMTP.
+
+    Si no se puede abrir la conexión, todos los correos del lote cuentan un intento
+    fallido y vuelven a la cola.
+
+    Args:
+        correos: Lista de CorreoSaliente en estado 'enviando' (tomar_lote)
+
+    Returns:
+        Tupla (enviados, fallidos)
+    """
+    if not correos:
+        return 0, 0
+
+    conexion = get_connection(fail_silently=False)
+    try:
+        conexion.open()
+    except Exception as e:
+        for correo in correos:
+            _registrar_fallo(correo, e)
+        return 0, len(correos)
+
+    enviados = fallidos = 0
+    try:
+        for correo in correos:
+            try:
+                construir_mensaje(correo, conexion).send(fail_silently=False)
+            except Exception as e:
+                _registrar_fallo(correo, e)
+                fallidos += 1
+                continue
+
+            correo.estado = 'enviado'
+            correo.intentos += 1
+            correo.enviado_el = timezone.now()
+            correo.ultimo_error = ''
+            correo.save(update_fields=['estado', 'intentos', 'enviado_el', 'ultimo_error'])
+            enviados += 1
+    finally:
+        conexion.close()
+    return enviados, fallidos
+
+
+def marcar_correos_interrumpidos():
+    """
+    Devuelve a la cola los correos que quedaron en 'enviando' porque el worker se detuvo.
+
+    Returns:
+        Cantidad de correos devueltos a la cola
+    """
+    return CorreoSaliente.objects.filter(
+        estado='enviando',
+        tomado_el__lt=timezone.now() - timedelta(minutes=MINUTOS_CORREO_INTERRUMPIDO),
+    ).update(estado='pendiente', tomado_el=None, proximo_intento_el=timezone.now())
+
+
+def limpiar_correos_enviados(dias=DIAS_CONSERVAR_ENVIADOS):
+    """
+    Elimina los correos enviados hace más de `dias` días junto con sus adjuntos en media.
+
+    Returns:
+        Cantidad de correos eliminados
+    """
+    eliminados = 0
+    vencidos = CorreoSaliente.objects.filter(
+        estado='enviado',
+        enviado_el__lt=timezone.now() - timedelta(days=dias),
+    ).prefetch_related('adjuntos')
+    for correo in vencidos:
+        try:
+            for adjunto in correo.adjuntos.all():
+                adjunto.archivo.delete(save=False)
+            correo.delete()
+            eliminados += 1
+        except Exception as e:
+            logger.error(f"Error al eliminar correo enviado #{correo.id}: {str(e)}")
+    return eliminados
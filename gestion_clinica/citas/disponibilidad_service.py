@@ -0,0 +1,325 @@
+"""
+Motor de disponibilidad calculada.
+
+Deriva las horas libres al vuelo a partir de los bloques de HorarioDentista menos
+las citas que ocupan la agenda, sin necesidad de insertar citas 'disponible'.
+
+Cada día de cada dentista se representa como un mapa de bits: el bit i indica si
+el tramo de GRANULARIDAD_MINUTOS que empieza en el minuto i * GRANULARIDAD_MINUTOS
+del día está libre. Una hora de N tramos cabe en la posición p si
+mapa & (mascara << p) == (mascara << p), lo que se evalúa con operaciones de enteros.
+
+La búsqueda avanza por ventanas de días (una consulta de citas por ventana) y se
+detiene al juntar las horas pedidas, por lo que buscar "las próximas N" no depende
+del largo del rango. El cursor permite continuar la búsqueda en la página siguiente.
+"""
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from citas.agenda_service import ESTADOS_OCUPAN_AGENDA, duracion_servicio, limites_dia
+from citas.models import Cita, HorarioDentista
+
+# Resolución del mapa de bits (minutos por tramo)
+GRANULARIDAD_MINUTOS = 5
+
+# Tramos que tiene un día
+TRAMOS_POR_DIA = 24 * 60 // GRANULARIDAD_MINUTOS
+
+# Días que se cargan por cada consulta de citas
+DIAS_POR_VENTANA = 14
+
+# Rango máximo de búsqueda permitido
+DIAS_MAXIMOS_BUSQUEDA = 366
+
+
+def _tramo_desde_minutos(minutos, redondear_arriba=False):
+    """Convierte minutos desde la medianoche en índice de tramo"""
+    if redondear_arriba:
+        return -(-minutos // GRANULARIDAD_MINUTOS)
+    return minutos // GRANULARIDAD_MINUTOS
+
+
+def _minutos_del_dia(valor):
+    """Minutos transcurridos desde la medianoche para un time"""
+    return valor.hour * 60 + valor.minute + (1 if valor.second or valor.microsecond else 0)
+
+
+def _rango_bits(desde, hasta):
+    """Entero con los bits [desde, hasta) encendidos"""
+    if hasta <= desde:
+        return 0
+    return ((1 << (hasta - desde)) - 1) << desde
+
+
+def _inicio_tramo(fecha, tramo):
+    """Datetime timezone-aware del inicio de un tramo del día"""
+    return timezone.make_aware(
+        datetime.combine(fecha, dt_time.min) + timedelta(minutes=tramo * GRANULARIDAD_MINUTOS)
+    )
+
+
+def codificar_cursor(inicio, dentista_id):
+    """Codifica la posición de la última hora entregada como cursor de paginación"""
+    return f"{int(inicio.timestamp())}-{dentista_id}"
+
+
+def decodificar_cursor(cursor):
+    """
+    Decodifica un cursor de paginación.
+
+    Returns:
+        tuple: (inicio, dentista_id)
+
+    Raises:
+        ValueError: si el cursor no es válido
+    """
+    try:
+        marca, dentista_id = cursor.split('-', 1)
+        return datetime.fromtimestamp(int(marca), tz=timezone.get_current_timezone()), int(dentista_id)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        raise ValueError('Cursor inválido')
+
+
+class MapaDia:
+    """
+    Mapa de bits de los tramos de un dentista en un día.
+
+    Guarda por separado los tramos de trabajo (bloques de horario) y los ocupados
+    por citas; los libres son trabajo & ~ocupado.
+    """
+    __slots__ = ('bloques', 'trabajo', 'ocupado')
+
+    def __init__(self):
+        self.bloques = []
+        self.trabajo = 0
+        self.ocupado = 0
+
+    def agregar_bloque(self, hora_inicio, hora_fin):
+        """Marca como tramos de trabajo el bloque [hora_inicio, hora_fin)"""
+        desde = _tramo_desde_minutos(_minutos_del_dia(hora_inicio), redondear_arriba=True)
+        hasta = _tramo_desde_minutos(hora_fin.hour * 60 + hora_fin.minute)
+        if hora_fin == dt_time.min:
+            hasta = TRAMOS_POR_DIA
+        if hasta > desde:
+            self.bloques.append((desde, hasta))
+            self.trabajo |= _rango_bits(desde, hasta)
+
+    def ocupar(self, minuto_inicio, minuto_fin):
+        """Marca como ocupados los tramos que tocan el rango de minutos [inicio, fin)"""
+        desde = max(_tramo_desde_minutos(minuto_inicio), 0)
+        hasta = min(_tramo_desde_minutos(minuto_fin, redondear_arriba=True), TRAMOS_POR_DIA)
+        self.ocupado |= _rango_bits(desde, hasta)
+
+    @property
+    def libre(self):
+        return self.trabajo & ~self.ocupado
+
+    def aperturas(self, tramos_duracion, tramo_minimo=0):
+        """
+        Genera los tramos de inicio donde cabe una hora de la duración indicada.
+
+        Las horas se alinean al inicio de cada bloque de horario y avanzan de a
+        una duración, igual que las horas generadas en lote por agenda_service.
+
+        Args:
+            tramos_duracion: Duración de la hora en tramos
+            tramo_minimo: Primer tramo aceptado (para omitir horas pasadas)
+        """
+        libre = self.libre
+        if not libre:
+            return
+        mascara = (1 << tramos_duracion) - 1
+        for desde, hasta in sorted(self.bloques):
+            tramo = desde
+            if tramo < tramo_minimo:
+                saltos = -(-(tramo_minimo - tramo) // tramos_duracion)
+                tramo += saltos * tramos_duracion
+            while tramo + tramos_duracion <= hasta:
+                bits = mascara << tramo
+                if libre & bits == bits:
+                    yield tramo
+                tramo += tramos_duracion
+
+
+def _cargar_horarios(dentista_ids):
+    """Bloques activos de HorarioDentista agrupados por dentista y día de la semana"""
+    horarios = defaultdict(lambda: defaultdict(list))
+    for horario in HorarioDentista.objects.filter(dentista_id__in=dentista_ids, activo=True).only(
+        'dentista_id', 'dia_semana', 'hora_inicio', 'hora_fin'
+    ):
+        horarios[horario.dentista_id][horario.dia_semana].append((horario.hora_inicio, horario.hora_fin))
+    return horarios
+
+
+def construir_mapas(salas_por_dentista, fecha_desde, fecha_hasta, horarios=None):
+    """
+    Construye los mapas de bits de varios dentistas para un rango de días.
+
+    Usa una consulta para los horarios (si no se entregan) y otra para las citas.
+    Las citas de la sala asignada a un dentista también ocupan sus tramos, aunque
+    sean de otro dentista.
+
+    Args:
+        salas_por_dentista: {dentista_id: sala_id o None}
+        fecha_desde: date inicial (inclusive)
+        fecha_hasta: date final (inclusive)
+        horarios: Resultado previo de _cargar_horarios (opcional)
+
+    Returns:
+        dict {(dentista_id, fecha): MapaDia}
+    """
+    dentista_ids = list(salas_por_dentista)
+    if horarios is None:
+        horarios = _cargar_horarios(dentista_ids)
+
+    mapas = {}
+    fecha = fecha_desde
+    while fecha <= fecha_hasta:
+        for dentista_id in dentista_ids:
+            bloques = horarios.get(dentista_id, {}).get(fecha.weekday())
+            if bloques:
+                mapa = MapaDia()
+                for hora_inicio, hora_fin in bloques:
+                    mapa.agregar_bloque(hora_inicio, hora_fin)
+                mapas[(dentista_id, fecha)] = mapa
+        fecha += timedelta(days=1)
+
+    dentistas_por_sala = defaultdict(list)
+    for dentista_id, sala_id in salas_por_dentista.items():
+        if sala_id:
+            dentistas_por_sala[sala_id].append(dentista_id)
+
+    inicio_rango, _ = limites_dia(fecha_desde)
+    _, fin_rango = limites_dia(fecha_hasta)
+    citas = Cita.objects.filter(
+        Q(dentista_id__in=dentista_ids) | Q(sala_id__in=list(dentistas_por_sala)),
+        fecha_hora__gte=inicio_rango,
+        fecha_hora__lt=fin_rango,
+        estado__in=ESTADOS_OCUPAN_AGENDA,
+    ).values_list('fecha_hora', 'dentista_id', 'sala_id', 'tipo_servicio__duracion_estimada')
+
+    for fecha_hora, dentista_id, sala_id, duracion in citas:
+        local = timezone.localtime(fecha_hora)
+        minuto_inicio = local.hour * 60 + local.minute
+        minuto_fin = minuto_inicio + (duracion or duracion_servicio(None))
+        afectados = set(dentistas_por_sala.get(sala_id, ()))
+        if dentista_id in salas_por_dentista:
+            afectados.add(dentista_id)
+        for afectado in afectados:
+            mapa = mapas.get((afectado, local.date()))
+            if mapa is not None:
+                mapa.ocupar(minuto_inicio, minuto_fin)
+    return mapas
+
+
+def buscar_horas_disponibles(fecha_desde, fecha_hasta, tipo_servicio=None, duracion_minutos=None,
+                             dentistas=None, limite=20, cursor=None):
+    """
+    Busca las próximas horas libres calculadas desde los horarios de los dentistas.
+
+    Las citas 'disponible' ya insertadas ocupan su tramo igual que una reserva, de
+    modo que una hora calculada nunca se solapa con una hora publicada a mano. El
+    panel del paciente muestra ambas; la API las separa (api_citas_disponibles
+    para las publicadas, api_horas_disponibles para las calculadas).
+
+    Args:
+        fecha_desde: date inicial (inclusive)
+        fecha_hasta: date final (inclusive)
+        tipo_servicio: TipoServicio cuya duración se usa (opcional)
+        duracion_minutos: Duración de la hora; por defecto la del servicio
+        dentistas: Iterable de Perfil a considerar; por defecto todos los dentistas activos
+        limite: Cantidad máxima de horas a retornar
+        cursor: Cursor entregado por una búsqueda anterior para continuar desde ahí
+
+    Returns:
+        dict: {'horas': [{'inicio', 'fin', 'dentista'}...], 'siguiente_cursor': str o None}
+    """
+    from personal.models import Perfil
+
+    if duracion_minutos is None:
+        duracion_minutos = duracion_servicio(tipo_servicio)
+    tramos_duracion = _tramo_desde_minutos(duracion_minutos, redondear_arriba=True)
+
+    if dentistas is None:
+        dentistas = Perfil.objects.filter(rol='dentista', activo=True)
+    dentistas_por_id = {d.id: d for d in dentistas}
+    dentista_ids = sorted(dentistas_por_id)
+    salas_por_dentista = {d.id: getattr(d, 'sala_asignada_id', None) for d in dentistas_por_id.values()}
+
+    desde_cursor = None
+    if cursor:
+        desde_cursor = decodificar_cursor(cursor)
+        fecha_desde = max(fecha_desde, timezone.localtime(desde_cursor[0]).date())
+
+    ahora = timezone.localtime()
+    fecha_desde = max(fecha_desde, ahora.date())
+
+    horas = []
+    if not dentista_ids or tramos_duracion <= 0 or limite <= 0:
+        return {'horas': horas, 'siguiente_cursor': None}
+
+    horarios = _cargar_horarios(dentista_ids)
+    ventana_desde = fecha_desde
+    while ventana_desde <= fecha_hasta and len(horas) <= limite:
+        ventana_hasta = min(ventana_desde + timedelta(days=DIAS_POR_VENTANA - 1), fecha_hasta)
+        mapas = construir_mapas(salas_por_dentista, ventana_desde, ventana_hasta, horarios)
+
+        fecha = ventana_desde
+        while fecha <= ventana_hasta and len(horas) <= limite:
+            tramo_minimo = 0
+            if fecha == ahora.date():
+                tramo_minimo = _tramo_desde_minutos(ahora.hour * 60 + ahora.minute + 1, redondear_arriba=True)
+
+            aperturas_dia = []
+            for dentista_id in dentista_ids:
+                mapa = mapas.get((dentista_id, fecha))
+                if mapa is None:
+                    continue
+                for tramo in mapa.aperturas(tramos_duracion, tramo_minimo):
+                    inicio = _inicio_tramo(fecha, tramo)
+                    if desde_cursor and (inicio, dentista_id) <= desde_cursor:
+                        continue
+                    aperturas_dia.append((inicio, dentista_id))
+
+            for inicio, dentista_id in sorted(aperturas_dia):
+                horas.append({
+                    'inicio': inicio,
+                    'fin': inicio + timedelta(minutes=duracion_minutos),
+                    'dentista': dentistas_por_id[dentista_id],
+                })
+                if len(horas) > limite:
+                    break
+            fecha += timedelta(days=1)
+        ventana_desde = ventana_hasta + timedelta(days=1)
+
+    # Se busca una hora de más para saber si existe una página siguiente
+    siguiente_cursor = None
+    if len(horas) > limite:
+        horas = horas[:limite]
+        ultima = horas[-1]
+        siguiente_cursor = codificar_cursor(ultima['inicio'], ultima['dentista'].id)
+    return {'horas': horas, 'siguiente_cursor': siguiente_cursor}
+
+
+def hora_dentro_de_horario(dentista, fecha_hora, duracion_minutos):
+    """
+    Indica si [fecha_hora, fecha_hora + duración) cae dentro de un bloque activo
+    del horario del dentista y está alineada a la granularidad del motor.
+    """
+    local = timezone.localtime(fecha_hora)
+    minuto_inicio = local.hour * 60 + local.minute
+    if local.second or local.microsecond or minuto_inicio % GRANULARIDAD_MINUTOS:
+        return False
+    tramo = minuto_inicio // GRANULARIDAD_MINUTOS
+    tramos_duracion = _tramo_desde_minutos(duracion_minutos, redondear_arriba=True)
+
+    mapa = MapaDia()
+    for hora_inicio, hora_fin in HorarioDentista.objects.filter(
+        dentista=dentista, dia_semana=local.weekday(), activo=True
+    ).values_list('hora_inicio', 'hora_fin'):
+        mapa.agregar_bloque(hora_inicio, hora_fin)
+    bits = _rango_bits(tramo, tramo + tramos_duracion)
+    return bool(bits) and mapa.trabajo & bits == bits
@@ -1,18 +1,28 @@
 """
 Servicio de correo electrónico para gestion_clinica
-Envía notificaciones por correo cuando se agendan o cancelan citas
+Envía notificaciones por correo cuando se agendan o cancelan citas.
+Los correos se dejan en la bandeja de salida (correos_service) y los envía el
+comando procesar_correos, así la reserva no espera al servidor SMTP.
 """
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.template.loader import get_template
 from django.utils import timezone
 import pytz
 import logging
 
+from citas.correos_service import encolar_correo
+
 logger = logging.getLogger(__name__)
 
 
-def _obtener_info_clinica():
+# Clave y duración de la copia en caché de la información de la clínica
+CLAVE_CACHE_INFO_CLINICA = 'email_service:info_clinica'
+SEGUNDOS_CACHE_INFO_CLINICA = 300
+
+
+def _leer_info_clinica():
     """
     Obtiene la información de la clínica desde el modelo InformacionClinica.
     Retorna un diccionario con los datos o valores por defecto.
@@ -35,6 +45,7 @@ def _obtener_info_clinica():
     except Exception as e:
         logger.warning(f"No se pudo obtener información de la clínica: {e}")
         return {
+            'por_defecto': True,
             'nombre': getattr(settings, 'CLINIC_NAME', "Clínica Dental San Felipe"),
             'direccion': getattr(settings, 'CLINIC_ADDRESS', ""),
             'telefono': getattr(settings, 'CLINIC_PHONE', ""),
@@ -45,15 +56,55 @@ def _obtener_info_clinica():
         }
 
 
-def enviar_email_confirmacion_cita(cita):
+def obtener_info_clinica():
+    """
+    Copia de la información de la clínica para los correos.
+    
+    Se lee de la base de datos una vez y se guarda en caché; la señal post_save de
+    InformacionClinica (citas/signals.py) la invalida cuando se edita. Si la lectura
+    falla se usan los valores por defecto sin guardarlos en caché.
+    """
+    info_clinica = cache.get(CLAVE_CACHE_INFO_CLINICA)
+    if info_clinica is None:
+        info_clinica = _leer_info_clinica()
+        if not info_clinica.pop('por_defecto', False):
+            cache.set(CLAVE_CACHE_INFO_CLINICA, info_clinica, SEGUNDOS_CACHE_INFO_CLINICA)
+    return info_clinica
+
+
+def invalidar_info_clinica():
+    """Descarta la copia en caché de la información de la clínica"""
+    cache.delete(CLAVE_CACHE_INFO_CLINICA)
+
+
+def renderizar_correo(plantilla, contexto):
+    """
+    Renderiza un correo desde sus plantillas `<plantilla>.txt` y `<plantilla>.html`.
+    
+    get_template usa el loader en caché de Django, así que cada plantilla se compila
+    una sola vez por proceso y los envíos siguientes solo la renderizan.
+    
+    Args:
+        plantilla: Ruta de las plantillas sin extensión, por ejemplo 'citas/emails/cita_confirmada'
+        contexto: dict con las variables de las plantillas
+    
+    Returns:
+        Tupla (texto_plano, html)
+    """
+    texto_plano = get_template(f'{plantilla}.txt').render(contexto).strip()
+    html = get_template(f'{plantilla}.html').render(contexto)
+    return texto_plano, html
+
+
+def construir_email_confirmacion_cita(cita):
     """
-    Envía notificación de confirmación de cita por correo electrónico.
+    Arma el correo de confirmación de una cita.
     
     Args:
         cita: Objeto Cita del modelo
     
     Returns:
-        bool: True si se envió exitosamente, False en caso contrario
+        EmailMultiAlternatives, o None si la cita no tiene email
     """
     # Obtener email de forma segura
     email_paciente = None
@@ -75,10 +126,10 @@ def enviar_email_confirmacion_cita(cita):
     
     if not email_paciente:
         logger.warning(f"No hay email del paciente para enviar notificación de confirmación (Cita ID: {cita.id}). Campos disponibles: paciente_email={getattr(cita, 'paciente_email', None)}, cliente={cita.cliente if hasattr(cita, 'cliente') else None}")
-        return False
+        return None
     
     # Obtener información de la clínica
-    info_clinica = _obtener_info_clinica()
+    info_clinica = obtener_info_clinica()
     
     # Obtener nombre del dentista de forma segura
     dentista_nombre = ""
@@ -192,220 +243,79 @@ def enviar_email_confirmacion_cita(cita):
                     else:
                         fecha_hora_chile = fecha_hora_original.astimezone(chile_tz)
         
-        logger.info(f"[DEBUG] Conversión de timezone para email cita {cita.id}: Original={fecha_hora_original} (naive={timezone.is_naive(fecha_hora_original)}, tzinfo={fecha_hora_original.tzinfo if not timezone.is_naive(fecha_hora_original) else 'naive'}, USE_TZ={getattr(settings, 'USE_TZ', False)}), Chile={fecha_hora_chile}, Hora={fecha_hora_chile.strftime('%H:%M')}")
+        logger.debug(f"[DEBUG] Conversión de timezone para email cita {cita.id}: Original={fecha_hora_original} (naive={timezone.is_naive(fecha_hora_original)}, tzinfo={fecha_hora_original.tzinfo if not timezone.is_naive(fecha_hora_original) else 'naive'}, USE_TZ={getattr(settings, 'USE_TZ', False)}), Chile={fecha_hora_chile}, Hora={fecha_hora_chile.strftime('%H:%M')}")
     except Exception as e:
         logger.warning(f"Error al convertir zona horaria: {e}. Usando fecha original.")
         import traceback
         logger.error(traceback.format_exc())
         fecha_hora_chile = cita.fecha_hora
     
-    # Construir mensaje HTML
-    logger.info(f"[DEBUG] Intentando renderizar template de CONFIRMACIÓN para cita {cita.id}")
-    try:
-        # Intentar renderizar el template, primero con la ruta normal, luego con ruta absoluta si falla
-        try:
-            logger.info(f"[DEBUG] Intentando renderizar 'citas/emails/cita_confirmada.html' para cita {cita.id}")
-            mensaje_html = render_to_string('citas/emails/cita_confirmada.html', {
-                'cliente_nombre': paciente_nombre,
-                'fecha_cita': fecha_hora_chile.strftime('%d/%m/%Y'),
-                'hora_cita': fecha_hora_chile.strftime('%H:%M'),
-                'dentista_nombre': dentista_nombre,
-                'servicio_nombre': servicio_nombre,
-                'precio_texto': precio_texto,
-                'nombre_clinica': nombre_clinica,
-                'direccion_clinica': info_clinica['direccion'],
-                'telefono_clinica': info_clinica['telefono'],
-                'email_clinica': info_clinica['email'],
-                'horario_clinica': info_clinica['horario'],
-                'map_url': map_url,
-            })
-        except Exception as template_error:
-            # Si falla, intentar con ruta absoluta
-            logger.warning(f"Error al renderizar template con ruta relativa: {template_error}. Intentando con ruta absoluta.")
-            import os
-            # Buscar el template en la ruta absoluta de gestion_clinica
-            # Intentar múltiples rutas posibles
-            # Buscar el template en múltiples ubicaciones posibles
-            posibles_rutas = []
-            
-            # Ruta 1: Desde el directorio de gestion_clinica (cuando se llama desde cliente_web)
-            # El archivo está en: gestion_clinica/citas/email_service.py
-            # El template está en: gestion_clinica/citas/templates/citas/emails/cita_confirmada.html
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            posibles_rutas.append(os.path.join(base_dir, 'citas', 'templates', 'citas', 'emails', 'cita_confirmada.html'))
-            
-            # Ruta 2: Desde el directorio actual usando rutas relativas
-            posibles_rutas.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'citas', 'templates', 'citas', 'emails', 'cita_confirmada.html'))
-            
-            # Ruta 3: Buscar en el directorio padre del proyecto (si estamos en cliente_web)
-            # El proyecto está en: Proyecto gestion clinica dental/
-            # gestion_clinica está en: Proyecto gestion clinica dental/gestion_clinica/
-            proyecto_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-            posibles_rutas.append(os.path.join(proyecto_dir, 'gestion_clinica', 'citas', 'templates', 'citas', 'emails', 'cita_confirmada.html'))
-            
-            template_encontrado = False
-            for template_path in posibles_rutas:
-                template_path = os.path.normpath(template_path)
-                logger.info(f"[DEBUG] Intentando encontrar template en: {template_path}")
-                if os.path.exists(template_path):
-                    logger.info(f"[DEBUG] Template encontrado en: {template_path}")
-                    try:
-                        # Leer el archivo directamente y renderizarlo con Django
-                        from django.template import Template, Context
-                        from django.template.loader import get_template
-                        from django.conf import settings as django_settings
-                        
-                        # Intentar agregar el directorio del template a los DIRS de templates
-                        template_dir = os.path.dirname(template_path)
-                        template_name = 'citas/emails/cita_confirmada.html'
-                        
-                        # Agregar el directorio padre de templates a DIRS si no está
-                        if hasattr(django_settings, 'TEMPLATES') and django_settings.TEMPLATES:
-                            for template_config in django_settings.TEMPLATES:
-                                if 'DIRS' in template_config:
-                                    # Agregar el directorio que contiene 'citas/templates'
-                                    templates_base_dir = os.path.dirname(template_dir)  # Esto es 'citas/templates'
-                                    templates_parent_dir = os.path.dirname(templates_base_dir)  # Esto es 'citas'
-                                    if templates_parent_dir not in template_config['DIRS']:
-                                        template_config['DIRS'].insert(0, templates_parent_dir)
-                        
-                        # Intentar usar render_to_string con el nombre del template
-                        try:
-                            mensaje_html = render_to_string(template_name, {
-                                'cliente_nombre': paciente_nombre,
-                                'fecha_cita': fecha_hora_chile.strftime('%d/%m/%Y'),
-                                'hora_cita': fecha_hora_chile.strftime('%H:%M'),
-                                'dentista_nombre': dentista_nombre,
-                                'servicio_nombre': servicio_nombre,
-                                'precio_texto': precio_texto,
-                                'nombre_clinica': nombre_clinica,
-                                'direccion_clinica': info_clinica['direccion'],
-                                'telefono_clinica': info_clinica['telefono'],
-                                'email_clinica': info_clinica['email'],
-                                'horario_clinica': info_clinica['horario'],
-                                'map_url': map_url,
-                            })
-                            template_encontrado = True
-                            logger.info(f"[DEBUG] Template renderizado exitosamente usando render_to_string")
-                            break
-                        except Exception as e2:
-                            # Si falla, leer el archivo directamente
-                            logger.warning(f"Error al usar render_to_string: {e2}. Leyendo archivo directamente.")
-                            with open(template_path, 'r', encoding='utf-8') as f:
-                                template_content = f.read()
-                            template = Template(template_content)
-                            mensaje_html = template.render(Context({
-                                'cliente_nombre': paciente_nombre,
-                                'fecha_cita': fecha_hora_chile.strftime('%d/%m/%Y'),
-                                'hora_cita': fecha_hora_chile.strftime('%H:%M'),
-                                'dentista_nombre': dentista_nombre,
-                                'servicio_nombre': servicio_nombre,
-                                'precio_texto': precio_texto,
-                                'nombre_clinica': nombre_clinica,
-                                'direccion_clinica': info_clinica['direccion'],
-                                'telefono_clinica': info_clinica['telefono'],
-                                'email_clinica': info_clinica['email'],
-                                'horario_clinica': info_clinica['horario'],
-                                'map_url': map_url,
-                            }))
-                            template_encontrado = True
-                            logger.info(f"[DEBUG] Template renderizado exitosamente leyendo archivo directamente")
-                            break
-                    except Exception as e:
-                        logger.warning(f"Error al renderizar template desde {template_path}: {e}")
-                        import traceback
-                        logger.error(traceback.format_exc())
-                        continue
-            
-            if not template_encontrado:
-                logger.error(f"No se pudo encontrar el template en ninguna de las rutas: {posibles_rutas}")
-                raise template_error
-    except Exception as e:
-        logger.warning(f"No se pudo renderizar template HTML, usando texto plano: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        # Fallback a texto plano (usar fecha_hora_chile que ya fue calculada)
-        mensaje_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px; background: #f0fdfa; border-left: 4px solid #14b8a6;">
-                <h2 style="color: #14b8a6; margin-top: 0;">{nombre_clinica}</h2>
-                <p>Hola {paciente_nombre}!</p>
-                <p>Gracias por reservar tu cita con nosotros. Tu cita ha sido agendada exitosamente.</p>
-                <div style="background: white; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #64748b; margin-top: 0;">Información de tu Cita:</h3>
-                    <p><strong>Fecha:</strong> {fecha_hora_chile.strftime('%d/%m/%Y')}</p>
-                    <p><strong>Hora:</strong> {fecha_hora_chile.strftime('%H:%M')}</p>
-                    {f'<p><strong>Dentista:</strong> {dentista_nombre}</p>' if dentista_nombre else ''}
-                    {f'<p><strong>Servicio:</strong> {servicio_nombre}</p>' if servicio_nombre else ''}
-                    {f'<p><strong>Precio:</strong> {precio_texto}</p>' if precio_texto else ''}
-                </div>
-                <p>Recomendación: Llega 10 minutos antes para facilitar la atención.</p>
-                {f'<p><strong>Dirección:</strong> {info_clinica["direccion"]}</p>' if info_clinica['direccion'] else ''}
-                {f'<p><strong>Contacto:</strong> {info_clinica["telefono"]}</p>' if info_clinica['telefono'] else ''}
-                {f'<p><strong>Email:</strong> {info_clinica["email"]}</p>' if info_clinica['email'] else ''}
-                <p style="margin-top: 30px; color: #64748b; font-size: 0.9em;">Saludos,<br>{nombre_clinica}</p>
-            </div>
-        </body>
-        </html>
-        """
-    
-    # Crear el email
+    # Renderizar HTML y texto plano con las plantillas compiladas (loader en caché)
+    contexto = {
+        'cliente_nombre': paciente_nombre,
+        'fecha_cita': fecha_hora_chile.strftime('%d/%m/%Y'),
+        'hora_cita': fecha_hora_chile.strftime('%H:%M'),
+        'dentista_nombre': dentista_nombre,
+        'servicio_nombre': servicio_nombre,
+        'precio_texto': precio_texto,
+        'nombre_clinica': nombre_clinica,
+        'direccion_clinica': info_clinica['direccion'],
+        'telefono_clinica': info_clinica['telefono'],
+        'email_clinica': info_clinica['email'],
+        'horario_clinica': info_clinica['horario'],
+        'map_url': map_url,
+    }
+    texto_plano, mensaje_html = renderizar_correo('citas/emails/cita_confirmada', contexto)
+    
+    # Crear el email con EmailMultiAlternatives: texto plano como cuerpo y HTML como alternativa
     asunto = f"Confirmación de Cita - {nombre_clinica}"
     email_clinica = info_clinica['email'] or getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
-    
-    try:
-        # Crear el email con EmailMultiAlternatives para asegurar que se envíe como HTML
-        # Proporcionar versión de texto plano como fallback
-        texto_plano = f"""
-Confirmación de Cita - {nombre_clinica}
-
-Hola {paciente_nombre}!
-
-Gracias por reservar tu cita con nosotros. Tu cita ha sido agendada exitosamente.
+    email = EmailMultiAlternatives(
+        subject=asunto,
+        body=texto_plano,
+        from_email=email_clinica,
+        to=[email_paciente],
+    )
+    email.attach_alternative(mensaje_html, "text/html")
+    return email
 
-INFORMACIÓN DE TU CITA:
-Fecha: {fecha_hora_chile.strftime('%d/%m/%Y')}
-Hora: {fecha_hora_chile.strftime('%H:%M')}
-{f'Dentista: {dentista_nombre}' if dentista_nombre else ''}
-{f'Servicio: {servicio_nombre}' if servicio_nombre else ''}
-{f'Precio: {precio_texto}' if precio_texto else ''}
 
-Recomendación: Llega 10 minutos antes para facilitar la atención.
-
-Saludos,
-{nombre_clinica}
-        """
-        
-        email = EmailMultiAlternatives(
-            subject=asunto,
-            body=texto_plano.strip(),  # Versión de texto plano
-            from_email=email_clinica,
-            to=[email_paciente],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
+def enviar_email_confirmacion_cita(cita):
+    """
+    Deja en la bandeja de salida la notificación de confirmación de cita.
+    
+    Args:
+        cita: Objeto Cita del modelo
+    
+    Returns:
+        bool: True si el correo quedó en la bandeja de salida, False en caso contrario
+    """
+    try:
+        email = construir_email_confirmacion_cita(cita)
+        if email is None:
+            return False
         
-        # Enviar email
-        email.send(fail_silently=False)
-        logger.info(f"Correo de confirmación enviado exitosamente a {email_paciente} para cita {cita.id}")
+        # Encolar el email (lo envía el comando procesar_correos)
+        encolar_correo(email, origen='confirmacion_cita')
+        logger.info(f"Correo de confirmación encolado para {email.to[0]} (cita {cita.id})")
         return True
         
     except Exception as e:
-        logger.error(f"Error al enviar correo de confirmación a {email_paciente} para cita {cita.id}: {e}")
+        logger.error(f"Error al encolar correo de confirmación (cita {cita.id}): {e}")
         import traceback
         logger.error(traceback.format_exc())
         return False
 
 
-def enviar_email_cancelacion_cita(cita):
+def construir_email_cancelacion_cita(cita):
     """
-    Envía notificación de cancelación de cita por correo electrónico.
+    Arma el correo de cancelación de una cita.
     
     Args:
         cita: Objeto Cita del modelo
     
     Returns:
-        bool: True si se envió exitosamente, False en caso contrario
+        EmailMultiAlternatives, o None si la cita no tiene email
     """
     # Obtener email de forma segura
     email_paciente = None
@@ -424,10 +334,10 @@ def enviar_email_cancelacion_cita(cita):
     
     if not email_paciente:
         logger.warning(f"No hay email del paciente para enviar notificación de cancelación (Cita ID: {cita.id})")
-        return False
+        return None
     
     # Obtener información de la clínica
-    info_clinica = _obtener_info_clinica()
+    info_clinica = obtener_info_clinica()
     
     # Obtener nombre del dentista de forma segura
     dentista_nombre = ""
@@ -496,93 +406,63 @@ def enviar_email_cancelacion_cita(cita):
                 # Está en otra zona, convertir a Chile
                 fecha_hora_chile = fecha_hora_original.astimezone(chile_tz)
         
-        logger.info(f"[DEBUG] Conversión de timezone para email cancelación cita {cita.id}: Original={fecha_hora_original}, Chile={fecha_hora_chile}, Hora={fecha_hora_chile.strftime('%H:%M')}")
+        logger.debug(f"[DEBUG] Conversión de timezone para email cancelación cita {cita.id}: Original={fecha_hora_original}, Chile={fecha_hora_chile}, Hora={fecha_hora_chile.strftime('%H:%M')}")
     except Exception as e:
         logger.warning(f"Error al convertir zona horaria: {e}. Usando fecha original.")
         import traceback
         logger.error(traceback.format_exc())
         fecha_hora_chile = cita.fecha_hora
     
-    # Construir mensaje HTML
-    try:
-        mensaje_html = render_to_string('citas/emails/cita_cancelada.html', {
-            'cliente_nombre': paciente_nombre,
-            'fecha_cita': fecha_hora_chile.strftime('%d/%m/%Y'),
-            'hora_cita': fecha_hora_chile.strftime('%H:%M'),
-            'dentista_nombre': dentista_nombre,
-            'servicio_nombre': servicio_nombre,
-            'nombre_clinica': nombre_clinica,
-            'direccion_clinica': info_clinica['direccion'],
-            'telefono_clinica': info_clinica['telefono'],
-            'email_clinica': info_clinica['email'],
-        })
-    except Exception as e:
-        logger.warning(f"No se pudo renderizar template HTML, usando texto plano: {e}")
-        # Fallback a texto plano (usar fecha_hora_chile que ya fue calculada)
-        mensaje_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px; background: #f0fdfa; border-left: 4px solid #14b8a6;">
-                <h2 style="color: #14b8a6; margin-top: 0;">{nombre_clinica}</h2>
-                <p>Hola {paciente_nombre},</p>
-                <p>Te informamos que tu cita ha sido cancelada.</p>
-                <div style="background: white; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #64748b; margin-top: 0;">Información de la Cita Cancelada:</h3>
-                    <p><strong>Fecha:</strong> {fecha_hora_chile.strftime('%d/%m/%Y')}</p>
-                    <p><strong>Hora:</strong> {fecha_hora_chile.strftime('%H:%M')}</p>
-                    {f'<p><strong>Dentista:</strong> {dentista_nombre}</p>' if dentista_nombre else ''}
-                    {f'<p><strong>Servicio:</strong> {servicio_nombre}</p>' if servicio_nombre else ''}
-                </div>
-                <p>Si fue un error o deseas reagendar, por favor contáctanos.</p>
-                {f'<p><strong>Contacto:</strong> {info_clinica["telefono"]}</p>' if info_clinica['telefono'] else ''}
-                {f'<p><strong>Email:</strong> {info_clinica["email"]}</p>' if info_clinica['email'] else ''}
-                <p style="margin-top: 30px; color: #64748b; font-size: 0.9em;">Saludos,<br>{nombre_clinica}</p>
-            </div>
-        </body>
-        </html>
-        """
-    
-    # Crear el email
+    # Renderizar HTML y texto plano con las plantillas compiladas (loader en caché)
+    contexto = {
+        'cliente_nombre': paciente_nombre,
+        'fecha_cita': fecha_hora_chile.strftime('%d/%m/%Y'),
+        'hora_cita': fecha_hora_chile.strftime('%H:%M'),
+        'dentista_nombre': dentista_nombre,
+        'servicio_nombre': servicio_nombre,
+        'nombre_clinica': nombre_clinica,
+        'direccion_clinica': info_clinica['direccion'],
+        'telefono_clinica': info_clinica['telefono'],
+        'email_clinica': info_clinica['email'],
+        'horario_clinica': info_clinica['horario'],
+    }
+    texto_plano, mensaje_html = renderizar_correo('citas/emails/cita_cancelada', contexto)
+    
+    # Crear el email con EmailMultiAlternatives: texto plano como cuerpo y HTML como alternativa
     asunto = f"Cancelación de Cita - {nombre_clinica}"
     email_clinica = info_clinica['email'] or getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
-    
-    try:
-        # Crear el email con EmailMultiAlternatives para asegurar que se envíe como HTML
-        # Proporcionar versión de texto plano como fallback
-        texto_plano = f"""
-Cancelación de Cita - {nombre_clinica}
-
-Hola {paciente_nombre},
-
-Te informamos que tu cita ha sido cancelada.
+    email = EmailMultiAlternatives(
+        subject=asunto,
+        body=texto_plano,
+        from_email=email_clinica,
+        to=[email_paciente],
+    )
+    email.attach_alternative(mensaje_html, "text/html")
+    return email
 
-INFORMACIÓN DE LA CITA CANCELADA:
-Fecha: {fecha_hora_chile.strftime('%d/%m/%Y')}
-Hora: {fecha_hora_chile.strftime('%H:%M')}
-{f'Dentista: {dentista_nombre}' if dentista_nombre else ''}
-{f'Servicio: {servicio_nombre}' if servicio_nombre else ''}
 
-Si fue un error o deseas reagendar, por favor contáctanos.
-
-Saludos,
-{nombre_clinica}
-        """
-        
-        email = EmailMultiAlternatives(
-            subject=asunto,
-            body=texto_plano.strip(),  # Versión de texto plano
-            from_email=email_clinica,
-            to=[email_paciente],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
+def enviar_email_cancelacion_cita(cita):
+    """
+    Deja en la bandeja de salida la notificación de cancelación de cita.
+    
+    Args:
+        cita: Objeto Cita del modelo
+    
+    Returns:
+        bool: True si el correo quedó en la bandeja de salida, False en caso contrario
+    """
+    try:
+        email = construir_email_cancelacion_cita(cita)
+        if email is None:
+            return False
         
-        # Enviar email
-        email.send(fail_silently=False)
-        logger.info(f"Correo de cancelación enviado exitosamente a {email_paciente} para cita {cita.id}")
+        # Encolar el email (lo envía el comando procesar_correos)
+        encolar_correo(email, origen='cancelacion_cita')
+        logger.info(f"Correo de cancelación encolado para {email.to[0]} (cita {cita.id})")
         return True
         
     except Exception as e:
-        logger.error(f"Error al enviar correo de cancelación a {email_paciente} para cita {cita.id}: {e}")
+        logger.error(f"Error al encolar correo de cancelación (cita {cita.id}): {e}")
         import traceback
         logger.error(traceback.format_exc())
         return False
@@ -0,0 +1,486 @@
+"""
+Servicio de estadísticas compartido por los dashboards.
+
+Los dashboards (inicio, reportes, estadísticas y finanzas) necesitan muchos conteos
+y sumas sobre las mismas tablas: uno por estado, uno por rango de fechas, uno por
+mes, uno por día de la semana... En lugar de una consulta .count() por cada cifra,
+este módulo arma una sola consulta con agregados condicionales (Count/Sum con
+filter=Q) y agrupa las series por mes o día de la semana en una consulta agrupada.
+
+También mantiene la tabla EstadisticaDiaria (resumen por día, dentista, servicio y
+estado) que usan los reportes para no recorrer todo el historial de citas: cada
+cambio suma o resta su aporte a las filas afectadas (registrar_cambios_citas,
+registrar_cambio_movimiento) y recalcular_rango reconstruye días completos.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateTimeField, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, ExtractWeekDay, NullIf, TruncDate, TruncMonth
+from django.utils import timezone
+
+from citas.models import BloqueoEstadisticaDiaria, Cita, EstadisticaDiaria, TipoServicio
+from finanzas.models import EgresoManual, IngresoManual
+
+logger = logging.getLogger(__name__)
+
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+MESES_NOMBRES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+                 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+
+
+def limites_mes(fecha):
+    """Primer y último día del mes de la fecha indicada"""
+    inicio = fecha.replace(day=1)
+    fin = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return inicio, fin
+
+
+def inicio_del_dia(fecha):
+    """Datetime timezone-aware de las 00:00 (hora local) de la fecha"""
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def q_fechas(campo, desde=None, hasta=None):
+    """
+    Q para un DateTimeField entre dos fechas locales (ambas inclusive).
+
+    Equivale a campo__date__gte / campo__date__lte, pero compara el campo directamente
+    contra los límites del día, por lo que la base de datos puede usar el índice.
+    """
+    condicion = Q()
+    if desde is not None:
+        condicion &= Q(**{f'{campo}__gte': inicio_del_dia(desde)})
+    if hasta is not None:
+        condicion &= Q(**{f'{campo}__lt': inicio_del_dia(hasta + timedelta(days=1))})
+    return condicion
+
+
+def contar(queryset, **condiciones):
+    """
+    Cuenta varias condiciones en una sola consulta.
+
+    Args:
+        queryset: QuerySet base
+        **condiciones: nombre=Q con la condición de cada conteo (Q() cuenta todas las filas)
+
+    Returns:
+        dict nombre -> cantidad
+    """
+    agregados = {
+        nombre: Count('id', filter=condicion) if condicion else Count('id')
+        for nombre, condicion in condiciones.items()
+    }
+    return queryset.aggregate(**agregados)
+
+
+def sumar(queryset, campo, **condiciones):
+    """
+    Suma un campo bajo varias condiciones en una sola consulta.
+
+    Args:
+        queryset: QuerySet base
+        campo: Campo (o expresión) a sumar
+        **condiciones: nombre=Q con la condición de cada suma (Q() suma todas las filas)
+
+    Returns:
+        dict nombre -> suma (0 si no hay filas)
+    """
+    agregados = {
+        nombre: Sum(campo, filter=condicion) if condicion else Sum(campo)
+        for nombre, condicion in condiciones.items()
+    }
+    return {nombre: valor or 0 for nombre, valor in queryset.aggregate(**agregados).items()}
+
+
+def primeros_de_mes(hoy, cantidad):
+    """Primer día de los últimos `cantidad` meses calendario (incluido el actual), del más antiguo al más reciente"""
+    meses = []
+    anio, mes = hoy.year, hoy.month
+    for _ in range(cantidad):
+        meses.append(date(anio, mes, 1))
+        mes -= 1
+        if mes == 0:
+            anio, mes = anio - 1, 12
+    meses.reverse()
+    return meses
+
+
+def serie_mensual(queryset, campo_fecha, hoy, cantidad, **agregados):
+    """
+    Agregados por mes calendario de los últimos `cantidad` meses en una sola consulta.
+
+    Args:
+        queryset: QuerySet base
+        campo_fecha: DateField o DateTimeField por el que se agrupa
+        hoy: Fecha de referencia (su mes es el último de la serie)
+        cantidad: Cantidad de meses
+        **agregados: nombre=expresión de agregación (Count, Sum...)
+
+    Returns:
+        Lista de dicts {'inicio': date, <nombre>: valor}, con ceros en los meses sin datos
+    """
+    meses = primeros_de_mes(hoy, cantidad)
+    if isinstance(queryset.model._meta.get_field(campo_fecha), DateTimeField):
+        desde = q_fechas(campo_fecha, desde=meses[0])
+    else:
+        desde = Q(**{f'{campo_fecha}__gte': meses[0]})
+
+    filas = queryset.filter(desde).annotate(
+        mes_grupo=TruncMonth(campo_fecha)
+    ).values('mes_grupo').annotate(**agregados).order_by()
+    por_mes = {(fila['mes_grupo'].year, fila['mes_grupo'].month): fila for fila in filas}
+
+    serie = []
+    for inicio in meses:
+        fila = por_mes.get((inicio.year, inicio.month), {})
+        serie.append({'inicio': inicio, **{nombre: fila.get(nombre) or 0 for nombre in agregados}})
+    return serie
+
+
+def serie_dia_semana(queryset, campo_fecha):
+    """
+    Cantidad de filas por día de la semana en una sola consulta.
+
+    Returns:
+        Lista de dicts {'dia': 'Lunes', 'total': n} de lunes a domingo
+    """
+    filas = queryset.annotate(
+        dia_grupo=ExtractWeekDay(campo_fecha)
+    ).values('dia_grupo').annotate(total=Count('id')).order_by()
+    por_dia = {fila['dia_grupo']: fila['total'] for fila in filas}
+
+    # ExtractWeekDay: 1=domingo, 2=lunes ... 7=sábado
+    return [
+        {'dia': nombre, 'total': por_dia.get((indice + 1) % 7 + 1, 0)}
+        for indice, nombre in enumerate(DIAS_SEMANA)
+    ]
+
+
+# ========== TABLA RESUMEN (EstadisticaDiaria) ==========
+
+# Monto de una cita: precio cobrado o, si no hay, el precio base del servicio
+MONTO_CITA = Coalesce(
+    NullIf('precio_cobrado', Value(0)),
+    'tipo_servicio__precio_base',
+    Value(0),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+# Estados especiales del resumen que no corresponden a citas
+ESTADOS_MANUALES = [EstadisticaDiaria.ESTADO_INGRESO_MANUAL, EstadisticaDiaria.ESTADO_EGRESO_MANUAL]
+
+# Días por lote al reconstruir rangos largos
+DIAS_POR_LOTE_RECALCULO = 31
+
+# Campos de la cita (attname) de los que depende su aporte a EstadisticaDiaria
+CAMPOS_APORTE_CITA = ('fecha_hora', 'dentista_id', 'tipo_servicio_id', 'estado', 'precio_cobrado')
+
+
+def valores_cita(cita):
+    """
+    Valores de la cita de los que depende su aporte a EstadisticaDiaria.
+
+    Incluye el precio base del servicio si la cita ya lo tiene cargado, para no
+    consultarlo al calcular el monto.
+    """
+    valores = {campo: getattr(cita, campo) for campo in CAMPOS_APORTE_CITA}
+    if cita.tipo_servicio_id and Cita.tipo_servicio.is_cached(cita) and cita.tipo_servicio:
+        valores['precio_base'] = cita.tipo_servicio.precio_base
+    return valores
+
+
+def _aporte_cita(valores, precios_base):
+    """Fila (fecha, dentista, servicio, estado) de la cita y lo que suma: (cantidad_con_precio, monto)"""
+    clave = (
+        timezone.localdate(valores['fecha_hora']),
+        valores['dentista_id'],
+        valores['tipo_servicio_id'],
+        valores['estado'],
+    )
+    # Igual que MONTO_CITA: precio cobrado o, si no hay (o es 0), el precio base del servicio
+    monto = valores['precio_cobrado'] or valores.get('precio_base')
+    if not monto:
+        monto = precios_base.get(valores['tipo_servicio_id'])
+    con_precio = valores['precio_cobrado'] is not None or valores['tipo_servicio_id'] is not None
+    return clave, int(con_precio), Decimal(monto or 0)
+
+
+def _sumar_a_fila(clave, cantidad, cantidad_con_precio, monto):
+    """Suma los deltas a la fila de la clave con un UPDATE ... SET campo = campo + delta"""
+    fecha, dentista_id, tipo_servicio_id, estado = clave
+    fila = EstadisticaDiaria.objects.filter(
+        fecha=fecha, dentista_id=dentista_id, tipo_servicio_id=tipo_servicio_id, estado=estado
+    )
+    campos = {
+        'cantidad': F('cantidad') + cantidad,
+        'cantidad_con_precio': F('cantidad_con_precio') + cantidad_con_precio,
+        'monto': F('monto') + monto,
+    }
+    if fila.update(**campos):
+        return
+    if cantidad < 0:
+        # Restar de una fila que no existe: el resumen estaba desfasado
+        logger.warning(f"EstadisticaDiaria sin fila para {clave}; ejecutar reconstruir_estadisticas")
+        return
+    try:
+        with transaction.atomic():
+            EstadisticaDiaria.objects.create(
+                fecha=fecha,
+                dentista_id=dentista_id,
+                tipo_servicio_id=tipo_servicio_id,
+                estado=estado,
+                cantidad=cantidad,
+                cantidad_con_precio=cantidad_con_precio,
+                monto=monto,
+            )
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT
+        fila.update(**campos)
+
+
+def _aplicar_deltas(deltas):
+    """
+    Aplica los deltas {clave: [cantidad, cantidad_con_precio, monto]} a EstadisticaDiaria.
+
+    Corre en la transacción del cambio que los origina (se deshacen con él), dentro
+    de un savepoint: un error en el resumen no debe afectar esa operación; se
+    registra y el comando reconstruir_estadisticas permite corregirlo. Las filas se
+    actualizan en orden de clave para que dos transacciones no se bloqueen en cruz.
+    """
+    deltas = {clave: delta for clave, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    try:
+        with transaction.atomic():
+            for clave in sorted(deltas, key=lambda c: (c[0], c[1] or 0, c[2] or 0, c[3])):
+                _sumar_a_fila(clave, *deltas[clave])
+    except Exception as e:
+        logger.error(f"Error al actualizar estadísticas diarias {sorted(str(c[0]) for c in deltas)}: {str(e)}")
+
+
+def registrar_cambios_citas(cambios):
+    """
+    Actualiza EstadisticaDiaria con el cambio de una o varias citas.
+
+    Resta el aporte que tenía cada cita y suma el que tiene ahora; los aportes a la
+    misma fila se agrupan, así que una reserva (disponible → reservada) son dos
+    UPDATE y generar cientos de horas es un UPDATE o INSERT por fila.
+
+    Args:
+        cambios: Iterable de pares (antes, despues) de valores_cita(); None si la
+            cita no existía (creada) o ya no existe (eliminada)
+    """
+    cambios = [(antes, despues) for antes, despues in cambios if antes != despues]
+    sin_precio_base = {
+        valores['tipo_servicio_id']
+        for par in cambios for valores in par
+        if valores and valores['tipo_servicio_id'] and not valores['precio_cobrado'] and 'precio_base' not in valores
+    }
+    precios_base = dict(
+        TipoServicio.objects.filter(id__in=sin_precio_base).values_list('id', 'precio_base')
+    ) if sin_precio_base else {}
+
+    deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+    for antes, despues in cambios:
+        for valores, signo in ((antes, -1), (despues, 1)):
+            if valores is None:
+                continue
+            clave, con_precio, monto = _aporte_cita(valores, precios_base)
+            delta = deltas[clave]
+            delta[0] += signo
+            delta[1] += signo * con_precio
+            delta[2] += signo * monto
+    _aplicar_deltas(deltas)
+
+
+def registrar_cambio_movimiento(estado, antes, despues):
+    """
+    Actualiza EstadisticaDiaria con el cambio de un ingreso o egreso manual.
+
+    Args:
+        estado: EstadisticaDiaria.ESTADO_INGRESO_MANUAL o ESTADO_EGRESO_MANUAL
+        antes: (fecha, monto) guardados antes del cambio, o None si es nuevo
+        despues: (fecha, monto) actuales, o None si se eliminó
+    """
+    if antes == despues:
+        return
+    deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+    for valores, signo in ((antes, -1), (despues, 1)):
+        if valores is None:
+            continue
+        fecha, monto = valores
+        delta = deltas[(fecha, None, None, estado)]
+        delta[0] += signo
+        delta[1] += signo
+        delta[2] += signo * Decimal(monto or 0)
+    _aplicar_deltas(deltas)
+
+
+def soltar_relacion(campo, valor):
+    """
+    Quita las filas de EstadisticaDiaria de un dentista o servicio que se va a
+    eliminar y recalcula sus días cuando la eliminación confirma.
+
+    El SET_NULL de la eliminación dejaría esas filas con la misma clave que las
+    que ya existen sin dentista o sin servicio y chocaría con la restricción
+    única. Además, sin servicio las citas sin precio cobrado dejan de sumar su
+    precio base, así que no basta con sumar las filas a las de clave NULL: los
+    días afectados se recalculan desde las citas ya sin relación.
+
+    Args:
+        campo: 'dentista_id' o 'tipo_servicio_id'
+        valor: id del dentista o servicio que se elimina
+    """
+    filas = EstadisticaDiaria.objects.filter(**{campo: valor})
+    fechas = set(filas.values_list('fecha', flat=True))
+    if fechas:
+        filas.delete()
+        programar_recalculo(fechas)
+
+
+@transaction.atomic
+def recalcular_rango(desde, hasta):
+    """
+    Recalcula las filas de EstadisticaDiaria de los días entre desde y hasta (inclusive).
+
+    Es la reconstrucción completa (comando reconstruir_estadisticas); los cambios
+    del día a día usan registrar_cambios_citas y registrar_cambio_movimiento.
+
+    Borra las filas de esos días y las vuelve a crear con una consulta agrupada
+    por tabla (citas, ingresos manuales y egresos manuales). Antes bloquea las filas
+    de BloqueoEstadisticaDiaria de esos días, en orden de fecha, para que dos
+    recálculos del mismo día no se mezclen; las consultas se hacen ya con el
+    bloqueo tomado, por lo que ven los cambios del recálculo anterior.
+
+    Returns:
+        Cantidad de filas creadas
+    """
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    BloqueoEstadisticaDiaria.objects.bulk_create(
+        [BloqueoEstadisticaDiaria(fecha=dia) for dia in dias], ignore_conflicts=True
+    )
+    list(BloqueoEstadisticaDiaria.objects.select_for_update().filter(
+        fecha__gte=desde, fecha__lte=hasta
+    ).order_by('fecha').values_list('id', flat=True))
+
+    filas_citas = Cita.objects.filter(
+        q_fechas('fecha_hora', desde, hasta)
+    ).annotate(
+        dia=TruncDate('fecha_hora')
+    ).values('dia', 'dentista', 'tipo_servicio', 'estado').annotate(
+        total=Count('id'),
+        total_con_precio=Count('id', filter=Q(precio_cobrado__isnull=False) | Q(tipo_servicio__isnull=False)),
+        suma=Sum(MONTO_CITA),
+    ).order_by()
+
+    nuevas = [
+        EstadisticaDiaria(
+            fecha=fila['dia'],
+            dentista_id=fila['dentista'],
+            tipo_servicio_id=fila['tipo_servicio'],
+            estado=fila['estado'],
+            cantidad=fila['total'],
+            cantidad_con_precio=fila['total_con_precio'],
+            monto=fila['suma'] or 0,
+        )
+        for fila in filas_citas
+    ]
+
+    for modelo, estado in ((IngresoManual, EstadisticaDiaria.ESTADO_INGRESO_MANUAL),
+                           (EgresoManual, EstadisticaDiaria.ESTADO_EGRESO_MANUAL)):
+        filas = modelo.objects.filter(
+            fecha__gte=desde, fecha__lte=hasta
+        ).values('fecha').annotate(total=Count('id'), suma=Sum('monto')).order_by()
+        nuevas.extend(
+            EstadisticaDiaria(
+                fecha=fila['fecha'],
+                estado=estado,
+                cantidad=fila['total'],
+                cantidad_con_precio=fila['total'],
+                monto=fila['suma'] or 0,
+            )
+            for fila in filas
+        )
+
+    EstadisticaDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta).delete()
+    EstadisticaDiaria.objects.bulk_create(nuevas, batch_size=500)
+    return len(nuevas)
+
+
+def recalcular_dias(fechas):
+    """Recalcula EstadisticaDiaria para cada uno de los días indicados"""
+    for fecha in sorted({fecha for fecha in fechas if fecha}):
+        recalcular_rango(fecha, fecha)
+
+
+def recalcular_rango_por_lotes(desde, hasta):
+    """Recalcula un rango largo en lotes de días (para reconstrucciones completas)"""
+    creadas = 0
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + timedelta(days=DIAS_POR_LOTE_RECALCULO - 1), hasta)
+        creadas += recalcular_rango(inicio, fin)
+        inicio = fin + timedelta(days=1)
+    return creadas
+
+
+def dias_de_citas(citas):
+    """Días (hora local) en que caen las citas de un queryset"""
+    return set(
+        citas.annotate(dia=TruncDate('fecha_hora')).values_list('dia', flat=True).distinct().order_by()
+    )
+
+
+def programar_recalculo(fechas):
+    """
+    Recalcula los días indicados cuando la transacción actual confirma.
+
+    Solo para cambios cuyo aporte anterior no se conoce (una cita cargada sin los
+    campos de CAMPOS_APORTE_CITA) o que cambian muchas filas a la vez (eliminar un
+    dentista o servicio). Un error en el resumen no debe afectar la operación que
+    lo originó: se registra y el comando reconstruir_estadisticas permite corregirlo.
+    """
+    fechas = set(fechas)
+
+    def _recalcular():
+        try:
+            recalcular_dias(fechas)
+        except Exception as e:
+            logger.error(f"Error al recalcular estadísticas diarias {sorted(fechas)}: {str(e)}")
+
+    transaction.on_commit(_recalcular)
+
+
+def resumen_citas():
+    """QuerySet de EstadisticaDiaria solo con filas de citas (sin movimientos manuales)"""
+    return EstadisticaDiaria.objects.exclude(estado__in=ESTADOS_MANUALES)
+
+
+def contar_citas_resumen(fecha_desde, fecha_hasta, hoy, mes_anterior_inicio, mes_anterior_fin):
+    """
+    Conteos de citas de los reportes leídos del resumen diario en una sola consulta.
+
+    Returns:
+        dict con total, disponibles, reservadas, completadas, canceladas (históricos),
+        mes, completadas_mes, canceladas_mes (período), semana, hoy y mes_anterior
+    """
+    del_periodo = Q(fecha__gte=fecha_desde, fecha__lte=fecha_hasta)
+    return sumar(
+        resumen_citas(), 'cantidad',
+        total=Q(),
+        disponibles=Q(estado='disponible'),
+        reservadas=Q(estado='reservada'),
+        completadas=Q(estado='completada'),
+        canceladas=Q(estado='cancelada'),
+        mes=del_periodo,
+        semana=Q(fecha__gte=hoy - timedelta(days=7)),
+        hoy=Q(fecha=hoy),
+        completadas_mes=del_periodo & Q(estado='completada'),
+        canceladas_mes=del_periodo & Q(estado='cancelada'),
+        mes_anterior=Q(fecha__gte=mes_anterior_inicio, fecha__lte=mes_anterior_fin),
+    )
@@ -0,0 +1,182 @@
+"""
+Servicio de exportación a Excel con diseño turquesa.
+
+Los reportes se escriben con openpyxl en modo write_only: cada fila se envía al
+archivo apenas se genera y no queda en memoria, por lo que exportar todo el
+historial de citas o finanzas usa la misma memoria que exportar un mes.
+
+Los estilos se registran una sola vez por libro como NamedStyle y las celdas solo
+los referencian por nombre (en vez de crear un PatternFill/Border por celda). El
+archivo terminado se guarda en un archivo temporal (en memoria mientras es
+pequeño, en disco si crece) y se envía al navegador en bloques con FileResponse.
+"""
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+
+# Color turquesa para Excel: #14B8A6 (primary) y #0D9488 (dark)
+TURQUESA_PRIMARY = "14B8A6"
+TURQUESA_DARK = "0D9488"
+TURQUESA_LIGHT = "2DD4BF"
+TURQUESA_BG = "F0FDFA"
+
+CONTENT_TYPE_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas que se leen de la base de datos por cada consulta al recorrer el historial
+TAMANO_LOTE_EXPORTACION = 2000
+
+# Bytes que el archivo temporal mantiene en memoria antes de pasar a disco
+MAXIMO_EN_MEMORIA_BYTES = 5 * 1024 * 1024
+
+# Nombres de los estilos registrados en cada libro
+ESTILO_TITULO = 'turquesa_titulo'
+ESTILO_SUBTITULO = 'turquesa_subtitulo'
+ESTILO_ENCABEZADO = 'turquesa_encabezado'
+ESTILO_CELDA = 'turquesa_celda'
+ESTILO_CELDA_ALTERNA = 'turquesa_celda_alterna'
+ESTILO_TOTAL = 'turquesa_total'
+
+# Fila de los encabezados de columna (1: título, 2: subtítulo, 3: espacio)
+FILA_ENCABEZADOS = 4
+
+
+def _borde_turquesa():
+    lado = Side(style='thin', color='CCCCCC')
+    return Border(left=lado, right=lado, top=lado, bottom=lado)
+
+
+def _estilos_turquesa():
+    """NamedStyles del diseño turquesa (se crean por libro porque un estilo solo puede pertenecer a uno)"""
+    return [
+        NamedStyle(
+            name=ESTILO_TITULO,
+            font=Font(bold=True, size=16, color=TURQUESA_DARK),
+            alignment=Alignment(horizontal='center'),
+        ),
+        NamedStyle(
+            name=ESTILO_SUBTITULO,
+            font=Font(size=11, color="666666"),
+            alignment=Alignment(horizontal='center'),
+        ),
+        NamedStyle(
+            name=ESTILO_ENCABEZADO,
+            font=Font(color="FFFFFF", bold=True, size=12),
+            fill=PatternFill(start_color=TURQUESA_PRIMARY, end_color=TURQUESA_DARK, fill_type="solid"),
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+            border=_borde_turquesa(),
+        ),
+        NamedStyle(
+            name=ESTILO_CELDA,
+            border=_borde_turquesa(),
+        ),
+        NamedStyle(
+            name=ESTILO_CELDA_ALTERNA,
+            fill=PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid"),
+            border=_borde_turquesa(),
+        ),
+        NamedStyle(
+            name=ESTILO_TOTAL,
+            font=Font(color="FFFFFF", bold=True),
+            fill=PatternFill(start_color=TURQUESA_PRIMARY, end_color=TURQUESA_PRIMARY, fill_type="solid"),
+            border=_borde_turquesa(),
+        ),
+    ]
+
+
+def crear_libro():
+    """Libro Excel en modo write_only con los estilos turquesa registrados"""
+    libro = Workbook(write_only=True)
+    for estilo in _estilos_turquesa():
+        libro.add_named_style(estilo)
+    return libro
+
+
+class HojaExcel:
+    """
+    Hoja de reporte con diseño turquesa escrita fila por fila.
+
+    En modo write_only las filas no se pueden volver a leer ni modificar: los anchos
+    de columna y la altura del encabezado se definen al crear la hoja, y los totales
+    se deben ir acumulando mientras se escriben las filas.
+    """
+
+    def __init__(self, libro, nombre, titulo, headers, anchos, subtitulo="Clínica San Felipe"):
+        """
+        Args:
+            libro: Libro creado con crear_libro()
+            nombre: Nombre de la pestaña
+            titulo: Título principal del reporte
+            headers: Encabezados de columna
+            anchos: Ancho de cada columna
+            subtitulo: Texto antes de la fecha de generación
+        """
+        self.ws = libro.create_sheet(nombre)
+        self.fila_actual = FILA_ENCABEZADOS
+
+        for indice, ancho in enumerate(anchos, 1):
+            self.ws.column_dimensions[get_column_letter(indice)].width = ancho
+        self.ws.row_dimensions[FILA_ENCABEZADOS].height = 25
+
+        # Título y subtítulo centrados sobre las primeras 10 columnas
+        ultima_columna = get_column_letter(max(len(headers), 10))
+        self.ws.merged_cells.add(CellRange(f'A1:{ultima_columna}1'))
+        self.ws.merged_cells.add(CellRange(f'A2:{ultima_columna}2'))
+
+        fecha_gen = datetime.now().strftime("%d/%m/%Y %H:%M")
+        subtitulo = f"{subtitulo} - Generado el {fecha_gen}" if subtitulo else f"Generado el {fecha_gen}"
+        self.ws.append([self._celda(titulo, ESTILO_TITULO)])
+        self.ws.append([self._celda(subtitulo, ESTILO_SUBTITULO)])
+        self.ws.append([])
+        self._escribir(headers, ESTILO_ENCABEZADO)
+
+    def _celda(self, valor, estilo):
+        celda = WriteOnlyCell(self.ws, value=valor)
+        celda.style = estilo
+        return celda
+
+    def _escribir(self, valores, estilo):
+        self.ws.append([self._celda(valor, estilo) for valor in valores])
+        self.fila_actual += 1
+
+    def agregar_fila(self, valores):
+        """Agrega una fila de datos con bordes y fondo alternado en las filas pares"""
+        self._escribir(valores, ESTILO_CELDA_ALTERNA if self.fila_actual % 2 == 0 else ESTILO_CELDA)
+
+    def agregar_total(self, valores):
+        """Agrega, tras una fila en blanco, la fila de totales con fondo turquesa"""
+        self.ws.append([])
+        self.fila_actual += 1
+        self._escribir(valores, ESTILO_TOTAL)
+
+
+def nombre_archivo_excel(nombre_base):
+    """Nombre de descarga con fecha y hora, por ejemplo citas_20250101_0930.xlsx"""
+    return f'{nombre_base}_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
+
+
+def respuesta_excel(libro, nombre_base):
+    """
+    Guarda el libro en un archivo temporal y lo envía como descarga.
+
+    Args:
+        libro: Libro creado con crear_libro() con todas sus hojas escritas
+        nombre_base: Prefijo del nombre del archivo (se agrega la fecha y hora)
+
+    Returns:
+        FileResponse que transmite el archivo en bloques y lo cierra al terminar
+    """
+    archivo = tempfile.SpooledTemporaryFile(max_size=MAXIMO_EN_MEMORIA_BYTES)
+    libro.save(archivo)
+    archivo.seek(0)
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=nombre_archivo_excel(nombre_base),
+        content_type=CONTENT_TYPE_EXCEL,
+    )
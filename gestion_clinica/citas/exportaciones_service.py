@@ -0,0 +1,244 @@
+"""
+Servicio de exportaciones en segundo plano.
+
+Las exportaciones grandes (finanzas completas, planes de tratamiento, PDFs de
+inventario y estadísticas) pueden tardar más que el timeout del worker web. En
+lugar de generarlas dentro de la petición, la vista crea un TrabajoExportacion y
+el comando procesar_exportaciones lo genera aparte, usando la misma base de datos
+como cola (sin broker externo). El navegador consulta el progreso y descarga el
+archivo cuando está listo.
+
+Uso:
+    trabajo = encolar_exportacion('excel_finanzas', perfil, {'tipo': 'ingresos'})
+    # ... en el worker:
+    trabajo = tomar_siguiente_trabajo()
+    ejecutar_trabajo(trabajo)
+"""
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.core.files import File
+from django.urls import reverse
+from django.utils import timezone
+
+from citas.models import TrabajoExportacion
+
+logger = logging.getLogger(__name__)
+
+# Horas que se conserva el archivo generado antes de eliminarlo
+VIGENCIA_EXPORTACION_HORAS = 24
+
+# Minutos tras los cuales un trabajo en 'procesando' se da por interrumpido (el worker se cayó)
+MINUTOS_TRABAJO_INTERRUMPIDO = 30
+
+ESTADOS_EN_CURSO = ['pendiente', 'procesando']
+
+
+# ========== GENERADORES ==========
+# Cada generador escribe el archivo en `archivo` y retorna el nombre con el que se descarga.
+# Se importan dentro de la función para no cargar las vistas al importar el servicio.
+
+def _generar_excel_finanzas(trabajo, archivo, progreso):
+    from citas.excel_service import nombre_archivo_excel
+    from citas.views_reportes import construir_excel_finanzas
+    libro, nombre_base = construir_excel_finanzas(trabajo.parametros.get('tipo', ''), progreso)
+    libro.save(archivo)
+    return nombre_archivo_excel(nombre_base)
+
+
+def _generar_excel_planes_tratamiento(trabajo, archivo, progreso):
+    from citas.excel_service import nombre_archivo_excel
+    from citas.views_reportes import construir_excel_planes_tratamiento
+    libro = construir_excel_planes_tratamiento(progreso)
+    libro.save(archivo)
+    return nombre_archivo_excel('planes_tratamiento')
+
+
+def _generar_pdf_insumos(trabajo, archivo, progreso):
+    from citas.pdf_service import construir_pdf_insumos, preparar_para_pdf
+    from inventario.models import Insumo
+    insumos = preparar_para_pdf('insumos', Insumo.objects.order_by('categoria', 'nombre'))
+    return construir_pdf_insumos(insumos, archivo, trabajo.solicitado_por.nombre_completo, progreso)
+
+
+def _generar_pdf_estadisticas(trabajo, archivo, progreso):
+    from citas.views_reportes import construir_pdf_estadisticas
+    return construir_pdf_estadisticas(archivo, progreso)
+
+
+GENERADORES = {
+    'excel_finanzas': _generar_excel_finanzas,
+    'excel_planes_tratamiento': _generar_excel_planes_tratamiento,
+    'pdf_insumos': _generar_pdf_insumos,
+    'pdf_estadisticas': _generar_pdf_estadisticas,
+}
+
+
+# ========== COLA ==========
+
+def encolar_exportacion(tipo, perfil, parametros=None):
+    """
+    Crea un trabajo de exportación pendiente.
+
+    Si el mismo usuario ya tiene en curso una exportación igual, retorna esa en vez
+    de crear otra (evita que varios clics generen el mismo archivo varias veces).
+
+    Args:
+        tipo: Clave de GENERADORES
+        perfil: Perfil que solicita la exportación
+        parametros: dict con las opciones de la exportación (opcional)
+
+    Returns:
+        TrabajoExportacion
+
+    Raises:
+        ValueError: si el tipo de exportación no existe
+    """
+    if tipo not in GENERADORES:
+        raise ValueError(f'Tipo de exportación no válido: {tipo}')
+
+    parametros = parametros or {}
+    en_curso = TrabajoExportacion.objects.filter(
+        tipo=tipo,
+        solicitado_por=perfil,
+        estado__in=ESTADOS_EN_CURSO,
+        parametros=parametros,
+    ).first()
+    if en_curso:
+        return en_curso
+
+    return TrabajoExportacion.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        solicitado_por=perfil,
+        mensaje='En cola',
+    )
+
+
+def tomar_siguiente_trabajo():
+    """
+    Reserva el trabajo pendiente más antiguo para este worker.
+
+    El paso de 'pendiente' a 'procesando' es un UPDATE condicional: si otro worker
+    tomó el mismo trabajo primero, el UPDATE no afecta filas y se prueba con el
+    siguiente.
+
+    Returns:
+        TrabajoExportacion en estado 'procesando', o None si la cola está vacía
+    """
+    while True:
+        candidato = TrabajoExportacion.objects.filter(
+            estado='pendiente'
+        ).order_by('creado_el', 'id').values_list('id', flat=True).first()
+        if candidato is None:
+            return None
+
+        tomados = TrabajoExportacion.objects.filter(id=candidato, estado='pendiente').update(
+            estado='procesando',
+            iniciado_el=timezone.now(),
+            progreso=0,
+            mensaje='Iniciando',
+        )
+        if tomados:
+            return TrabajoExportacion.objects.select_related('solicitado_por').get(id=candidato)
+
+
+def ejecutar_trabajo(trabajo):
+    """
+    Genera el archivo de un trabajo ya tomado y lo guarda en media.
+
+    El progreso se guarda con UPDATE directos (solo cuando cambia el porcentaje) para
+    que la vista de estado lo vea mientras el archivo se genera.
+
+    Returns:
+        True si el archivo se generó, False si hubo un error
+    """
+    ultimo_porcentaje = [-1]
+
+    def progreso(porcentaje, mensaje=''):
+        porcentaje = max(0, min(int(porcentaje), 99))
+        if porcentaje == ultimo_porcentaje[0]:
+            return
+        ultimo_porcentaje[0] = porcentaje
+        TrabajoExportacion.objects.filter(id=trabajo.id).update(progreso=porcentaje, mensaje=mensaje[:255])
+
+    try:
+        # Archivo temporal en disco: el archivo completo nunca queda en la memoria del worker
+        with tempfile.TemporaryFile() as archivo:
+            nombre = GENERADORES[trabajo.tipo](trabajo, archivo, progreso)
+            archivo.seek(0)
+            trabajo.archivo.save(nombre, File(archivo), save=False)
+
+        ahora = timezone.now()
+        trabajo.estado = 'completado'
+        trabajo.progreso = 100
+        trabajo.mensaje = 'Archivo listo'
+        trabajo.finalizado_el = ahora
+        trabajo.expira_el = ahora + timedelta(hours=VIGENCIA_EXPORTACION_HORAS)
+        trabajo.save(update_fields=['archivo', 'estado', 'progreso', 'mensaje', 'finalizado_el', 'expira_el'])
+        return True
+    except Exception as e:
+        logger.error(f"Error al generar exportación #{trabajo.id} ({trabajo.tipo}): {str(e)}")
+        ahora = timezone.now()
+        trabajo.estado = 'error'
+        trabajo.mensaje = f'Error al generar el archivo: {str(e)}'[:255]
+        trabajo.finalizado_el = ahora
+        trabajo.expira_el = ahora + timedelta(hours=VIGENCIA_EXPORTACION_HORAS)
+        trabajo.save(update_fields=['estado', 'mensaje', 'finalizado_el', 'expira_el'])
+        return False
+
+
+def marcar_trabajos_interrumpidos():
+    """
+    Marca como error los trabajos que quedaron en 'procesando' porque el worker se detuvo.
+
+    Returns:
+        Cantidad de trabajos marcados
+    """
+    ahora = timezone.now()
+    return TrabajoExportacion.objects.filter(
+        estado='procesando',
+        iniciado_el__lt=ahora - timedelta(minutes=MINUTOS_TRABAJO_INTERRUMPIDO),
+    ).update(
+        estado='error',
+        mensaje='La exportación se interrumpió. Vuelve a solicitarla.',
+        finalizado_el=ahora,
+        expira_el=ahora + timedelta(hours=VIGENCIA_EXPORTACION_HORAS),
+    )
+
+
+def limpiar_exportaciones_vencidas():
+    """
+    Elimina los trabajos vencidos y sus archivos en media.
+
+    Returns:
+        Cantidad de trabajos eliminados
+    """
+    eliminados = 0
+    for trabajo in TrabajoExportacion.objects.filter(expira_el__lt=timezone.now()).iterator():
+        try:
+            if trabajo.archivo:
+                trabajo.archivo.delete(save=False)
+            trabajo.delete()
+            eliminados += 1
+        except Exception as e:
+            logger.error(f"Error al eliminar exportación vencida #{trabajo.id}: {str(e)}")
+    return eliminados
+
+
+def datos_trabajo(trabajo):
+    """dict JSON con el estado de un trabajo para la vista de progreso"""
+    datos = {
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'tipo_display': trabajo.get_tipo_display(),
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'mensaje': trabajo.mensaje,
+        'url_estado': reverse('estado_exportacion', args=[trabajo.id]),
+        'url_descarga': None,
+    }
+    if trabajo.estado == 'completado' and trabajo.archivo:
+        datos['url_descarga'] = reverse('descargar_exportacion', args=[trabajo.id])
+    return datos
@@ -0,0 +1,131 @@
+"""
+Servicio de las firmas dibujadas de los consentimientos informados.
+
+Las firmas hechas en el canvas llegan como data URL base64 y se guardaban tal
+cual en firma_paciente/firma_testigo (TextField): cada listado de
+consentimientos traía esos textos de decenas de KB y cada exportación a PDF
+volvía a decodificar, aplanar, escalar y recodificar la imagen.
+
+Ahora, al firmar, guardar_imagenes_firma() decodifica la firma una sola vez y
+guarda dos PNG optimizados: el original (firma_*_imagen) y la versión ya escalada
+al tamaño del PDF (firma_*_pdf). El campo de texto queda vacío, o con la firma
+escrita si el paciente firmó con su nombre. El PDF solo referencia el archivo
+escalado.
+
+Los consentimientos firmados antes de este cambio se convierten con el comando
+migrar_firmas_consentimientos, o la primera vez que se exportan.
+"""
+import base64
+import binascii
+import logging
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de la firma en el PDF: 2.5 x 0.8 pulgadas a 96 DPI (resolución del canvas)
+DPI_FIRMA = 96
+ANCHO_PDF_PX = int(2.5 * DPI_FIRMA)
+ALTO_PDF_PX = int(0.8 * DPI_FIRMA)
+
+# Base64 sin prefijo data: (firmas antiguas); las firmas escritas como texto nunca son tan largas
+BASE64_RE = re.compile(r'^[A-Za-z0-9+/=\s]{200,}$')
+
+# Firmantes con firma dibujada: prefijo de los campos del modelo
+FIRMANTES = ('firma_paciente', 'firma_testigo')
+
+
+def es_firma_dibujada(valor):
+    """True si el valor de firma_paciente/firma_testigo es una imagen en base64"""
+    if not valor or not isinstance(valor, str):
+        return False
+    return valor.startswith('data:image') or bool(BASE64_RE.match(valor))
+
+
+def _decodificar(valor):
+    """Imagen RGB sobre fondo blanco a partir del base64, o None si no es una imagen válida"""
+    datos = valor.split(',', 1)[1] if valor.startswith('data:image') and ',' in valor else valor
+    try:
+        imagen = Image.open(BytesIO(base64.b64decode(datos)))
+        imagen.load()
+    except (binascii.Error, ValueError, UnidentifiedImageError, OSError):
+        return None
+
+    # El canvas entrega PNG con fondo transparente: aplanar sobre blanco
+    if imagen.mode in ('RGBA', 'LA', 'P'):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.split()[-1])
+        return fondo
+    return imagen.convert('RGB')
+
+
+def _escalada_pdf(imagen):
+    """Reduce la firma para que quepa en ANCHO_PDF_PX x ALTO_PDF_PX manteniendo la proporción"""
+    ancho, alto = imagen.size
+    ratio = min(ANCHO_PDF_PX / ancho, ALTO_PDF_PX / alto, 1)
+    if ratio < 1:
+        imagen = imagen.resize((max(int(ancho * ratio), 1), max(int(alto * ratio), 1)), Image.Resampling.LANCZOS)
+    return imagen
+
+
+def _png(imagen):
+    buffer = BytesIO()
+    imagen.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def guardar_imagenes_firma(consentimiento):
+    """
+    Convierte las firmas dibujadas del consentimiento en archivos PNG.
+
+    No guarda el consentimiento: el llamador lo guarda (por ejemplo junto con el
+    resto de los datos de la firma) usando los campos retornados si usa update_fields.
+    Las firmas que no son imágenes (texto) no se tocan.
+
+    Returns:
+        Lista de campos modificados
+    """
+    modificados = []
+    for campo in FIRMANTES:
+        valor = getattr(consentimiento, campo)
+        if not es_firma_dibujada(valor):
+            continue
+        imagen = _decodificar(valor)
+        if imagen is None:
+            logger.warning(f"Firma no válida en {campo} del consentimiento {consentimiento.id}; se mantiene como texto")
+            continue
+
+        nombre = f'consentimiento_{consentimiento.id or "nuevo"}_{campo}'
+        getattr(consentimiento, f'{campo}_imagen').save(f'{nombre}.png', ContentFile(_png(imagen)), save=False)
+        getattr(consentimiento, f'{campo}_pdf').save(f'{nombre}_pdf.png', ContentFile(_png(_escalada_pdf(imagen))), save=False)
+        setattr(consentimiento, campo, '')
+        modificados += [campo, f'{campo}_imagen', f'{campo}_pdf']
+    return modificados
+
+
+def asegurar_imagenes_firma(consentimiento):
+    """
+    Convierte y guarda las firmas de un consentimiento firmado antes de este cambio.
+
+    Returns:
+        True si se convirtió alguna firma
+    """
+    modificados = guardar_imagenes_firma(consentimiento)
+    if modificados:
+        consentimiento.save(update_fields=modificados)
+    return bool(modificados)
+
+
+def consentimientos_con_firma_en_base64():
+    """QuerySet de los consentimientos que aún guardan alguna firma dibujada como texto"""
+    from historial_clinico.models import ConsentimientoInformado
+
+    filtro = Q()
+    for campo in FIRMANTES:
+        filtro |= Q(**{f'{campo}__startswith': 'data:image'}) | Q(**{f'{campo}__regex': BASE64_RE.pattern})
+    return ConsentimientoInformado.objects.filter(filtro)
@@ -0,0 +1,103 @@
+"""
+Benchmark del armado de correos (sin enviarlos ni encolarlos).
+
+Arma N veces cada correo transaccional con una cita en memoria y reporta el
+costo del primer mensaje (plantillas sin compilar y datos de la clínica sin
+caché) frente al promedio de los siguientes, junto con las consultas a la base
+de datos por mensaje. Sirve para comprobar que el costo por mensaje se mantiene
+bajo cuando se envían muchos correos seguidos (recordatorios, confirmaciones).
+
+No escribe en la base de datos.
+
+Uso:
+    python manage.py benchmark_correos
+    python manage.py benchmark_correos --iteraciones 1000
+"""
+
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from citas.email_service import (
+    construir_email_cancelacion_cita,
+    construir_email_confirmacion_cita,
+    invalidar_info_clinica,
+    obtener_info_clinica,
+    renderizar_correo,
+)
+from citas.models import Cita
+from citas.recordatorios_service import cargar_plantillas_recordatorio, construir_recordatorio
+
+
+def _vaciar_cache_plantillas():
+    """Descarta las plantillas compiladas del loader en caché para medir el primer mensaje"""
+    for motor in engines.all():
+        if not hasattr(motor, 'engine'):
+            continue
+        for loader in motor.engine.template_loaders:
+            if hasattr(loader, 'reset'):
+                loader.reset()
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo por mensaje de armar los correos de citas a partir de las plantillas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iteraciones',
+            type=int,
+            default=200,
+            help='Mensajes a armar por tipo de correo (por defecto: 200)',
+        )
+
+    def handle(self, *args, **options):
+        iteraciones = options['iteraciones']
+        if iteraciones < 2:
+            raise CommandError('Se necesitan al menos 2 iteraciones')
+
+        # Cita en memoria (sin guardar): no hay relaciones que cargar
+        cita = Cita(
+            id=0,
+            fecha_hora=timezone.now().replace(second=0, microsecond=0) + timedelta(days=1),
+            estado='reservada',
+            paciente_nombre='Paciente Benchmark',
+            paciente_email='paciente@benchmark.example.com',
+            tipo_consulta='Control',
+            precio_cobrado=Decimal('25000'),
+        )
+
+        casos = [
+            ('Confirmación', lambda: construir_email_confirmacion_cita(cita)),
+            ('Cancelación', lambda: construir_email_cancelacion_cita(cita)),
+            ('Recordatorio', lambda: construir_recordatorio(cita, cargar_plantillas_recordatorio(), obtener_info_clinica())),
+            ('Documentos tratamiento', lambda: renderizar_correo('citas/emails/documentos_tratamiento', {
+                'cliente_nombre': cita.nombre_paciente,
+                'plan_nombre': 'Plan de Benchmark',
+                'total_consentimientos': 2,
+                'nombre_clinica': obtener_info_clinica()['nombre'],
+            })),
+        ]
+
+        self.stdout.write(f'{"Correo":<24} {"Primero (ms)":>13} {"Promedio (ms)":>14} {"Consultas/msg":>14}')
+        for nombre, armar in casos:
+            _vaciar_cache_plantillas()
+            invalidar_info_clinica()
+
+            inicio = time.perf_counter()
+            armar()
+            primero = (time.perf_counter() - inicio) * 1000
+
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                for _ in range(iteraciones - 1):
+                    armar()
+                promedio = (time.perf_counter() - inicio) * 1000 / (iteraciones - 1)
+
+            por_mensaje = len(consultas.captured_queries) / (iteraciones - 1)
+            self.stdout.write(f'{nombre:<24} {primero:>13.2f} {promedio:>14.3f} {por_mensaje:>14.2f}')
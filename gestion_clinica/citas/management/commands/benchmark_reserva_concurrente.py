@@ -0,0 +1,123 @@
+"""
+Benchmark de concurrencia para el servicio de reservas.
+
+Crea una hora disponible temporal, lanza N reservas en paralelo contra ella y
+verifica que exactamente una gane. Todas usan el mismo email nuevo, así que
+también compiten por crear el Cliente: las que pierden deben terminar en
+CitaNoDisponible y no en un error. Además mide cuántas consultas hace una
+reserva sin competencia, de un paciente nuevo y de uno que ya existe. Al terminar elimina las citas y los clientes de prueba,
+los eventos en tiempo real que publicaron las reservas y recalcula el resumen
+diario (EstadisticaDiaria) de esos días.
+
+Con SQLite los escritores concurrentes pueden fallar con "database is locked";
+se reportan como errores y nunca cuentan como ganadores. En PostgreSQL los
+perdedores reciben CitaNoDisponible.
+
+Uso:
+    python manage.py benchmark_reserva_concurrente
+    python manage.py benchmark_reserva_concurrente --intentos 50
+"""
+
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from citas.estadisticas_service import recalcular_dias
+from citas.models import Cita, EventoTiempoReal
+from citas.reserva_service import reservar_cita_disponible, CitaNoDisponible
+from pacientes.models import Cliente
+
+
+class Command(BaseCommand):
+    help = 'Lanza reservas concurrentes contra una misma hora y verifica que haya un único ganador'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intentos',
+            type=int,
+            default=20,
+            help='Número de reservas simultáneas (por defecto: 20)',
+        )
+
+    def handle(self, *args, **options):
+        intentos = options['intentos']
+        if intentos < 2:
+            raise CommandError('Se necesitan al menos 2 intentos para medir concurrencia')
+
+        marca = uuid.uuid4().hex[:10]
+        dominio = f'benchmark-{marca}.example.com'
+        # Horas lejanas en el futuro para no interferir con la agenda real
+        base = timezone.now().replace(microsecond=0) + timedelta(days=3650)
+        cita_concurrente = Cita.objects.create(fecha_hora=base, estado='disponible', notas=f'benchmark {marca}')
+        citas_secuenciales = [
+            Cita.objects.create(fecha_hora=base + timedelta(minutes=minuto), estado='disponible', notas=f'benchmark {marca}')
+            for minuto in (1, 2)
+        ]
+
+        try:
+            # 1) Consultas de una reserva sin competencia: la primera crea el Cliente, la segunda lo reutiliza
+            for cita_secuencial, descripcion in zip(citas_secuenciales, ('paciente nuevo', 'paciente existente')):
+                with CaptureQueriesContext(connection) as consultas:
+                    reservar_cita_disponible(cita_secuencial.id, 'Paciente Secuencial', f'secuencial@{dominio}')
+                self.stdout.write(f'Consultas por reserva ({descripcion}): {len(consultas.captured_queries)}')
+
+            # 2) Reservas concurrentes contra la misma hora
+            barrera = threading.Barrier(intentos)
+            resultados = []
+            bloqueo = threading.Lock()
+
+            def reservar(indice):
+                try:
+                    barrera.wait()
+                    inicio = time.perf_counter()
+                    try:
+                        reservar_cita_disponible(cita_concurrente.id, f'Paciente {indice}', f'concurrente@{dominio}')
+                        resultado = 'ganador'
+                    except CitaNoDisponible:
+                        resultado = 'rechazado'
+                    except Exception as e:
+                        resultado = f'error: {e.__class__.__name__}'
+                    duracion = (time.perf_counter() - inicio) * 1000
+                    with bloqueo:
+                        resultados.append((resultado, duracion))
+                finally:
+                    connections.close_all()
+
+            hilos = [threading.Thread(target=reservar, args=(i,)) for i in range(intentos)]
+            inicio_total = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            total_ms = (time.perf_counter() - inicio_total) * 1000
+
+            ganadores = sum(1 for r, _ in resultados if r == 'ganador')
+            rechazados = sum(1 for r, _ in resultados if r == 'rechazado')
+            errores = [r for r, _ in resultados if r.startswith('error')]
+            latencias = sorted(d for _, d in resultados)
+
+            self.stdout.write(f'Intentos: {intentos} | Ganadores: {ganadores} | Rechazados: {rechazados} | Errores: {len(errores)}')
+            if errores:
+                self.stdout.write(self.style.WARNING(f'Errores: {", ".join(sorted(set(errores)))}'))
+            self.stdout.write(
+                f'Latencia p50: {latencias[len(latencias) // 2]:.1f} ms | '
+                f'máx: {latencias[-1]:.1f} ms | total: {total_ms:.1f} ms'
+            )
+
+            cita_concurrente.refresh_from_db()
+            if ganadores != 1 or cita_concurrente.estado != 'reservada':
+                raise CommandError(f'Se esperaba exactamente un ganador y hubo {ganadores}')
+            self.stdout.write(self.style.SUCCESS(f'✓ Exactamente una reserva ganó la hora ({cita_concurrente.paciente_email})'))
+        finally:
+            ids_citas = [cita_concurrente.id] + [cita.id for cita in citas_secuenciales]
+            Cita.objects.filter(id__in=ids_citas).delete()
+            Cliente.objects.filter(email__endswith=f'@{dominio}').delete()
+            # Las reservas publican eventos y recalculan el resumen diario: no dejar rastros en la base real
+            EventoTiempoReal.objects.filter(tipo='cita', datos__id__in=ids_citas).delete()
+            recalcular_dias({timezone.localdate(base), timezone.localdate(citas_secuenciales[-1].fecha_hora)})
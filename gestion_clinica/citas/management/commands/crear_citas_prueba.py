@@ -62,8 +62,8 @@ class Command(BaseCommand):
         for i, datos_cita in enumerate(citas_prueba):
             fecha_hora = base_fecha + timedelta(hours=i*2)  # Citas cada 2 horas
             
-            # Verificar que no exista ya una cita en esa fecha/hora
-            if not Cita.objects.filter(fecha_hora=fecha_hora).exists():
+            # Verificar que el dentista no tenga ya una cita en esa fecha/hora
+            if not Cita.objects.filter(fecha_hora=fecha_hora, dentista=dentista).exclude(estado='cancelada').exists():
                 cita = Cita.objects.create(
                     fecha_hora=fecha_hora,
                     paciente_nombre=datos_cita['paciente_nombre'],
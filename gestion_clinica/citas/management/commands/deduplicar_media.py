@@ -0,0 +1,75 @@
+"""
+Comando de gestión que mantiene el almacenamiento deduplicado de media.
+
+Elimina el contenido de MEDIA_ROOT/.contenido que ya no referencia ningún
+archivo (por ejemplo radiografías o documentos eliminados) y, con --existentes,
+convierte en enlaces al contenido los archivos guardados antes de activar
+AlmacenamientoDeduplicado (ver citas/almacenamiento.py).
+
+Uso:
+    # Recolección periódica (por ejemplo desde cron una vez al día)
+    python manage.py deduplicar_media
+
+    # Una vez, al activar la deduplicación en una instalación existente
+    python manage.py deduplicar_media --existentes
+
+    # Ver cuánto se liberaría sin modificar nada
+    python manage.py deduplicar_media --existentes --dry-run
+"""
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from citas.almacenamiento import AlmacenamientoDeduplicado, deduplicar_existentes, recolectar_contenido
+
+
+def _mb(cantidad_bytes):
+    return f'{cantidad_bytes / (1024 * 1024):.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Elimina el contenido de media sin referencias y deduplica los archivos existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--existentes',
+            action='store_true',
+            help='Convertir en enlaces los archivos guardados antes de activar la deduplicación'
+        )
+        parser.add_argument(
+            '--gracia',
+            type=int,
+            default=3600,
+            help='Segundos que el contenido debe llevar sin referencias antes de eliminarlo (por defecto: 3600)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Simular sin modificar archivos'
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, AlmacenamientoDeduplicado):
+            self.stdout.write(self.style.WARNING(
+                'El almacenamiento de media no es AlmacenamientoDeduplicado (MEDIA_DEDUPLICAR=False); no hay nada que hacer.'
+            ))
+            return
+
+        simular = options['dry_run']
+        prefijo = '[Simulación] ' if simular else ''
+
+        if options['existentes']:
+            revisados, duplicados, ahorrados = deduplicar_existentes(
+                default_storage,
+                excluir=(settings.SUBIDAS_DIRECTORIO,),
+                simular=simular,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'{prefijo}✓ {revisados} archivo(s) revisado(s), {duplicados} duplicado(s) enlazado(s), {_mb(ahorrados)} ahorrados'
+            ))
+
+        eliminados, liberados = recolectar_contenido(default_storage, options['gracia'], simular=simular)
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefijo}✓ {eliminados} contenido(s) sin referencias eliminado(s), {_mb(liberados)} liberados'
+        ))
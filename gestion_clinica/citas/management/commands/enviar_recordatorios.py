@@ -0,0 +1,121 @@
+"""
+Comando de gestión que envía los recordatorios de las citas del día siguiente.
+
+Lee en una sola consulta todas las citas reservadas del día, arma cada correo con
+la misma plantilla compilada y los envía por una única conexión SMTP, respetando
+un máximo de correos por minuto para no superar el límite del servidor (Gmail
+bloquea la cuenta si se envían demasiados seguidos). Cada cita queda marcada al
+enviarse, por lo que se puede volver a ejecutar sin duplicar recordatorios.
+
+Uso:
+    # Recordatorios de mañana (por ejemplo desde cron todos los días a las 18:00)
+    python manage.py enviar_recordatorios
+
+    # Recordatorios de un día específico, sin enviar nada
+    python manage.py enviar_recordatorios --fecha 2025-03-04 --simular
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from citas.email_service import obtener_info_clinica
+from citas.recordatorios_service import (
+    cargar_plantillas_recordatorio,
+    citas_para_recordar,
+    construir_recordatorio,
+    liberar_recordatorio,
+    reservar_recordatorio,
+)
+
+
+class Command(BaseCommand):
+    help = 'Envía los recordatorios por correo de las citas reservadas para mañana'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha',
+            help='Día de las citas a recordar (YYYY-MM-DD). Por defecto: mañana',
+        )
+        parser.add_argument(
+            '--por-minuto',
+            type=int,
+            default=30,
+            help='Máximo de correos por minuto (por defecto: 30)',
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Mostrar los recordatorios que se enviarían sin enviarlos ni marcar las citas',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fecha = (
+                datetime.strptime(options['fecha'], '%Y-%m-%d').date() if options['fecha']
+                else timezone.localdate() + timedelta(days=1)
+            )
+        except ValueError:
+            raise CommandError('La fecha debe tener el formato YYYY-MM-DD')
+        if options['por_minuto'] < 1:
+            raise CommandError('--por-minuto debe ser mayor que cero')
+        pausa = 60 / options['por_minuto']
+
+        citas = list(citas_para_recordar(fecha))
+        if not citas:
+            self.stdout.write(f'No hay recordatorios pendientes para el {fecha.strftime("%d/%m/%Y")}')
+            return
+
+        plantillas = cargar_plantillas_recordatorio()
+        info_clinica = obtener_info_clinica()
+
+        if options['simular']:
+            for cita in citas:
+                email = construir_recordatorio(cita, plantillas, info_clinica)
+                destino = email.to[0] if email else 'sin email'
+                self.stdout.write(f'  Cita #{cita.id} {timezone.localtime(cita.fecha_hora).strftime("%H:%M")} → {destino}')
+            self.stdout.write(self.style.WARNING(f'Simulación: {len(citas)} recordatorio(s), no se envió nada'))
+            return
+
+        conexion = get_connection(fail_silently=False)
+        try:
+            conexion.open()
+        except Exception as e:
+            raise CommandError(f'No se pudo conectar al servidor de correo: {e}')
+
+        enviados = sin_email = fallidos = 0
+        ultimo_envio = None
+        try:
+            for cita in citas:
+                email = construir_recordatorio(cita, plantillas, info_clinica, conexion)
+                if email is None:
+                    sin_email += 1
+                    continue
+                if not reservar_recordatorio(cita):
+                    # Otra ejecución ya envió este recordatorio
+                    continue
+
+                if ultimo_envio is not None:
+                    espera = pausa - (time.monotonic() - ultimo_envio)
+                    if espera > 0:
+                        time.sleep(espera)
+                ultimo_envio = time.monotonic()
+
+                try:
+                    email.send(fail_silently=False)
+                    enviados += 1
+                except Exception as e:
+                    liberar_recordatorio(cita)
+                    fallidos += 1
+                    self.stdout.write(self.style.ERROR(f'✗ Cita #{cita.id} ({email.to[0]}): {e}'))
+        finally:
+            conexion.close()
+
+        estilo = self.style.SUCCESS if not fallidos else self.style.WARNING
+        self.stdout.write(estilo(
+            f'Recordatorios del {fecha.strftime("%d/%m/%Y")}: {enviados} enviado(s), '
+            f'{fallidos} con error, {sin_email} cita(s) sin email'
+        ))
@@ -0,0 +1,121 @@
+"""
+Comando de gestión para generar horas disponibles a partir de los horarios de los dentistas.
+
+Divide los bloques de HorarioDentista de cada día del rango en horas del tamaño
+de la duración del servicio, omite las que chocan con citas existentes e inserta
+el resto en lotes dentro de una sola transacción.
+
+Uso:
+    python manage.py generar_horas_disponibles --desde 2025-12-01 --hasta 2025-12-31
+    python manage.py generar_horas_disponibles --desde 2025-12-01 --hasta 2025-12-31 --dentista 3 --dentista 5
+    python manage.py generar_horas_disponibles --desde 2025-12-01 --hasta 2025-12-31 --servicio 2 --dry-run
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.agenda_service import generar_horas_disponibles
+from citas.models import TipoServicio
+from citas.models_auditoria import registrar_auditoria
+from personal.models import Perfil
+
+
+class Command(BaseCommand):
+    help = 'Genera citas disponibles en lote a partir de los horarios de los dentistas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            required=True,
+            help='Fecha inicial (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--hasta',
+            required=True,
+            help='Fecha final, inclusive (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--dentista',
+            type=int,
+            action='append',
+            help='ID del dentista (se puede repetir). Por defecto: todos los dentistas activos',
+        )
+        parser.add_argument(
+            '--servicio',
+            type=int,
+            help='ID del tipo de servicio para las horas generadas (opcional)',
+        )
+        parser.add_argument(
+            '--duracion',
+            type=int,
+            help='Duración de cada hora en minutos (por defecto la del servicio o 30)',
+        )
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=500,
+            help='Filas por cada inserción en lote (por defecto: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué se generaría sin crear las citas',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fecha_desde = datetime.strptime(options['desde'], '%Y-%m-%d').date()
+            fecha_hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato YYYY-MM-DD')
+
+        if fecha_hasta < fecha_desde:
+            raise CommandError('La fecha final debe ser igual o posterior a la fecha inicial')
+
+        if options['duracion'] is not None and options['duracion'] <= 0:
+            raise CommandError('La duración debe ser mayor que 0 minutos')
+
+        dentistas = Perfil.objects.filter(rol='dentista', activo=True)
+        if options['dentista']:
+            dentistas = dentistas.filter(id__in=options['dentista'])
+        dentistas = list(dentistas.order_by('nombre_completo'))
+        if not dentistas:
+            raise CommandError('No se encontraron dentistas activos para generar horas')
+
+        tipo_servicio = None
+        if options['servicio']:
+            try:
+                tipo_servicio = TipoServicio.objects.get(id=options['servicio'], activo=True)
+            except TipoServicio.DoesNotExist:
+                raise CommandError(f'El servicio {options["servicio"]} no existe o está inactivo')
+
+        dry_run = options['dry_run']
+        reporte = generar_horas_disponibles(
+            dentistas,
+            fecha_desde,
+            fecha_hasta,
+            tipo_servicio=tipo_servicio,
+            duracion_minutos=options['duracion'],
+            dry_run=dry_run,
+            tamano_lote=options['tamano_lote'],
+        )
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'[DRY RUN] Se crearían {reporte["creadas"]:,} horas disponibles'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Se crearon {reporte["creadas"]:,} horas disponibles'))
+        for nombre, cantidad in reporte['por_dentista'].items():
+            self.stdout.write(f'  - {nombre}: {cantidad:,}')
+        self.stdout.write(f'Omitidas por choque con citas existentes: {reporte["omitidas_conflicto"]:,}')
+        self.stdout.write(f'Omitidas por estar en el pasado: {reporte["omitidas_pasado"]:,}')
+
+        if not dry_run and reporte['creadas']:
+            registrar_auditoria(
+                usuario=None,
+                accion='crear',
+                modulo='citas',
+                descripcion=f'Generación masiva de {reporte["creadas"]} horas disponibles',
+                detalles=f'Rango: {fecha_desde.strftime("%d/%m/%Y")} - {fecha_hasta.strftime("%d/%m/%Y")}, Dentistas: {", ".join(reporte["por_dentista"].keys())}',
+                tipo_objeto='Cita',
+            )
@@ -0,0 +1,100 @@
+"""
+Comando de gestión que genera la miniatura, la vista previa y las teselas de zoom
+de las radiografías que aún no las tienen.
+
+No se generan en la petición de la subida: el worker procesar_colas llama a
+procesar_siguiente() y toma las radiografías pendientes de a una (una subida
+nueva, una imagen reemplazada o una radiografía anterior a esta función). Una
+radiografía que falla se reintenta pasada una hora. Este comando sirve para
+procesar las pendientes de una vez o regenerar radiografías puntuales.
+
+Uso:
+    python manage.py generar_teselas_radiografias
+    python manage.py generar_teselas_radiografias --forzar --id 15
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from citas.teselas_service import generar_derivados, radiografias_sin_derivados
+from historial_clinico.models import Radiografia
+
+# Segundos antes de reintentar una radiografía cuyos derivados fallaron en el worker
+ESPERA_REINTENTO_SEGUNDOS = 3600
+
+
+class Command(BaseCommand):
+    help = 'Genera miniatura, vista previa y teselas de zoom de las radiografías pendientes'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # id de radiografía -> momento (monotonic) del último fallo en este proceso
+        self._fallidas = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Regenerar también las radiografías que ya tienen derivados vigentes',
+        )
+        parser.add_argument(
+            '--id',
+            type=int,
+            action='append',
+            dest='ids',
+            help='Procesar solo esta radiografía (se puede repetir)',
+        )
+
+    def mantencion(self):
+        # Las que fallaron hace más de ESPERA_REINTENTO_SEGUNDOS vuelven a la cola
+        limite = time.monotonic() - ESPERA_REINTENTO_SEGUNDOS
+        self._fallidas = {id_: momento for id_, momento in self._fallidas.items() if momento > limite}
+
+    def _generar(self, radiografia):
+        """Genera los derivados de una radiografía; retorna False si falló"""
+        inicio = time.monotonic()
+        try:
+            generar_derivados(radiografia)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Radiografía #{radiografia.id} ({radiografia.imagen.name}): {e}'))
+            return False
+        self.stdout.write(
+            f'  Radiografía #{radiografia.id}: {radiografia.ancho}x{radiografia.alto} '
+            f'en {time.monotonic() - inicio:.1f}s'
+        )
+        return True
+
+    def procesar_siguiente(self):
+        """Genera los derivados de la siguiente radiografía pendiente; retorna False si no había ninguna"""
+        radiografia = (
+            radiografias_sin_derivados()
+            .exclude(id__in=list(self._fallidas))
+            .order_by('id')
+            .first()
+        )
+        if radiografia is None:
+            return False
+        if not self._generar(radiografia):
+            self._fallidas[radiografia.id] = time.monotonic()
+        return True
+
+    def handle(self, *args, **options):
+        radiografias = Radiografia.objects.exclude(imagen='').order_by('id')
+        if options['ids']:
+            radiografias = radiografias.filter(id__in=options['ids'])
+
+        generadas = fallidas = omitidas = 0
+        for radiografia in radiografias.iterator():
+            if radiografia.derivados_vigentes and not options['forzar']:
+                omitidas += 1
+                continue
+            if self._generar(radiografia):
+                generadas += 1
+            else:
+                fallidas += 1
+
+        estilo = self.style.SUCCESS if not fallidas else self.style.WARNING
+        self.stdout.write(estilo(
+            f'Radiografías: {generadas} generada(s), {fallidas} con error, {omitidas} ya al día'
+        ))
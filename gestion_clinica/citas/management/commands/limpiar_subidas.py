@@ -0,0 +1,24 @@
+"""
+Comando de gestión que elimina las subidas fragmentadas vencidas.
+
+Las subidas que el navegador dejó a medias (o completó pero nunca adjuntó)
+vencen VIGENCIA_HORAS después del último fragmento; este comando borra su
+registro y el archivo temporal. También elimina los registros ya adjuntados o
+cancelados y los temporales huérfanos.
+
+Uso:
+    # Por ejemplo desde cron cada hora
+    python manage.py limpiar_subidas
+"""
+
+from django.core.management.base import BaseCommand
+
+from citas.subidas_service import limpiar_subidas_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Elimina las subidas fragmentadas vencidas y sus archivos temporales'
+
+    def handle(self, *args, **options):
+        eliminadas = limpiar_subidas_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'✓ {eliminadas} subida(s) eliminada(s)'))
@@ -0,0 +1,48 @@
+"""
+Comando de gestión que convierte las firmas en base64 de los consentimientos a PNG.
+
+Los consentimientos firmados antes de guardar las firmas como archivos tienen la
+imagen del canvas en firma_paciente/firma_testigo. Este comando las decodifica
+una vez, guarda el PNG original y el escalado para el PDF (citas/firmas_service.py)
+y vacía el texto, para que los listados no carguen esos textos ni el PDF vuelva
+a decodificarlos en cada exportación.
+
+Uso:
+    python manage.py migrar_firmas_consentimientos [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+
+from citas.firmas_service import asegurar_imagenes_firma, consentimientos_con_firma_en_base64
+
+
+class Command(BaseCommand):
+    help = 'Convierte las firmas en base64 de los consentimientos a archivos PNG'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo contar los consentimientos pendientes de convertir'
+        )
+
+    def handle(self, *args, **options):
+        pendientes = consentimientos_con_firma_en_base64()
+
+        if options['dry_run']:
+            self.stdout.write(f'[Simulación] {pendientes.count()} consentimiento(s) con firmas en base64')
+            return
+
+        convertidos = 0
+        errores = 0
+        for consentimiento in pendientes.iterator(chunk_size=50):
+            try:
+                if asegurar_imagenes_firma(consentimiento):
+                    convertidos += 1
+            except Exception as e:
+                errores += 1
+                self.stdout.write(self.style.ERROR(f'✗ Consentimiento #{consentimiento.id}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {convertidos} consentimiento(s) convertido(s)'))
+        if errores:
+            self.stdout.write(self.style.WARNING(f'{errores} consentimiento(s) con errores'))
@@ -0,0 +1,88 @@
+"""
+Comando de gestión que atiende todas las colas en segundo plano con un solo proceso.
+
+Es el worker del Procfile: en cada vuelta toma un elemento de cada cola
+(exportaciones encoladas, lotes de la bandeja de salida de correos, subidas
+fragmentadas por verificar y radiografías sin miniatura, vista previa ni
+teselas) y solo espera cuando todas están vacías. Cada cola mantiene su propio
+comando (procesar_exportaciones, procesar_correos, procesar_subidas,
+generar_teselas_radiografias) para correrla por separado si se prefiere.
+
+Uso:
+    # Worker permanente (entrada 'worker' del Procfile)
+    python manage.py procesar_colas
+
+    # Procesar lo pendiente de todas las colas y terminar
+    python manage.py procesar_colas --una-vez
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from citas.management.commands import (
+    generar_teselas_radiografias,
+    procesar_correos,
+    procesar_exportaciones,
+    procesar_subidas,
+)
+
+# Cada cuántos segundos se ejecuta la mantención de cada cola
+INTERVALO_MANTENCION_SEGUNDOS = 300
+
+
+class Command(BaseCommand):
+    help = 'Worker único que atiende todas las colas en segundo plano (exportaciones, correos, subidas y radiografías)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar lo pendiente de todas las colas y terminar'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2,
+            help='Segundos de espera cuando todas las colas están vacías (por defecto: 2)'
+        )
+
+    def _colas(self):
+        """Comandos de cada cola, con la salida de este comando"""
+        return [
+            procesar_exportaciones.Command(stdout=self.stdout, stderr=self.stderr),
+            procesar_correos.Command(stdout=self.stdout, stderr=self.stderr),
+            procesar_subidas.Command(stdout=self.stdout, stderr=self.stderr),
+            generar_teselas_radiografias.Command(stdout=self.stdout, stderr=self.stderr),
+        ]
+
+    def handle(self, *args, **options):
+        una_vez = options['una_vez']
+        intervalo = options['intervalo']
+        colas = self._colas()
+
+        for cola in colas:
+            cola.mantencion()
+        ultima_mantencion = time.monotonic()
+
+        try:
+            while True:
+                # El worker vive mucho tiempo: descartar conexiones cerradas o vencidas
+                close_old_connections()
+
+                if time.monotonic() - ultima_mantencion >= INTERVALO_MANTENCION_SEGUNDOS:
+                    for cola in colas:
+                        cola.mantencion()
+                    ultima_mantencion = time.monotonic()
+
+                # Un elemento por cola y por vuelta, para que ninguna cola espere a que otra se vacíe
+                procesados = [cola.procesar_siguiente() for cola in colas]
+                if any(procesados):
+                    continue
+
+                if una_vez:
+                    break
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Worker de colas detenido'))
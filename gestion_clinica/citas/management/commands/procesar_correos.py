@@ -0,0 +1,108 @@
+"""
+Comando de gestión que envía los correos de la bandeja de salida (CorreoSaliente).
+
+Funciona como un worker local que usa la base de datos como cola: toma los
+correos pendientes en lotes y envía cada lote por una sola conexión SMTP. Los
+correos que fallan vuelven a la cola con espera exponencial. También devuelve a
+la cola los correos que quedaron a medias si el worker se detuvo y elimina los
+correos enviados antiguos.
+
+Uso:
+    # Worker permanente (por ejemplo con systemd o supervisor)
+    python manage.py procesar_correos
+
+    # Enviar lo pendiente y terminar (por ejemplo desde cron cada minuto)
+    python manage.py procesar_correos --una-vez
+
+En el despliegue con Procfile, el worker procesar_colas atiende esta cola junto
+con las demás.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from citas.correos_service import (
+    enviar_lote,
+    limpiar_correos_enviados,
+    marcar_correos_interrumpidos,
+    tomar_lote,
+)
+
+# Cada cuántos segundos se ejecuta la limpieza de enviados e interrumpidos
+INTERVALO_MANTENCION_SEGUNDOS = 300
+
+# Cantidad máxima de correos por conexión SMTP
+TAMANO_LOTE = 50
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos encolados en lotes por una sola conexión SMTP y reintenta los fallidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Enviar los correos pendientes y terminar'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5,
+            help='Segundos de espera cuando no hay correos pendientes (por defecto: 5)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE,
+            help=f'Cantidad máxima de correos por conexión SMTP (por defecto: {TAMANO_LOTE})'
+        )
+
+    def mantencion(self):
+        interrumpidos = marcar_correos_interrumpidos()
+        eliminados = limpiar_correos_enviados()
+        if interrumpidos or eliminados:
+            self.stdout.write(
+                f'Mantención: {interrumpidos} correo(s) devuelto(s) a la cola, {eliminados} correo(s) enviado(s) eliminado(s)'
+            )
+
+    def procesar_siguiente(self, tamano_lote=TAMANO_LOTE):
+        """Envía el siguiente lote de correos pendientes; retorna False si no había ninguno"""
+        correos = tomar_lote(tamano_lote)
+        if not correos:
+            return False
+        inicio = time.monotonic()
+        enviados, fallidos = enviar_lote(correos)
+        estilo = self.style.SUCCESS if not fallidos else self.style.WARNING
+        self.stdout.write(estilo(
+            f'Lote de {len(correos)} correo(s): {enviados} enviado(s), {fallidos} con error '
+            f'en {time.monotonic() - inicio:.1f}s'
+        ))
+        return True
+
+    def handle(self, *args, **options):
+        una_vez = options['una_vez']
+        intervalo = options['intervalo']
+        tamano_lote = max(1, options['lote'])
+
+        self.mantencion()
+        ultima_mantencion = time.monotonic()
+
+        try:
+            while True:
+                # El worker vive mucho tiempo: descartar conexiones cerradas o vencidas
+                close_old_connections()
+
+                if time.monotonic() - ultima_mantencion >= INTERVALO_MANTENCION_SEGUNDOS:
+                    self.mantencion()
+                    ultima_mantencion = time.monotonic()
+
+                if self.procesar_siguiente(tamano_lote):
+                    continue
+
+                if una_vez:
+                    break
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Worker de correos detenido'))
@@ -0,0 +1,101 @@
+"""
+Comando de gestión que genera las exportaciones encoladas (TrabajoExportacion).
+
+Funciona como un worker local que usa la base de datos como cola: toma los
+trabajos pendientes de a uno, genera el archivo y lo deja en media para que el
+usuario lo descargue. También elimina los archivos vencidos y marca como error
+los trabajos que quedaron a medias si el worker se detuvo.
+
+Uso:
+    # Worker permanente (por ejemplo con systemd o supervisor)
+    python manage.py procesar_exportaciones
+
+    # Procesar lo pendiente y terminar (por ejemplo desde cron cada minuto)
+    python manage.py procesar_exportaciones --una-vez
+
+En el despliegue con Procfile, el worker procesar_colas atiende esta cola junto
+con las demás.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from citas.exportaciones_service import (
+    ejecutar_trabajo,
+    limpiar_exportaciones_vencidas,
+    marcar_trabajos_interrumpidos,
+    tomar_siguiente_trabajo,
+)
+
+# Cada cuántos segundos se ejecuta la limpieza de vencidos e interrumpidos
+INTERVALO_MANTENCION_SEGUNDOS = 300
+
+
+class Command(BaseCommand):
+    help = 'Genera las exportaciones Excel/PDF encoladas y limpia los archivos vencidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar los trabajos pendientes y terminar'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2,
+            help='Segundos de espera cuando no hay trabajos pendientes (por defecto: 2)'
+        )
+
+    def mantencion(self):
+        interrumpidos = marcar_trabajos_interrumpidos()
+        vencidos = limpiar_exportaciones_vencidas()
+        if interrumpidos or vencidos:
+            self.stdout.write(
+                f'Mantención: {interrumpidos} trabajo(s) interrumpido(s), {vencidos} exportación(es) vencida(s) eliminada(s)'
+            )
+
+    def _procesar(self, trabajo):
+        inicio = time.monotonic()
+        self.stdout.write(f'Procesando exportación #{trabajo.id} ({trabajo.get_tipo_display()})...')
+        if ejecutar_trabajo(trabajo):
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Exportación #{trabajo.id} lista en {time.monotonic() - inicio:.1f}s'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f'✗ Exportación #{trabajo.id}: {trabajo.mensaje}'))
+
+    def procesar_siguiente(self):
+        """Genera la siguiente exportación pendiente; retorna False si no había ninguna"""
+        trabajo = tomar_siguiente_trabajo()
+        if trabajo is None:
+            return False
+        self._procesar(trabajo)
+        return True
+
+    def handle(self, *args, **options):
+        una_vez = options['una_vez']
+        intervalo = options['intervalo']
+
+        self.mantencion()
+        ultima_mantencion = time.monotonic()
+
+        try:
+            while True:
+                # El worker vive mucho tiempo: descartar conexiones cerradas o vencidas
+                close_old_connections()
+
+                if time.monotonic() - ultima_mantencion >= INTERVALO_MANTENCION_SEGUNDOS:
+                    self.mantencion()
+                    ultima_mantencion = time.monotonic()
+
+                if self.procesar_siguiente():
+                    continue
+
+                if una_vez:
+                    break
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Worker de exportaciones detenido'))
@@ -0,0 +1,54 @@
+"""
+Comando de gestión que verifica las subidas fragmentadas recibidas completas.
+
+Cuando llega el último fragmento, la subida queda 'verificando': este comando
+calcula el SHA-256 del archivo completo en una sola pasada y la deja
+'completada' (o 'cancelada' si no coincide con el que informó el navegador),
+fuera de la petición del fragmento. Su mantención elimina las subidas vencidas,
+igual que limpiar_subidas.
+
+Uso:
+    python manage.py procesar_subidas
+
+En el despliegue con Procfile, el worker procesar_colas atiende esta cola junto
+con las demás.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from citas.subidas_service import limpiar_subidas_vencidas, tomar_siguiente_verificacion, verificar_subida
+
+
+class Command(BaseCommand):
+    help = 'Verifica el SHA-256 de las subidas fragmentadas completas y elimina las vencidas'
+
+    def mantencion(self):
+        eliminadas = limpiar_subidas_vencidas()
+        if eliminadas:
+            self.stdout.write(f'Mantención: {eliminadas} subida(s) vencida(s) eliminada(s)')
+
+    def procesar_siguiente(self):
+        """Verifica la siguiente subida completa; retorna False si no había ninguna"""
+        subida = tomar_siguiente_verificacion()
+        if subida is None:
+            return False
+        inicio = time.monotonic()
+        if verificar_subida(subida):
+            self.stdout.write(
+                f'  Subida {subida.identificador} ({subida.tamano_total} bytes) verificada '
+                f'en {time.monotonic() - inicio:.1f}s'
+            )
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'✗ Subida {subida.identificador}: el archivo no coincide con el original'
+            ))
+        return True
+
+    def handle(self, *args, **options):
+        verificadas = 0
+        while self.procesar_siguiente():
+            verificadas += 1
+        self.mantencion()
+        self.stdout.write(self.style.SUCCESS(f'✓ {verificadas} subida(s) verificada(s)'))
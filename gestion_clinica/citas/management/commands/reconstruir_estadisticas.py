@@ -0,0 +1,74 @@
+"""
+Comando de gestión para reconstruir la tabla de estadísticas diarias (EstadisticaDiaria).
+
+Las estadísticas se mantienen solas al guardar citas e ingresos/egresos manuales,
+pero los cambios hechos con UPDATE masivos, cargas de datos o correcciones directas
+en la base de datos no pasan por esas señales. Este comando vuelve a calcular los
+días indicados (o todo el historial) a partir de las tablas originales.
+
+Uso:
+    python manage.py reconstruir_estadisticas
+    python manage.py reconstruir_estadisticas --desde 2025-01-01 --hasta 2025-12-31
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from citas.estadisticas_service import recalcular_rango_por_lotes
+from citas.models import Cita, EstadisticaDiaria
+from finanzas.models import EgresoManual, IngresoManual
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye las estadísticas diarias de citas e ingresos/egresos manuales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            help='Fecha inicial (YYYY-MM-DD). Por defecto: el primer registro del historial',
+        )
+        parser.add_argument(
+            '--hasta',
+            help='Fecha final, inclusive (YYYY-MM-DD). Por defecto: el último registro del historial',
+        )
+
+    def _rango_historial(self):
+        """Primer y último día con datos en citas, ingresos, egresos o estadísticas"""
+        fechas = []
+        citas = Cita.objects.aggregate(minima=Min('fecha_hora'), maxima=Max('fecha_hora'))
+        if citas['minima']:
+            fechas += [timezone.localdate(citas['minima']), timezone.localdate(citas['maxima'])]
+        for modelo in (IngresoManual, EgresoManual, EstadisticaDiaria):
+            rango = modelo.objects.aggregate(minima=Min('fecha'), maxima=Max('fecha'))
+            if rango['minima']:
+                fechas += [rango['minima'], rango['maxima']]
+        if not fechas:
+            return None, None
+        return min(fechas), max(fechas)
+
+    def handle(self, *args, **options):
+        try:
+            fecha_desde = datetime.strptime(options['desde'], '%Y-%m-%d').date() if options['desde'] else None
+            fecha_hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date() if options['hasta'] else None
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato YYYY-MM-DD')
+
+        if fecha_desde is None or fecha_hasta is None:
+            primera, ultima = self._rango_historial()
+            if primera is None:
+                self.stdout.write(self.style.WARNING('No hay datos para calcular estadísticas'))
+                return
+            fecha_desde = fecha_desde or primera
+            fecha_hasta = fecha_hasta or ultima
+
+        if fecha_hasta < fecha_desde:
+            raise CommandError('La fecha final debe ser igual o posterior a la fecha inicial')
+
+        creadas = recalcular_rango_por_lotes(fecha_desde, fecha_hasta)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Estadísticas reconstruidas del {fecha_desde.strftime("%d/%m/%Y")} '
+            f'al {fecha_hasta.strftime("%d/%m/%Y")}: {creadas:,} filas'
+        ))
@@ -0,0 +1,305 @@
+"""
+Servicio de entrega de archivos de media protegidos.
+
+MEDIA_ROOT guarda radiografías, consentimientos firmados, documentos PDF de los
+pacientes y adjuntos de correos, por lo que no se puede publicar con
+django.views.static.serve. La vista servir_media pasa cada petición por
+puede_acceder_archivo(), que busca el registro dueño del archivo y aplica las
+mismas reglas que las pantallas del sistema:
+
+- Trabajadores activos: archivos clínicos (radiografías, consentimientos,
+  documentos) e imágenes de insumos.
+- Clientes: solo los archivos clínicos propios (por email del paciente o del
+  cliente asociado).
+- Adjuntos de la bandeja de salida: administrativos.
+- Exportaciones: quien las solicitó.
+- MEDIA_PUBLICA (fotos del personal e imágenes del sitio): cualquiera.
+- Cualquier otra carpeta: nadie.
+
+Una vez autorizado, la transferencia se entrega al servidor frontal según
+settings.MEDIA_SERVIDOR_FRONTAL para que Python no lea el archivo:
+
+- 'nginx': cabecera X-Accel-Redirect hacia una location interna que apunta a
+  MEDIA_ROOT, por ejemplo:
+      location /media-protegida/ {
+          internal;
+          alias /ruta/a/gestion_clinica/media/;
+      }
+- 'apache' (mod_xsendfile) o 'lighttpd': cabecera X-Sendfile con la ruta absoluta.
+- '' (sin servidor frontal, por ejemplo runserver o Render): FileResponse con
+  soporte de Range, para que el navegador pueda reanudar descargas y pedir
+  partes de los PDF.
+
+Uso:
+    if not puede_acceder_archivo(request.user, nombre):
+        raise Http404
+    return entregar_archivo(request, nombre)
+"""
+import logging
+import mimetypes
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+logger = logging.getLogger(__name__)
+
+# Rutas de media que se pueden ver sin iniciar sesión (prefijos o archivos exactos)
+MEDIA_PUBLICA = ('personal/', 'hero/', 'fondo.jpg')
+
+# Descriptores de la pirámide de teselas de las radiografías (teselas_service); el visor los lee como XML
+mimetypes.add_type('application/xml', '.dzi')
+
+# Rango de bytes "bytes=inicio-fin" (un solo rango; varios rangos se responden completos)
+RANGO_BYTES_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# ========== RUTAS ==========
+
+def normalizar_ruta_media(ruta):
+    """
+    Convierte la ruta pedida en un nombre del almacenamiento.
+
+    Returns:
+        Nombre relativo a MEDIA_ROOT, o None si la ruta sale de MEDIA_ROOT
+    """
+    nombre = posixpath.normpath((ruta or '').replace('\\', '/')).lstrip('/')
+    if not nombre or nombre == '.' or nombre == '..' or nombre.startswith('../'):
+        return None
+    return nombre
+
+
+# ========== AUTORIZACIÓN ==========
+
+def _perfil_trabajador(user):
+    """Perfil activo del trabajador, o None si el usuario no es trabajador"""
+    from personal.models import Perfil
+    return Perfil.objects.filter(user=user, activo=True).first()
+
+
+def _email_cliente(user):
+    """Email con el que el cliente ve sus documentos en el portal"""
+    from cuentas.models import PerfilCliente
+    perfil = PerfilCliente.objects.filter(user=user).only('email').first()
+    return ((perfil.email if perfil else '') or user.email or '').strip().lower()
+
+
+def _pertenece_al_cliente(email_cliente, paciente_email=None, cliente=None):
+    """True si el registro es del cliente, por email del paciente o del cliente asociado"""
+    if not email_cliente:
+        return False
+    emails = {(paciente_email or '').strip().lower(), (getattr(cliente, 'email', '') or '').strip().lower()}
+    return email_cliente in emails
+
+
+def _acceso_radiografia(user, perfil, nombre):
+    from historial_clinico.models import Radiografia
+    from citas.teselas_service import CARPETA_TESELAS
+    if nombre.startswith(f'{CARPETA_TESELAS}/'):
+        # Miniatura, vista previa y teselas: radiografias/teselas/<id>/<generación>/...
+        radiografia_id = nombre[len(CARPETA_TESELAS) + 1:].split('/', 1)[0]
+        if not radiografia_id.isdigit():
+            return False
+        radiografias = Radiografia.objects.filter(id=int(radiografia_id))
+    else:
+        radiografias = Radiografia.objects.filter(Q(imagen=nombre) | Q(imagen_anotada=nombre))
+    radiografia = radiografias.select_related('cliente').first()
+    if radiografia is None:
+        return False
+    if perfil is not None:
+        return True
+    return _pertenece_al_cliente(_email_cliente(user), radiografia.paciente_email, radiografia.cliente)
+
+
+def _acceso_consentimiento(user, perfil, nombre):
+    from historial_clinico.models import ConsentimientoInformado
+    consentimiento = ConsentimientoInformado.objects.filter(
+        Q(archivo_pdf=nombre) | Q(documento_firmado_fisico=nombre)
+        | Q(firma_paciente_imagen=nombre) | Q(firma_paciente_pdf=nombre)
+        | Q(firma_testigo_imagen=nombre) | Q(firma_testigo_pdf=nombre)
+    ).select_related('cliente').first()
+    if consentimiento is None:
+        return False
+    if perfil is not None:
+        return True
+    return _pertenece_al_cliente(_email_cliente(user), cliente=consentimiento.cliente)
+
+
+def _acceso_documento(user, perfil, nombre):
+    from historial_clinico.models import DocumentoCliente
+    documento = DocumentoCliente.objects.filter(archivo_pdf=nombre).select_related('cliente').first()
+    if documento is None:
+        return False
+    if perfil is not None:
+        return True
+    return _pertenece_al_cliente(_email_cliente(user), cliente=documento.cliente)
+
+
+def _acceso_adjunto_correo(user, perfil, nombre):
+    from citas.models import AdjuntoCorreo
+    return perfil is not None and perfil.es_administrativo() and AdjuntoCorreo.objects.filter(archivo=nombre).exists()
+
+
+def _acceso_exportacion(user, perfil, nombre):
+    from citas.models import TrabajoExportacion
+    return perfil is not None and TrabajoExportacion.objects.filter(archivo=nombre, solicitado_por=perfil).exists()
+
+
+def _acceso_insumo(user, perfil, nombre):
+    return perfil is not None
+
+
+# Carpeta de media → regla de acceso (según upload_to de cada modelo)
+REGLAS_ACCESO = (
+    ('radiografias/', _acceso_radiografia),
+    ('consentimientos/', _acceso_consentimiento),
+    ('documentos/', _acceso_documento),
+    ('correos/', _acceso_adjunto_correo),
+    ('exportaciones/', _acceso_exportacion),
+    ('insumos/', _acceso_insumo),
+)
+
+
+def es_media_publica(nombre):
+    """True si el archivo se puede servir sin iniciar sesión"""
+    return any(nombre == publico or (publico.endswith('/') and nombre.startswith(publico)) for publico in MEDIA_PUBLICA)
+
+
+def puede_acceder_archivo(user, nombre):
+    """
+    Indica si el usuario puede descargar un archivo de media.
+
+    Los archivos que no pertenecen a ninguna carpeta conocida se niegan.
+
+    Args:
+        user: Usuario de la petición (puede ser anónimo)
+        nombre: Nombre del archivo relativo a MEDIA_ROOT (normalizar_ruta_media)
+
+    Returns:
+        bool
+    """
+    if es_media_publica(nombre):
+        return True
+    if not user.is_authenticated:
+        return False
+
+    for prefijo, regla in REGLAS_ACCESO:
+        if nombre.startswith(prefijo):
+            return regla(user, _perfil_trabajador(user), nombre)
+    return False
+
+
+# ========== ENTREGA ==========
+
+def _rango_solicitado(cabecera, tamano):
+    """
+    Interpreta la cabecera Range.
+
+    Returns:
+        None si se debe enviar el archivo completo, (inicio, fin) inclusivo,
+        o False si el rango no se puede satisfacer (416)
+    """
+    coincidencia = RANGO_BYTES_RE.match((cabecera or '').strip())
+    if not coincidencia:
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # "bytes=-500": los últimos 500 bytes
+        largo = int(fin)
+        if largo == 0:
+            return False
+        return max(tamano - largo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def _leer_tramo(archivo, inicio, largo, bloque):
+    """Genera el contenido de un tramo del archivo y lo cierra al terminar"""
+    try:
+        archivo.seek(inicio)
+        while largo > 0:
+            datos = archivo.read(min(bloque, largo))
+            if not datos:
+                break
+            largo -= len(datos)
+            yield datos
+    finally:
+        archivo.close()
+
+
+def _respuesta_con_rango(request, nombre, as_attachment, filename):
+    """FileResponse del archivo completo, o 206/416 si el navegador pidió un rango"""
+    archivo = default_storage.open(nombre, 'rb')
+    tamano = archivo.size
+    rango = _rango_solicitado(request.headers.get('Range'), tamano) if request.method in ('GET', 'HEAD') else None
+
+    if rango is None:
+        respuesta = FileResponse(archivo, as_attachment=as_attachment, filename=filename)
+    elif rango is False:
+        archivo.close()
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f'bytes */{tamano}'
+        return respuesta
+    else:
+        inicio, fin = rango
+        respuesta = StreamingHttpResponse(
+            _leer_tramo(archivo, inicio, fin - inicio + 1, FileResponse.block_size),
+            status=206,
+            content_type=mimetypes.guess_type(nombre)[0] or 'application/octet-stream',
+        )
+        respuesta['Content-Length'] = str(fin - inicio + 1)
+        respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+        if disposicion := content_disposition_header(as_attachment, filename):
+            respuesta['Content-Disposition'] = disposicion
+    respuesta['Accept-Ranges'] = 'bytes'
+    return respuesta
+
+
+def entregar_archivo(request, nombre, as_attachment=False, filename=''):
+    """
+    Respuesta que entrega un archivo de media ya autorizado.
+
+    Args:
+        request: Petición HTTP (para la cabecera Range)
+        nombre: Nombre del archivo relativo a MEDIA_ROOT
+        as_attachment: Forzar descarga en vez de mostrarlo en el navegador
+        filename: Nombre sugerido al descargar (por defecto el del archivo)
+
+    Returns:
+        HttpResponse, o None si el archivo no existe
+    """
+    filename = filename or posixpath.basename(nombre)
+    try:
+        if not default_storage.exists(nombre):
+            return None
+    except SuspiciousFileOperation:
+        return None
+
+    servidor = (getattr(settings, 'MEDIA_SERVIDOR_FRONTAL', '') or '').lower()
+    if servidor in ('nginx', 'apache', 'lighttpd'):
+        respuesta = HttpResponse(content_type=mimetypes.guess_type(nombre)[0] or 'application/octet-stream')
+        if disposicion := content_disposition_header(as_attachment, filename):
+            respuesta['Content-Disposition'] = disposicion
+        if servidor == 'nginx':
+            prefijo = getattr(settings, 'MEDIA_PREFIJO_INTERNO', '/media-protegida/').rstrip('/')
+            respuesta['X-Accel-Redirect'] = f'{prefijo}/{quote(nombre)}'
+            return respuesta
+        try:
+            respuesta['X-Sendfile'] = default_storage.path(nombre)
+            return respuesta
+        except NotImplementedError:
+            # Almacenamiento remoto: no hay ruta en disco para el servidor frontal
+            logger.warning("MEDIA_SERVIDOR_FRONTAL requiere almacenamiento en disco; se sirve desde Django")
+
+    return _respuesta_con_rango(request, nombre, as_attachment, filename)
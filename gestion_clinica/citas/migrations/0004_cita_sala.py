@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0003_initial'),
+        ('historial_clinico', '0003_cambiar_cascade_a_set_null_para_preservar_historial'),
+        ('pacientes', '0001_initial'),
+        ('personal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='sala',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='citas', to='citas.sala', verbose_name='Sala'),
+        ),
+    ]
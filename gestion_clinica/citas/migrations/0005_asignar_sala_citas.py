@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:04
+
+from django.db import migrations
+
+
+def asignar_sala_de_dentista(apps, schema_editor):
+    """Asigna a las citas existentes la sala asignada a su dentista"""
+    Cita = apps.get_model('citas', 'Cita')
+    Perfil = apps.get_model('personal', 'Perfil')
+    for dentista_id, sala_id in Perfil.objects.filter(sala_asignada__isnull=False).values_list('id', 'sala_asignada_id'):
+        Cita.objects.filter(dentista_id=dentista_id, sala__isnull=True).update(sala_id=sala_id)
+
+
+class Migration(migrations.Migration):
+    # Migración separada de la que agrega la columna y de la que crea las restricciones:
+    # en PostgreSQL, actualizar filas y luego alterar la tabla en la misma transacción
+    # falla con "pending trigger events" (la FK sala_id es DEFERRABLE)
+
+    dependencies = [
+        ('citas', '0004_cita_sala'),
+    ]
+
+    operations = [
+        migrations.RunPython(asignar_sala_de_dentista, migrations.RunPython.noop),
+    ]
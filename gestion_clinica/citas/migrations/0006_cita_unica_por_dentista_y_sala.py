@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0005_asignar_sala_citas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cita',
+            name='fecha_hora',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['fecha_hora'], name='citas_cita_fecha_h_fd1701_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['dentista', 'fecha_hora'], name='citas_cita_dentist_8a82c5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['sala', 'fecha_hora'], name='citas_cita_sala_id_d74715_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'cancelada'), _negated=True), fields=('dentista', 'fecha_hora'), name='cita_unica_dentista_fecha_hora'),
+        ),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'cancelada'), _negated=True), fields=('sala', 'fecha_hora'), name='cita_unica_sala_fecha_hora'),
+        ),
+    ]
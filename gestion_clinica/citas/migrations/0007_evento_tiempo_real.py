@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0006_cita_unica_por_dentista_y_sala'),
+        ('personal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoTiempoReal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cita', 'Cambio de Cita'), ('mensaje', 'Nuevo Mensaje')], max_length=20, verbose_name='Tipo')),
+                ('datos', models.JSONField(default=dict, verbose_name='Datos')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+                ('destinatario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='eventos_tiempo_real', to='personal.perfil', verbose_name='Destinatario')),
+            ],
+            options={
+                'verbose_name': 'Evento en Tiempo Real',
+                'verbose_name_plural': 'Eventos en Tiempo Real',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['creado_el'], name='citas_event_creado__7d1730_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncDate
+
+
+def construir_estadisticas_iniciales(apps, schema_editor):
+    """Llena EstadisticaDiaria con el historial existente de citas e ingresos/egresos manuales"""
+    Cita = apps.get_model('citas', 'Cita')
+    EstadisticaDiaria = apps.get_model('citas', 'EstadisticaDiaria')
+    IngresoManual = apps.get_model('finanzas', 'IngresoManual')
+    EgresoManual = apps.get_model('finanzas', 'EgresoManual')
+
+    monto_cita = Coalesce(
+        NullIf('precio_cobrado', Value(0)),
+        'tipo_servicio__precio_base',
+        Value(0),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    filas = Cita.objects.annotate(dia=TruncDate('fecha_hora')).values(
+        'dia', 'dentista', 'tipo_servicio', 'estado'
+    ).annotate(
+        total=Count('id'),
+        total_con_precio=Count('id', filter=Q(precio_cobrado__isnull=False) | Q(tipo_servicio__isnull=False)),
+        suma=Sum(monto_cita),
+    ).order_by()
+    nuevas = [
+        EstadisticaDiaria(
+            fecha=fila['dia'],
+            dentista_id=fila['dentista'],
+            tipo_servicio_id=fila['tipo_servicio'],
+            estado=fila['estado'],
+            cantidad=fila['total'],
+            cantidad_con_precio=fila['total_con_precio'],
+            monto=fila['suma'] or 0,
+        )
+        for fila in filas
+    ]
+    for modelo, estado in ((IngresoManual, 'ingreso_manual'), (EgresoManual, 'egreso_manual')):
+        for fila in modelo.objects.values('fecha').annotate(total=Count('id'), suma=Sum('monto')).order_by():
+            nuevas.append(EstadisticaDiaria(
+                fecha=fila['fecha'],
+                estado=estado,
+                cantidad=fila['total'],
+                cantidad_con_precio=fila['total'],
+                monto=fila['suma'] or 0,
+            ))
+    EstadisticaDiaria.objects.bulk_create(nuevas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0007_evento_tiempo_real'),
+        ('finanzas', '0001_initial'),
+        ('personal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('estado', models.CharField(max_length=20, verbose_name='Estado')),
+                ('cantidad', models.PositiveIntegerField(default=0, verbose_name='Cantidad')),
+                ('cantidad_con_precio', models.PositiveIntegerField(default=0, verbose_name='Cantidad con Precio')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+                ('dentista', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='estadisticas_diarias', to='personal.perfil', verbose_name='Dentista')),
+                ('tipo_servicio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='estadisticas_diarias', to='citas.tiposervicio', verbose_name='Tipo de Servicio')),
+            ],
+            options={
+                'verbose_name': 'Estadística Diaria',
+                'verbose_name_plural': 'Estadísticas Diarias',
+                'ordering': ['fecha'],
+                'indexes': [models.Index(fields=['fecha', 'estado'], name='citas_estad_fecha_44db07_idx')],
+            },
+        ),
+        migrations.RunPython(construir_estadisticas_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:29
+
+import citas.models_exportaciones
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0008_estadistica_diaria'),
+        ('personal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('excel_finanzas', 'Excel de Finanzas'), ('excel_planes_tratamiento', 'Excel de Planes de Tratamiento'), ('pdf_insumos', 'PDF de Inventario de Insumos'), ('pdf_estadisticas', 'PDF de Resumen de Estadísticas')], max_length=40, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('progreso', models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')),
+                ('mensaje', models.CharField(blank=True, max_length=255, verbose_name='Mensaje')),
+                ('archivo', models.FileField(blank=True, upload_to=citas.models_exportaciones.ruta_exportacion, verbose_name='Archivo')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+                ('iniciado_el', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado el')),
+                ('finalizado_el', models.DateTimeField(blank=True, null=True, verbose_name='Finalizado el')),
+                ('expira_el', models.DateTimeField(blank=True, null=True, verbose_name='Expira el')),
+                ('solicitado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_exportacion', to='personal.perfil', verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Exportación',
+                'verbose_name_plural': 'Trabajos de Exportación',
+                'ordering': ['-creado_el'],
+                'indexes': [models.Index(fields=['estado', 'creado_el'], name='citas_traba_estado_3fca5d_idx'), models.Index(fields=['expira_el'], name='citas_traba_expira__a4693e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:43
+
+import citas.models_correos
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0009_trabajo_exportacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoSaliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asunto', models.CharField(max_length=255, verbose_name='Asunto')),
+                ('remitente', models.CharField(blank=True, max_length=255, verbose_name='Remitente')),
+                ('destinatarios', models.JSONField(default=list, verbose_name='Destinatarios')),
+                ('cc', models.JSONField(blank=True, default=list, verbose_name='CC')),
+                ('cco', models.JSONField(blank=True, default=list, verbose_name='CCO')),
+                ('responder_a', models.JSONField(blank=True, default=list, verbose_name='Responder a')),
+                ('cuerpo_texto', models.TextField(blank=True, verbose_name='Cuerpo (texto)')),
+                ('cuerpo_html', models.TextField(blank=True, verbose_name='Cuerpo (HTML)')),
+                ('origen', models.CharField(blank=True, max_length=50, verbose_name='Origen')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('max_intentos', models.PositiveSmallIntegerField(default=6, verbose_name='Máximo de intentos')),
+                ('proximo_intento_el', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo intento el')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último error')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+                ('tomado_el', models.DateTimeField(blank=True, null=True, verbose_name='Tomado el')),
+                ('enviado_el', models.DateTimeField(blank=True, null=True, verbose_name='Enviado el')),
+            ],
+            options={
+                'verbose_name': 'Correo Saliente',
+                'verbose_name_plural': 'Correos Salientes',
+                'ordering': ['-creado_el'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento_el'], name='citas_corre_estado_87306c_idx'), models.Index(fields=['estado', 'enviado_el'], name='citas_corre_estado_39ba71_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AdjuntoCorreo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, verbose_name='Nombre del archivo')),
+                ('tipo_mime', models.CharField(blank=True, max_length=100, verbose_name='Tipo MIME')),
+                ('archivo', models.FileField(upload_to=citas.models_correos.ruta_adjunto_correo, verbose_name='Archivo')),
+                ('correo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adjuntos', to='citas.correosaliente', verbose_name='Correo')),
+            ],
+            options={
+                'verbose_name': 'Adjunto de Correo',
+                'verbose_name_plural': 'Adjuntos de Correo',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0010_correo_saliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='recordatorio_enviado_para',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Recordatorio enviado para'),
+        ),
+    ]
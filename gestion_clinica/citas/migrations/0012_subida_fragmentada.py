@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:06
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0011_cita_recordatorio_enviado'),
+        ('personal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaFragmentada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identificador', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Identificador')),
+                ('destino', models.CharField(choices=[('radiografia', 'Imagen de radiografía'), ('consentimiento_firmado', 'Documento firmado de consentimiento')], max_length=30, verbose_name='Destino')),
+                ('nombre_archivo', models.CharField(max_length=255, verbose_name='Nombre del archivo')),
+                ('tipo_contenido', models.CharField(blank=True, max_length=100, verbose_name='Tipo de contenido')),
+                ('tamano_total', models.BigIntegerField(verbose_name='Tamaño total (bytes)')),
+                ('recibido', models.BigIntegerField(default=0, verbose_name='Bytes recibidos')),
+                ('sha256_esperado', models.CharField(blank=True, max_length=64, verbose_name='SHA-256 esperado')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256')),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('completada', 'Completada'), ('adjuntada', 'Adjuntada'), ('cancelada', 'Cancelada')], default='en_curso', max_length=20, verbose_name='Estado')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+                ('actualizado_el', models.DateTimeField(auto_now=True, verbose_name='Actualizado el')),
+                ('expira_el', models.DateTimeField(verbose_name='Expira el')),
+                ('creado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subidas_fragmentadas', to='personal.perfil', verbose_name='Creado por')),
+            ],
+            options={
+                'verbose_name': 'Subida Fragmentada',
+                'verbose_name_plural': 'Subidas Fragmentadas',
+                'ordering': ['-creado_el'],
+                'indexes': [models.Index(fields=['expira_el'], name='citas_subid_expira__5ab4b6_idx')],
+            },
+        ),
+    ]
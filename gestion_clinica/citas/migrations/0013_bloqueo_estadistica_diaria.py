@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0012_subida_fragmentada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoEstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True, verbose_name='Fecha')),
+            ],
+            options={
+                'verbose_name': 'Bloqueo de Estadística Diaria',
+                'verbose_name_plural': 'Bloqueos de Estadísticas Diarias',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:29
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def eliminar_duplicados(apps, schema_editor):
+    """
+    Deja una sola fila por fecha, dentista, servicio y estado antes de crear la restricción.
+
+    Los duplicados vienen de dos recálculos simultáneos del mismo día, que insertaron
+    las mismas filas; se conserva la de menor ID. Conviene correr luego
+    reconstruir_estadisticas para los días afectados.
+    """
+    EstadisticaDiaria = apps.get_model('citas', 'EstadisticaDiaria')
+    duplicados = EstadisticaDiaria.objects.values(
+        'fecha', 'dentista', 'tipo_servicio', 'estado'
+    ).annotate(total=Count('id'), conservar=Min('id')).filter(total__gt=1).order_by()
+    for fila in duplicados:
+        EstadisticaDiaria.objects.filter(
+            fecha=fila['fecha'],
+            dentista=fila['dentista'],
+            tipo_servicio=fila['tipo_servicio'],
+            estado=fila['estado'],
+        ).exclude(id=fila['conservar']).delete()
+
+
+class Migration(migrations.Migration):
+    # Separada de la que crea la restricción (ver 0005_asignar_sala_citas)
+
+    dependencies = [
+        ('citas', '0013_bloqueo_estadistica_diaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:29
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0014_deduplicar_estadistica_diaria'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='estadisticadiaria',
+            constraint=models.UniqueConstraint(models.F('fecha'), django.db.models.functions.comparison.Coalesce('dentista', models.Value(0)), django.db.models.functions.comparison.Coalesce('tipo_servicio', models.Value(0)), models.F('estado'), name='estadistica_diaria_unica'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0015_estadistica_diaria_unica'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subidafragmentada',
+            name='estado',
+            field=models.CharField(choices=[('en_curso', 'En curso'), ('verificando', 'Verificando'), ('completada', 'Completada'), ('adjuntada', 'Adjuntada'), ('cancelada', 'Cancelada')], default='en_curso', max_length=20, verbose_name='Estado'),
+        ),
+    ]
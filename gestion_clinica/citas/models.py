@@ -5,6 +5,21 @@ from personal.models import Perfil
 # Importar modelo de auditoría
 from .models_auditoria import AuditoriaLog, registrar_auditoria
 
+# Importar modelo de eventos en tiempo real
+from .models_eventos import EventoTiempoReal, publicar_evento, publicar_cambio_cita
+
+# Importar modelo de estadísticas diarias
+from .models_estadisticas import EstadisticaDiaria, BloqueoEstadisticaDiaria
+
+# Importar modelo de exportaciones en segundo plano
+from .models_exportaciones import TrabajoExportacion
+
+# Importar modelos de la bandeja de salida de correos
+from .models_correos import CorreoSaliente, AdjuntoCorreo
+
+# Importar modelo de subidas fragmentadas reanudables
+from .models_subidas import SubidaFragmentada
+
 
 # Citas disponibles o tomadas
 class Cita(models.Model):
@@ -20,7 +35,8 @@ class Cita(models.Model):
         ('no_show', 'No Llegó'),
     )
     
-    fecha_hora = models.DateTimeField(unique=True)
+    # La unicidad del horario es por dentista y por sala (ver Meta.constraints)
+    fecha_hora = models.DateTimeField()
     
     # Información del cliente
     cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='citas')
@@ -109,6 +125,16 @@ class Cita(models.Model):
     # Relación con dentista (si es una cita reservada)
     dentista = models.ForeignKey(Perfil, on_delete=models.SET_NULL, null=True, blank=True, related_name='citas_asignadas')
     
+    # Sala (sillón) donde se atiende la cita; por defecto la sala asignada al dentista
+    sala = models.ForeignKey(
+        'Sala',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='citas',
+        verbose_name="Sala"
+    )
+    
     # Relación con Plan de Tratamiento
     plan_tratamiento = models.ForeignKey(
         'historial_clinico.PlanTratamiento',
@@ -127,6 +153,49 @@ class Cita(models.Model):
         verbose_name="Fase del Tratamiento"
     )
     
+    # Fecha y hora de la cita para la que se envió el recordatorio (comando enviar_recordatorios).
+    # Si la cita se reagenda deja de coincidir con fecha_hora y se vuelve a recordar.
+    recordatorio_enviado_para = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Recordatorio enviado para"
+    )
+    
+    class Meta:
+        constraints = [
+            # Un dentista y una sala solo pueden tener una cita vigente por instante.
+            # Las citas canceladas no bloquean la hora para volver a ofrecerla.
+            models.UniqueConstraint(
+                fields=['dentista', 'fecha_hora'],
+                condition=~models.Q(estado='cancelada'),
+                name='cita_unica_dentista_fecha_hora',
+            ),
+            models.UniqueConstraint(
+                fields=['sala', 'fecha_hora'],
+                condition=~models.Q(estado='cancelada'),
+                name='cita_unica_sala_fecha_hora',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['fecha_hora']),
+            models.Index(fields=['dentista', 'fecha_hora']),
+            models.Index(fields=['sala', 'fecha_hora']),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Recordar los valores cargados (por attname) para detectar cambios al guardar
+        instancia._estado_original = instancia.__dict__.get('estado')
+        instancia._valores_originales = dict(zip(field_names, values))
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        # Si no se indicó sala, usar la sala asignada al dentista
+        if self.sala_id is None and self.dentista_id:
+            self.sala_id = self.dentista.sala_asignada_id
+        super().save(*args, **kwargs)
+    
     @property
     def disponible(self):
         return self.estado == 'disponible'
@@ -159,6 +228,13 @@ class Cita(models.Model):
     def reservar(self, cliente=None, paciente_nombre=None, paciente_email=None, paciente_telefono=None, dentista=None):
         """Reserva una cita para un paciente"""
         if self.estado == 'disponible':
+            if dentista:
+                # La cita pasa a la sala del dentista: validar su agenda y la de la sala
+                from citas.agenda_service import buscar_solapamiento, duracion_servicio, sala_de_dentista
+                sala_id = sala_de_dentista(dentista)
+                if buscar_solapamiento(dentista, self.fecha_hora, duracion_servicio(self.tipo_servicio),
+                                       excluir_cita_id=self.id, sala_id=sala_id):
+                    return False
             if cliente:
                 self.cliente = cliente
                 self.paciente_nombre = cliente.nombre_completo
@@ -170,6 +246,8 @@ class Cita(models.Model):
                 self.paciente_telefono = paciente_telefono
             self.estado = 'reservada'
             self.dentista = dentista
+            if dentista:
+                self.sala_id = sala_id
             self.save()
             return True
         return False
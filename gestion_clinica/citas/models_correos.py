@@ -0,0 +1,83 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+def ruta_adjunto_correo(instance, filename):
+    """Carpeta aleatoria por adjunto para que la URL no se pueda adivinar"""
+    return f'correos/{uuid.uuid4().hex}/{filename}'
+
+
+class CorreoSaliente(models.Model):
+    """
+    Correo en la bandeja de salida (outbox) pendiente de entrega.
+
+    Las vistas y servicios no abren una conexión SMTP: solo guardan aquí el
+    mensaje ya armado. El comando procesar_correos toma los pendientes en lotes,
+    los envía por una sola conexión SMTP y, si el envío falla, lo reintenta más
+    tarde con espera exponencial hasta agotar max_intentos.
+    """
+
+    ESTADO_CHOICES = (
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('error', 'Error'),
+    )
+
+    asunto = models.CharField(max_length=255, verbose_name="Asunto")
+    remitente = models.CharField(max_length=255, blank=True, verbose_name="Remitente")
+    # Listas de direcciones de correo
+    destinatarios = models.JSONField(default=list, verbose_name="Destinatarios")
+    cc = models.JSONField(default=list, blank=True, verbose_name="CC")
+    cco = models.JSONField(default=list, blank=True, verbose_name="CCO")
+    responder_a = models.JSONField(default=list, blank=True, verbose_name="Responder a")
+    cuerpo_texto = models.TextField(blank=True, verbose_name="Cuerpo (texto)")
+    cuerpo_html = models.TextField(blank=True, verbose_name="Cuerpo (HTML)")
+    # Qué generó el correo, por ejemplo 'confirmacion_cita' (para los logs y para filtrar la cola)
+    origen = models.CharField(max_length=50, blank=True, verbose_name="Origen")
+
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name="Estado")
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    max_intentos = models.PositiveSmallIntegerField(default=6, verbose_name="Máximo de intentos")
+    proximo_intento_el = models.DateTimeField(default=timezone.now, verbose_name="Próximo intento el")
+    ultimo_error = models.TextField(blank=True, verbose_name="Último error")
+
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+    tomado_el = models.DateTimeField(null=True, blank=True, verbose_name="Tomado el")
+    enviado_el = models.DateTimeField(null=True, blank=True, verbose_name="Enviado el")
+
+    class Meta:
+        verbose_name = "Correo Saliente"
+        verbose_name_plural = "Correos Salientes"
+        ordering = ['-creado_el']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento_el']),
+            models.Index(fields=['estado', 'enviado_el']),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} → {', '.join(self.destinatarios)} ({self.get_estado_display()})"
+
+
+class AdjuntoCorreo(models.Model):
+    """Archivo adjunto de un CorreoSaliente (se guarda en media hasta que se limpia el correo)"""
+
+    correo = models.ForeignKey(
+        CorreoSaliente,
+        on_delete=models.CASCADE,
+        related_name='adjuntos',
+        verbose_name="Correo"
+    )
+    nombre = models.CharField(max_length=255, verbose_name="Nombre del archivo")
+    tipo_mime = models.CharField(max_length=100, blank=True, verbose_name="Tipo MIME")
+    archivo = models.FileField(upload_to=ruta_adjunto_correo, verbose_name="Archivo")
+
+    class Meta:
+        verbose_name = "Adjunto de Correo"
+        verbose_name_plural = "Adjuntos de Correo"
+        ordering = ['id']
+
+    def __str__(self):
+        return self.nombre
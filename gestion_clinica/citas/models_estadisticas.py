@@ -0,0 +1,91 @@
+from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+
+class EstadisticaDiaria(models.Model):
+    """
+    Resumen diario precalculado de citas e ingresos/egresos manuales.
+
+    Cada fila agrupa, para un día (hora local), las citas de un dentista, tipo de
+    servicio y estado, con su cantidad y su monto. Los ingresos y egresos manuales
+    se guardan con los estados especiales 'ingreso_manual' y 'egreso_manual' (sin
+    dentista ni servicio). Los reportes suman estas filas en vez de recorrer la
+    tabla de citas, por lo que su costo no crece con los años de historial.
+
+    Cada combinación de fecha, dentista, servicio y estado tiene una sola fila.
+    Cuando cambia una cita o un movimiento manual se resta su aporte anterior y se
+    suma el nuevo con UPDATE ... SET cantidad = cantidad + delta sobre esas filas
+    (estadisticas_service.registrar_cambios_citas). El comando
+    reconstruir_estadisticas recalcula días completos desde las tablas de origen;
+    sirve también tras cambiar el precio base de un servicio, que no se propaga a
+    las citas sin precio cobrado ya resumidas.
+    """
+
+    ESTADO_INGRESO_MANUAL = 'ingreso_manual'
+    ESTADO_EGRESO_MANUAL = 'egreso_manual'
+
+    fecha = models.DateField(verbose_name="Fecha")
+    dentista = models.ForeignKey(
+        'personal.Perfil',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='estadisticas_diarias',
+        verbose_name="Dentista"
+    )
+    tipo_servicio = models.ForeignKey(
+        'TipoServicio',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='estadisticas_diarias',
+        verbose_name="Tipo de Servicio"
+    )
+    # Estado de la cita, o 'ingreso_manual' / 'egreso_manual'
+    estado = models.CharField(max_length=20, verbose_name="Estado")
+    cantidad = models.PositiveIntegerField(default=0, verbose_name="Cantidad")
+    # Citas con precio cobrado o servicio (las que cuentan en finanzas)
+    cantidad_con_precio = models.PositiveIntegerField(default=0, verbose_name="Cantidad con Precio")
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Monto")
+
+    class Meta:
+        verbose_name = "Estadística Diaria"
+        verbose_name_plural = "Estadísticas Diarias"
+        ordering = ['fecha']
+        indexes = [
+            models.Index(fields=['fecha', 'estado']),
+        ]
+        constraints = [
+            # Coalesce: las filas sin dentista o sin servicio (NULL) también deben ser únicas
+            models.UniqueConstraint(
+                F('fecha'),
+                Coalesce('dentista', Value(0)),
+                Coalesce('tipo_servicio', Value(0)),
+                F('estado'),
+                name='estadistica_diaria_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.estado}: {self.cantidad}"
+
+
+class BloqueoEstadisticaDiaria(models.Model):
+    """
+    Fila de bloqueo por día para recalcular EstadisticaDiaria.
+
+    Dos recálculos del mismo día a la vez (reconstruir_estadisticas) podían, con
+    READ COMMITTED, borrar ambos las filas y luego insertar las suyas, duplicando
+    el resumen. El recálculo toma esta fila con SELECT ... FOR UPDATE antes de leer
+    y reemplazar las filas del día, así que se ejecutan uno tras otro.
+    """
+
+    fecha = models.DateField(unique=True, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = "Bloqueo de Estadística Diaria"
+        verbose_name_plural = "Bloqueos de Estadísticas Diarias"
+
+    def __str__(self):
+        return str(self.fecha)
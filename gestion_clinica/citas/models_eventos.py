@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.utils import timezone
+
+
+class EventoTiempoReal(models.Model):
+    """
+    Evento publicado para los navegadores conectados al canal de eventos (SSE).
+
+    La tabla funciona como un registro corto de difusión: cada conexión recuerda el
+    último ID que recibió y lee solo los eventos nuevos, por lo que todos los
+    procesos del servidor ven los mismos eventos sin un broker externo.
+    """
+
+    TIPO_CHOICES = (
+        ('cita', 'Cambio de Cita'),
+        ('mensaje', 'Nuevo Mensaje'),
+    )
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name="Tipo")
+    datos = models.JSONField(default=dict, verbose_name="Datos")
+    # Si se indica, solo ese usuario recibe el evento; si no, todo el personal activo
+    destinatario = models.ForeignKey(
+        'personal.Perfil',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='eventos_tiempo_real',
+        verbose_name="Destinatario"
+    )
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+
+    class Meta:
+        verbose_name = "Evento en Tiempo Real"
+        verbose_name_plural = "Eventos en Tiempo Real"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['creado_el']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.id}"
+
+
+# Horas que se conservan los eventos (solo sirven para reconexiones recientes)
+RETENCION_EVENTOS_HORAS = 24
+
+
+def publicar_evento(tipo, datos, destinatario=None):
+    """
+    Publica un evento en el canal de tiempo real cuando la transacción actual confirma.
+
+    Args:
+        tipo: 'cita' o 'mensaje'
+        datos: dict serializable a JSON con el contenido del evento
+        destinatario: Perfil que debe recibirlo (opcional, por defecto todo el personal)
+    """
+    def _crear():
+        try:
+            EventoTiempoReal.objects.create(tipo=tipo, datos=datos, destinatario=destinatario)
+
+            # Limpieza de eventos antiguos (cada ~200 eventos para no afectar rendimiento)
+            import random
+            if random.randint(1, 200) == 1:
+                limite = timezone.now() - timedelta(hours=RETENCION_EVENTOS_HORAS)
+                EventoTiempoReal.objects.filter(creado_el__lt=limite).delete()
+        except Exception as e:
+            # Un evento perdido no debe afectar la operación que lo generó
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.error(f"Error al publicar evento en tiempo real: {str(e)}")
+
+    transaction.on_commit(_crear)
+
+
+def publicar_cambio_cita(cita, estado_anterior=None):
+    """
+    Publica el cambio de estado de una cita (llegada, inicio/fin de atención, reserva, etc.).
+
+    Args:
+        cita: Instancia de Cita ya guardada
+        estado_anterior: Estado previo de la cita (None si la cita es nueva)
+    """
+    fecha_local = timezone.localtime(cita.fecha_hora)
+    publicar_evento('cita', {
+        'id': cita.id,
+        'estado': cita.estado,
+        'estado_anterior': estado_anterior,
+        'fecha': fecha_local.strftime('%Y-%m-%d'),
+        'hora': fecha_local.strftime('%H:%M'),
+        'dentista_id': cita.dentista_id,
+        'paciente': cita.paciente_nombre or '',
+    })
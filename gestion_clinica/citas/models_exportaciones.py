@@ -0,0 +1,68 @@
+import uuid
+
+from django.db import models
+
+
+def ruta_exportacion(instance, filename):
+    """Carpeta aleatoria por archivo para que la URL no se pueda adivinar"""
+    return f'exportaciones/{uuid.uuid4().hex}/{filename}'
+
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación pesada (Excel/PDF) que se genera fuera de la petición web.
+
+    La vista solo crea el trabajo en estado 'pendiente'; el comando
+    procesar_exportaciones lo toma, genera el archivo, lo guarda en media y
+    va actualizando el progreso. El navegador consulta el estado hasta que el
+    archivo está listo y luego lo descarga. Los archivos vencen después de
+    unas horas y el mismo comando los elimina.
+    """
+
+    TIPO_CHOICES = (
+        ('excel_finanzas', 'Excel de Finanzas'),
+        ('excel_planes_tratamiento', 'Excel de Planes de Tratamiento'),
+        ('pdf_insumos', 'PDF de Inventario de Insumos'),
+        ('pdf_estadisticas', 'PDF de Resumen de Estadísticas'),
+    )
+
+    ESTADO_CHOICES = (
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    )
+
+    tipo = models.CharField(max_length=40, choices=TIPO_CHOICES, verbose_name="Tipo")
+    # Opciones de la exportación (por ejemplo {'tipo': 'ingresos'} para finanzas)
+    parametros = models.JSONField(default=dict, blank=True, verbose_name="Parámetros")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name="Estado")
+    progreso = models.PositiveSmallIntegerField(default=0, verbose_name="Progreso (%)")
+    mensaje = models.CharField(max_length=255, blank=True, verbose_name="Mensaje")
+    archivo = models.FileField(upload_to=ruta_exportacion, blank=True, verbose_name="Archivo")
+    solicitado_por = models.ForeignKey(
+        'personal.Perfil',
+        on_delete=models.CASCADE,
+        related_name='trabajos_exportacion',
+        verbose_name="Solicitado por"
+    )
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+    iniciado_el = models.DateTimeField(null=True, blank=True, verbose_name="Iniciado el")
+    finalizado_el = models.DateTimeField(null=True, blank=True, verbose_name="Finalizado el")
+    expira_el = models.DateTimeField(null=True, blank=True, verbose_name="Expira el")
+
+    class Meta:
+        verbose_name = "Trabajo de Exportación"
+        verbose_name_plural = "Trabajos de Exportación"
+        ordering = ['-creado_el']
+        indexes = [
+            models.Index(fields=['estado', 'creado_el']),
+            models.Index(fields=['expira_el']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.id} ({self.get_estado_display()})"
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
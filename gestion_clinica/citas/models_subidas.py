@@ -0,0 +1,67 @@
+import uuid
+
+from django.db import models
+
+
+class SubidaFragmentada(models.Model):
+    """
+    Subida de un archivo grande en fragmentos, reanudable.
+
+    El navegador crea la subida indicando el destino, el nombre y el tamaño
+    total, y luego envía el archivo en fragmentos (PUT con el desplazamiento).
+    Cada fragmento se escribe directo en un archivo temporal; si la conexión se
+    corta, el navegador consulta 'recibido' y continúa desde ahí. Recibido el
+    último, la subida queda 'verificando' hasta que el worker procesar_colas
+    calcula el SHA-256 del archivo completo. Al completarse, el formulario de destino (agregar o
+    editar radiografía, documento firmado del consentimiento) envía el
+    identificador en vez del archivo y la vista lo adjunta al modelo. El comando
+    limpiar_subidas elimina las subidas vencidas y sus archivos temporales.
+    """
+
+    DESTINO_CHOICES = (
+        ('radiografia', 'Imagen de radiografía'),
+        ('consentimiento_firmado', 'Documento firmado de consentimiento'),
+    )
+
+    ESTADO_CHOICES = (
+        ('en_curso', 'En curso'),
+        ('verificando', 'Verificando'),
+        ('completada', 'Completada'),
+        ('adjuntada', 'Adjuntada'),
+        ('cancelada', 'Cancelada'),
+    )
+
+    identificador = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, verbose_name="Identificador")
+    destino = models.CharField(max_length=30, choices=DESTINO_CHOICES, verbose_name="Destino")
+    nombre_archivo = models.CharField(max_length=255, verbose_name="Nombre del archivo")
+    tipo_contenido = models.CharField(max_length=100, blank=True, verbose_name="Tipo de contenido")
+    tamano_total = models.BigIntegerField(verbose_name="Tamaño total (bytes)")
+    recibido = models.BigIntegerField(default=0, verbose_name="Bytes recibidos")
+    # SHA-256 que informó el navegador al crear la subida (opcional) y el calculado al verificarla
+    sha256_esperado = models.CharField(max_length=64, blank=True, verbose_name="SHA-256 esperado")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='en_curso', verbose_name="Estado")
+    creado_por = models.ForeignKey(
+        'personal.Perfil',
+        on_delete=models.CASCADE,
+        related_name='subidas_fragmentadas',
+        verbose_name="Creado por"
+    )
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+    actualizado_el = models.DateTimeField(auto_now=True, verbose_name="Actualizado el")
+    expira_el = models.DateTimeField(verbose_name="Expira el")
+
+    class Meta:
+        verbose_name = "Subida Fragmentada"
+        verbose_name_plural = "Subidas Fragmentadas"
+        ordering = ['-creado_el']
+        indexes = [
+            models.Index(fields=['expira_el']),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.recibido}/{self.tamano_total} bytes, {self.get_estado_display()})"
+
+    @property
+    def completa(self):
+        return self.recibido >= self.tamano_total
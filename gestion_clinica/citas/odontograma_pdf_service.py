@@ -0,0 +1,170 @@
+"""
+Servicio del PDF de la ficha odontológica con caché en el DocumentoCliente.
+
+Generar la ficha con ReportLab es caro: son varias páginas de tablas y, por cada
+diente, se vuelve a leer el JSON del odontograma interactivo que está guardado en
+EstadoDiente.observaciones. Además, la misma ficha se pide muchas veces sin cambios:
+desde el detalle, desde el gestor de documentos, desde el portal del paciente y al
+enviarla por correo.
+
+Por eso el PDF generado se guarda en el DocumentoCliente de la ficha (archivo_pdf)
+junto con la huella de los datos con que se generó (huella_pdf). Mientras la huella
+no cambie, las descargas sirven el archivo guardado sin volver a generarlo. La
+huella combina fecha_actualizacion del odontograma (cambia con cada edición de la
+ficha) y un hash de los dientes (que se editan sin tocar el odontograma). Las
+señales de citas/signals.py eliminan el archivo guardado apenas se edita la ficha
+o alguno de sus dientes.
+
+Uso:
+    documento = obtener_pdf_odontograma(odontograma, perfil)
+    return FileResponse(documento.archivo_pdf.open('rb'), ...)
+"""
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from citas.pdf_service import construir_pdf_odontograma
+from historial_clinico.models import DocumentoCliente, EstadoDiente
+from pacientes.models import Cliente
+
+logger = logging.getLogger(__name__)
+
+# Subir este número cuando cambie el diseño del PDF para regenerar todas las fichas guardadas
+VERSION_PLANTILLA_ODONTOGRAMA = 1
+
+# Campos de cada diente que aparecen en el PDF
+CAMPOS_HUELLA_DIENTE = ('numero_diente', 'estado', 'observaciones', 'fecha_tratamiento', 'costo_tratamiento')
+
+
+def huella_odontograma(odontograma):
+    """
+    Huella de los datos con que se genera el PDF de la ficha.
+
+    Args:
+        odontograma: Odontograma de historial_clinico
+
+    Returns:
+        str con el sha256 en hexadecimal (64 caracteres)
+    """
+    actualizacion = odontograma.fecha_actualizacion.isoformat() if odontograma.fecha_actualizacion else ''
+    huella = hashlib.sha256(f'v{VERSION_PLANTILLA_ODONTOGRAMA}|{odontograma.id}|{actualizacion}'.encode())
+    dientes = EstadoDiente.objects.filter(
+        odontograma_id=odontograma.id
+    ).order_by('numero_diente').values_list(*CAMPOS_HUELLA_DIENTE)
+    for diente in dientes:
+        huella.update(repr(diente).encode())
+    return huella.hexdigest()
+
+
+def _cliente_de_odontograma(odontograma):
+    """Cliente de la ficha; si no está asociado directamente se busca por el email del paciente"""
+    if odontograma.cliente_id or not odontograma.paciente_email:
+        return odontograma.cliente
+    return Cliente.objects.filter(email=odontograma.paciente_email, activo=True).first()
+
+
+def obtener_documento_odontograma(odontograma, perfil=None):
+    """
+    DocumentoCliente de tipo 'odontograma' de la ficha (se crea si no existe).
+
+    Args:
+        odontograma: Odontograma de historial_clinico
+        perfil: Perfil que queda como generado_por si el documento se crea
+
+    Returns:
+        DocumentoCliente
+    """
+    documento = DocumentoCliente.objects.filter(odontograma=odontograma, tipo='odontograma').first()
+    if documento is None:
+        return DocumentoCliente.objects.create(
+            odontograma=odontograma,
+            tipo='odontograma',
+            cliente=_cliente_de_odontograma(odontograma),
+            titulo=f'Ficha Odontológica - {odontograma.paciente_nombre}',
+            descripcion=f'Ficha odontológica del paciente {odontograma.paciente_nombre}',
+            generado_por=perfil,
+        )
+
+    if not documento.cliente_id:
+        cliente = _cliente_de_odontograma(odontograma)
+        if cliente:
+            documento.cliente = cliente
+            documento.save(update_fields=['cliente'])
+    return documento
+
+
+def _pdf_guardado_vigente(documento, huella):
+    """True si el archivo guardado se generó con la huella actual y sigue en el storage"""
+    if not documento.archivo_pdf or documento.huella_pdf != huella:
+        return False
+    return documento.archivo_pdf.storage.exists(documento.archivo_pdf.name)
+
+
+def obtener_pdf_odontograma(odontograma, perfil=None):
+    """
+    DocumentoCliente de la ficha con el PDF al día en archivo_pdf.
+
+    Si el PDF guardado se generó con la huella actual se reutiliza tal cual. Si no
+    (primera descarga, ficha editada o archivo perdido) se genera, se guarda en el
+    documento y se elimina el archivo anterior.
+
+    Args:
+        odontograma: Odontograma de historial_clinico
+        perfil: Perfil que solicita el PDF (queda como generado_por si se regenera)
+
+    Returns:
+        DocumentoCliente con archivo_pdf listo para abrir
+    """
+    huella = huella_odontograma(odontograma)
+    documento = obtener_documento_odontograma(odontograma, perfil)
+    if _pdf_guardado_vigente(documento, huella):
+        return documento
+
+    archivo_anterior = documento.archivo_pdf.name if documento.archivo_pdf else None
+    with tempfile.TemporaryFile() as archivo:
+        construir_pdf_odontograma(odontograma, archivo)
+        archivo.seek(0)
+        documento.archivo_pdf.save(f'ficha_odontologica_{odontograma.id}_{huella[:12]}.pdf', File(archivo), save=False)
+
+    documento.huella_pdf = huella
+    documento.fecha_generacion = timezone.now()
+    if perfil is not None:
+        documento.generado_por = perfil
+    documento.save(update_fields=['archivo_pdf', 'huella_pdf', 'fecha_generacion', 'generado_por'])
+
+    if archivo_anterior and archivo_anterior != documento.archivo_pdf.name:
+        try:
+            documento.archivo_pdf.storage.delete(archivo_anterior)
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar el PDF anterior de la ficha #{odontograma.id}: {str(e)}")
+    return documento
+
+
+def invalidar_pdf_odontograma(odontograma_id):
+    """
+    Elimina el PDF guardado de una ficha para que la próxima descarga lo regenere.
+
+    Args:
+        odontograma_id: ID del Odontograma editado
+    """
+    documentos = DocumentoCliente.objects.filter(
+        odontograma_id=odontograma_id,
+        tipo='odontograma',
+    ).exclude(Q(archivo_pdf='') | Q(archivo_pdf__isnull=True))
+    for documento in documentos:
+        try:
+            documento.archivo_pdf.delete(save=False)
+            documento.huella_pdf = ''
+            documento.save(update_fields=['archivo_pdf', 'huella_pdf'])
+        except Exception as e:
+            logger.error(f"Error al invalidar el PDF de la ficha #{odontograma_id}: {str(e)}")
+
+
+def nombre_descarga_odontograma(odontograma):
+    """Nombre de descarga de la ficha, por ejemplo ficha_odontologica_Juan_Perez_20250101_0930.pdf"""
+    return f'ficha_odontologica_{odontograma.paciente_nombre.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
@@ -0,0 +1,122 @@
+"""
+Servicio de recordatorios de citas para el día siguiente.
+
+El comando enviar_recordatorios lo usa una vez al día (por ejemplo desde cron)
+para avisar a todos los pacientes con cita reservada para mañana. A diferencia
+de mensajeria_service, que notifica una cita por petición, aquí se trabaja con
+el día completo:
+
+- Las citas del día se leen en una sola consulta con sus relaciones.
+- Las plantillas del correo se compilan una vez y se reutilizan para cada cita.
+- Cada cita se marca antes de enviar (recordatorio_enviado_para) con un UPDATE
+  condicional, así volver a ejecutar el comando, o ejecutar dos a la vez, nunca
+  envía el mismo recordatorio dos veces.
+
+Uso:
+    plantillas = cargar_plantillas_recordatorio()
+    info_clinica = obtener_info_clinica()
+    for cita in citas_para_recordar(fecha):
+        if reservar_recordatorio(cita):
+            construir_recordatorio(cita, plantillas, info_clinica, conexion).send()
+"""
+import logging
+
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils import timezone
+
+from citas.models import Cita
+
+logger = logging.getLogger(__name__)
+
+PLANTILLA_RECORDATORIO_HTML = 'citas/emails/recordatorio_cita.html'
+PLANTILLA_RECORDATORIO_TEXTO = 'citas/emails/recordatorio_cita.txt'
+
+
+def citas_para_recordar(fecha):
+    """
+    Citas reservadas de un día que todavía no tienen recordatorio para su hora actual.
+
+    Args:
+        fecha: date del día de las citas (en la zona horaria de la clínica)
+
+    Returns:
+        QuerySet de Cita con cliente, dentista y tipo_servicio cargados
+    """
+    return Cita.objects.filter(
+        estado='reservada',
+        fecha_hora__date=fecha,
+    ).exclude(
+        recordatorio_enviado_para=F('fecha_hora')
+    ).select_related(
+        'cliente', 'dentista', 'tipo_servicio'
+    ).order_by('fecha_hora', 'id')
+
+
+def cargar_plantillas_recordatorio():
+    """Plantillas HTML y texto del recordatorio, compiladas una sola vez por ejecución"""
+    return get_template(PLANTILLA_RECORDATORIO_HTML), get_template(PLANTILLA_RECORDATORIO_TEXTO)
+
+
+def reservar_recordatorio(cita):
+    """
+    Marca la cita como recordada antes de enviar el correo.
+
+    Returns:
+        True si esta ejecución obtuvo la cita; False si otra ya la recordó
+    """
+    return bool(
+        Cita.objects.filter(id=cita.id).exclude(
+            recordatorio_enviado_para=F('fecha_hora')
+        ).update(recordatorio_enviado_para=F('fecha_hora'))
+    )
+
+
+def liberar_recordatorio(cita):
+    """Quita la marca si el envío falló, para que la siguiente ejecución lo reintente"""
+    Cita.objects.filter(id=cita.id, recordatorio_enviado_para=F('fecha_hora')).update(recordatorio_enviado_para=None)
+
+
+def construir_recordatorio(cita, plantillas, info_clinica, conexion=None):
+    """
+    Arma el correo de recordatorio de una cita.
+
+    Args:
+        cita: Cita con cliente, dentista y tipo_servicio cargados
+        plantillas: Tupla (html, texto) de cargar_plantillas_recordatorio()
+        info_clinica: dict de email_service.obtener_info_clinica()
+        conexion: Conexión de correo a usar al enviar (opcional)
+
+    Returns:
+        EmailMultiAlternatives, o None si la cita no tiene email
+    """
+    email_paciente = cita.email_paciente
+    if not email_paciente:
+        return None
+
+    fecha_hora = timezone.localtime(cita.fecha_hora)
+    servicio_nombre = cita.tipo_servicio.nombre if cita.tipo_servicio else (cita.tipo_consulta or '')
+    contexto = {
+        'cliente_nombre': cita.nombre_paciente,
+        'fecha_cita': fecha_hora.strftime('%d/%m/%Y'),
+        'hora_cita': fecha_hora.strftime('%H:%M'),
+        'dentista_nombre': cita.dentista.nombre_completo if cita.dentista else '',
+        'servicio_nombre': servicio_nombre,
+        'nombre_clinica': info_clinica['nombre'],
+        'direccion_clinica': info_clinica['direccion'],
+        'telefono_clinica': info_clinica['telefono'],
+        'email_clinica': info_clinica['email'],
+        'horario_clinica': info_clinica['horario'],
+    }
+
+    plantilla_html, plantilla_texto = plantillas
+    email = EmailMultiAlternatives(
+        subject=f"Recordatorio de Cita - {info_clinica['nombre']}",
+        body=plantilla_texto.render(contexto).strip(),
+        from_email=info_clinica['email'],
+        to=[email_paciente],
+        connection=conexion,
+    )
+    email.attach_alternative(plantilla_html.render(contexto), "text/html")
+    return email
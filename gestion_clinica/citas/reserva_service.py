@@ -0,0 +1,221 @@
+"""
+Servicio de reserva de citas sin condiciones de carrera.
+
+La hora se toma con un único UPDATE condicional (WHERE estado='disponible') dentro
+de la misma transacción que crea o actualiza el Cliente. Si dos pacientes intentan
+reservar la misma hora al mismo tiempo, solo uno de los UPDATE afecta una fila y
+el otro recibe CitaNoDisponible.
+
+El número de consultas es fijo por reserva (benchmark_reserva_concurrente):
+10 con un paciente que ya existe (BEGIN/COMMIT incluidos): buscar el Cliente,
+tomar la hora, releerla, dos UPDATE del resumen diario en un savepoint y el
+evento en tiempo real. Un paciente nuevo suma el INSERT del Cliente en su
+savepoint (13), y la primera cita del día en ese estado, dentista y servicio
+crea además su fila del resumen (hasta 16).
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from citas.estadisticas_service import registrar_cambios_citas, valores_cita
+from citas.models import Cita, Sala, publicar_cambio_cita
+from pacientes.models import Cliente, normalizar_telefono_chileno_modelo
+
+logger = logging.getLogger(__name__)
+
+# Teléfono usado cuando el paciente no tiene uno registrado (el modelo lo exige)
+TELEFONO_POR_DEFECTO = '+56900000000'
+
+# Estados que cuentan como "cita activa" para la regla de una reserva a la vez
+ESTADOS_CITA_ACTIVA = ['reservada', 'confirmada']
+
+
+class ReservaError(Exception):
+    """Error base de una reserva que no se pudo completar"""
+
+
+class CitaNoDisponible(ReservaError):
+    """La hora ya fue tomada por otro paciente o no existe"""
+
+
+class ClienteConCitaActiva(ReservaError):
+    """El paciente ya tiene una cita activa y solo puede tener una a la vez"""
+
+
+def _upsert_cliente(nombre, email, telefono):
+    """
+    Obtiene o crea el Cliente por email y actualiza nombre/teléfono/activo si cambiaron.
+    Debe llamarse dentro de una transacción.
+
+    El INSERT corre en un savepoint: si dos primeras reservas simultáneas usan el
+    mismo email nuevo, la que pierde recibe IntegrityError por el email único, lo
+    deshace sin abortar la transacción de la reserva y usa el Cliente de la otra.
+    """
+    telefono_normalizado = normalizar_telefono_chileno_modelo(telefono) if telefono else None
+    cliente = Cliente.objects.filter(email=email).first()
+    if cliente is None:
+        try:
+            with transaction.atomic():
+                return Cliente.objects.create(
+                    email=email,
+                    nombre_completo=nombre,
+                    telefono=telefono_normalizado or TELEFONO_POR_DEFECTO,
+                    activo=True,
+                )
+        except IntegrityError:
+            # Otra reserva creó el Cliente entre la consulta y el INSERT
+            cliente = Cliente.objects.filter(email=email).first()
+            if cliente is None:
+                raise
+
+    cambios = {}
+    if nombre and nombre != cliente.nombre_completo:
+        cambios['nombre_completo'] = nombre
+    if telefono_normalizado and telefono_normalizado != cliente.telefono:
+        cambios['telefono'] = telefono_normalizado
+    if not cliente.activo:
+        cambios['activo'] = True
+    if cambios:
+        Cliente.objects.filter(pk=cliente.pk).update(**cambios)
+        for campo, valor in cambios.items():
+            setattr(cliente, campo, valor)
+    return cliente
+
+
+def reservar_cita_disponible(cita_id, nombre, email, telefono=None, nota=None, una_cita_activa=False):
+    """
+    Reserva una cita disponible para un paciente de forma atómica.
+
+    Args:
+        cita_id: ID de la cita a reservar
+        nombre: Nombre completo del paciente
+        email: Email del paciente (identifica al Cliente)
+        telefono: Teléfono del paciente (opcional)
+        nota: Línea a agregar a las notas de la cita (opcional)
+        una_cita_activa: Si True, rechaza la reserva si el paciente ya tiene una cita activa
+
+    Returns:
+        Cita reservada, con dentista, tipo_servicio y cliente cargados
+
+    Raises:
+        ClienteConCitaActiva: si una_cita_activa=True y el paciente ya tiene una cita activa
+        CitaNoDisponible: si la hora ya no está disponible
+    """
+    with transaction.atomic():
+        cliente = _upsert_cliente(nombre, email, telefono)
+
+        if una_cita_activa and Cita.objects.filter(
+            Q(cliente=cliente) | Q(paciente_email=email),
+            estado__in=ESTADOS_CITA_ACTIVA
+        ).exists():
+            raise ClienteConCitaActiva('El paciente ya tiene una cita activa')
+
+        campos = {
+            'cliente': cliente,
+            'paciente_nombre': nombre,
+            'paciente_email': email,
+            'paciente_telefono': cliente.telefono if telefono else None,
+            'estado': 'reservada',
+            'actualizada_el': timezone.now(),
+        }
+        if nota:
+            campos['notas'] = Case(
+                When(Q(notas__isnull=True) | Q(notas=''), then=Value(nota)),
+                default=Concat(F('notas'), Value(f'\n{nota}')),
+            )
+
+        # Toma la hora solo si sigue disponible: el UPDATE es la única fuente de verdad
+        tomadas = Cita.objects.filter(id=cita_id, estado='disponible').update(**campos)
+        if tomadas != 1:
+            raise CitaNoDisponible('La cita ya no está disponible')
+
+        # El UPDATE condicional no dispara post_save: publicar el cambio explícitamente
+        cita = Cita.objects.select_related('dentista', 'tipo_servicio', 'cliente').get(id=cita_id)
+        publicar_cambio_cita(cita, 'disponible')
+        despues = valores_cita(cita)
+        registrar_cambios_citas([({**despues, 'estado': 'disponible'}, despues)])
+
+    logger.info(f"Cita {cita_id} reservada para {email}")
+    return cita
+
+
+def reservar_hora_calculada(dentista, fecha_hora, nombre, email, telefono=None, tipo_servicio=None,
+                            duracion_minutos=None, nota=None, una_cita_activa=False):
+    """
+    Reserva una hora entregada por el motor de disponibilidad calculada.
+
+    No existe una fila 'disponible' que tomar, así que la cita se crea directamente
+    como 'reservada'. Para evitar que dos reservas simultáneas creen citas solapadas,
+    se bloquean las filas del dentista y de su sala (SELECT ... FOR UPDATE) y se
+    vuelve a validar la agenda dentro de la misma transacción.
+
+    Args:
+        dentista: Perfil del dentista
+        fecha_hora: Inicio de la hora (timezone-aware)
+        nombre: Nombre completo del paciente
+        email: Email del paciente (identifica al Cliente)
+        telefono: Teléfono del paciente (opcional)
+        tipo_servicio: TipoServicio de la cita (opcional)
+        duracion_minutos: Duración de la hora; por defecto la del servicio
+        nota: Texto para las notas de la cita (opcional)
+        una_cita_activa: Si True, rechaza la reserva si el paciente ya tiene una cita activa
+
+    Returns:
+        Cita creada, con dentista, tipo_servicio y cliente cargados
+
+    Raises:
+        ClienteConCitaActiva: si una_cita_activa=True y el paciente ya tiene una cita activa
+        CitaNoDisponible: si la hora está fuera del horario, ya pasó o fue tomada
+    """
+    from citas.agenda_service import buscar_solapamiento, duracion_servicio
+    from citas.disponibilidad_service import hora_dentro_de_horario
+    from personal.models import Perfil
+
+    if duracion_minutos is None:
+        duracion_minutos = duracion_servicio(tipo_servicio)
+    if fecha_hora <= timezone.now():
+        raise CitaNoDisponible('La hora seleccionada ya pasó')
+
+    try:
+        with transaction.atomic():
+            # Serializa las reservas calculadas de un mismo dentista y de su sala
+            Perfil.objects.select_for_update().filter(pk=dentista.pk).exists()
+            if dentista.sala_asignada_id:
+                Sala.objects.select_for_update().filter(pk=dentista.sala_asignada_id).exists()
+
+            if not hora_dentro_de_horario(dentista, fecha_hora, duracion_minutos):
+                raise CitaNoDisponible('La hora está fuera del horario del dentista')
+            if buscar_solapamiento(dentista, fecha_hora, duracion_minutos):
+                raise CitaNoDisponible('La hora ya no está disponible')
+
+            cliente = _upsert_cliente(nombre, email, telefono)
+
+            if una_cita_activa and Cita.objects.filter(
+                Q(cliente=cliente) | Q(paciente_email=email),
+                estado__in=ESTADOS_CITA_ACTIVA
+            ).exists():
+                raise ClienteConCitaActiva('El paciente ya tiene una cita activa')
+
+            cita = Cita.objects.create(
+                fecha_hora=fecha_hora,
+                dentista=dentista,
+                sala_id=dentista.sala_asignada_id,
+                tipo_servicio=tipo_servicio,
+                tipo_consulta=tipo_servicio.nombre if tipo_servicio else None,
+                precio_cobrado=tipo_servicio.precio_base if tipo_servicio else None,
+                cliente=cliente,
+                paciente_nombre=nombre,
+                paciente_email=email,
+                paciente_telefono=cliente.telefono if telefono else None,
+                estado='reservada',
+                notas=nota or None,
+            )
+    except IntegrityError:
+        # Restricción única por dentista/sala: otra cita tomó el mismo instante
+        raise CitaNoDisponible('La hora ya no está disponible')
+
+    logger.info(f"Hora calculada {fecha_hora} con dentista {dentista.id} reservada para {email} (cita {cita.id})")
+    return Cita.objects.select_related('dentista', 'tipo_servicio', 'cliente').get(id=cita.id)
@@ -0,0 +1,209 @@
+"""
+Señales de la app citas.
+
+- Canal de eventos en tiempo real: los cambios de estado de las citas y los mensajes
+  nuevos se publican como EventoTiempoReal; la vista stream_eventos los entrega a
+  los navegadores conectados.
+- Estadísticas diarias: cada cambio en citas o ingresos/egresos manuales resta su
+  aporte anterior y suma el nuevo a las filas de EstadisticaDiaria afectadas. Al
+  eliminar un dentista o servicio se recalculan los días en que tenía citas.
+- PDF de fichas odontológicas: editar una ficha o uno de sus dientes elimina el PDF
+  guardado en su DocumentoCliente para que la próxima descarga lo regenere.
+- Calendario: editar el nombre o teléfono de un cliente, el nombre de un dentista
+  o un servicio marca sus citas como actualizadas (actualizada_el), para que cambie
+  la versión (ETag) de las ventanas del calendario donde aparecen.
+- Información de la clínica: editarla descarta la copia en caché que usan los
+  correos (email_service).
+- Radiografías: eliminarla borra su miniatura, vista previa y teselas de zoom
+  (teselas_service). Al subir o cambiar la imagen, el worker procesar_colas las
+  genera fuera de la petición.
+"""
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from citas.email_service import invalidar_info_clinica
+from citas.estadisticas_service import (
+    CAMPOS_APORTE_CITA,
+    programar_recalculo,
+    registrar_cambio_movimiento,
+    registrar_cambios_citas,
+    soltar_relacion,
+    valores_cita,
+)
+from citas.models import Cita, EstadisticaDiaria, TipoServicio, publicar_cambio_cita, publicar_evento
+from citas.odontograma_pdf_service import invalidar_pdf_odontograma
+from citas.teselas_service import eliminar_derivados
+from configuracion.models import InformacionClinica
+from finanzas.models import EgresoManual, IngresoManual
+from historial_clinico.models import EstadoDiente, Odontograma, Radiografia
+from pacientes.models import Cliente
+from personal.models import Perfil
+
+# Modelos cuyos datos muestra el calendario: campo de la cita que los referencia y campos mostrados
+CAMPOS_CALENDARIO = {
+    Cliente: ('cliente', ('nombre_completo', 'telefono')),
+    Perfil: ('dentista', ('nombre_completo',)),
+    TipoServicio: ('tipo_servicio', ('nombre', 'duracion_estimada', 'precio_base')),
+}
+
+# Estado de EstadisticaDiaria de cada modelo de movimientos manuales
+ESTADOS_MOVIMIENTO = {
+    IngresoManual: EstadisticaDiaria.ESTADO_INGRESO_MANUAL,
+    EgresoManual: EstadisticaDiaria.ESTADO_EGRESO_MANUAL,
+}
+
+
+def _valores_cita_originales(instance):
+    """Valores de aporte de la cita tal como se cargaron (None si no se cargaron todos)"""
+    originales = getattr(instance, '_valores_originales', None)
+    if originales is None or not all(campo in originales for campo in CAMPOS_APORTE_CITA):
+        return None
+    return {campo: originales[campo] for campo in CAMPOS_APORTE_CITA}
+
+
+@receiver(post_save, sender=Cita)
+def cita_guardada(sender, instance, created, **kwargs):
+    """Publica la cita cuando se crea o cuando cambia su estado"""
+    estado_anterior = getattr(instance, '_estado_original', None)
+    if created or estado_anterior != instance.estado:
+        publicar_cambio_cita(instance, None if created else estado_anterior)
+    instance._estado_original = instance.estado
+
+
+@receiver(post_save, sender=Cita)
+def cita_guardada_estadisticas(sender, instance, created, update_fields=None, **kwargs):
+    """Mueve el aporte de la cita en EstadisticaDiaria de sus valores anteriores a los actuales"""
+    actualizados = None
+    if update_fields:
+        actualizados = {sender._meta.get_field(nombre).attname for nombre in update_fields}
+        if not actualizados.intersection(CAMPOS_APORTE_CITA):
+            return
+
+    antes = None if created else _valores_cita_originales(instance)
+    if not created and antes is None:
+        # Cita cargada sin todos los campos: no se sabe qué aportaba, recalcular el día
+        programar_recalculo({timezone.localdate(instance.fecha_hora)})
+        return
+
+    despues = valores_cita(instance)
+    if actualizados and antes is not None:
+        # Los campos que no se guardaron siguen en la base con su valor anterior
+        despues = {campo: despues[campo] if campo in actualizados else antes[campo] for campo in CAMPOS_APORTE_CITA}
+    registrar_cambios_citas([(antes, despues)])
+    instance._valores_originales = {**getattr(instance, '_valores_originales', {}), **despues}
+
+
+@receiver(post_delete, sender=Cita)
+def cita_eliminada_estadisticas(sender, instance, **kwargs):
+    antes = _valores_cita_originales(instance) or valores_cita(instance)
+    registrar_cambios_citas([(antes, None)])
+
+
+@receiver(post_save, sender=IngresoManual)
+@receiver(post_save, sender=EgresoManual)
+def movimiento_manual_guardado(sender, instance, created, **kwargs):
+    antes = None if created else getattr(instance, '_fecha_monto_original', None)
+    despues = (instance.fecha, instance.monto)
+    if not created and antes is None:
+        # Movimiento guardado sin cargarlo completo: no se sabe qué aportaba, recalcular el día
+        programar_recalculo({instance.fecha})
+        instance._fecha_monto_original = despues
+        return
+    registrar_cambio_movimiento(ESTADOS_MOVIMIENTO[sender], antes, despues)
+    instance._fecha_monto_original = despues
+
+
+@receiver(post_delete, sender=IngresoManual)
+@receiver(post_delete, sender=EgresoManual)
+def movimiento_manual_eliminado(sender, instance, **kwargs):
+    antes = getattr(instance, '_fecha_monto_original', None) or (instance.fecha, instance.monto)
+    registrar_cambio_movimiento(ESTADOS_MOVIMIENTO[sender], antes, None)
+
+
+@receiver(pre_delete, sender=Perfil)
+def dentista_por_eliminar_estadisticas(sender, instance, **kwargs):
+    soltar_relacion('dentista_id', instance.pk)
+
+
+@receiver(pre_delete, sender=TipoServicio)
+def servicio_por_eliminar_estadisticas(sender, instance, **kwargs):
+    soltar_relacion('tipo_servicio_id', instance.pk)
+
+
+@receiver(post_save, sender=Odontograma)
+@receiver(pre_delete, sender=Odontograma)
+def odontograma_cambiado(sender, instance, **kwargs):
+    invalidar_pdf_odontograma(instance.id)
+
+
+@receiver(post_save, sender=EstadoDiente)
+@receiver(post_delete, sender=EstadoDiente)
+def diente_cambiado(sender, instance, **kwargs):
+    invalidar_pdf_odontograma(instance.odontograma_id)
+
+
+def _marcar_citas_actualizadas(sender, instance):
+    campo, _ = CAMPOS_CALENDARIO[sender]
+    # UPDATE directo: no cambia nada que dispare las señales de la cita
+    Cita.objects.filter(**{campo: instance.pk}).update(actualizada_el=timezone.now())
+
+
+def relacionado_por_guardar(sender, instance, update_fields=None, **kwargs):
+    """Recuerda los valores que muestra el calendario antes de guardar"""
+    _, campos = CAMPOS_CALENDARIO[sender]
+    instance._valores_calendario = None
+    if instance.pk and (not update_fields or set(campos).intersection(update_fields)):
+        instance._valores_calendario = sender.objects.filter(pk=instance.pk).values(*campos).first()
+
+
+def relacionado_guardado(sender, instance, created, **kwargs):
+    """Cambia la versión del calendario de las citas si cambió un dato que este muestra"""
+    anteriores = getattr(instance, '_valores_calendario', None)
+    if created or not anteriores:
+        return
+    _, campos = CAMPOS_CALENDARIO[sender]
+    if any(anteriores[campo] != getattr(instance, campo) for campo in campos):
+        _marcar_citas_actualizadas(sender, instance)
+
+
+def relacionado_eliminado(sender, instance, **kwargs):
+    # Antes del borrado: el on_delete=SET_NULL de las citas no toca actualizada_el
+    _marcar_citas_actualizadas(sender, instance)
+
+
+for modelo in CAMPOS_CALENDARIO:
+    pre_save.connect(relacionado_por_guardar, sender=modelo)
+    post_save.connect(relacionado_guardado, sender=modelo)
+    pre_delete.connect(relacionado_eliminado, sender=modelo)
+
+
+@receiver(post_save, sender=InformacionClinica)
+@receiver(post_delete, sender=InformacionClinica)
+def informacion_clinica_cambiada(sender, instance, **kwargs):
+    invalidar_info_clinica()
+
+
+@receiver(post_delete, sender=Radiografia)
+def radiografia_eliminada(sender, instance, **kwargs):
+    # Los archivos se borran solo si la eliminación se confirma
+    transaction.on_commit(lambda: eliminar_derivados(instance))
+
+
+def mensaje_creado(sender, instance, created, **kwargs):
+    """Avisa al destinatario de un mensaje interno nuevo"""
+    if not created:
+        return
+    publicar_evento('mensaje', {
+        'id': instance.id,
+        'asunto': instance.asunto,
+        'tipo': instance.tipo,
+        'remitente': instance.remitente.nombre_completo,
+    }, destinatario=instance.destinatario)
+
+
+# La mensajería interna (app comunicacion) es opcional: solo se escucha si está instalada
+if apps.is_installed('comunicacion'):
+    post_save.connect(mensaje_creado, sender='comunicacion.Mensaje', dispatch_uid='citas_mensaje_creado')
@@ -0,0 +1,412 @@
+"""
+Servicio de subidas fragmentadas y reanudables (SubidaFragmentada).
+
+Los formularios de radiografías y el documento firmado de los consentimientos
+enviaban el archivo completo en un solo POST multipart, que Django recibe entero
+antes de llamar a la vista; con una tomografía de cientos de MB y una conexión
+inestable, un corte obligaba a partir de cero. Ahora el navegador:
+
+1. Crea la subida (crear_subida) con el destino, el nombre y el tamaño total.
+2. Envía el archivo en fragmentos de TAMANO_FRAGMENTO, de a uno y en orden
+   (recibir_fragmento). Cada fragmento se escribe directo en el archivo temporal
+   en su desplazamiento, sin pasar por memoria ni por el parser multipart; solo
+   se verifica el SHA-256 del fragmento si el navegador lo envía.
+3. Si la conexión se corta, consulta 'recibido' y continúa desde ese byte.
+4. Con el último fragmento la subida pasa a 'verificando': el worker
+   procesar_colas calcula el SHA-256 del archivo completo en una sola pasada
+   sobre el temporal (verificar_subida) y la deja 'completada', o 'cancelada' si
+   no coincide con el que informó el navegador. Así ninguna petición lee el
+   archivo completo y no queda estado en la memoria de un proceso (hashlib no
+   permite guardar el estado parcial del hash entre fragmentos). El navegador
+   consulta el estado hasta que termina.
+5. Al completar, envía el formulario con el identificador de la subida en vez del
+   archivo; la vista lo obtiene con archivo_del_formulario() y el almacenamiento
+   mueve el temporal a su carpeta definitiva sin copiarlo ni volver a hashearlo
+   (usa el SHA-256 ya verificado).
+
+Las subidas que no se completan o no se adjuntan vencen a las VIGENCIA_HORAS y
+las elimina el comando limpiar_subidas.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from citas.almacenamiento import SHA256_RE
+from citas.models import SubidaFragmentada
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de fragmento que usa el navegador y máximo aceptado por petición
+TAMANO_FRAGMENTO = 4 * 1024 * 1024
+TAMANO_MAXIMO_FRAGMENTO = 16 * 1024 * 1024
+
+# Horas sin actividad tras las que una subida se considera abandonada
+VIGENCIA_HORAS = 24
+
+# Bloque de lectura al escribir el fragmento y al verificar el hash del archivo
+BLOQUE_LECTURA = 256 * 1024
+
+# Límites por destino: tamaño máximo y extensiones aceptadas (None = cualquiera)
+LIMITES_DESTINO = {
+    'radiografia': {
+        'tamano_maximo': lambda: settings.SUBIDAS_MAX_RADIOGRAFIA,
+        'extensiones': None,
+    },
+    'consentimiento_firmado': {
+        'tamano_maximo': lambda: 10 * 1024 * 1024,
+        'extensiones': ('.pdf', '.jpg', '.jpeg', '.png', '.heic', '.heif'),
+    },
+}
+
+
+class FragmentoFueraDeOrden(ValueError):
+    """El fragmento no empieza donde termina lo recibido; el navegador debe continuar desde 'recibido'"""
+
+    def __init__(self, recibido):
+        super().__init__(f'Se esperaba el fragmento desde el byte {recibido}.')
+        self.recibido = recibido
+
+
+# ========== ARCHIVOS TEMPORALES ==========
+
+def directorio_subidas():
+    """Carpeta de los archivos temporales (settings.SUBIDAS_DIRECTORIO)"""
+    directorio = Path(settings.SUBIDAS_DIRECTORIO)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def ruta_temporal(subida):
+    """Ruta del archivo temporal de una subida"""
+    return directorio_subidas() / f'{subida.identificador.hex}.parte'
+
+
+def eliminar_temporal(subida):
+    """Elimina el archivo temporal de una subida"""
+    try:
+        ruta_temporal(subida).unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"No se pudo eliminar el temporal de la subida {subida.identificador}: {e}")
+
+
+def _hash_archivo(subida):
+    """SHA-256 del archivo temporal completo, leído en una sola pasada por bloques"""
+    hasher = hashlib.sha256()
+    with open(ruta_temporal(subida), 'rb') as archivo:
+        for datos in iter(lambda: archivo.read(BLOQUE_LECTURA), b''):
+            hasher.update(datos)
+    return hasher.hexdigest()
+
+
+# ========== SUBIDAS ==========
+
+def crear_subida(perfil, destino, nombre_archivo, tamano_total, sha256_esperado='', tipo_contenido=''):
+    """
+    Crea una subida en curso y su archivo temporal vacío.
+
+    Args:
+        perfil: Perfil del trabajador que sube el archivo
+        destino: 'radiografia' o 'consentimiento_firmado'
+        nombre_archivo: Nombre original del archivo
+        tamano_total: Tamaño del archivo en bytes
+        sha256_esperado: SHA-256 calculado por el navegador (opcional)
+        tipo_contenido: Tipo MIME informado por el navegador
+
+    Returns:
+        SubidaFragmentada
+
+    Raises:
+        ValueError: Si el destino, el nombre o el tamaño no son válidos
+    """
+    limites = LIMITES_DESTINO.get(destino)
+    if limites is None:
+        raise ValueError('Destino de subida no válido.')
+
+    nombre_archivo = os.path.basename((nombre_archivo or '').replace('\\', '/')).strip()[:255]
+    if not nombre_archivo:
+        raise ValueError('El archivo no tiene nombre.')
+    if limites['extensiones'] and not nombre_archivo.lower().endswith(limites['extensiones']):
+        raise ValueError('Formato de archivo no válido.')
+
+    try:
+        tamano_total = int(tamano_total)
+    except (TypeError, ValueError):
+        raise ValueError('Tamaño de archivo no válido.')
+    if tamano_total <= 0:
+        raise ValueError('El archivo está vacío.')
+    tamano_maximo = limites['tamano_maximo']()
+    if tamano_total > tamano_maximo:
+        raise ValueError(f'El archivo es demasiado grande. El tamaño máximo es {tamano_maximo // (1024 * 1024)}MB.')
+
+    sha256_esperado = (sha256_esperado or '').strip().lower()
+    if sha256_esperado and not SHA256_RE.match(sha256_esperado):
+        raise ValueError('SHA-256 no válido.')
+
+    subida = SubidaFragmentada.objects.create(
+        destino=destino,
+        nombre_archivo=nombre_archivo,
+        tipo_contenido=(tipo_contenido or '')[:100],
+        tamano_total=tamano_total,
+        sha256_esperado=sha256_esperado,
+        creado_por=perfil,
+        expira_el=timezone.now() + timedelta(hours=VIGENCIA_HORAS),
+    )
+    ruta_temporal(subida).touch()
+    return subida
+
+
+def recibir_fragmento(subida, desplazamiento, flujo, largo, sha256_fragmento=''):
+    """
+    Escribe un fragmento en el archivo temporal y avanza 'recibido'.
+
+    El fragmento se lee del flujo por bloques y se escribe en su desplazamiento, así
+    que un reintento del mismo fragmento sobrescribe los mismos bytes. 'recibido'
+    solo avanza con un UPDATE condicional sobre el valor anterior, por lo que si dos
+    peticiones llegan con el mismo fragmento solo una lo cuenta.
+
+    Args:
+        subida: SubidaFragmentada en curso
+        desplazamiento: Byte donde empieza el fragmento (debe ser subida.recibido)
+        flujo: Objeto con read(n), por ejemplo el request
+        largo: Bytes del fragmento (Content-Length)
+        sha256_fragmento: SHA-256 del fragmento calculado por el navegador (opcional)
+
+    Returns:
+        SubidaFragmentada actualizada (estado 'verificando' con el último fragmento)
+
+    Raises:
+        FragmentoFueraDeOrden: Si el desplazamiento no coincide con lo recibido
+        ValueError: Si el fragmento no es válido o llegó incompleto o dañado
+    """
+    if subida.estado != 'en_curso':
+        raise ValueError('La subida ya no está en curso.')
+    if desplazamiento != subida.recibido:
+        raise FragmentoFueraDeOrden(subida.recibido)
+    if largo <= 0 or largo > TAMANO_MAXIMO_FRAGMENTO:
+        raise ValueError('Tamaño de fragmento no válido.')
+    if desplazamiento + largo > subida.tamano_total:
+        raise ValueError('El fragmento excede el tamaño del archivo.')
+
+    ruta = ruta_temporal(subida)
+    if not ruta.exists():
+        raise ValueError('El archivo temporal de la subida ya no existe.')
+
+    hasher_fragmento = hashlib.sha256()
+    escritos = 0
+    with open(ruta, 'r+b') as archivo:
+        archivo.seek(desplazamiento)
+        while escritos < largo:
+            datos = flujo.read(min(BLOQUE_LECTURA, largo - escritos))
+            if not datos:
+                break
+            archivo.write(datos)
+            hasher_fragmento.update(datos)
+            escritos += len(datos)
+
+        sha256_fragmento = (sha256_fragmento or '').strip().lower()
+        if escritos != largo or (sha256_fragmento and hasher_fragmento.hexdigest() != sha256_fragmento):
+            # Conexión cortada o fragmento dañado: descartar lo escrito para reintentarlo
+            archivo.truncate(desplazamiento)
+            if escritos != largo:
+                raise ValueError('El fragmento llegó incompleto.')
+            raise ValueError('El fragmento llegó dañado (SHA-256 distinto).')
+        archivo.truncate(desplazamiento + largo)
+
+    recibido = desplazamiento + largo
+    ahora = timezone.now()
+    campos = {
+        'recibido': recibido,
+        'actualizado_el': ahora,
+        'expira_el': ahora + timedelta(hours=VIGENCIA_HORAS),
+    }
+    if recibido == subida.tamano_total:
+        # El hash del archivo completo lo calcula el worker (verificar_subida)
+        campos['estado'] = 'verificando'
+
+    avanzo = SubidaFragmentada.objects.filter(
+        id=subida.id, recibido=desplazamiento, estado='en_curso'
+    ).update(**campos)
+    subida.refresh_from_db()
+    if not avanzo:
+        raise FragmentoFueraDeOrden(subida.recibido)
+    return subida
+
+
+def tomar_siguiente_verificacion():
+    """Subida recibida completa más antigua pendiente de verificar, o None"""
+    return SubidaFragmentada.objects.filter(estado='verificando').order_by('actualizado_el', 'id').first()
+
+
+def verificar_subida(subida):
+    """
+    Calcula el SHA-256 del archivo recibido completo y deja la subida lista para adjuntar.
+
+    Lee el temporal una sola vez. Si el navegador informó un SHA-256 al crear la
+    subida y no coincide, la subida se cancela (no tiene sentido reanudarla).
+
+    Returns:
+        True si quedó 'completada', False si se canceló
+    """
+    try:
+        sha256 = _hash_archivo(subida)
+    except FileNotFoundError:
+        sha256 = None
+    estado = 'completada'
+    if sha256 is None or (subida.sha256_esperado and sha256 != subida.sha256_esperado):
+        estado = 'cancelada'
+
+    ahora = timezone.now()
+    SubidaFragmentada.objects.filter(id=subida.id, estado='verificando').update(
+        sha256=sha256 or '',
+        estado=estado,
+        actualizado_el=ahora,
+        expira_el=ahora + timedelta(hours=VIGENCIA_HORAS),
+    )
+    if estado == 'cancelada':
+        eliminar_temporal(subida)
+    return estado == 'completada'
+
+
+def cancelar_subida(subida):
+    """Cancela una subida y elimina su archivo temporal"""
+    SubidaFragmentada.objects.filter(id=subida.id).exclude(estado='adjuntada').update(
+        estado='cancelada', actualizado_el=timezone.now()
+    )
+    eliminar_temporal(subida)
+
+
+def datos_subida(subida):
+    """dict JSON con el estado de una subida para el navegador"""
+    return {
+        'id': str(subida.identificador),
+        'destino': subida.destino,
+        'nombre': subida.nombre_archivo,
+        'tamano_total': subida.tamano_total,
+        'recibido': subida.recibido,
+        'estado': subida.estado,
+        'sha256': subida.sha256,
+        'tamano_fragmento': TAMANO_FRAGMENTO,
+    }
+
+
+# ========== ADJUNTAR AL MODELO ==========
+
+class ArchivoSubidaFragmentada(File):
+    """
+    Archivo armado por una subida fragmentada.
+
+    Expone temporary_file_path() como TemporaryUploadedFile, así FileSystemStorage
+    mueve el temporal a la carpeta del campo en vez de copiarlo, y sha256 con el
+    hash ya verificado, que AlmacenamientoDeduplicado usa en vez de releer el archivo.
+    """
+
+    def __init__(self, subida):
+        self.subida = subida
+        self._ruta = str(ruta_temporal(subida))
+        super().__init__(open(self._ruta, 'rb'), name=subida.nombre_archivo)
+        self.size = subida.tamano_total
+        self.content_type = subida.tipo_contenido
+        self.sha256 = subida.sha256
+
+    def temporary_file_path(self):
+        return self._ruta
+
+
+def archivo_del_formulario(request, campo, perfil, destino):
+    """
+    Archivo de un formulario que acepta subida directa o fragmentada.
+
+    El formulario envía el archivo en request.FILES[campo] (subida tradicional) o
+    el identificador de una subida completada en request.POST['<campo>_subida'].
+
+    Args:
+        request: Petición del formulario
+        campo: Nombre del campo de archivo
+        perfil: Perfil del trabajador (la subida debe ser suya)
+        destino: Destino con el que se creó la subida
+
+    Returns:
+        UploadedFile, ArchivoSubidaFragmentada o None si no se envió archivo
+
+    Raises:
+        ValueError: Si el identificador no corresponde a una subida completada
+    """
+    archivo = request.FILES.get(campo)
+    if archivo:
+        return archivo
+
+    identificador = (request.POST.get(f'{campo}_subida') or '').strip()
+    if not identificador:
+        return None
+    try:
+        identificador = uuid.UUID(identificador)
+    except ValueError:
+        raise ValueError('Identificador de subida no válido.')
+    subida = SubidaFragmentada.objects.filter(
+        identificador=identificador,
+        creado_por=perfil,
+        destino=destino,
+        estado='completada',
+    ).first()
+    if subida is None or not ruta_temporal(subida).exists():
+        raise ValueError('La subida del archivo no existe, no terminó o ya venció. Vuelve a subirlo.')
+    return ArchivoSubidaFragmentada(subida)
+
+
+def confirmar_adjunto(archivo):
+    """
+    Marca como adjuntada la subida de la que salió el archivo, una vez guardado el modelo.
+
+    No hace nada si el archivo vino en una subida tradicional.
+    """
+    if not isinstance(archivo, ArchivoSubidaFragmentada):
+        return
+    archivo.close()
+    SubidaFragmentada.objects.filter(id=archivo.subida.id, estado='completada').update(
+        estado='adjuntada', actualizado_el=timezone.now()
+    )
+    # Normalmente el almacenamiento ya movió el temporal; si lo copió (o el contenido ya estaba guardado), eliminarlo
+    eliminar_temporal(archivo.subida)
+
+
+# ========== MANTENCIÓN ==========
+
+def limpiar_subidas_vencidas():
+    """
+    Elimina las subidas vencidas o ya adjuntadas y sus archivos temporales.
+
+    También borra los temporales que quedaron sin registro (por ejemplo si se
+    eliminó la fila a mano).
+
+    Returns:
+        Cantidad de subidas eliminadas
+    """
+    ahora = timezone.now()
+    eliminadas = 0
+    vencidas = SubidaFragmentada.objects.filter(expira_el__lt=ahora) | SubidaFragmentada.objects.filter(
+        estado__in=('adjuntada', 'cancelada')
+    )
+    for subida in vencidas.iterator():
+        try:
+            eliminar_temporal(subida)
+            subida.delete()
+            eliminadas += 1
+        except Exception as e:
+            logger.error(f"Error al eliminar subida vencida {subida.identificador}: {str(e)}")
+
+    vigentes = {identificador.hex for identificador in SubidaFragmentada.objects.values_list('identificador', flat=True)}
+    limite = (ahora - timedelta(hours=VIGENCIA_HORAS)).timestamp()
+    for ruta in directorio_subidas().glob('*.parte'):
+        try:
+            if ruta.stem not in vigentes and ruta.stat().st_mtime < limite:
+                ruta.unlink()
+        except OSError as e:
+            logger.warning(f"No se pudo eliminar el temporal huérfano {ruta.name}: {e}")
+    return eliminadas
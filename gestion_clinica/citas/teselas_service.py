@@ -0,0 +1,256 @@
+"""
+Servicio de versiones livianas de las radiografías (miniatura, vista previa y teselas).
+
+Las panorámicas, cefalométricas y tomografías pesan decenas de MB y antes se
+enviaban completas a las grillas, al lienzo de anotaciones y al portal del
+cliente. Al subir una radiografía se generan con Pillow:
+
+- Una miniatura para las grillas (LADO_MINIATURA px en el lado mayor).
+- Una vista previa para el visualizador y el lienzo de anotaciones
+  (LADO_VISTA_PREVIA px en el lado mayor).
+- Una pirámide de teselas en formato Deep Zoom (DZI): cada nivel es la mitad
+  del anterior y se corta en teselas de TAMANO_TESELA px, así el visor de zoom
+  solo descarga las teselas del área y el nivel de zoom que se están viendo.
+
+Todo se guarda en una carpeta nueva por generación,
+radiografias/teselas/<id_radiografia>/<generacion>/, de modo que al cambiar la
+imagen las URLs cambian (sin problemas de caché) y la carpeta anterior se
+elimina completa. media_service autoriza estas rutas según la radiografía del
+<id_radiografia>.
+
+Decodificar y cortar una panorámica o tomografía grande puede tardar más que el
+timeout de gunicorn, así que no se hace en la petición de la subida: el worker
+procesar_colas toma las radiografías de radiografias_sin_derivados() (cola en la
+base de datos, como las exportaciones) y mientras tanto las vistas usan la
+imagen original.
+
+Uso:
+    # Worker permanente (entrada 'worker' del Procfile)
+    python manage.py procesar_colas
+    # Procesar las pendientes y terminar
+    python manage.py generar_teselas_radiografias
+"""
+import logging
+import math
+import os
+import uuid
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Carpeta base de las versiones livianas (la autorización en media_service depende de ella)
+CARPETA_TESELAS = 'radiografias/teselas'
+
+TAMANO_TESELA = 254
+SOLAPAMIENTO_TESELA = 1
+FORMATO_TESELA = 'jpg'
+CALIDAD_JPEG = 85
+
+LADO_MINIATURA = 320
+LADO_VISTA_PREVIA = 2048
+
+# Las tomografías grandes superan el límite por defecto de Pillow contra "bombas de descompresión"
+PIXELES_MAXIMOS = 400_000_000
+Image.MAX_IMAGE_PIXELS = max(Image.MAX_IMAGE_PIXELS or 0, PIXELES_MAXIMOS)
+
+DZI_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'TileSize="{tamano}" Overlap="{solapamiento}" Format="{formato}">'
+    '<Size Width="{ancho}" Height="{alto}"/></Image>\n'
+)
+
+
+# ========== IMAGEN ==========
+
+def abrir_imagen(archivo):
+    """
+    Abre una radiografía y la deja lista para reducir y guardar como JPEG.
+
+    Corrige la orientación EXIF y pasa a 8 bits las imágenes de 16 bits
+    (frecuentes en radiografías digitales).
+
+    Returns:
+        Imagen PIL en modo 'L' (escala de grises) o 'RGB'
+    """
+    imagen = Image.open(archivo)
+    imagen.load()
+    imagen = ImageOps.exif_transpose(imagen)
+
+    if imagen.mode in ('I;16', 'I;16B', 'I;16L', 'I'):
+        imagen = imagen.convert('I').point(lambda valor: valor * (1 / 256)).convert('L')
+    elif imagen.mode == 'F':
+        imagen = imagen.convert('L')
+    elif imagen.mode not in ('L', 'RGB'):
+        if 'A' in imagen.getbands() or imagen.mode == 'P':
+            imagen = imagen.convert('RGBA')
+            fondo = Image.new('RGB', imagen.size, (0, 0, 0))
+            fondo.paste(imagen, mask=imagen.getchannel('A'))
+            imagen = fondo
+        else:
+            imagen = imagen.convert('RGB')
+    return imagen
+
+
+def _jpeg(imagen):
+    """Bytes JPEG de una imagen PIL"""
+    salida = BytesIO()
+    imagen.save(salida, format='JPEG', quality=CALIDAD_JPEG, optimize=True)
+    return salida.getvalue()
+
+
+def _reducida(imagen, lado_maximo):
+    """Copia reducida para que el lado mayor no supere lado_maximo (no amplía)"""
+    copia = imagen.copy()
+    copia.thumbnail((lado_maximo, lado_maximo), Image.Resampling.LANCZOS)
+    return copia
+
+
+# ========== PIRÁMIDE ==========
+
+def niveles_piramide(ancho, alto):
+    """Cantidad de niveles DZI: el nivel 0 mide 1x1 y el último es la imagen completa"""
+    return int(math.ceil(math.log2(max(ancho, alto, 1)))) + 1
+
+
+def construir_piramide(imagen, carpeta):
+    """
+    Corta la imagen en teselas DZI y guarda el descriptor .dzi.
+
+    Cada nivel se obtiene reduciendo a la mitad el nivel siguiente, en vez de
+    reducir siempre desde el original, para no recorrer la imagen completa en
+    cada nivel.
+
+    Args:
+        imagen: Imagen PIL (abrir_imagen)
+        carpeta: Carpeta del almacenamiento donde guardar (sin '/' final)
+
+    Returns:
+        Nombre del archivo .dzi en el almacenamiento
+    """
+    ancho, alto = imagen.size
+    ultimo_nivel = niveles_piramide(ancho, alto) - 1
+
+    nivel_imagen = imagen
+    for nivel in range(ultimo_nivel, -1, -1):
+        escala = 2 ** (ultimo_nivel - nivel)
+        tamano_nivel = (max(1, math.ceil(ancho / escala)), max(1, math.ceil(alto / escala)))
+        if nivel_imagen.size != tamano_nivel:
+            nivel_imagen = nivel_imagen.resize(tamano_nivel, Image.Resampling.LANCZOS)
+
+        columnas = math.ceil(tamano_nivel[0] / TAMANO_TESELA)
+        filas = math.ceil(tamano_nivel[1] / TAMANO_TESELA)
+        for columna in range(columnas):
+            for fila in range(filas):
+                izquierda = columna * TAMANO_TESELA - (SOLAPAMIENTO_TESELA if columna else 0)
+                arriba = fila * TAMANO_TESELA - (SOLAPAMIENTO_TESELA if fila else 0)
+                derecha = min((columna + 1) * TAMANO_TESELA + SOLAPAMIENTO_TESELA, tamano_nivel[0])
+                abajo = min((fila + 1) * TAMANO_TESELA + SOLAPAMIENTO_TESELA, tamano_nivel[1])
+                tesela = nivel_imagen.crop((izquierda, arriba, derecha, abajo))
+                default_storage.save(
+                    f'{carpeta}/radiografia_files/{nivel}/{columna}_{fila}.{FORMATO_TESELA}',
+                    ContentFile(_jpeg(tesela)),
+                )
+
+    return default_storage.save(f'{carpeta}/radiografia.dzi', ContentFile(DZI_XML.format(
+        tamano=TAMANO_TESELA,
+        solapamiento=SOLAPAMIENTO_TESELA,
+        formato=FORMATO_TESELA,
+        ancho=ancho,
+        alto=alto,
+    ).encode('utf-8')))
+
+
+# ========== DERIVADOS ==========
+
+def eliminar_carpeta(carpeta):
+    """Elimina recursivamente una carpeta del almacenamiento"""
+    try:
+        subcarpetas, archivos = default_storage.listdir(carpeta)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for archivo in archivos:
+        default_storage.delete(f'{carpeta}/{archivo}')
+    for subcarpeta in subcarpetas:
+        eliminar_carpeta(f'{carpeta}/{subcarpeta}')
+    # FileSystemStorage no borra carpetas vacías
+    try:
+        os.rmdir(default_storage.path(carpeta))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def carpeta_derivados(radiografia):
+    """Carpeta de la generación vigente ('' si no hay derivados)"""
+    if not radiografia.teselas_dzi:
+        return ''
+    return radiografia.teselas_dzi.rsplit('/', 1)[0]
+
+
+def generar_derivados(radiografia):
+    """
+    Genera miniatura, vista previa y pirámide de teselas de una radiografía.
+
+    Guarda los campos con un UPDATE (sin save()) para no volver a disparar las
+    señales de la radiografía, y elimina la generación anterior.
+
+    Args:
+        radiografia: historial_clinico.Radiografia con imagen
+
+    Returns:
+        True si se generaron; False si la radiografía no tiene imagen
+    """
+    from historial_clinico.models import Radiografia
+
+    if not radiografia.imagen:
+        return False
+
+    nombre_imagen = radiografia.imagen.name
+    with radiografia.imagen.open('rb') as archivo:
+        imagen = abrir_imagen(archivo)
+
+    carpeta = f'{CARPETA_TESELAS}/{radiografia.id}/{uuid.uuid4().hex[:12]}'
+    try:
+        miniatura = default_storage.save(f'{carpeta}/miniatura.jpg', ContentFile(_jpeg(_reducida(imagen, LADO_MINIATURA))))
+        vista_previa = default_storage.save(f'{carpeta}/vista_previa.jpg', ContentFile(_jpeg(_reducida(imagen, LADO_VISTA_PREVIA))))
+        dzi = construir_piramide(imagen, carpeta)
+    except Exception:
+        eliminar_carpeta(carpeta)
+        raise
+
+    carpeta_anterior = carpeta_derivados(radiografia)
+    campos = {
+        'miniatura': miniatura,
+        'vista_previa': vista_previa,
+        'teselas_dzi': dzi,
+        'ancho': imagen.width,
+        'alto': imagen.height,
+        'derivados_de': nombre_imagen,
+    }
+    Radiografia.objects.filter(id=radiografia.id).update(**campos)
+    for campo, valor in campos.items():
+        setattr(radiografia, campo, valor)
+
+    if carpeta_anterior and carpeta_anterior != carpeta:
+        eliminar_carpeta(carpeta_anterior)
+    logger.info(f"Derivados de la radiografía {radiografia.id} generados ({imagen.width}x{imagen.height}) en {carpeta}")
+    return True
+
+
+def eliminar_derivados(radiografia):
+    """Elimina todas las generaciones de versiones livianas de una radiografía"""
+    eliminar_carpeta(f'{CARPETA_TESELAS}/{radiografia.id}')
+
+
+def radiografias_sin_derivados():
+    """QuerySet de las radiografías con imagen cuyos derivados faltan o son de una imagen anterior"""
+    from historial_clinico.models import Radiografia
+
+    return Radiografia.objects.exclude(imagen='').filter(
+        Q(teselas_dzi='') | ~Q(derivados_de=F('imagen'))
+    )
@@ -8,6 +8,9 @@ from . import views_dashboard
 from . import views_reportes
 from . import views_auditoria
 from . import views_salas
+from . import views_eventos
+from . import views_exportaciones
+from . import views_subidas
 
 urlpatterns = [
     # Auth trabajadores
@@ -18,6 +21,7 @@ urlpatterns = [
     # Panel trabajador
     path('panel/', views.panel_trabajador, name='panel_trabajador'),
     path('panel/citas-dia-ajax/', views.obtener_citas_dia_ajax, name='obtener_citas_dia_ajax'),
+    path('eventos/stream/', views_eventos.stream_eventos, name='stream_eventos'),
     path('obtener_cita/<int:cita_id>/', views.obtener_cita, name='obtener_cita'),
     
     # Gestión de citas con navbar lateral
@@ -26,6 +30,7 @@ urlpatterns = [
     path('citas/tomadas/', views.citas_tomadas, name='citas_tomadas'),
     path('citas/completadas/', views.citas_completadas, name='citas_completadas'),
     path('citas/calendario/', views.calendario_citas, name='calendario_citas'),
+    path('citas/calendario/eventos/', views.calendario_citas_eventos_ajax, name='calendario_citas_eventos_ajax'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('dashboard-dentista/', views.dashboard_dentista, name='dashboard_dentista'),
     path('dashboard-reportes/', views_dashboard.dashboard_reportes, name='dashboard_reportes'),
@@ -42,6 +47,16 @@ urlpatterns = [
     path('exportar-excel-servicios/', views_reportes.exportar_excel_servicios, name='exportar_excel_servicios'),
     path('exportar-excel-planes-tratamiento/', views_reportes.exportar_excel_planes_tratamiento, name='exportar_excel_planes_tratamiento'),
     
+    # Exportaciones en segundo plano (las genera el comando procesar_exportaciones)
+    path('exportaciones/solicitar/<str:tipo>/', views_exportaciones.solicitar_exportacion, name='solicitar_exportacion'),
+    path('exportaciones/<int:trabajo_id>/estado/', views_exportaciones.estado_exportacion, name='estado_exportacion'),
+    path('exportaciones/<int:trabajo_id>/descargar/', views_exportaciones.descargar_exportacion, name='descargar_exportacion'),
+
+    # Subidas fragmentadas y reanudables (radiografías y documentos firmados)
+    path('subidas/', views_subidas.crear_subida_fragmentada, name='crear_subida_fragmentada'),
+    path('subidas/<uuid:identificador>/', views_subidas.estado_subida_fragmentada, name='estado_subida_fragmentada'),
+    path('subidas/<uuid:identificador>/fragmento/', views_subidas.enviar_fragmento, name='enviar_fragmento_subida'),
+    
     # Gestión de citas (solo administrativos)
     path('agregar_hora/', views.agregar_hora, name='agregar_hora'),
     path('editar_cita/<int:cita_id>/', views.editar_cita, name='editar_cita'),
@@ -157,6 +172,7 @@ urlpatterns = [
     path('horarios/dentista/<int:dentista_id>/agregar/', views.agregar_horario_ajax, name='agregar_horario_ajax'),
     path('horarios/<int:horario_id>/editar/', views.editar_horario_ajax, name='editar_horario_ajax'),
     path('horarios/dentista/<int:dentista_id>/eliminar/', views.eliminar_horarios_ajax, name='eliminar_horarios_ajax'),
+    path('horarios/generar-horas/', views.generar_horas_disponibles_ajax, name='generar_horas_disponibles_ajax'),
     path('mi-horario/', views.ver_mi_horario, name='ver_mi_horario'),
     
     # Gestión de salas
@@ -184,6 +200,7 @@ urlpatterns = [
     path('clientes/validar-username/', views.validar_username, name='validar_username'),
     path('clientes/validar-email/', views.validar_email, name='validar_email'),
     path('clientes/buscar-por-email/', views.buscar_cliente_por_email, name='buscar_cliente_por_email'),
+    path('clientes/buscar/', views.buscar_clientes_ajax, name='buscar_clientes_ajax'),
     path('clientes/validar-rut/', views.validar_rut, name='validar_rut'),
     path('clientes/validar-telefono/', views.validar_telefono, name='validar_telefono'),
     path('clientes/crear/', views.crear_cliente_presencial, name='crear_cliente_presencial'),
@@ -232,4 +249,5 @@ urlpatterns = [
     path('radiografias/<int:radiografia_id>/enviar-correo/', views.enviar_radiografia_por_correo, name='enviar_radiografia_por_correo'),
     path('radiografias/<int:radiografia_id>/guardar-anotaciones/', views.guardar_anotaciones_radiografia, name='guardar_anotaciones_radiografia'),
     path('radiografias/<int:radiografia_id>/anotaciones/', views.obtener_anotaciones_radiografia, name='obtener_anotaciones_radiografia'),
+    path('radiografias/<int:radiografia_id>/anotada/', views.imagen_anotada_radiografia, name='imagen_anotada_radiografia'),
 ]
@@ -2,10 +2,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, FileResponse
 from django.utils import timezone
-from django.db.models import Count, Q, F, Sum, Avg
-from datetime import datetime, timedelta
+from django.db.models import Count, Q, F, Sum, Avg, Max
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal, InvalidOperation
 from django.contrib.auth.views import LoginView
 from django.contrib.auth import logout, authenticate
@@ -30,7 +30,7 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 
-from .models import Cita, TipoServicio, HorarioDentista, Sala
+from .models import Cita, TipoServicio, HorarioDentista, Sala, EstadisticaDiaria
 from personal.models import Perfil
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
@@ -329,10 +329,54 @@ def panel_trabajador(request):
         # Por defecto, redirigir a citas del día
         return redirect('citas_dia')
 
+# Margen con que se piden los cambios de un delta, para no perder filas guardadas
+# en transacciones que confirmaron después de la consulta anterior
+MARGEN_DELTA_CITAS_DIA = timedelta(seconds=5)
+
+
+def _version_citas_dia(fecha, citas_dia):
+    """
+    Calcula la versión del tablero de citas del día.
+
+    Se compone de la última actualización de las citas del día, la cantidad de citas
+    y un contador de fichas (cantidad e ID mayor de odontogramas ligados a las citas).
+    Crear, modificar o eliminar una cita, o crearle una ficha, cambia la versión.
+
+    Returns:
+        tuple: (version, ultima_actualizacion)
+    """
+    from historial_clinico.models import Odontograma
+
+    resumen = citas_dia.aggregate(ultima=Max('actualizada_el'), total=Count('id'))
+    fichas = Odontograma.objects.filter(cita__in=citas_dia).aggregate(total=Count('id'), mayor=Max('id'))
+    ultima = resumen['ultima']
+    version = '.'.join([
+        fecha.strftime('%Y%m%d'),
+        str(int(ultima.timestamp() * 1_000_000)) if ultima else '0',
+        str(resumen['total']),
+        f"{fichas['total']}-{fichas['mayor'] or 0}",
+    ])
+    return version, ultima
+
+
 # Vista AJAX para obtener citas del día actualizadas (para actualización automática)
 @login_required
 def obtener_citas_dia_ajax(request):
-    """Vista AJAX que devuelve las citas del día en formato JSON para actualización automática"""
+    """
+    Vista AJAX que devuelve las citas del día en formato JSON para actualización automática.
+
+    Parámetros GET:
+    - version: Versión recibida en la respuesta anterior (opcional)
+
+    Si la versión no cambió responde 304 sin cuerpo. Si cambió solo el contenido de
+    algunas citas, devuelve únicamente esas citas (completo=False) junto con 'ids', la
+    lista vigente de IDs del día, para que el cliente descarte las eliminadas. En
+    cualquier otro caso devuelve el día completo (completo=True).
+    """
+    from django.http import HttpResponseNotModified
+    from historial_clinico.models import Odontograma
+    from citas.agenda_service import limites_dia
+
     try:
         perfil = Perfil.objects.get(user=request.user)
         if not perfil.activo:
@@ -340,68 +384,75 @@ def obtener_citas_dia_ajax(request):
     except Perfil.DoesNotExist:
         return JsonResponse({'error': 'Perfil no encontrado'}, status=404)
     
-    # Obtener citas del día usando rango de fechas en la zona horaria local
-    fecha_hoy = timezone.localtime(timezone.now()).date()
-    from datetime import datetime, time as dt_time, timedelta
-    from django.conf import settings
-    import pytz
-    local_tz = pytz.timezone(settings.TIME_ZONE)
-    
-    inicio_dia_local = datetime.combine(fecha_hoy, dt_time.min)
-    inicio_dia = local_tz.localize(inicio_dia_local)
-    fin_dia = inicio_dia + timedelta(days=1)
+    # Citas del día en la zona horaria local
+    fecha_hoy = timezone.localdate()
+    inicio_dia, fin_dia = limites_dia(fecha_hoy)
+    citas_dia = Cita.objects.filter(fecha_hora__gte=inicio_dia, fecha_hora__lt=fin_dia)
+    
+    version, _ = _version_citas_dia(fecha_hoy, citas_dia)
+    version_cliente = request.GET.get('version', '')
+    if version_cliente == version:
+        respuesta = HttpResponseNotModified()
+        respuesta['Cache-Control'] = 'private, no-cache'
+        return respuesta
+    
+    # Delta: mismo día y mismas fichas, solo cambiaron (o se eliminaron) citas
+    completo = True
+    citas = citas_dia
+    partes_cliente = version_cliente.split('.')
+    partes_actuales = version.split('.')
+    if len(partes_cliente) == 4 and partes_cliente[0] == partes_actuales[0] and partes_cliente[3] == partes_actuales[3]:
+        try:
+            desde = datetime.fromtimestamp(int(partes_cliente[1]) / 1_000_000, tz=dt_timezone.utc)
+            citas = citas_dia.filter(actualizada_el__gt=desde - MARGEN_DELTA_CITAS_DIA)
+            completo = False
+        except (ValueError, OverflowError, OSError):
+            pass
     
-    citas_hoy = Cita.objects.filter(
-        fecha_hora__gte=inicio_dia,
-        fecha_hora__lt=fin_dia
-    ).select_related('tipo_servicio', 'dentista', 'cliente').prefetch_related('odontogramas').order_by('fecha_hora')
+    filas = list(citas.order_by('fecha_hora').values(
+        'id', 'estado', 'fecha_hora', 'hora_llegada', 'paciente_nombre',
+        'cliente__nombre_completo', 'dentista_id', 'dentista__nombre_completo',
+        'tipo_servicio__nombre', 'tipo_consulta',
+    ))
     
-    # Obtener información de fichas
-    from historial_clinico.models import Odontograma
-    odontogramas = Odontograma.objects.filter(cita__isnull=False).select_related('cita')
-    citas_con_ficha = set(odontogramas.values_list('cita_id', flat=True))
+    # Fichas (odontograma más reciente de cada cita) resueltas con una sola consulta
+    fichas = {}
+    for cita_id, odontograma_id in Odontograma.objects.filter(
+        cita_id__in=[fila['id'] for fila in filas]
+    ).order_by('cita_id', '-fecha_creacion').values_list('cita_id', 'id'):
+        fichas.setdefault(cita_id, odontograma_id)
     
-    # Preparar datos de citas en formato JSON
+    estados = dict(Cita.ESTADO_CHOICES)
     citas_data = []
-    for cita in citas_hoy:
-        cita.tiene_ficha = cita.id in citas_con_ficha
-        odontograma = None
-        if cita.tiene_ficha:
-            odontograma = odontogramas.filter(cita_id=cita.id).first()
-        
-        # Convertir fecha_hora a zona horaria de Chile
-        from django.utils import timezone
-        import pytz
-        try:
-            chile_tz = pytz.timezone('America/Santiago')
-            if timezone.is_naive(cita.fecha_hora):
-                fecha_hora_chile = timezone.make_aware(cita.fecha_hora, timezone.utc).astimezone(chile_tz)
-            else:
-                fecha_hora_chile = cita.fecha_hora.astimezone(chile_tz)
-        except Exception:
-            fecha_hora_chile = cita.fecha_hora
-        
+    for fila in filas:
+        fecha_hora_local = timezone.localtime(fila['fecha_hora'])
+        hora_llegada = timezone.localtime(fila['hora_llegada']) if fila['hora_llegada'] else None
         citas_data.append({
-            'id': cita.id,
-            'estado': cita.estado,
-            'estado_display': cita.get_estado_display(),
-            'fecha': fecha_hora_chile.strftime('%d/%m/%Y'),
-            'fecha_hora': fecha_hora_chile.strftime('%Y-%m-%d %H:%M'),
-            'hora': fecha_hora_chile.strftime('%H:%M'),
-            'paciente_nombre': cita.paciente_nombre or (cita.cliente.nombre_completo if cita.cliente else 'Sin asignar'),
-            'dentista_id': cita.dentista.id if cita.dentista else None,
-            'dentista_nombre': cita.dentista.nombre_completo if cita.dentista else 'Sin asignar',
-            'tipo_servicio': cita.tipo_servicio.nombre if cita.tipo_servicio else (cita.tipo_consulta or 'Sin servicio'),
-            'tiene_ficha': cita.tiene_ficha,
-            'odontograma_id': odontograma.id if odontograma else None,
-            'hora_llegada': cita.hora_llegada.strftime('%Y-%m-%d %H:%M') if cita.hora_llegada else None,
+            'id': fila['id'],
+            'estado': fila['estado'],
+            'estado_display': estados.get(fila['estado'], fila['estado']),
+            'fecha': fecha_hora_local.strftime('%d/%m/%Y'),
+            'fecha_hora': fecha_hora_local.strftime('%Y-%m-%d %H:%M'),
+            'hora': fecha_hora_local.strftime('%H:%M'),
+            'paciente_nombre': fila['paciente_nombre'] or fila['cliente__nombre_completo'] or 'Sin asignar',
+            'dentista_id': fila['dentista_id'],
+            'dentista_nombre': fila['dentista__nombre_completo'] or 'Sin asignar',
+            'tipo_servicio': fila['tipo_servicio__nombre'] or fila['tipo_consulta'] or 'Sin servicio',
+            'tiene_ficha': fila['id'] in fichas,
+            'odontograma_id': fichas.get(fila['id']),
+            'hora_llegada': hora_llegada.strftime('%Y-%m-%d %H:%M') if hora_llegada else None,
         })
     
-    return JsonResponse({
+    respuesta = {
         'success': True,
+        'version': version,
+        'completo': completo,
         'citas': citas_data,
         'timestamp': timezone.now().isoformat()
-    })
+    }
+    if not completo:
+        respuesta['ids'] = list(citas_dia.values_list('id', flat=True))
+    return JsonResponse(respuesta)
 
 # Agregar hora disponible (solo administrativos)
 # Esta vista solo procesa POST desde el modal, nunca renderiza una página
@@ -503,10 +554,9 @@ def agregar_hora(request):
                 return JsonResponse({'success': False, 'error': f'La hora seleccionada no está dentro del horario de trabajo del dentista. Horarios disponibles: {horarios_str}'}, status=400)
             
             # Validar duración de la cita
-            duracion_minutos = 30  # Duración por defecto
-            if tipo_servicio and tipo_servicio.duracion_estimada:
-                duracion_minutos = tipo_servicio.duracion_estimada
-            
+            from citas.agenda_service import duracion_servicio, buscar_solapamiento
+            duracion_minutos = duracion_servicio(tipo_servicio)
+
             # Calcular hora de fin de la cita
             from datetime import timedelta
             fecha_hora_fin = fecha_hora + timedelta(minutes=duracion_minutos)
@@ -523,47 +573,22 @@ def agregar_hora(request):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado. Por favor, seleccione una hora más temprana.'}, status=400)
             
             # Verificar que no se solape con otra cita del mismo dentista
-            # Solo verificar citas activas (no completadas, canceladas o no_show)
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            ).exclude(estado__in=['completada', 'cancelada', 'no_show', 'finalizada']).exclude(id=None)
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)  # Duración por defecto
-                
-                # Verificar solapamiento: las citas se solapan si hay intersección en el tiempo
-                # Nueva cita empieza antes de que termine la existente Y termina después de que empiece la existente
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    # Obtener información de la cita existente para el mensaje
-                    # Usar timezone.localtime para mostrar la hora en la zona horaria local
-                    from django.utils import timezone as tz
-                    fecha_hora_existente_local = tz.localtime(cita_existente.fecha_hora)
-                    hora_inicio_existente = fecha_hora_existente_local.strftime("%H:%M")
-                    hora_fin_existente = tz.localtime(fecha_hora_existente_fin).strftime("%H:%M")
-                    
-                    cliente_info = cita_existente.cliente.nombre_completo if cita_existente.cliente else cita_existente.paciente_nombre or "Sin cliente"
-                    servicio_info = cita_existente.tipo_servicio.nombre if cita_existente.tipo_servicio else cita_existente.tipo_consulta or "Sin servicio"
-                    
-                    # Log para debugging
-                    logger.warning(f"SOLAPAMIENTO DETECTADO: Nueva cita {fecha_hora} se solapa con cita existente {cita_existente.fecha_hora} (ID: {cita_existente.id})")
-                    
-                    # Retornar error y DETENER la ejecución
-                    response = JsonResponse({
-                        'success': False, 
-                        'error': f'La cita se solapa con otra cita existente del dentista de {hora_inicio_existente} a {hora_fin_existente} (Cliente: {cliente_info}, Servicio: {servicio_info}). Por favor, seleccione otra hora.'
-                    }, status=400)
-                    logger.warning(f"Retornando respuesta de error de solapamiento. La cita NO debe crearse.")
-                    return response
-            
-            # Verificar que no exista ya una cita en esa fecha/hora exacta
-            if Cita.objects.filter(fecha_hora=fecha_hora).exists():
-                return JsonResponse({'success': False, 'error': 'Ya existe una cita en esa fecha y hora exacta.'}, status=400)
+            # Solo se consideran citas activas (no completadas, canceladas o no_show)
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                cita_existente = conflicto.cita
+                # Usar timezone.localtime para mostrar la hora en la zona horaria local
+                hora_inicio_existente = timezone.localtime(conflicto.inicio).strftime("%H:%M")
+                hora_fin_existente = timezone.localtime(conflicto.fin).strftime("%H:%M")
+
+                cliente_info = cita_existente.cliente.nombre_completo if cita_existente.cliente else cita_existente.paciente_nombre or "Sin cliente"
+                servicio_info = cita_existente.tipo_servicio.nombre if cita_existente.tipo_servicio else cita_existente.tipo_consulta or "Sin servicio"
+
+                logger.warning(f"SOLAPAMIENTO DETECTADO: Nueva cita {fecha_hora} se solapa con cita existente {cita_existente.fecha_hora} (ID: {cita_existente.id})")
+                return JsonResponse({
+                    'success': False,
+                    'error': f'La cita se solapa con otra cita existente del dentista de {hora_inicio_existente} a {hora_fin_existente} (Cliente: {cliente_info}, Servicio: {servicio_info}). Por favor, seleccione otra hora.'
+                }, status=400)
             
             # Obtener precio del servicio si existe
             precio_cobrado = None
@@ -920,6 +945,8 @@ def editar_cita(request, cita_id):
                 return redirect('editar_cita', cita_id=cita_id)
             
             fecha_hora = datetime.fromisoformat(fecha_hora_str)
+            if timezone.is_naive(fecha_hora):
+                fecha_hora = timezone.make_aware(fecha_hora)
             cita.fecha_hora = fecha_hora
             cita.tipo_consulta = tipo_consulta
             
@@ -928,6 +955,7 @@ def editar_cita(request, cita_id):
                 try:
                     dentista = Perfil.objects.get(id=dentista_id, es_dentista=True, activo=True)
                     cita.dentista = dentista
+                    cita.sala_id = dentista.sala_asignada_id
                 except Perfil.DoesNotExist:
                     pass
             
@@ -981,7 +1009,24 @@ def editar_cita(request, cita_id):
                     cita.paciente_telefono = cliente.telefono
                 except Cliente.DoesNotExist:
                     messages.warning(request, 'El cliente seleccionado no existe o está inactivo.')
-            
+
+            # Verificar que la nueva fecha/hora no se solape con otra cita del dentista o de su sala
+            from citas.agenda_service import duracion_servicio, buscar_solapamiento
+            conflicto = buscar_solapamiento(
+                cita.dentista,
+                cita.fecha_hora,
+                duracion_servicio(cita.tipo_servicio),
+                excluir_cita_id=cita.id,
+                sala_id=cita.sala_id
+            )
+            if conflicto:
+                mensaje_error = f'La cita se solapa con otra cita existente del dentista a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    from django.http import JsonResponse
+                    return JsonResponse({'success': False, 'message': mensaje_error}, status=400)
+                messages.error(request, mensaje_error)
+                return redirect('editar_cita', cita_id=cita_id)
+
             cita.notas = notas
             cita.save()
             
@@ -1712,39 +1757,19 @@ def reagendar_cita(request, cita_id):
                 return redirect('panel_trabajador')
         
         # Verificar que no se solape con otra cita del mismo dentista
-        citas_existentes = Cita.objects.filter(
-            dentista=dentista,
-            fecha_hora__date=nueva_fecha_hora.date(),
-            estado__in=['disponible', 'reservada', 'confirmada']
-        ).exclude(id=cita.id)
-        
-        from datetime import timedelta
-        duracion_minutos = 30
-        if cita.tipo_servicio and cita.tipo_servicio.duracion_estimada:
-            duracion_minutos = cita.tipo_servicio.duracion_estimada
-        
-        fecha_hora_fin = nueva_fecha_hora + timedelta(minutes=duracion_minutos)
-        
-        for cita_existente in citas_existentes:
-            fecha_hora_existente_fin = cita_existente.fecha_hora
-            if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-            else:
-                fecha_hora_existente_fin += timedelta(minutes=30)
-            
-            if (nueva_fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    from django.http import JsonResponse
-                    return JsonResponse({'success': False, 'error': f'La nueva fecha/hora se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
-                messages.error(request, f'La nueva fecha/hora se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.')
-                return redirect('panel_trabajador')
-        
-        # Verificar que no exista ya una cita en esa fecha/hora exacta
-        if Cita.objects.filter(fecha_hora=nueva_fecha_hora).exclude(id=cita.id).exists():
+        from citas.agenda_service import duracion_servicio, buscar_solapamiento
+        conflicto = buscar_solapamiento(
+            dentista,
+            nueva_fecha_hora,
+            duracion_servicio(cita.tipo_servicio),
+            excluir_cita_id=cita.id
+        )
+        if conflicto:
+            hora_conflicto = timezone.localtime(conflicto.inicio).strftime("%H:%M")
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
-                return JsonResponse({'success': False, 'error': 'Ya existe una cita en esa fecha y hora exacta.'}, status=400)
-            messages.error(request, 'Ya existe una cita en esa fecha y hora exacta.')
+                return JsonResponse({'success': False, 'error': f'La nueva fecha/hora se solapa con otra cita existente a las {hora_conflicto}.'}, status=400)
+            messages.error(request, f'La nueva fecha/hora se solapa con otra cita existente a las {hora_conflicto}.')
             return redirect('panel_trabajador')
         
         # Guardar fecha/hora anterior para el mensaje
@@ -1757,6 +1782,7 @@ def reagendar_cita(request, cita_id):
         cita.fecha_hora = nueva_fecha_hora
         if dentista:
             cita.dentista = dentista
+            cita.sala_id = dentista.sala_asignada_id
         cita.save()
         
         mensaje = f'Cita reagendada de {fecha_hora_anterior.strftime("%d/%m/%Y %H:%M")} a {nueva_fecha_hora.strftime("%d/%m/%Y %H:%M")}.'
@@ -2490,25 +2516,9 @@ def calendario_citas(request):
         return redirect('panel_trabajador')
     
     # Filtro de búsqueda (opcional para el calendario)
+    # Las citas se cargan por ventana desde calendario_citas_eventos_ajax
     search_query = request.GET.get('search', '').strip()
     
-    # Obtener todas las citas para el calendario (con filtro si existe)
-    citas_calendario = Cita.objects.all().select_related('tipo_servicio', 'dentista', 'cliente').order_by('fecha_hora')
-    
-    # Aplicar filtro de búsqueda si existe
-    if search_query:
-        citas_calendario = citas_calendario.filter(
-            Q(cliente__nombre_completo__icontains=search_query) |
-            Q(cliente__email__icontains=search_query) |
-            Q(cliente__telefono__icontains=search_query) |
-            Q(paciente_nombre__icontains=search_query) |
-            Q(paciente_email__icontains=search_query) |
-            Q(tipo_servicio__nombre__icontains=search_query) |
-            Q(tipo_consulta__icontains=search_query) |
-            Q(dentista__nombre_completo__icontains=search_query) |
-            Q(notas__icontains=search_query)
-        )
-    
     # Estadísticas
     # El contador debe excluir las citas canceladas para ser consistente
     estadisticas = {
@@ -2520,8 +2530,6 @@ def calendario_citas(request):
     # Obtener datos necesarios
     dentistas = Perfil.objects.filter(rol='dentista', activo=True).select_related('user')
     servicios_activos = TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre')
-    from pacientes.models import Cliente
-    clientes = Cliente.objects.filter(activo=True).order_by('nombre_completo')
     
     # Citas pasadas para sidebar
     citas_pasadas = Cita.objects.filter(
@@ -2532,20 +2540,105 @@ def calendario_citas(request):
         estado__in=['disponible', 'reservada', 'confirmada']
     ).select_related('tipo_servicio', 'dentista', 'cliente').order_by('-fecha_hora')[:10]
     
+    # Los clientes no se incrustan en la página: el modal de nueva cita los busca en el servidor
     context = {
         'perfil': perfil,
         'estadisticas': estadisticas,
         'dentistas': dentistas,
         'servicios_activos': servicios_activos,
-        'clientes': clientes,
+        'busqueda_clientes_remota': True,
         'es_admin': True,
         'seccion_activa': 'calendario',
         'search_query': search_query,
-        'citas_calendario': citas_calendario,
         'citas_pasadas': citas_pasadas,
     }
     return render(request, 'citas/citas/gestor_citas_base.html', context)
 
+
+# Vista AJAX con las citas de la ventana visible del calendario general
+@login_required
+def calendario_citas_eventos_ajax(request):
+    """
+    Devuelve en JSON las citas de la ventana [start, end) que muestra el calendario.
+
+    Parámetros GET:
+    - start, end: Límites de la ventana en ISO 8601 (los envía FullCalendar)
+    - search: Texto de búsqueda (opcional)
+
+    Responde 304 si el navegador envía un If-None-Match con la versión vigente.
+    """
+    from django.http import HttpResponseNotModified
+    from django.utils.dateparse import parse_datetime, parse_date
+    from django.utils.http import parse_etags, quote_etag
+    from citas.calendario_service import (
+        DIAS_MAXIMOS_VENTANA, citas_ventana, eventos_ventana, version_ventana
+    )
+
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.activo or not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'error': 'No tienes permisos para ver el calendario'}, status=403)
+    except Perfil.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Perfil no encontrado'}, status=404)
+
+    limites = []
+    for parametro in ('start', 'end'):
+        valor = request.GET.get(parametro, '').strip().replace(' ', '+')
+        fecha_hora = parse_datetime(valor)
+        if fecha_hora is None:
+            fecha = parse_date(valor[:10]) if valor else None
+            if fecha is None:
+                return JsonResponse({'success': False, 'error': f'Parámetro {parametro} inválido'}, status=400)
+            fecha_hora = datetime.combine(fecha, datetime.min.time())
+        if timezone.is_naive(fecha_hora):
+            fecha_hora = timezone.make_aware(fecha_hora)
+        limites.append(fecha_hora)
+    inicio, fin = limites
+
+    if fin <= inicio or (fin - inicio).days > DIAS_MAXIMOS_VENTANA:
+        return JsonResponse({'success': False, 'error': f'La ventana debe ser de máximo {DIAS_MAXIMOS_VENTANA} días'}, status=400)
+
+    search_query = request.GET.get('search', '').strip()
+    citas = citas_ventana(inicio, fin, search_query)
+
+    etag = quote_etag(version_ventana(citas, inicio, fin, search_query))
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        respuesta = HttpResponseNotModified()
+    else:
+        respuesta = JsonResponse({'success': True, 'eventos': eventos_ventana(citas)})
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+# Vista AJAX para buscar clientes activos por nombre o email (modal de nueva cita)
+@login_required
+def buscar_clientes_ajax(request):
+    """Devuelve hasta 10 clientes activos cuyo nombre o email contiene el texto buscado"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.activo or not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'error': 'No tienes permisos para buscar clientes'}, status=403)
+    except Perfil.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Perfil no encontrado'}, status=404)
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'success': True, 'clientes': []})
+
+    from pacientes.models import Cliente
+    clientes = Cliente.objects.filter(
+        Q(nombre_completo__icontains=query) | Q(email__icontains=query),
+        activo=True
+    ).order_by('nombre_completo').values('id', 'nombre_completo', 'email', 'telefono')[:10]
+    return JsonResponse({
+        'success': True,
+        'clientes': [
+            {'id': c['id'], 'nombre': c['nombre_completo'], 'email': c['email'], 'telefono': c['telefono'] or ''}
+            for c in clientes
+        ]
+    })
+
 # Registrar nuevo trabajador con protección de seguridad
 @never_cache
 @csrf_protect
@@ -2635,112 +2728,87 @@ def dashboard(request):
     except Perfil.DoesNotExist:
         return redirect('login')
     
+    from citas.estadisticas_service import contar, limites_mes, q_fechas
+    
     # Fechas de referencia
-    ahora = timezone.now()
-    hoy = ahora.date()
-    inicio_mes = hoy.replace(day=1)
-    fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    hoy = timezone.now().date()
+    inicio_mes, fin_mes = limites_mes(hoy)
     semana_actual = hoy - timedelta(days=7)
-    mes_actual = hoy - timedelta(days=30)
+    proximos_7_dias = hoy + timedelta(days=7)
+    
+    # Conteos de citas compartidos por ambos roles
+    condiciones_citas = {
+        # Excluir citas canceladas para que el contador coincida con la lista
+        'citas_hoy': q_fechas('fecha_hora', hoy, hoy) & ~Q(estado='cancelada'),
+        'citas_semana': q_fechas('fecha_hora', desde=semana_actual),
+        'citas_mes': q_fechas('fecha_hora', inicio_mes, fin_mes),
+        'citas_confirmadas': Q(estado='confirmada'),
+        'citas_completadas': Q(estado='completada'),
+    }
     
     if perfil.es_administrativo():
         # ===== ESTADÍSTICAS GENERALES =====
-        total_citas = Cita.objects.count()
-        total_clientes = Cliente.objects.filter(activo=True).count()
-        total_personal = Perfil.objects.filter(activo=True).count()
-        total_insumos = Insumo.objects.count()
-        
-        # Citas
-        # Excluir citas canceladas para que el contador coincida con la lista
-        citas_hoy = Cita.objects.filter(fecha_hora__date=hoy).exclude(estado='cancelada').count()
-        citas_semana = Cita.objects.filter(fecha_hora__date__gte=semana_actual).count()
-        citas_mes = Cita.objects.filter(fecha_hora__date__gte=inicio_mes, fecha_hora__date__lte=fin_mes).count()
-        citas_disponibles = Cita.objects.filter(estado='disponible').count()
-        citas_reservadas = Cita.objects.filter(estado='reservada').count()
-        citas_confirmadas = Cita.objects.filter(estado='confirmada').count()
-        citas_completadas = Cita.objects.filter(estado='completada').count()
+        # Todos los conteos de citas en una sola consulta (agregados condicionales)
+        estadisticas = contar(
+            Cita.objects,
+            total_citas=Q(),
+            citas_disponibles=Q(estado='disponible'),
+            citas_reservadas=Q(estado='reservada'),
+            **condiciones_citas
+        )
+        estadisticas.update(contar(
+            Cliente.objects,
+            total_clientes=Q(activo=True),
+            clientes_nuevos_mes=q_fechas('fecha_registro', inicio_mes, fin_mes),
+        ))
+        estadisticas.update(contar(
+            Insumo.objects,
+            total_insumos=Q(),
+            insumos_bajo_stock=Q(cantidad_actual__lte=F('cantidad_minima')),
+        ))
+        estadisticas['total_personal'] = Perfil.objects.filter(activo=True).count()
+        insumos_bajo_stock = estadisticas['insumos_bajo_stock']
+        clientes_nuevos_mes = estadisticas['clientes_nuevos_mes']
         
         # Citas próximas (próximas 7 días)
-        proximos_7_dias = hoy + timedelta(days=7)
         citas_proximas = Cita.objects.filter(
-            fecha_hora__date__gte=hoy,
-            fecha_hora__date__lte=proximos_7_dias,
+            q_fechas('fecha_hora', hoy, proximos_7_dias),
             estado__in=['reservada', 'confirmada']
         ).select_related('dentista', 'cliente').order_by('fecha_hora')[:10]
         
         # Citas de hoy con detalles (excluir canceladas para consistencia)
         citas_hoy_detalle = Cita.objects.filter(
-            fecha_hora__date=hoy
+            q_fechas('fecha_hora', hoy, hoy)
         ).exclude(estado='cancelada').select_related('dentista', 'cliente').order_by('fecha_hora')
         
-        
-        # Insumos con stock bajo
-        insumos_bajo_stock = Insumo.objects.filter(
-            cantidad_actual__lte=F('cantidad_minima')
-        ).count()
-        
-        # Clientes nuevos este mes
-        clientes_nuevos_mes = Cliente.objects.filter(
-            fecha_registro__date__gte=inicio_mes,
-            fecha_registro__date__lte=fin_mes
-        ).count()
-        
         # Citas por estado (últimos 7 días)
         citas_por_estado = Cita.objects.filter(
-            fecha_hora__date__gte=semana_actual
+            q_fechas('fecha_hora', desde=semana_actual)
         ).values('estado').annotate(total=Count('estado'))
         
-        estadisticas = {
-            'total_citas': total_citas,
-            'total_clientes': total_clientes,
-            'total_personal': total_personal,
-            'total_insumos': total_insumos,
-            'citas_hoy': citas_hoy,
-            'citas_semana': citas_semana,
-            'citas_mes': citas_mes,
-            'citas_disponibles': citas_disponibles,
-            'citas_reservadas': citas_reservadas,
-            'citas_confirmadas': citas_confirmadas,
-            'citas_completadas': citas_completadas,
-            'insumos_bajo_stock': insumos_bajo_stock,
-            'clientes_nuevos_mes': clientes_nuevos_mes,
-        }
-        
     else:
-        # Estadísticas para dentistas
-        # Excluir citas canceladas para que el contador coincida con la lista
-        citas_hoy = Cita.objects.filter(fecha_hora__date=hoy, dentista=perfil).exclude(estado='cancelada').count()
-        citas_semana = Cita.objects.filter(fecha_hora__date__gte=semana_actual, dentista=perfil).count()
-        citas_mes = Cita.objects.filter(fecha_hora__date__gte=inicio_mes, fecha_hora__date__lte=fin_mes, dentista=perfil).count()
+        # Estadísticas para dentistas (una sola consulta sobre sus citas)
+        citas_dentista = Cita.objects.filter(dentista=perfil)
+        estadisticas = contar(
+            citas_dentista,
+            citas_pendientes=Q(estado='reservada'),
+            **condiciones_citas
+        )
         
         # Citas próximas del dentista
-        proximos_7_dias = hoy + timedelta(days=7)
-        citas_proximas = Cita.objects.filter(
-            dentista=perfil,
-            fecha_hora__date__gte=hoy,
-            fecha_hora__date__lte=proximos_7_dias,
+        citas_proximas = citas_dentista.filter(
+            q_fechas('fecha_hora', hoy, proximos_7_dias),
             estado__in=['reservada', 'confirmada']
         ).select_related('cliente').order_by('fecha_hora')[:10]
         
         # Citas de hoy del dentista (excluir canceladas para consistencia)
-        citas_hoy_detalle = Cita.objects.filter(
-            fecha_hora__date=hoy,
-            dentista=perfil
+        citas_hoy_detalle = citas_dentista.filter(
+            q_fechas('fecha_hora', hoy, hoy)
         ).exclude(estado='cancelada').select_related('cliente').order_by('fecha_hora')
         
-        estadisticas = {
-            'citas_hoy': citas_hoy,
-            'citas_semana': citas_semana,
-            'citas_mes': citas_mes,
-            'citas_pendientes': Cita.objects.filter(dentista=perfil, estado='reservada').count(),
-            'citas_confirmadas': Cita.objects.filter(dentista=perfil, estado='confirmada').count(),
-            'citas_completadas': Cita.objects.filter(dentista=perfil, estado='completada').count(),
-        }
-        
         # Citas por estado para el dentista (últimos 7 días)
-        citas_por_estado = Cita.objects.filter(
-            fecha_hora__date__gte=semana_actual,
-            dentista=perfil
+        citas_por_estado = citas_dentista.filter(
+            q_fechas('fecha_hora', desde=semana_actual)
         ).values('estado').annotate(total=Count('estado'))
         
         # Valores por defecto para dentistas
@@ -4653,8 +4721,20 @@ def asignar_dentista_cita(request, cita_id):
         if dentista_id:
             try:
                 dentista = Perfil.objects.get(id=dentista_id, rol='dentista', activo=True)
+                # Verificar que la cita no choque con la agenda del dentista ni de su sala
+                from citas.agenda_service import duracion_servicio, buscar_solapamiento
+                conflicto = buscar_solapamiento(
+                    dentista,
+                    cita.fecha_hora,
+                    duracion_servicio(cita.tipo_servicio),
+                    excluir_cita_id=cita.id
+                )
+                if conflicto:
+                    messages.error(request, f'El dentista {dentista.nombre_completo} ya tiene una cita a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")} que se solapa con esta.')
+                    return redirect('panel_trabajador')
                 # Asignar dentista usando ORM normal
                 cita.dentista = dentista
+                cita.sala_id = dentista.sala_asignada_id
                 cita.save()
                 messages.success(request, f'Dentista {dentista.nombre_completo} asignado correctamente.')
                 return redirect('panel_trabajador')
@@ -4823,191 +4903,17 @@ def exportar_insumos_pdf(request):
         messages.error(request, 'No tienes permisos para acceder a esta función.')
         return redirect('login')
 
-    # Obtener todos los insumos
-    insumos = Insumo.objects.all().order_by('categoria', 'nombre')
-    
-    # Crear el buffer para el PDF
+    from .pdf_service import construir_pdf_insumos, preparar_para_pdf
+
+    insumos = preparar_para_pdf('insumos', Insumo.objects.order_by('categoria', 'nombre'))
     buffer = BytesIO()
-    
-    # Crear el documento PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=18
-    )
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    
-    # Estilo personalizado para el título
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#3b82f6')
-    )
-    
-    # Estilo para subtítulos
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#1e293b')
-    )
-    
-    # Estilo para información de la clínica
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#64748b')
-    )
-    
-    # Contenido del PDF
-    story = []
-    
-    # Título principal
-    title = Paragraph("INVENTARIO DE INSUMOS", title_style)
-    story.append(title)
-    
-    # Información de la clínica y fecha
-    clinic_info = Paragraph(
-        f"<b>Clínica Dental</b><br/>"
-        f"Reporte generado el: {datetime.now().strftime('%d/%m/%Y a las %H:%M')}<br/>"
-        f"Generado por: {perfil.nombre_completo}",
-        info_style
-    )
-    story.append(clinic_info)
-    story.append(Spacer(1, 20))
-    
-    # Estadísticas generales
-    total_insumos = insumos.count()
-    stock_bajo = insumos.filter(cantidad_actual__lte=F('cantidad_minima')).count()
-    agotados = insumos.filter(estado='agotado').count()
-    
-    stats_text = f"""
-    <b>ESTADÍSTICAS GENERALES:</b><br/>
-    • Total de insumos: {total_insumos}<br/>
-    • Stock bajo: {stock_bajo}<br/>
-    • Agotados: {agotados}
-    """
-    stats_para = Paragraph(stats_text, subtitle_style)
-    story.append(stats_para)
-    story.append(Spacer(1, 20))
-    
-    # Agrupar insumos por categoría
-    categorias = {}
-    for insumo in insumos:
-        categoria = insumo.get_categoria_display()
-        if categoria not in categorias:
-            categorias[categoria] = []
-        categorias[categoria].append(insumo)
-    
-    # Crear tabla para cada categoría
-    for categoria, insumos_categoria in categorias.items():
-        # Subtítulo de categoría
-        categoria_title = Paragraph(f"<b>{categoria.upper()}</b>", subtitle_style)
-        story.append(categoria_title)
-        story.append(Spacer(1, 10))
-        
-        # Crear tabla de insumos
-        table_data = [
-            ['Nombre', 'Stock Actual', 'Stock Mínimo', 'Estado', 'Proveedor', 'Ubicación']
-        ]
-        
-        for insumo in insumos_categoria:
-            # Determinar estado visual
-            if insumo.estado == 'agotado':
-                estado = "AGOTADO"
-            elif insumo.stock_bajo:
-                estado = "STOCK BAJO"
-            elif insumo.proximo_vencimiento:
-                estado = "PRÓXIMO A VENCER"
-            else:
-                estado = "DISPONIBLE"
-            
-            table_data.append([
-                insumo.nombre,
-                f"{insumo.cantidad_actual} {insumo.unidad_medida}",
-                f"{insumo.cantidad_minima} {insumo.unidad_medida}",
-                estado,
-                insumo.proveedor or "N/A",
-                insumo.ubicacion or "N/A"
-            ])
-        
-        # Crear tabla
-        table = Table(table_data, colWidths=[2*inch, 1*inch, 1*inch, 1*inch, 1.5*inch, 1*inch])
-        
-        # Estilo de la tabla
-        table.setStyle(TableStyle([
-            # Encabezados
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Filas de datos
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            
-            # Colores de estado
-            ('TEXTCOLOR', (3, 1), (3, -1), colors.black),
-        ]))
-        
-        # Aplicar colores de estado
-        for i, insumo in enumerate(insumos_categoria, 1):
-            if insumo.estado == 'agotado':
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.red),
-                ]))
-            elif insumo.stock_bajo:
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.orange),
-                ]))
-            elif insumo.proximo_vencimiento:
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.red),
-                ]))
-            else:
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.green),
-                ]))
-        
-        story.append(table)
-        story.append(Spacer(1, 20))
-    
-    # Pie de página
-    footer_text = f"""
-    <i>Este reporte fue generado automáticamente por el sistema de gestión de la clínica dental.<br/>
-    Para más información, consulte el sistema en línea.</i>
-    """
-    footer_para = Paragraph(footer_text, info_style)
-    story.append(Spacer(1, 30))
-    story.append(footer_para)
-    
-    # Construir el PDF
-    doc.build(story)
-    
-    # Obtener el contenido del buffer
+    filename = construir_pdf_insumos(insumos, buffer, perfil.nombre_completo)
     pdf_content = buffer.getvalue()
     buffer.close()
     
     # Crear respuesta HTTP
     response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="inventario_insumos_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf"'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     response.write(pdf_content)
     
     return response
@@ -5237,6 +5143,17 @@ def asignar_dentista_cliente(request, cliente_id):
         return redirect('gestor_clientes')
     
     if request.method == 'POST':
+        from citas.agenda_service import reasignar_citas
+        
+        def avisar_conflictos(conflictos):
+            """Informa las citas que no se movieron porque chocan con la agenda del dentista o de su sala"""
+            if not conflictos:
+                return
+            horas = ', '.join(timezone.localtime(c.fecha_hora).strftime('%d/%m/%Y %H:%M') for c in conflictos[:5])
+            if len(conflictos) > 5:
+                horas += f' y {len(conflictos) - 5} más'
+            messages.warning(request, f'{len(conflictos)} cita(s) no se reasignaron porque chocan con otra cita del dentista o de su sala: {horas}.')
+        
         dentista_id = request.POST.get('dentista')
         if dentista_id:
             try:
@@ -5245,11 +5162,12 @@ def asignar_dentista_cliente(request, cliente_id):
                 cliente.dentista_asignado = dentista
                 cliente.save()
                 
-                # También actualizar las citas del cliente
-                Cita.objects.filter(cliente=cliente).update(dentista=dentista)
-                Cita.objects.filter(paciente_email=cliente.email).update(dentista=dentista)
+                # También actualizar las citas del cliente (cada una se valida contra la agenda)
+                citas_cliente = Cita.objects.filter(Q(cliente=cliente) | Q(paciente_email=cliente.email))
+                _, conflictos = reasignar_citas(citas_cliente, dentista)
                 
                 messages.success(request, f'Dentista {dentista.nombre_completo} asignado correctamente al cliente {cliente.nombre_completo}.')
+                avisar_conflictos(conflictos)
                 return redirect('gestor_clientes')
             except Perfil.DoesNotExist:
                 messages.error(request, 'Dentista no encontrado.')
@@ -5259,10 +5177,11 @@ def asignar_dentista_cliente(request, cliente_id):
             cliente.save()
             
             # También remover de las citas del cliente
-            Cita.objects.filter(cliente=cliente).update(dentista=None)
-            Cita.objects.filter(paciente_email=cliente.email).update(dentista=None)
+            citas_cliente = Cita.objects.filter(Q(cliente=cliente) | Q(paciente_email=cliente.email))
+            _, conflictos = reasignar_citas(citas_cliente, None)
             
             messages.success(request, f'Dentista removido del cliente {cliente.nombre_completo}.')
+            avisar_conflictos(conflictos)
             return redirect('gestor_clientes')
     
     # Obtener dentistas disponibles
@@ -6248,7 +6167,9 @@ def eliminar_odontograma(request, odontograma_id):
 # Vista para exportar odontograma a PDF
 @login_required
 def exportar_odontograma_pdf(request, odontograma_id):
-    """Vista para exportar un odontograma a PDF"""
+    """Vista para exportar un odontograma a PDF (servido desde el PDF guardado si la ficha no cambió)"""
+    from .odontograma_pdf_service import nombre_descarga_odontograma, obtener_pdf_odontograma
+
     try:
         perfil = Perfil.objects.get(user=request.user)
         # Permitir tanto a dentistas como a administrativos
@@ -6261,1099 +6182,80 @@ def exportar_odontograma_pdf(request, odontograma_id):
 
     # Los administrativos pueden ver cualquier odontograma, los dentistas solo los suyos
     if perfil.es_administrativo():
-        odontograma = get_object_or_404(Odontograma, id=odontograma_id)
+        odontograma = get_object_or_404(Odontograma.objects.select_related('dentista'), id=odontograma_id)
     else:
-        odontograma = get_object_or_404(Odontograma, id=odontograma_id, dentista=perfil)
-    
-    # Obtener estados de los dientes
-    estados_dientes = odontograma.dientes.all().order_by('numero_diente')
-    
-    # Crear diccionario de dientes para facilitar el acceso
-    dientes_dict = {diente.numero_diente: diente for diente in estados_dientes}
-    
-    # Función para extraer datos del odontograma interactivo desde observaciones
-    def get_tooth_interactive_data(estado_diente):
-        """Extrae los datos de las caras del odontograma interactivo desde observaciones"""
-        if not estado_diente or not estado_diente.observaciones:
-            return None
-        if estado_diente.observaciones.startswith('Datos del odontograma interactivo: '):
-            try:
-                import json
-                json_str = estado_diente.observaciones.replace('Datos del odontograma interactivo: ', '')
-                data = json.loads(json_str)
-                # Si tiene estructura con 'caras', devolver las caras directamente
-                if isinstance(data, dict) and 'caras' in data:
-                    return data['caras']
-                # Si es directamente un diccionario de caras, devolverlo
-                elif isinstance(data, dict):
-                    return data
-                return None
-            except:
-                return None
-        return None
-    
-    # Crear el buffer para el PDF
-    buffer = BytesIO()
-    
-    # Crear el documento PDF con márgenes mejorados
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=25,
-        leftMargin=25,
-        topMargin=40,
-        bottomMargin=30
-    )
+        odontograma = get_object_or_404(Odontograma.objects.select_related('dentista'), id=odontograma_id, dentista=perfil)
     
-    # Estilos mejorados
-    styles = getSampleStyleSheet()
-    
-    # Estilo personalizado para el título principal
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=10,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold'
-    )
+    documento = obtener_pdf_odontograma(odontograma, perfil)
     
-    # Estilo para subtítulos con color turquesa
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=11,
-        spaceAfter=8,
-        spaceBefore=12,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold',
-        borderColor=colors.HexColor('#14b8a6'),
-        borderWidth=1,
-        borderPadding=6,
-        backColor=colors.HexColor('#f0fdfa')
-    )
+    # Registrar auditoría - Exportar odontograma a PDF (solo para dentistas)
+    if perfil.es_dentista():
+        registrar_auditoria(
+            usuario=perfil,
+            accion='exportar',
+            modulo='odontogramas',
+            descripcion=f'Ficha odontológica exportada a PDF para {odontograma.paciente_nombre}',
+            detalles=f'Odontograma ID: {odontograma.id}, Paciente: {odontograma.paciente_nombre}',
+            objeto_id=odontograma.id,
+            tipo_objeto='Odontograma',
+            request=request
+        )
     
-    # Estilo para información de la clínica
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=8,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#64748b')
+    return FileResponse(
+        documento.archivo_pdf.open('rb'),
+        as_attachment=True,
+        filename=nombre_descarga_odontograma(odontograma),
+        content_type='application/pdf',
     )
-    
-    # Estilo para texto normal
-    normal_style = ParagraphStyle(
-        'NormalCompact',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=4,
-        alignment=TA_LEFT,
-        leading=12
+
+
+def _registrar_documento_presupuesto(plan, perfil):
+    """Crea el DocumentoCliente del presupuesto si aún no existe"""
+    documento, created = DocumentoCliente.objects.get_or_create(
+        plan_tratamiento=plan,
+        tipo='presupuesto',
+        defaults={
+            'cliente': plan.cliente,  # Puede ser None si el cliente fue eliminado
+            'titulo': f'Presupuesto - {plan.nombre}',
+            'descripcion': f'Presupuesto del tratamiento {plan.nombre}',
+            'generado_por': perfil,
+        }
     )
+    return documento
+
+
+# Vista para exportar presupuesto/tratamiento a PDF
+@login_required
+def exportar_presupuesto_pdf(request, plan_id):
+    """Vista para exportar un plan de tratamiento (presupuesto) a PDF"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not (perfil.es_dentista() or perfil.es_administrativo()):
+            messages.error(request, 'No tienes permisos para exportar presupuestos.')
+            return redirect('panel_trabajador')
+    except Perfil.DoesNotExist:
+        messages.error(request, 'No tienes permisos para acceder a esta función.')
+        return redirect('login')
+
+    from .pdf_service import construir_pdf_presupuesto, datos_clinica, preparar_para_pdf
+
+    # Obtener el plan de tratamiento
+    planes = preparar_para_pdf('presupuesto', PlanTratamiento.objects.all())
+    if perfil.es_administrativo():
+        plan = get_object_or_404(planes, id=plan_id)
+    else:
+        plan = get_object_or_404(planes, id=plan_id, dentista=perfil)
     
-    # Estilo para texto de secciones
-    section_text_style = ParagraphStyle(
-        'SectionText',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=6,
-        alignment=TA_LEFT,
-        leading=13,
-        textColor=colors.HexColor('#374151')
-    )
+    # Generar el PDF
+    buffer = BytesIO()
+    construir_pdf_presupuesto(plan, buffer, perfil.nombre_completo, datos_clinica())
     
-    # Contenido del PDF
-    story = []
+    # Obtener el contenido del buffer
+    pdf_content = buffer.getvalue()
+    buffer.close()
     
-    # Título principal con diseño mejorado
-    title = Paragraph("<b>FICHA ODONTOLÓGICA</b>", title_style)
-    story.append(title)
-    
-    # Información de la clínica y fecha
-    clinic_info = Paragraph(
-        f"<b>Clínica Dental</b> | Fecha de Emisión: {datetime.now().strftime('%d/%m/%Y %H:%M')}",
-        info_style
-    )
-    story.append(clinic_info)
-    story.append(Spacer(1, 12))
-    
-    # Nota introductoria breve para el paciente con color turquesa
-    nota_intro = Paragraph(
-        "<b>NOTA:</b><br/>"
-        "Este documento contiene el registro de su salud dental. "
-        "El odontograma muestra la condición de cada diente. "
-        "Consulte la leyenda al final para entender los símbolos y colores.",
-        ParagraphStyle(
-            'NotaIntro',
-            parent=styles['Normal'],
-            fontSize=8,
-            spaceAfter=10,
-            alignment=TA_LEFT,
-            textColor=colors.HexColor('#374151'),
-            leading=12,
-            leftIndent=0,
-            rightIndent=0,
-            backColor=colors.HexColor('#f0fdfa'),
-            borderPadding=8,
-            borderColor=colors.HexColor('#14b8a6'),
-            borderWidth=1
-        )
-    )
-    story.append(nota_intro)
-    story.append(Spacer(1, 12))
-    
-    # Sección: Información del Paciente
-    paciente_title = Paragraph("<b>INFORMACIÓN DEL PACIENTE</b>", subtitle_style)
-    story.append(paciente_title)
-    
-    # Tabla de información del paciente (solo datos esenciales)
-    paciente_data = [
-        ['Nombre:', odontograma.paciente_nombre],
-        ['Email:', odontograma.paciente_email],
-        ['Teléfono:', odontograma.paciente_telefono or 'No especificado']
-    ]
-    if odontograma.paciente_fecha_nacimiento:
-        paciente_data.append(['Fecha de Nacimiento:', odontograma.paciente_fecha_nacimiento.strftime('%d/%m/%Y')])
-    paciente_table = Table(paciente_data, colWidths=[2*inch, 4.5*inch])
-    paciente_table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ])
-    paciente_table.setStyle(paciente_table_style)
-    story.append(paciente_table)
-    story.append(Spacer(1, 12))
-    
-    # Sección: Información Clínica
-    clinica_title = Paragraph("<b>INFORMACIÓN CLÍNICA</b>", subtitle_style)
-    story.append(clinica_title)
-    
-    # Motivo de consulta (solo si existe)
-    if odontograma.motivo_consulta:
-        motivo_text = Paragraph(f"<b>Motivo de Consulta:</b> {odontograma.motivo_consulta}", section_text_style)
-        story.append(motivo_text)
-        story.append(Spacer(1, 4))
-    
-    # Estado e higiene en tabla (solo si hay datos)
-    estado_data = []
-    if odontograma.higiene_oral:
-        estado_data.append(['Higiene Oral:', odontograma.get_higiene_oral_display()])
-    if odontograma.estado_general:
-        estado_data.append(['Estado General:', odontograma.get_estado_general_display()])
-    if estado_data:
-        estado_table = Table(estado_data, colWidths=[2*inch, 4.5*inch])
-        estado_table_style = TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ])
-        estado_table.setStyle(estado_table_style)
-        story.append(estado_table)
-        story.append(Spacer(1, 6))
-    
-    # Antecedentes médicos (solo si existe)
-    if odontograma.antecedentes_medicos:
-        antecedentes_text = Paragraph(f"<b>Antecedentes Médicos:</b> {odontograma.antecedentes_medicos}", section_text_style)
-        story.append(antecedentes_text)
-        story.append(Spacer(1, 4))
-    
-    # Alergias (solo si existe)
-    if odontograma.alergias:
-        alergias_text = Paragraph(f"<b>Alergias:</b> {odontograma.alergias}", section_text_style)
-        story.append(alergias_text)
-        story.append(Spacer(1, 4))
-    
-    # Medicamentos actuales (solo si existe)
-    if odontograma.medicamentos_actuales:
-        medicamentos_text = Paragraph(f"<b>Medicamentos Actuales:</b> {odontograma.medicamentos_actuales}", section_text_style)
-        story.append(medicamentos_text)
-        story.append(Spacer(1, 6))
-    
-    # Sección: Odontograma Visual
-    odontograma_title = Paragraph("<b>ODONTOGRAMA DENTAL</b>", subtitle_style)
-    story.append(odontograma_title)
-    
-    # Explicación clara del odontograma
-    explicacion_odontograma = Paragraph(
-        "<b>¿Cómo leer este odontograma?</b><br/>"
-        "La boca se divide en 4 cuadrantes (superior derecho, superior izquierdo, inferior izquierdo, inferior derecho). "
-        "Cada diente tiene un número único según la numeración internacional (FDI). "
-        "Los símbolos y colores indican el estado de cada diente. Consulte la leyenda al final para entender cada símbolo.",
-        ParagraphStyle(
-            'ExplicacionOdontograma',
-            parent=styles['Normal'],
-            fontSize=9,
-            spaceAfter=8,
-            alignment=TA_LEFT,
-            textColor=colors.HexColor('#374151'),
-            leading=13,
-            leftIndent=0,
-            backColor=colors.HexColor('#f0fdfa'),
-            borderPadding=8,
-            borderColor=colors.HexColor('#ccfbf1'),
-            borderWidth=1
-        )
-    )
-    story.append(explicacion_odontograma)
-    story.append(Spacer(1, 6))
-    
-    # Función para obtener color según estado
-    def get_tooth_color(estado):
-        # Asegurarse de que estado sea un string
-        if not isinstance(estado, str):
-            if isinstance(estado, dict):
-                return colors.HexColor('#f3f4f6')  # Gris claro por defecto
-            estado = str(estado) if estado else 'sano'
-        
-        color_map = {
-            'sano': colors.HexColor('#10b981'),      # Verde
-            'cariado': colors.HexColor('#dc2626'),    # Rojo
-            'caries': colors.HexColor('#dc2626'),     # Rojo
-            'obturado': colors.HexColor('#f59e0b'),  # Amarillo
-            'corona': colors.HexColor('#fbbf24'),    # Dorado
-            'perdido': colors.HexColor('#6b7280'),   # Gris
-            'ausente': colors.HexColor('#6b7280'),    # Gris
-            'endodoncia': colors.HexColor('#0ea5e9'), # Azul
-            'protesis': colors.HexColor('#8b5cf6'),  # Púrpura
-            'implante': colors.HexColor('#06b6d4'),  # Cian
-            'sellante': colors.HexColor('#84cc16'),   # Verde claro
-            'fractura': colors.HexColor('#ef4444'),  # Rojo oscuro
-            'extraccion': colors.HexColor('#991b1b'), # Rojo muy oscuro
-        }
-        return color_map.get(estado.lower() if estado else 'sano', colors.HexColor('#f3f4f6'))  # Gris claro por defecto
-    
-    # Función para obtener el estado principal del diente (considerando datos interactivos)
-    def get_tooth_main_state(numero_diente):
-        estado_diente = dientes_dict.get(numero_diente)
-        if not estado_diente:
-            return 'sano', None
-        
-        # Intentar obtener datos interactivos
-        interactive_data = get_tooth_interactive_data(estado_diente)
-        
-        if interactive_data:
-            # Si hay datos interactivos, determinar el estado principal
-            estados = list(interactive_data.values())
-            if 'ausente' in estados or 'perdido' in estados:
-                return 'ausente', interactive_data
-            elif 'caries' in estados or 'cariado' in estados:
-                return 'caries', interactive_data
-            elif 'obturado' in estados:
-                return 'obturado', interactive_data
-            elif 'corona' in estados:
-                return 'corona', interactive_data
-            elif 'endodoncia' in estados:
-                return 'endodoncia', interactive_data
-            elif 'protesis' in estados:
-                return 'protesis', interactive_data
-            elif 'implante' in estados:
-                return 'implante', interactive_data
-            elif 'fractura' in estados:
-                return 'fractura', interactive_data
-            elif 'sellante' in estados:
-                return 'sellante', interactive_data
-            else:
-                return 'sano', interactive_data
-        
-        # Si no hay datos interactivos, usar el estado general
-        # Asegurarse de que siempre devolvamos un string
-        estado = estado_diente.estado
-        if isinstance(estado, dict):
-            # Si el estado es un diccionario, usar 'sano' por defecto
-            return 'sano', None
-        return str(estado) if estado else 'sano', None
-    
-    # Función para obtener símbolo según estado
-    def get_tooth_symbol(estado):
-        # Asegurarse de que estado sea un string
-        if not isinstance(estado, str):
-            if isinstance(estado, dict):
-                return '?'
-            estado = str(estado) if estado else 'sano'
-        
-        symbol_map = {
-            'sano': '✓',
-            'caries': '●',
-            'cariado': '●',
-            'obturado': '■',
-            'corona': '◊',
-            'perdido': '✕',
-            'ausente': '✕',
-            'endodoncia': '◐',
-            'protesis': '◈',
-            'implante': '◉',
-            'sellante': '◯',
-            'fractura': '◢',
-            'extraccion': '✕',
-        }
-        return symbol_map.get(estado.lower() if estado else 'sano', '?')
-    
-    # Función para obtener texto del diente (simplificado - solo número y símbolo principal)
-    def get_tooth_display(numero_diente, estado_val, interactive_data):
-        # Mostrar solo número de diente y símbolo principal - sin duplicar información
-        symbol = get_tooth_symbol(estado_val)
-        return f"{numero_diente}\n{symbol}"
-    
-    # Crear estructura del odontograma anatómico
-    odontograma_data = []
-    
-    # Encabezado con nombres de dientes (más claro)
-    header_row = ['CUADRANTE', 'Molar 3', 'Molar 2', 'Molar 1', 'Premolar 2', 'Premolar 1', 'Canino', 'Incisivo 2', 'Incisivo 1']
-    odontograma_data.append(header_row)
-    
-    # Cuadrante Superior Derecho (vista del paciente)
-    superior_derecho = ['SUPERIOR\nDERECHO']
-    for numero in [18, 17, 16, 15, 14, 13, 12, 11]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        superior_derecho.append(display_text)
-    odontograma_data.append(superior_derecho)
-    
-    # Cuadrante Superior Izquierdo (vista del paciente)
-    superior_izquierdo = ['SUPERIOR\nIZQUIERDO']
-    for numero in [21, 22, 23, 24, 25, 26, 27, 28]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        superior_izquierdo.append(display_text)
-    odontograma_data.append(superior_izquierdo)
-    
-    # Separador visual
-    odontograma_data.append(['─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10])
-    
-    # Cuadrante Inferior Izquierdo (vista del paciente)
-    inferior_izquierdo = ['INFERIOR\nIZQUIERDO']
-    for numero in [38, 37, 36, 35, 34, 33, 32, 31]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        inferior_izquierdo.append(display_text)
-    odontograma_data.append(inferior_izquierdo)
-    
-    # Cuadrante Inferior Derecho (vista del paciente)
-    inferior_derecho = ['INFERIOR\nDERECHO']
-    for numero in [41, 42, 43, 44, 45, 46, 47, 48]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        inferior_derecho.append(display_text)
-    odontograma_data.append(inferior_derecho)
-    
-    # Crear tabla del odontograma mejorada (con más espacio para legibilidad)
-    odontograma_table = Table(odontograma_data, colWidths=[1*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch])
-    
-    # Estilo de la tabla del odontograma mejorada con colores turquesa
-    table_style = TableStyle([
-        # Encabezado con color turquesa
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        
-        # Cuadrantes - colores turquesa diferenciados
-        ('BACKGROUND', (0, 1), (0, 1), colors.HexColor('#14b8a6')),  # Sup Der
-        ('BACKGROUND', (0, 2), (0, 2), colors.HexColor('#0d9488')),  # Sup Izq
-        ('BACKGROUND', (0, 4), (0, 4), colors.HexColor('#5eead4')),  # Inf Izq
-        ('BACKGROUND', (0, 5), (0, 5), colors.HexColor('#2dd4bf')),  # Inf Der
-        
-        # Texto de cuadrantes
-        ('TEXTCOLOR', (0, 1), (0, 5), colors.white),
-        ('FONTNAME', (0, 1), (0, 5), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (0, 5), 8),
-        
-        # Dientes - texto más grande y legible
-        ('FONTNAME', (1, 1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (1, 1), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#14b8a6')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (1, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (1, 1), (-1, -1), 8),
-        ('LEFTPADDING', (1, 1), (-1, -1), 6),
-        ('RIGHTPADDING', (1, 1), (-1, -1), 6),
-    ])
-    
-    # Aplicar colores específicos a dientes según su estado
-    for row_idx in range(1, len(odontograma_data)):
-        if row_idx == 3:  # Fila separadora
-            continue
-        
-        for col_idx in range(1, len(odontograma_data[row_idx])):
-            # Determinar el número del diente
-            if row_idx == 1:  # Superior derecho
-                tooth_nums = [18, 17, 16, 15, 14, 13, 12, 11]
-            elif row_idx == 2:  # Superior izquierdo
-                tooth_nums = [21, 22, 23, 24, 25, 26, 27, 28]
-            elif row_idx == 4:  # Inferior izquierdo
-                tooth_nums = [38, 37, 36, 35, 34, 33, 32, 31]
-            elif row_idx == 5:  # Inferior derecho
-                tooth_nums = [41, 42, 43, 44, 45, 46, 47, 48]
-            else:
-                continue
-            
-            if col_idx - 1 < len(tooth_nums):
-                tooth_num = tooth_nums[col_idx - 1]
-                estado_val, interactive_data = get_tooth_main_state(tooth_num)
-                color = get_tooth_color(estado_val)
-                table_style.add('BACKGROUND', (col_idx, row_idx), (col_idx, row_idx), color)
-                # Usar texto blanco solo si el color es oscuro
-                if estado_val in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
-                    table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.white)
-                else:
-                    table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.HexColor('#1e293b'))
-    
-    # Estilo para la fila separadora con color turquesa
-    table_style.add('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#ccfbf1'))
-    table_style.add('TEXTCOLOR', (0, 3), (-1, 3), colors.HexColor('#64748b'))
-    table_style.add('FONTSIZE', (0, 3), (-1, 3), 6)
-    
-    odontograma_table.setStyle(table_style)
-    story.append(odontograma_table)
-    story.append(Spacer(1, 12))
-    
-    # Resumen de estado dental
-    estados_count = {}
-    for diente in estados_dientes:
-        estado_val, interactive_data = get_tooth_main_state(diente.numero_diente)
-        estados_count[estado_val] = estados_count.get(estado_val, 0) + 1
-    
-    if estados_count:
-        resumen_title = Paragraph("<b>RESUMEN DEL ESTADO DENTAL</b>", subtitle_style)
-        story.append(resumen_title)
-        
-        resumen_data = [['Estado Dental', 'Cantidad', 'Explicación']]
-        estado_descriptions = {
-            'sano': 'Diente en perfecto estado, sin problemas',
-            'caries': 'Diente con caries que necesita tratamiento',
-            'obturado': 'Diente ya tratado con empaste',
-            'corona': 'Diente con corona o funda protectora',
-            'ausente': 'Diente que falta o fue extraído',
-            'endodoncia': 'Diente con tratamiento de conducto (nervio tratado)',
-            'protesis': 'Diente con prótesis o funda',
-            'implante': 'Diente reemplazado con implante dental',
-            'sellante': 'Diente con sellante preventivo',
-            'fractura': 'Diente con fractura o grieta',
-        }
-        
-        for estado, cantidad in sorted(estados_count.items(), key=lambda x: x[1], reverse=True):
-            desc = estado_descriptions.get(estado, 'Estado dental')
-            # Capitalizar primera letra y el resto en minúsculas
-            estado_display = estado.capitalize().replace('_', ' ')
-            resumen_data.append([estado_display, str(cantidad), desc])
-        
-        resumen_table = Table(resumen_data, colWidths=[1.8*inch, 1*inch, 3.7*inch])
-        resumen_style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.white, colors.HexColor('#f0fdfa')]),
-        ])
-        
-        # Colorear la columna de cantidad según el estado
-        row_idx = 1
-        for estado, cantidad in sorted(estados_count.items(), key=lambda x: x[1], reverse=True):
-            color = get_tooth_color(estado)
-            resumen_style.add('BACKGROUND', (1, row_idx), (1, row_idx), color)
-            if estado in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
-                resumen_style.add('TEXTCOLOR', (1, row_idx), (1, row_idx), colors.white)
-            else:
-                resumen_style.add('TEXTCOLOR', (1, row_idx), (1, row_idx), colors.HexColor('#1e293b'))
-            row_idx += 1
-        
-        resumen_table.setStyle(resumen_style)
-        story.append(resumen_table)
-        story.append(Spacer(1, 12))
-    
-    # Sección: Detalle de Caras de Dientes (si hay datos interactivos)
-    dientes_con_caras = []
-    for diente in estados_dientes:
-        interactive_data = get_tooth_interactive_data(diente)
-        if interactive_data and isinstance(interactive_data, dict):
-            caras_afectadas = {}
-            for cara, condicion in interactive_data.items():
-                if isinstance(condicion, str) and condicion != 'sano':
-                    caras_afectadas[cara] = condicion
-            
-            if caras_afectadas:
-                dientes_con_caras.append({
-                    'numero': diente.numero_diente,
-                    'caras': caras_afectadas
-                })
-    
-    if dientes_con_caras:
-        detalle_caras_title = Paragraph("<b>DETALLE DE CARAS DE DIENTES</b>", subtitle_style)
-        story.append(detalle_caras_title)
-        
-        # Explicación sobre las caras
-        explicacion_caras = Paragraph(
-            "Esta sección muestra qué cara específica de cada diente tiene una condición. "
-            "Las caras son: Oclusal (O) - superficie de masticación, Vestibular (V) - lado externo, "
-            "Lingual (L) - lado interno, Mesial (M) - lado anterior, Distal (D) - lado posterior.",
-            ParagraphStyle(
-                'ExplicacionCaras',
-                parent=styles['Normal'],
-                fontSize=8,
-                spaceAfter=6,
-                alignment=TA_LEFT,
-                textColor=colors.HexColor('#64748b'),
-                leading=11
-            )
-        )
-        story.append(explicacion_caras)
-        story.append(Spacer(1, 4))
-        
-        # Crear tabla de detalles de caras (solo 3 columnas, sin duplicar)
-        detalle_caras_data = [['Diente', 'Cara', 'Condición']]
-        
-        cara_nombres_completos = {
-            'oclusal': 'Oclusal (O)',
-            'vestibular': 'Vestibular (V)',
-            'lingual': 'Lingual (L)',
-            'mesial': 'Mesial (M)',
-            'distal': 'Distal (D)'
-        }
-        
-        estado_nombres = {
-            'sano': 'Sano',
-            'caries': 'Caries',
-            'cariado': 'Cariado',
-            'obturado': 'Obturado',
-            'corona': 'Corona',
-            'ausente': 'Ausente',
-            'endodoncia': 'Endodoncia',
-            'protesis': 'Prótesis',
-            'implante': 'Implante',
-            'sellante': 'Sellante',
-            'fractura': 'Fractura',
-            'perdido': 'Perdido',
-            'extraccion': 'Extracción'
-        }
-        
-        # Crear filas con información de caras (una fila por cara afectada)
-        for diente_info in dientes_con_caras:
-            numero_diente = diente_info['numero']
-            for cara, condicion in diente_info['caras'].items():
-                cara_nombre = cara_nombres_completos.get(cara, cara.capitalize())
-                condicion_nombre = estado_nombres.get(condicion, condicion.capitalize())
-                detalle_caras_data.append([str(numero_diente), cara_nombre, condicion_nombre])
-        
-        if len(detalle_caras_data) > 1:  # Si hay al menos una fila de datos
-            detalle_caras_table = Table(detalle_caras_data, colWidths=[0.8*inch, 1.8*inch, 2.9*inch])
-            detalle_caras_style = TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # Número de diente centrado
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-                ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.white, colors.HexColor('#f0fdfa')]),
-            ])
-            
-            # Colorear la columna de condición según el estado
-            row_idx = 1
-            for fila in detalle_caras_data[1:]:
-                if len(fila) >= 3 and fila[2]:
-                    condicion = fila[2].lower()
-                    color = get_tooth_color(condicion)
-                    detalle_caras_style.add('BACKGROUND', (2, row_idx), (2, row_idx), color)
-                    if condicion in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
-                        detalle_caras_style.add('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.white)
-                    else:
-                        detalle_caras_style.add('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.HexColor('#1e293b'))
-                row_idx += 1
-            
-            detalle_caras_table.setStyle(detalle_caras_style)
-            story.append(detalle_caras_table)
-            story.append(Spacer(1, 12))
-    
-    # Leyenda de símbolos resumida y compacta
-    leyenda_title = Paragraph("<b>GUÍA DE SÍMBOLOS</b>", ParagraphStyle(
-        'LeyendaTitle',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=4,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold'
-    ))
-    story.append(leyenda_title)
-    
-    # Leyenda compacta en formato de lista simple
-    leyenda_texto = (
-        "<b>✓</b> Sano | <b>●</b> Caries | <b>■</b> Obturado | <b>◊</b> Corona | <b>✕</b> Ausente | "
-        "<b>◐</b> Endodoncia | <b>◈</b> Prótesis | <b>◉</b> Implante | <b>◯</b> Sellante | <b>◢</b> Fractura"
-    )
-    
-    leyenda_parrafo = Paragraph(
-        leyenda_texto,
-        ParagraphStyle(
-            'LeyendaCompacta',
-            parent=styles['Normal'],
-            fontSize=7,
-            spaceAfter=6,
-            alignment=TA_LEFT,
-            textColor=colors.HexColor('#374151'),
-            leading=10,
-            backColor=colors.HexColor('#f0fdfa'),
-            borderPadding=6,
-            borderColor=colors.HexColor('#ccfbf1'),
-            borderWidth=1
-        )
-    )
-    story.append(leyenda_parrafo)
-    story.append(Spacer(1, 8))
-    
-    # Sección: Plan de Tratamiento y Observaciones
-    if odontograma.plan_tratamiento or odontograma.observaciones:
-        plan_title = Paragraph("<b>PLAN DE TRATAMIENTO Y RECOMENDACIONES</b>", subtitle_style)
-        story.append(plan_title)
-        
-        # Nota breve sobre el plan de tratamiento
-        nota_plan = Paragraph(
-            "Plan de tratamiento y recomendaciones:",
-            ParagraphStyle(
-                'NotaPlan',
-                parent=styles['Normal'],
-                fontSize=8,
-                spaceAfter=4,
-                alignment=TA_LEFT,
-                textColor=colors.HexColor('#64748b'),
-                leading=11
-            )
-        )
-        story.append(nota_plan)
-        story.append(Spacer(1, 2))
-        
-        plan_data = []
-        if odontograma.plan_tratamiento:
-            plan_data.append(['Plan de Tratamiento:', odontograma.plan_tratamiento])
-        
-        if odontograma.observaciones:
-            plan_data.append(['Observaciones:', odontograma.observaciones])
-        
-        if plan_data:
-            plan_table = Table(plan_data, colWidths=[2*inch, 4.5*inch])
-            plan_table_style = TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-                ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
-                ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 8),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ])
-            plan_table.setStyle(plan_table_style)
-            story.append(plan_table)
-            story.append(Spacer(1, 10))
-    
-    # Información del sistema (footer)
-    system_info = Paragraph(
-        f"<b>Odontólogo responsable:</b> Dr. {odontograma.dentista.nombre_completo} | "
-        f"<b>Fecha de creación:</b> {odontograma.fecha_creacion.strftime('%d/%m/%Y %H:%M')} | "
-        f"<b>Última actualización:</b> {odontograma.fecha_actualizacion.strftime('%d/%m/%Y %H:%M')}",
-        ParagraphStyle(
-            'SystemInfo',
-            parent=styles['Normal'],
-            fontSize=7,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#64748b'),
-            spaceBefore=12
-        )
-    )
-    story.append(system_info)
-    
-    # Construir el PDF
-    doc.build(story)
-    
-    # Obtener el contenido del buffer
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Crear o actualizar el documento en la base de datos
-    try:
-        # Buscar cliente por email si no está asociado directamente
-        cliente_doc = odontograma.cliente
-        if not cliente_doc and odontograma.paciente_email:
-            try:
-                cliente_doc = Cliente.objects.get(email=odontograma.paciente_email, activo=True)
-            except Cliente.DoesNotExist:
-                cliente_doc = None
-            except Cliente.MultipleObjectsReturned:
-                cliente_doc = Cliente.objects.filter(email=odontograma.paciente_email, activo=True).first()
-        
-        documento, created = DocumentoCliente.objects.get_or_create(
-            odontograma=odontograma,
-            tipo='odontograma',
-            defaults={
-                'cliente': cliente_doc,
-                'titulo': f'Ficha Odontológica - {odontograma.paciente_nombre}',
-                'descripcion': f'Ficha odontológica del paciente {odontograma.paciente_nombre}',
-                'generado_por': perfil,
-            }
-        )
-        if not created:
-            # Actualizar fecha de generación y cliente si cambió
-            documento.fecha_generacion = timezone.now()
-            documento.generado_por = perfil
-            if not documento.cliente and cliente_doc:
-                documento.cliente = cliente_doc
-            documento.save()
-    except Exception as e:
-        logger.error(f"Error al crear documento de odontograma: {str(e)}")
-    
-    # Registrar auditoría - Exportar odontograma a PDF (solo para dentistas)
-    if perfil.es_dentista():
-        registrar_auditoria(
-            usuario=perfil,
-            accion='exportar',
-            modulo='odontogramas',
-            descripcion=f'Ficha odontológica exportada a PDF para {odontograma.paciente_nombre}',
-            detalles=f'Odontograma ID: {odontograma.id}, Paciente: {odontograma.paciente_nombre}',
-            objeto_id=odontograma.id,
-            tipo_objeto='Odontograma',
-            request=request
-        )
-    
-    # Crear respuesta HTTP
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="ficha_odontologica_{odontograma.paciente_nombre.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf"'
-    response.write(pdf_content)
-    
-    return response
-
-
-# Vista para exportar presupuesto/tratamiento a PDF
-@login_required
-def exportar_presupuesto_pdf(request, plan_id):
-    """Vista para exportar un plan de tratamiento (presupuesto) a PDF"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_dentista() or perfil.es_administrativo()):
-            messages.error(request, 'No tienes permisos para exportar presupuestos.')
-            return redirect('panel_trabajador')
-    except Perfil.DoesNotExist:
-        messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('login')
-
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    # Obtener información de la clínica
-    try:
-        from configuracion.models import InformacionClinica
-        info_clinica = InformacionClinica.obtener()
-        nombre_clinica = info_clinica.nombre_clinica
-        direccion_clinica = info_clinica.direccion
-        telefono_clinica = info_clinica.telefono
-        email_clinica = info_clinica.email
-    except:
-        nombre_clinica = "Clínica Dental"
-        direccion_clinica = ""
-        telefono_clinica = ""
-        email_clinica = ""
-    
-    # Crear el buffer para el PDF
-    buffer = BytesIO()
-    
-    # Crear el documento PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=30,
-        leftMargin=30,
-        topMargin=40,
-        bottomMargin=30
-    )
-    
-    # Estilos base de ReportLab
-    styles = getSampleStyleSheet()
-    
-    # Paleta de colores (turquesa)
-    primary_color = colors.HexColor('#14b8a6')  # turquesa principal
-    primary_dark = colors.HexColor('#0f766e')
-    soft_bg = colors.HexColor('#ecfeff')
-    soft_bg_alt = colors.HexColor('#e0f2f1')
-    gray_text = colors.HexColor('#64748b')
-    dark_text = colors.HexColor('#0f172a')
-    
-    # Estilo para el título principal
-    title_style = ParagraphStyle(
-        'PresupuestoTitle',
-        parent=styles['Heading1'],
-        fontSize=20,
-        spaceAfter=12,
-        alignment=TA_CENTER,
-        textColor=primary_dark,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo para subtítulos
-    subtitle_style = ParagraphStyle(
-        'PresupuestoSubtitle',
-        parent=styles['Heading2'],
-        fontSize=12,
-        spaceAfter=8,
-        spaceBefore=12,
-        alignment=TA_LEFT,
-        textColor=primary_dark,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo para información de la clínica
-    clinic_info_style = ParagraphStyle(
-        'ClinicInfo',
-        parent=styles['Normal'],
-        fontSize=9,
-        alignment=TA_CENTER,
-        textColor=gray_text
-    )
-    
-    # Estilo para texto normal
-    normal_style = ParagraphStyle(
-        'NormalPresupuesto',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=4,
-        alignment=TA_LEFT,
-        leading=14
-    )
-    
-    # Contenido del PDF
-    story = []
-    
-    # Encabezado con información de la clínica
-    header_text = f"<b>{nombre_clinica}</b><br/>"
-    if direccion_clinica:
-        header_text += f"{direccion_clinica}<br/>"
-    if telefono_clinica:
-        header_text += f"Tel: {telefono_clinica} | "
-    if email_clinica:
-        header_text += f"Email: {email_clinica}"
-    header = Paragraph(header_text, clinic_info_style)
-    story.append(header)
-    story.append(Spacer(1, 12))
-    
-    # Título principal
-    title = Paragraph("<b>PRESUPUESTO DE TRATAMIENTO</b>", title_style)
-    story.append(title)
-    
-    # Información de fecha y número
-    fecha_info = Paragraph(
-        f"Fecha de Emisión: {datetime.now().strftime('%d/%m/%Y %H:%M')} | Presupuesto N° {plan.id}",
-        clinic_info_style
-    )
-    story.append(fecha_info)
-    story.append(Spacer(1, 16))
-    
-    # Sección: Información del Paciente
-    paciente_title = Paragraph("<b>INFORMACIÓN DEL PACIENTE</b>", subtitle_style)
-    story.append(paciente_title)
-    
-    # Manejar caso donde el cliente fue eliminado (cliente=NULL)
-    if plan.cliente:
-        paciente_data = [
-            ['Nombre Completo:', plan.cliente.nombre_completo],
-            ['RUT:', plan.cliente.rut or 'No especificado'],
-            ['Email:', plan.cliente.email or 'No especificado'],
-            ['Teléfono:', plan.cliente.telefono or 'No especificado'],
-        ]
-    else:
-        # Si el cliente fue eliminado, usar información del odontograma si existe
-        paciente_nombre = 'Cliente eliminado del sistema'
-        paciente_rut = 'No disponible'
-        paciente_email = 'No disponible'
-        paciente_telefono = 'No disponible'
-        
-        # Intentar obtener información del odontograma inicial si existe
-        if plan.odontograma_inicial:
-            paciente_nombre = plan.odontograma_inicial.paciente_nombre or paciente_nombre
-            paciente_email = plan.odontograma_inicial.paciente_email or paciente_email
-            paciente_telefono = plan.odontograma_inicial.paciente_telefono or paciente_telefono
-        
-        paciente_data = [
-            ['Nombre Completo:', paciente_nombre],
-            ['RUT:', paciente_rut],
-            ['Email:', paciente_email],
-            ['Teléfono:', paciente_telefono],
-        ]
-    
-    paciente_table = Table(paciente_data, colWidths=[2 * inch, 4.5 * inch])
-    paciente_table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), soft_bg),
-        ('TEXTCOLOR', (0, 0), (0, -1), primary_dark),
-        ('TEXTCOLOR', (1, 0), (1, -1), dark_text),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ])
-    paciente_table.setStyle(paciente_table_style)
-    story.append(paciente_table)
-    story.append(Spacer(1, 12))
-    
-    # Sección: Información del Tratamiento
-    tratamiento_title = Paragraph("<b>INFORMACIÓN DEL TRATAMIENTO</b>", subtitle_style)
-    story.append(tratamiento_title)
-    
-    tratamiento_info = [
-        ['Nombre del Plan:', plan.nombre],
-        ['Dentista:', plan.dentista.nombre_completo],
-        ['Estado:', plan.get_estado_display()],
-    ]
-    
-    if plan.fecha_inicio_estimada:
-        tratamiento_info.append(['Fecha Inicio Estimada:', plan.fecha_inicio_estimada.strftime('%d/%m/%Y')])
-    if plan.fecha_fin_estimada:
-        tratamiento_info.append(['Fecha Fin Estimada:', plan.fecha_fin_estimada.strftime('%d/%m/%Y')])
-    if plan.citas_estimadas:
-        tratamiento_info.append(['Citas Estimadas:', str(plan.citas_estimadas)])
-    
-    tratamiento_table = Table(tratamiento_info, colWidths=[2 * inch, 4.5 * inch])
-    tratamiento_table.setStyle(paciente_table_style)
-    story.append(tratamiento_table)
-    story.append(Spacer(1, 12))
-    
-    # Diagnóstico y Objetivo
-    if plan.diagnostico:
-        diagnostico_text = Paragraph(f"<b>Diagnóstico:</b><br/>{plan.diagnostico}", normal_style)
-        story.append(diagnostico_text)
-        story.append(Spacer(1, 8))
-    
-    if plan.objetivo:
-        objetivo_text = Paragraph(f"<b>Objetivo del Tratamiento:</b><br/>{plan.objetivo}", normal_style)
-        story.append(objetivo_text)
-        story.append(Spacer(1, 12))
-    
-    # Sección: Detalle del Tratamiento (Fases e Items)
-    # Nota: la gestión de fases y pagos se ha simplificado en el sistema,
-    # por lo que esta sección se omite del PDF para mantener un diseño limpio.
-    # Sección: Resumen Financiero
-    resumen_title = Paragraph("<b>RESUMEN FINANCIERO</b>", subtitle_style)
-    story.append(resumen_title)
-    
-    resumen_data = [
-        ['Presupuesto Total:', f"${plan.presupuesto_total:,.0f}"],
-        ['Precio Final:', f"${plan.precio_final:,.0f}"],
-        ['Total Pagado:', f"${plan.total_pagado:,.0f}"],
-        ['Saldo Pendiente:', f"${plan.saldo_pendiente:,.0f}"],
-    ]
-    
-    resumen_table = Table(resumen_data, colWidths=[2.5 * inch, 4 * inch])
-    resumen_table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), soft_bg_alt),
-        ('TEXTCOLOR', (0, 0), (0, -1), primary_dark),
-        ('TEXTCOLOR', (1, 0), (1, -1), dark_text),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('BACKGROUND', (0, 2), (1, 2), soft_bg),  # Precio Final
-        ('BACKGROUND', (0, 4), (1, 4), colors.HexColor('#fef2f2')),  # Saldo Pendiente
-    ])
-    resumen_table.setStyle(resumen_table_style)
-    story.append(resumen_table)
-    story.append(Spacer(1, 12))
-    
-    # Historial de Pagos (se omite en la versión actual del presupuesto para mantener el enfoque en el resumen financiero)
-    
-    # Notas
-    if plan.notas_paciente:
-        notas_title = Paragraph("<b>NOTAS PARA EL PACIENTE</b>", subtitle_style)
-        story.append(notas_title)
-        notas_text = Paragraph(plan.notas_paciente, normal_style)
-        story.append(notas_text)
-        story.append(Spacer(1, 12))
-    
-    # Footer
-    footer_text = f"<b>Generado por:</b> {perfil.nombre_completo} | <b>Fecha:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    footer = Paragraph(footer_text, clinic_info_style)
-    story.append(footer)
-    
-    # Construir el PDF
-    doc.build(story)
-    
-    # Obtener el contenido del buffer
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Crear o actualizar el documento en la base de datos
-    documento, created = DocumentoCliente.objects.get_or_create(
-        plan_tratamiento=plan,
-        tipo='presupuesto',
-        defaults={
-            'cliente': plan.cliente,  # Puede ser None si el cliente fue eliminado
-            'titulo': f'Presupuesto - {plan.nombre}',
-            'descripcion': f'Presupuesto del tratamiento {plan.nombre}',
-            'generado_por': perfil,
-        }
-    )
+    # Crear o actualizar el documento en la base de datos
+    _registrar_documento_presupuesto(plan, perfil)
     
     # Crear respuesta HTTP
     response = HttpResponse(content_type='application/pdf')
@@ -7615,9 +6517,11 @@ def enviar_documento_correo(request, documento_id):
             pdf_content = response.content
             filename = f"presupuesto_{documento.cliente.nombre_completo.replace(' ', '_')}.pdf"
         elif documento.tipo == 'odontograma' and documento.odontograma:
-            # Generar PDF del odontograma
-            response = exportar_odontograma_pdf(request, documento.odontograma.id)
-            pdf_content = response.content
+            # PDF del odontograma (el guardado si la ficha no cambió)
+            from .odontograma_pdf_service import obtener_pdf_odontograma
+            documento_pdf = obtener_pdf_odontograma(documento.odontograma, perfil)
+            with documento_pdf.archivo_pdf.open('rb') as archivo:
+                pdf_content = archivo.read()
             filename = f"ficha_odontologica_{documento.cliente.nombre_completo.replace(' ', '_')}.pdf"
         elif documento.tipo == 'consentimiento':
             # Buscar el consentimiento asociado
@@ -7639,19 +6543,13 @@ def enviar_documento_correo(request, documento_id):
         else:
             return JsonResponse({'error': 'El documento no está disponible para envío.'}, status=400)
         
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica or "Clínica Dental San Felipe"
-            email_clinica = info_clinica.email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
-            direccion_clinica = info_clinica.direccion or ''
-            telefono_clinica = info_clinica.telefono or ''
-        except:
-            nombre_clinica = "Clínica Dental San Felipe"
-            email_clinica = getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
-            direccion_clinica = ''
-            telefono_clinica = ''
+        # Información de la clínica (copia en caché)
+        from .email_service import obtener_info_clinica
+        info_clinica = obtener_info_clinica()
+        nombre_clinica = info_clinica['nombre']
+        email_clinica = info_clinica['email']
+        direccion_clinica = info_clinica['direccion']
+        telefono_clinica = info_clinica['telefono']
         
         # Renderizar template HTML
         from django.template.loader import render_to_string
@@ -7679,8 +6577,9 @@ def enviar_documento_correo(request, documento_id):
         # Adjuntar PDF
         email.attach(filename, pdf_content, 'application/pdf')
         
-        # Enviar email
-        email.send()
+        # Encolar email (lo envía el comando procesar_correos)
+        from .correos_service import encolar_correo
+        encolar_correo(email, origen='documento_cliente')
         
         # Actualizar documento
         documento.enviado_por_correo = True
@@ -7690,7 +6589,7 @@ def enviar_documento_correo(request, documento_id):
         
         return JsonResponse({
             'success': True,
-            'message': f'Documento enviado exitosamente a {email_destino}'
+            'message': f'Documento encolado para su envío a {email_destino}. Se enviará en unos momentos.'
         })
         
     except Exception as e:
@@ -7734,19 +6633,13 @@ def enviar_consentimiento_por_correo(request, consentimiento_id):
         pdf_content = response.content
         filename = f"consentimiento_{consentimiento.cliente.nombre_completo.replace(' ', '_')}.pdf"
         
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
-            direccion_clinica = info_clinica.direccion or ''
-            telefono_clinica = info_clinica.telefono or ''
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
-            direccion_clinica = ''
-            telefono_clinica = ''
+        # Información de la clínica (copia en caché)
+        from .email_service import obtener_info_clinica
+        info_clinica = obtener_info_clinica()
+        nombre_clinica = info_clinica['nombre']
+        email_clinica = info_clinica['email']
+        direccion_clinica = info_clinica['direccion']
+        telefono_clinica = info_clinica['telefono']
         
         # Construir URL de firma (pública con token)
         dominio = request.get_host()
@@ -7785,12 +6678,13 @@ def enviar_consentimiento_por_correo(request, consentimiento_id):
         # Adjuntar PDF
         email.attach(filename, pdf_content, 'application/pdf')
         
-        # Enviar email
-        email.send()
+        # Encolar email (lo envía el comando procesar_correos)
+        from .correos_service import encolar_correo
+        encolar_correo(email, origen='consentimiento')
         
         return JsonResponse({
             'success': True,
-            'message': f'Consentimiento enviado exitosamente a {email_destino}. Se ha incluido un enlace para firmar.'
+            'message': f'Consentimiento encolado para su envío a {email_destino}, con un enlace para firmar. Se enviará en unos momentos.'
         })
         
     except Exception as e:
@@ -8311,6 +7205,7 @@ def detalle_consentimiento(request, consentimiento_id):
 
 def firmar_consentimiento_publico(request, token):
     """Vista pública para firmar un consentimiento usando token (sin autenticación)"""
+    from citas.firmas_service import guardar_imagenes_firma
     consentimiento = get_object_or_404(ConsentimientoInformado, token_firma=token)
     
     # Verificar que el token sea válido
@@ -8365,6 +7260,8 @@ def firmar_consentimiento_publico(request, token):
             consentimiento.derecho_revocacion = derecho_revocacion
             consentimiento.estado = 'firmado'
             consentimiento.fecha_firma = timezone.now()
+            # Las firmas dibujadas se guardan como PNG (original y escalada para el PDF)
+            guardar_imagenes_firma(consentimiento)
             consentimiento.save()
             
             return render(request, 'citas/consentimientos/firmar_consentimiento_publico.html', {
@@ -8390,6 +7287,7 @@ def firmar_consentimiento_publico(request, token):
 @login_required
 def firmar_consentimiento(request, consentimiento_id):
     """Vista para firmar un consentimiento informado (presencial o desde sistema)"""
+    from citas.firmas_service import guardar_imagenes_firma
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
     
@@ -8435,6 +7333,8 @@ def firmar_consentimiento(request, consentimiento_id):
         consentimiento.derecho_revocacion = derecho_revocacion
         consentimiento.estado = 'firmado'
         consentimiento.fecha_firma = timezone.now()
+        # Las firmas dibujadas se guardan como PNG (original y escalada para el PDF)
+        guardar_imagenes_firma(consentimiento)
         consentimiento.save()
         
         # Si el consentimiento está asociado a un plan de tratamiento, verificar si se puede activar
@@ -8458,594 +7358,8 @@ def firmar_consentimiento(request, consentimiento_id):
         return JsonResponse({'error': f'Error al firmar el consentimiento: {str(e)}'}, status=500)
 
 
-@login_required
-def exportar_consentimiento_pdf(request, consentimiento_id):
-    """Vista para exportar un consentimiento informado a PDF"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_dentista() or perfil.es_administrativo()):
-            messages.error(request, 'No tienes permisos para exportar consentimientos.')
-            return redirect('panel_trabajador')
-    except Perfil.DoesNotExist:
-        messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('login')
-    
-    consentimiento = get_object_or_404(ConsentimientoInformado, id=consentimiento_id)
-    
-    # Obtener información de la clínica
-    try:
-        from configuracion.models import InformacionClinica
-        info_clinica = InformacionClinica.obtener()
-        nombre_clinica = info_clinica.nombre_clinica
-        direccion_clinica = info_clinica.direccion
-        telefono_clinica = info_clinica.telefono
-        email_clinica = info_clinica.email
-    except:
-        nombre_clinica = "Clínica Dental"
-        direccion_clinica = ""
-        telefono_clinica = ""
-        email_clinica = ""
-    
-    # Crear el buffer para el PDF
-    buffer = BytesIO()
-    
-    # Función para convertir firma base64 a imagen de ReportLab
-    def convertir_firma_base64_a_imagen(firma_base64, max_width=3*inch, max_height=1*inch):
-        """Convierte una firma en formato base64 a una imagen de ReportLab"""
-        if not firma_base64:
-            return None
-        
-        try:
-            import base64
-            from io import BytesIO
-            from PIL import Image as PILImage
-            
-            # Verificar si es una cadena base64
-            if not isinstance(firma_base64, str):
-                return None
-            
-            # Si no empieza con data:image, asumir que es solo base64
-            if firma_base64.startswith('data:image'):
-                # Extraer solo la parte base64
-                firma_base64 = firma_base64.split(',')[1] if ',' in firma_base64 else firma_base64
-            
-            # Decodificar base64
-            imagen_bytes = base64.b64decode(firma_base64)
-            imagen_pil = PILImage.open(BytesIO(imagen_bytes))
-            
-            # Convertir a RGB si es necesario (para PNG con transparencia)
-            if imagen_pil.mode in ('RGBA', 'LA', 'P'):
-                fondo = PILImage.new('RGB', imagen_pil.size, (255, 255, 255))
-                if imagen_pil.mode == 'P':
-                    imagen_pil = imagen_pil.convert('RGBA')
-                fondo.paste(imagen_pil, mask=imagen_pil.split()[-1] if imagen_pil.mode in ('RGBA', 'LA') else None)
-                imagen_pil = fondo
-            elif imagen_pil.mode != 'RGB':
-                imagen_pil = imagen_pil.convert('RGB')
-            
-            # Redimensionar si es muy grande
-            # Asumir que las imágenes del canvas tienen aproximadamente 96 DPI (estándar web)
-            ancho_px, alto_px = imagen_pil.size
-            # Convertir max_width y max_height de pulgadas a píxeles (asumiendo 96 DPI para web)
-            max_width_px = (float(max_width) / inch) * 96
-            max_height_px = (float(max_height) / inch) * 96
-            
-            # Calcular ratio para mantener proporción
-            ratio_ancho = max_width_px / ancho_px if ancho_px > max_width_px else 1
-            ratio_alto = max_height_px / alto_px if alto_px > max_height_px else 1
-            ratio = min(ratio_ancho, ratio_alto)
-            
-            if ratio < 1:
-                nuevo_ancho = int(ancho_px * ratio)
-                nuevo_alto = int(alto_px * ratio)
-                imagen_pil = imagen_pil.resize((nuevo_ancho, nuevo_alto), PILImage.Resampling.LANCZOS)
-            
-            # Guardar en BytesIO
-            img_buffer = BytesIO()
-            imagen_pil.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            # Crear Image de ReportLab
-            # ReportLab usa puntos (72 puntos = 1 pulgada)
-            # Convertir píxeles a pulgadas (asumiendo 96 DPI) y luego a puntos
-            ancho_final, alto_final = imagen_pil.size
-            # Convertir píxeles a pulgadas (96 píxeles = 1 pulgada para imágenes web)
-            width_inches = ancho_final / 96.0
-            height_inches = alto_final / 96.0
-            
-            # Limitar al máximo permitido y convertir a puntos
-            width_final = min(width_inches * inch, max_width)
-            height_final = min(height_inches * inch, max_height)
-            
-            return Image(img_buffer, width=width_final, height=height_final)
-        except Exception as e:
-            logger.error(f"Error al convertir firma base64 a imagen: {str(e)}")
-            return None
-    
-    # Función para agregar marca de agua con logo de diente
-    def add_watermark(canvas_obj, doc_obj):
-        """Agregar marca de agua con logo de diente en todas las páginas"""
-        canvas_obj.saveState()
-        # Color turquesa transparente para la marca de agua
-        canvas_obj.setFillColor(colors.HexColor('#14b8a6'), alpha=0.06)
-        canvas_obj.setFont('Helvetica-Bold', 150)
-        # Rotar el texto 45 grados
-        canvas_obj.rotate(45)
-        # Posicionar en el centro de la página (ajustado para A4)
-        # A4: 8.27 x 11.69 pulgadas
-        canvas_obj.drawCentredString(4.5*inch, -2.5*inch, '🦷')
-        canvas_obj.restoreState()
-    
-    # Crear el documento PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=35,
-        leftMargin=35,
-        topMargin=50,
-        bottomMargin=40,
-        onFirstPage=add_watermark,
-        onLaterPages=add_watermark
-    )
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    
-    # Estilo para el título principal
-    title_style = ParagraphStyle(
-        'ConsentimientoTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=12,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo para subtítulos con color turquesa
-    subtitle_style = ParagraphStyle(
-        'ConsentimientoSubtitle',
-        parent=styles['Heading2'],
-        fontSize=13,
-        spaceAfter=10,
-        spaceBefore=14,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#14b8a6'),  # Color turquesa
-        fontName='Helvetica-Bold',
-        borderWidth=0,
-        borderPadding=0,
-        leftIndent=0,
-        rightIndent=0,
-    )
-    
-    # Estilo para subtítulos de secciones (B.1, B.2, etc.)
-    section_subtitle_style = ParagraphStyle(
-        'SectionSubtitle',
-        parent=styles['Heading3'],
-        fontSize=11,
-        spaceAfter=6,
-        spaceBefore=10,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#0d9488'),  # Turquesa más oscuro
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo para encabezado de clínica
-    clinic_header_style = ParagraphStyle(
-        'ClinicHeader',
-        parent=styles['Heading1'],
-        fontSize=16,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#14b8a6'),  # Color turquesa
-        fontName='Helvetica-Bold',
-        spaceAfter=8
-    )
-    
-    # Estilo para información de la clínica
-    clinic_info_style = ParagraphStyle(
-        'ClinicInfo',
-        parent=styles['Normal'],
-        fontSize=10,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#64748b'),
-        spaceAfter=12
-    )
-    
-    # Estilo para texto normal
-    normal_style = ParagraphStyle(
-        'NormalConsentimiento',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6,
-        alignment=TA_LEFT,
-        leading=14
-    )
-    
-    # Contenido del PDF - Estructura según Ley 20.584
-    story = []
-    
-    # A. ENCABEZADO - Información de la Clínica (mejorado)
-    clinic_header = Paragraph(f"<b>{nombre_clinica}</b>", clinic_header_style)
-    story.append(clinic_header)
-    
-    header_info = []
-    if direccion_clinica:
-        header_info.append(direccion_clinica)
-    contact_info = []
-    if telefono_clinica:
-        contact_info.append(f"Teléfono: {telefono_clinica}")
-    if email_clinica:
-        contact_info.append(f"Email: {email_clinica}")
-    
-    if header_info or contact_info:
-        header_text = ""
-        if header_info:
-            header_text += "<br/>".join(header_info)
-        if contact_info:
-            if header_text:
-                header_text += "<br/>"
-            header_text += " | ".join(contact_info)
-        header_text += f"<br/><b>Fecha de Generación:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-        header = Paragraph(header_text, clinic_info_style)
-        story.append(header)
-    
-    story.append(Spacer(1, 20))
-    
-    # Título principal con línea decorativa
-    title = Paragraph(f"<b>CONSENTIMIENTO INFORMADO</b>", title_style)
-    story.append(title)
-    story.append(Spacer(1, 8))
-    
-    # Subtítulo del procedimiento
-    if consentimiento.titulo:
-        subtitle_proc = Paragraph(f"<i>{consentimiento.titulo}</i>", ParagraphStyle(
-            'SubtitleProc',
-            parent=styles['Normal'],
-            fontSize=12,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#14b8a6'),
-            fontName='Helvetica-Oblique',
-            spaceAfter=16
-        ))
-        story.append(subtitle_proc)
-    else:
-        story.append(Spacer(1, 16))
-    
-    # A. IDENTIFICACIÓN Y ANTECEDENTES
-    identificacion_title = Paragraph("<b>A. IDENTIFICACIÓN Y ANTECEDENTES</b>", subtitle_style)
-    story.append(identificacion_title)
-    
-    # Limpiar RUT para evitar símbolos extraños (como '$' de datos antiguos)
-    rut_paciente = (consentimiento.cliente.rut or 'No especificado').replace('$', '')
-    
-    paciente_data = [
-        ['Nombre Completo del Paciente:', consentimiento.cliente.nombre_completo],
-        ['RUT:', rut_paciente],
-        ['Email:', consentimiento.cliente.email or 'No especificado'],
-        ['Teléfono:', consentimiento.cliente.telefono or 'No especificado'],
-    ]
-    
-    paciente_table = Table(paciente_data, colWidths=[2.2*inch, 4.3*inch])
-    paciente_table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecfeff')),  # Fondo turquesa muy claro
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#0d9488')),  # Texto turquesa oscuro
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#14b8a6')),  # Borde turquesa
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('LINEBELOW', (0, 0), (-1, -1), 0.5, colors.HexColor('#14b8a6')),  # Línea inferior turquesa
-    ])
-    paciente_table.setStyle(paciente_table_style)
-    story.append(paciente_table)
-    story.append(Spacer(1, 16))
-    
-    # B. INFORMACIÓN DETALLADA DEL PROCEDIMIENTO
-    info_title = Paragraph("<b>B. INFORMACIÓN DETALLADA DEL PROCEDIMIENTO</b>", subtitle_style)
-    story.append(info_title)
-    story.append(Spacer(1, 8))
-    
-    # B.1. Diagnóstico y Justificación
-    if consentimiento.diagnostico:
-        diagnostico_title = Paragraph("<b>B.1. Diagnóstico y Justificación del Tratamiento</b>", section_subtitle_style)
-        story.append(diagnostico_title)
-        diagnostico_text = Paragraph(consentimiento.diagnostico or 'No especificado', normal_style)
-        story.append(diagnostico_text)
-        if consentimiento.justificacion:
-            justificacion_text = Paragraph(consentimiento.justificacion or 'No especificado', normal_style)
-            story.append(justificacion_text)
-        story.append(Spacer(1, 12))
-    
-    # B.2. Naturaleza y Objetivos del Tratamiento
-    if consentimiento.naturaleza_procedimiento or consentimiento.objetivos_tratamiento:
-        naturaleza_title = Paragraph("<b>B.2. Naturaleza y Objetivos del Tratamiento</b>", section_subtitle_style)
-        story.append(naturaleza_title)
-        if consentimiento.naturaleza_procedimiento:
-            naturaleza_text = Paragraph(f"<b>Naturaleza del Procedimiento:</b><br/>{consentimiento.naturaleza_procedimiento or 'No especificado'}", normal_style)
-            story.append(naturaleza_text)
-        if consentimiento.objetivos_tratamiento:
-            objetivos_text = Paragraph(f"<b>Objetivos del Tratamiento:</b><br/>{consentimiento.objetivos_tratamiento or 'No especificado'}", normal_style)
-            story.append(objetivos_text)
-        story.append(Spacer(1, 12))
-    
-    # B.3. Contenido General del Consentimiento
-    if consentimiento.contenido:
-        contenido_title = Paragraph("<b>B.3. Información General del Procedimiento</b>", section_subtitle_style)
-        story.append(contenido_title)
-        contenido_text = Paragraph(consentimiento.contenido or 'No especificado', normal_style)
-        story.append(contenido_text)
-        story.append(Spacer(1, 12))
-    
-    # B.4. Alternativas de Tratamiento (OBLIGATORIO - Ley 20.584)
-    if consentimiento.alternativas:
-        alternativas_title = Paragraph("<b>B.4. Alternativas de Tratamiento</b>", section_subtitle_style)
-        story.append(alternativas_title)
-        alternativas_text = Paragraph(consentimiento.alternativas or 'No especificado', normal_style)
-        story.append(alternativas_text)
-        story.append(Spacer(1, 12))
-    
-    # B.5. Riesgos y Complicaciones Relevantes (OBLIGATORIO - Ley 20.584)
-    if consentimiento.riesgos:
-        riesgos_title = Paragraph("<b>B.5. Riesgos y Complicaciones Relevantes</b>", section_subtitle_style)
-        story.append(riesgos_title)
-        riesgos_text = Paragraph(consentimiento.riesgos or 'No especificado', normal_style)
-        story.append(riesgos_text)
-        story.append(Spacer(1, 12))
-    
-    # B.6. Beneficios Esperados
-    if consentimiento.beneficios:
-        beneficios_title = Paragraph("<b>B.6. Beneficios Esperados</b>", section_subtitle_style)
-        story.append(beneficios_title)
-        beneficios_text = Paragraph(consentimiento.beneficios or 'No especificado', normal_style)
-        story.append(beneficios_text)
-        story.append(Spacer(1, 12))
-    
-    # B.7. Pronóstico
-    if consentimiento.pronostico:
-        pronostico_title = Paragraph("<b>B.7. Pronóstico</b>", section_subtitle_style)
-        story.append(pronostico_title)
-        pronostico_text = Paragraph(consentimiento.pronostico or 'No especificado', normal_style)
-        story.append(pronostico_text)
-        story.append(Spacer(1, 12))
-    
-    # B.8. Cuidados Postoperatorios
-    if consentimiento.cuidados_postoperatorios:
-        cuidados_title = Paragraph("<b>B.8. Cuidados Postoperatorios</b>", section_subtitle_style)
-        story.append(cuidados_title)
-        cuidados_text = Paragraph(consentimiento.cuidados_postoperatorios or 'No especificado', normal_style)
-        story.append(cuidados_text)
-        story.append(Spacer(1, 16))
-    
-    # C. DECLARACIÓN DEL PACIENTE Y FIRMAS (Ley 20.584)
-    declaracion_title = Paragraph("<b>C. DECLARACIÓN DEL PACIENTE Y FIRMAS</b>", subtitle_style)
-    story.append(declaracion_title)
-    story.append(Spacer(1, 10))
-    
-    # Declaración de Comprensión (Ley 20.584) - con fondo turquesa
-    declaracion_box_style = ParagraphStyle(
-        'DeclaracionBox',
-        parent=normal_style,
-        backColor=colors.HexColor('#ecfeff'),  # Fondo turquesa muy claro
-        borderColor=colors.HexColor('#14b8a6'),  # Borde turquesa
-        borderWidth=1,
-        borderPadding=10,
-        leftIndent=0,
-        rightIndent=0,
-    )
-    declaracion_text = Paragraph(
-        "<b>DECLARACIÓN DE COMPRENSIÓN:</b><br/>"
-        "Yo, el paciente o su representante legal, declaro que he sido informado de forma clara, comprensible y oportuna "
-        "sobre mi diagnóstico, los riesgos, beneficios y alternativas del procedimiento propuesto, de acuerdo con lo "
-        "establecido en la <b>Ley N° 20.584</b> sobre Derechos y Deberes de las Personas en relación con las Acciones vinculadas "
-        "a su Atención en Salud.",
-        declaracion_box_style
-    )
-    story.append(declaracion_text)
-    story.append(Spacer(1, 10))
-    
-    # Derecho de Revocación (Ley 20.584) - con fondo turquesa
-    revocacion_text = Paragraph(
-        "<b>DERECHO DE REVOCACIÓN:</b><br/>"
-        "Conozco que tengo el derecho a revocar libremente este consentimiento en cualquier momento previo al inicio del tratamiento.",
-        declaracion_box_style
-    )
-    story.append(revocacion_text)
-    story.append(Spacer(1, 16))
-    
-    # Espacios para Firmas
-    firmas_title = Paragraph("<b>FIRMAS</b>", subtitle_style)
-    story.append(firmas_title)
-    story.append(Spacer(1, 12))
-    
-    # Estilo para títulos de sección de firmas
-    firma_section_title_style = ParagraphStyle(
-        'FirmaSectionTitle',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.HexColor('#14b8a6'),
-        fontName='Helvetica-Bold',
-        spaceAfter=6,
-        spaceBefore=0
-    )
-    
-    # Tabla de firmas - Estructura mejorada y organizada
-    firmas_data = []
-    row_idx = 0
-    title_rows = []  # Filas que son títulos de sección (para aplicar SPAN)
-    
-    # Paciente
-    if consentimiento.esta_firmado:
-        # Título de sección que ocupará ambas columnas
-        firmas_data.append([Paragraph('<b>PACIENTE</b>', firma_section_title_style), ''])
-        title_rows.append(row_idx)
-        row_idx += 1
-        
-        firmas_data.append(['Nombre:', consentimiento.nombre_firmante or consentimiento.cliente.nombre_completo])
-        row_idx += 1
-        
-        if consentimiento.rut_firmante:
-            firmas_data.append(['RUT:', consentimiento.rut_firmante])
-            row_idx += 1
-        
-        # Convertir firma base64 a imagen si es necesario
-        firma_paciente_img = convertir_firma_base64_a_imagen(consentimiento.firma_paciente, max_width=2.5*inch, max_height=0.8*inch)
-        if firma_paciente_img:
-            firmas_data.append(['Firma:', firma_paciente_img])
-        else:
-            firmas_data.append(['Firma:', consentimiento.firma_paciente or '_________________________'])
-        row_idx += 1
-        
-        firmas_data.append(['Fecha y Hora:', consentimiento.fecha_firma.strftime('%d/%m/%Y %H:%M') if consentimiento.fecha_firma else ''])
-        row_idx += 1
-    else:
-        firmas_data.append([Paragraph('<b>PACIENTE</b>', firma_section_title_style), Paragraph('<i>Pendiente de firma</i>', normal_style)])
-        title_rows.append(row_idx)
-        row_idx += 1
-    
-    # Separador visual
-    firmas_data.append(['', ''])
-    row_idx += 1
-    
-    # Profesional Tratante
-    if consentimiento.dentista:
-        # Título de sección que ocupará ambas columnas
-        firmas_data.append([Paragraph('<b>PROFESIONAL TRATANTE</b>', firma_section_title_style), ''])
-        title_rows.append(row_idx)
-        row_idx += 1
-        
-        firmas_data.append(['Nombre:', consentimiento.dentista.nombre_completo])
-        row_idx += 1
-        
-        if consentimiento.rut_dentista:
-            firmas_data.append(['RUT:', consentimiento.rut_dentista])
-            row_idx += 1
-        
-        if consentimiento.registro_superintendencia:
-            firmas_data.append(['Registro Superintendencia de Salud:', consentimiento.registro_superintendencia])
-            row_idx += 1
-        
-        firmas_data.append(['Firma:', '_________________________'])
-        row_idx += 1
-        
-        # Espacio
-        firmas_data.append(['', ''])
-        row_idx += 1
-    
-    # Testigo (opcional pero recomendado)
-    if consentimiento.nombre_testigo:
-        firmas_data.append([Paragraph('<b>TESTIGO</b>', firma_section_title_style), ''])
-        title_rows.append(row_idx)
-        row_idx += 1
-        
-        firmas_data.append(['Nombre:', consentimiento.nombre_testigo])
-        row_idx += 1
-        
-        if consentimiento.rut_testigo:
-            firmas_data.append(['RUT:', consentimiento.rut_testigo])
-            row_idx += 1
-        
-        # Convertir firma testigo base64 a imagen si es necesario
-        firma_testigo_img = convertir_firma_base64_a_imagen(consentimiento.firma_testigo, max_width=2.5*inch, max_height=0.8*inch)
-        if firma_testigo_img:
-            firmas_data.append(['Firma:', firma_testigo_img])
-        else:
-            firmas_data.append(['Firma:', consentimiento.firma_testigo or '_________________________'])
-        row_idx += 1
-    
-    if firmas_data:
-        firmas_table = Table(firmas_data, colWidths=[2.4*inch, 4.1*inch])
-        
-        # Construir lista de estilos
-        style_list = [
-            # Estilo base para la primera columna (etiquetas)
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecfeff')),  # Fondo turquesa muy claro
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#0d9488')),  # Texto turquesa oscuro
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (0, -1), 10),
-            
-            # Estilo para la segunda columna (valores)
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-            ('FONTSIZE', (1, 0), (1, -1), 10),
-            
-            # Alineación
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            
-            # Bordes
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#14b8a6')),  # Borde turquesa
-            ('LINEBELOW', (0, 0), (-1, 0), 1.5, colors.HexColor('#14b8a6')),  # Línea superior más gruesa
-            
-            # Padding base
-            ('LEFTPADDING', (0, 0), (-1, -1), 12),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 12),
-            ('TOPPADDING', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ]
-        
-        # Aplicar SPAN a los títulos de sección para que ocupen ambas columnas
-        for title_row in title_rows:
-            style_list.append(('SPAN', (0, title_row), (1, title_row)))  # Ocupar ambas columnas
-            style_list.append(('BACKGROUND', (0, title_row), (1, title_row), colors.HexColor('#b2f5ea')))  # Fondo turquesa más destacado
-            style_list.append(('ALIGN', (0, title_row), (1, title_row), 'LEFT'))
-            style_list.append(('TOPPADDING', (0, title_row), (1, title_row), 12))
-            style_list.append(('BOTTOMPADDING', (0, title_row), (1, title_row), 12))
-        
-        # Aplicar estilos a filas vacías (separadores)
-        for i, row in enumerate(firmas_data):
-            if len(row) >= 2 and (row[0] == '' or row[0] is None) and (row[1] == '' or row[1] is None):
-                style_list.append(('BACKGROUND', (0, i), (1, i), colors.HexColor('#ffffff')))
-                style_list.append(('TOPPADDING', (0, i), (1, i), 4))
-                style_list.append(('BOTTOMPADDING', (0, i), (1, i), 4))
-        
-        firmas_table_style = TableStyle(style_list)
-        firmas_table.setStyle(firmas_table_style)
-        story.append(firmas_table)
-        story.append(Spacer(1, 16))
-    
-    # Footer con información legal (mejorado)
-    story.append(Spacer(1, 12))
-    footer_text = f"<b>Documento generado el:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    if consentimiento.fecha_vencimiento:
-        footer_text += f" | <b>Válido hasta:</b> {consentimiento.fecha_vencimiento.strftime('%d/%m/%Y')}"
-    footer_text += "<br/><i>Este documento cumple con los requisitos de la <b>Ley N° 20.584</b> sobre Derechos y Deberes de las Personas en relación con las Acciones vinculadas a su Atención en Salud.</i>"
-    
-    footer_style = ParagraphStyle(
-        'FooterStyle',
-        parent=clinic_info_style,
-        fontSize=8,
-        textColor=colors.HexColor('#14b8a6'),  # Color turquesa para el footer
-        spaceBefore=8,
-        borderColor=colors.HexColor('#14b8a6'),
-        borderWidth=1,
-        borderPadding=8,
-        backColor=colors.HexColor('#f0fdfa'),  # Fondo turquesa muy claro
-    )
-    footer = Paragraph(footer_text, footer_style)
-    story.append(footer)
-    
-    # Construir el PDF
-    try:
-        doc.build(story)
-    except Exception as e:
-        logger.error(f"Error al construir PDF del consentimiento {consentimiento_id}: {str(e)}")
-        buffer.close()
-        messages.error(request, f'Error al generar el PDF: {str(e)}')
-        return redirect('gestor_consentimientos')
-    
-    # Obtener el contenido del buffer
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Crear o actualizar el documento en la base de datos (usando consentimiento como referencia única)
+def _registrar_documento_consentimiento(consentimiento, perfil):
+    """Crea o actualiza el DocumentoCliente del consentimiento (usando el consentimiento como referencia única)"""
     try:
         documento = DocumentoCliente.objects.get(
             tipo='consentimiento',
@@ -9083,6 +7397,44 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         documento.generado_por = perfil
         documento.fecha_generacion = timezone.now()
         documento.save()
+    return documento
+
+
+@login_required
+def exportar_consentimiento_pdf(request, consentimiento_id):
+    """Vista para exportar un consentimiento informado a PDF"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not (perfil.es_dentista() or perfil.es_administrativo()):
+            messages.error(request, 'No tienes permisos para exportar consentimientos.')
+            return redirect('panel_trabajador')
+    except Perfil.DoesNotExist:
+        messages.error(request, 'No tienes permisos para acceder a esta función.')
+        return redirect('login')
+    
+    from .pdf_service import construir_pdf_consentimiento, datos_clinica, preparar_para_pdf
+
+    consentimiento = get_object_or_404(
+        preparar_para_pdf('consentimiento', ConsentimientoInformado.objects.all()),
+        id=consentimiento_id
+    )
+    
+    # Generar el PDF
+    buffer = BytesIO()
+    try:
+        construir_pdf_consentimiento(consentimiento, buffer, datos_clinica())
+    except Exception as e:
+        logger.error(f"Error al construir PDF del consentimiento {consentimiento_id}: {str(e)}")
+        buffer.close()
+        messages.error(request, f'Error al generar el PDF: {str(e)}')
+        return redirect('gestor_consentimientos')
+    
+    # Obtener el contenido del buffer
+    pdf_content = buffer.getvalue()
+    buffer.close()
+    
+    # Crear o actualizar el documento en la base de datos (usando consentimiento como referencia única)
+    _registrar_documento_consentimiento(consentimiento, perfil)
     
     # Crear respuesta HTTP
     response = HttpResponse(content_type='application/pdf')
@@ -9147,8 +7499,12 @@ def firmar_consentimiento_recepcion(request, plan_id, consentimiento_id):
     if consentimiento.estado == 'firmado':
         return JsonResponse({'success': False, 'error': 'Este consentimiento ya está firmado.'}, status=400)
     
-    # Obtener el archivo del formulario
-    documento_firmado = request.FILES.get('documento_firmado_fisico')
+    # Obtener el archivo del formulario o de una subida fragmentada ya completada
+    from citas.subidas_service import archivo_del_formulario, confirmar_adjunto
+    try:
+        documento_firmado = archivo_del_formulario(request, 'documento_firmado_fisico', perfil, 'consentimiento_firmado')
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     
     # Validaciones
     if not documento_firmado:
@@ -9194,6 +7550,7 @@ def firmar_consentimiento_recepcion(request, plan_id, consentimiento_id):
         consentimiento.estado = 'firmado'
         consentimiento.fecha_firma = timezone.now()
         consentimiento.save()
+        confirmar_adjunto(documento_firmado)
         
         # Si el consentimiento está asociado a un plan de tratamiento, verificar si se puede activar
         mensaje = f'El documento firmado del consentimiento "{consentimiento.titulo}" fue subido exitosamente.'
@@ -9285,23 +7642,6 @@ def obtener_plantilla_consentimiento(request, plantilla_id):
 
 
 # ============================================================================
-def _calcular_monto_cita(cita):
-    """Función auxiliar para calcular el monto de una cita"""
-    if cita.precio_cobrado:
-        return float(cita.precio_cobrado)
-    elif cita.tipo_servicio and cita.tipo_servicio.precio_base:
-        return float(cita.tipo_servicio.precio_base)
-    return 0
-
-
-def _calcular_ingresos_citas(citas_queryset):
-    """Función auxiliar para calcular ingresos totales de un queryset de citas"""
-    total = 0
-    for cita in citas_queryset:
-        total += _calcular_monto_cita(cita)
-    return total
-
-
 @login_required
 def gestor_finanzas(request):
     """
@@ -9327,10 +7667,11 @@ def gestor_finanzas(request):
         messages.error(request, 'Error al acceder a las finanzas.')
         return redirect('panel_trabajador')
     
+    from citas.estadisticas_service import MONTO_CITA, contar, limites_mes, q_fechas, serie_mensual, sumar
+    
     # Obtener fechas para filtros
     hoy = timezone.now().date()
-    inicio_mes = hoy.replace(day=1)
-    fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    inicio_mes, fin_mes = limites_mes(hoy)
     inicio_año = hoy.replace(month=1, day=1)
     
     # Obtener todas las citas completadas (excluir las que tienen precio_cobrado = None y no tienen tipo_servicio, que fueron eliminadas del historial)
@@ -9386,92 +7727,79 @@ def gestor_finanzas(request):
         from pacientes.models import Cliente
         from inventario.models import Insumo
         
-        total_citas = Cita.objects.count()
-        total_clientes = Cliente.objects.filter(activo=True).count()
-        citas_disponibles = Cita.objects.filter(estado='disponible').count()
-        citas_reservadas = Cita.objects.filter(estado='reservada').count()
-        citas_completadas_count = Cita.objects.filter(estado='completada').count()
-        citas_canceladas = Cita.objects.filter(estado='cancelada').count()
-        citas_hoy = Cita.objects.filter(fecha_hora__date=hoy).count()
-        
-        # Estadísticas financieras generales - optimizado
-        # Calcular ingresos considerando precio_cobrado o precio del servicio
-        total_ingresos = _calcular_ingresos_citas(citas_completadas)
-        
-        # Sumar ingresos manuales (optimizado con agregación)
-        total_ingresos += IngresoManual.objects.aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # Ingresos del mes actual
-        citas_completadas_mes = citas_completadas.filter(
-            fecha_hora__date__gte=inicio_mes,
-            fecha_hora__date__lte=fin_mes
+        # Conteos de citas en una sola consulta (agregados condicionales)
+        conteo_citas = contar(
+            Cita.objects,
+            total=Q(),
+            disponibles=Q(estado='disponible'),
+            reservadas=Q(estado='reservada'),
+            completadas=Q(estado='completada'),
+            canceladas=Q(estado='cancelada'),
+            hoy=q_fechas('fecha_hora', hoy, hoy),
         )
-        ingresos_mes = _calcular_ingresos_citas(citas_completadas_mes)
+        total_citas = conteo_citas['total']
+        citas_disponibles = conteo_citas['disponibles']
+        citas_reservadas = conteo_citas['reservadas']
+        citas_completadas_count = conteo_citas['completadas']
+        citas_canceladas = conteo_citas['canceladas']
+        citas_hoy = conteo_citas['hoy']
+        total_clientes = Cliente.objects.filter(activo=True).count()
         
-        # Sumar ingresos manuales del mes (optimizado)
-        ingresos_mes += IngresoManual.objects.filter(
-        fecha__gte=inicio_mes,
-        fecha__lte=fin_mes
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
+        del_mes = q_fechas('fecha_hora', inicio_mes, fin_mes)
+        del_año = q_fechas('fecha_hora', desde=inicio_año)
         
-        # Ingresos del año actual
-        citas_completadas_año = citas_completadas.filter(
-            fecha_hora__date__gte=inicio_año
+        # Ingresos manuales del total, el mes y el año en una sola consulta
+        sumas_ingresos_manuales = sumar(
+            IngresoManual.objects, 'monto',
+            total=Q(),
+            mes=Q(fecha__gte=inicio_mes, fecha__lte=fin_mes),
+            año=Q(fecha__gte=inicio_año),
         )
-        ingresos_año = _calcular_ingresos_citas(citas_completadas_año)
-        
-        # Sumar ingresos manuales del año (optimizado)
-        ingresos_año += IngresoManual.objects.filter(
-            fecha__gte=inicio_año
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # Cantidad de citas
-        total_citas_completadas = citas_completadas.count()
-        citas_mes = citas_completadas_mes.count()
-        citas_año = citas_completadas_año.count()
-        
-        # Ingresos por servicio (optimizado - una sola iteración)
-        ingresos_por_servicio_dict = {}
-        for cita in citas_completadas:
-            servicio_nombre = cita.tipo_servicio.nombre if cita.tipo_servicio else 'Sin servicio'
-            servicio_categoria = cita.tipo_servicio.categoria if cita.tipo_servicio else 'otros'
-            
-            if servicio_nombre not in ingresos_por_servicio_dict:
-                ingresos_por_servicio_dict[servicio_nombre] = {
-                    'tipo_servicio__nombre': servicio_nombre,
-                    'tipo_servicio__categoria': servicio_categoria,
-                    'total_ingresos': 0,
-                    'cantidad_citas': 0
-                }
-            
-            ingresos_por_servicio_dict[servicio_nombre]['cantidad_citas'] += 1
-            ingresos_por_servicio_dict[servicio_nombre]['total_ingresos'] += _calcular_monto_cita(cita)
-        
-        ingresos_por_servicio = sorted(ingresos_por_servicio_dict.values(), key=lambda x: x['total_ingresos'], reverse=True)
-        
-        # Ingresos por mes (últimos 12 meses)
-        ingresos_por_mes = []
-        from calendar import monthrange
-        for i in range(11, -1, -1):
-            # Calcular fecha del mes
-            mes_fecha = hoy - timedelta(days=30 * i)
-            mes_inicio = mes_fecha.replace(day=1)
-            # Obtener último día del mes
-            ultimo_dia = monthrange(mes_fecha.year, mes_fecha.month)[1]
-            mes_fin = mes_fecha.replace(day=ultimo_dia)
-            
-            citas_mes_actual = citas_completadas.filter(
-                fecha_hora__date__gte=mes_inicio,
-                fecha_hora__date__lte=mes_fin
+        
+        # Ingresos de citas del total, el mes y el año calculados en SQL (Decimal exacto)
+        # Monto de cada cita: precio_cobrado o, si no hay, el precio base del servicio
+        sumas_ingresos_citas = sumar(
+            citas_completadas, MONTO_CITA,
+            total=Q(),
+            mes=del_mes,
+            año=del_año,
+        )
+        total_ingresos = sumas_ingresos_citas['total'] + sumas_ingresos_manuales['total']
+        ingresos_mes = sumas_ingresos_citas['mes'] + sumas_ingresos_manuales['mes']
+        ingresos_año = sumas_ingresos_citas['año'] + sumas_ingresos_manuales['año']
+        
+        # Cantidad de citas completadas (total, mes y año en una sola consulta)
+        conteo_completadas = contar(citas_completadas, total=Q(), mes=del_mes, año=del_año)
+        total_citas_completadas = conteo_completadas['total']
+        citas_mes = conteo_completadas['mes']
+        citas_año = conteo_completadas['año']
+        
+        # Ingresos por servicio (una consulta agrupada)
+        ingresos_por_servicio = []
+        for fila in citas_completadas.values(
+            'tipo_servicio__nombre', 'tipo_servicio__categoria'
+        ).annotate(
+            total_ingresos=Sum(MONTO_CITA),
+            cantidad_citas=Count('id')
+        ).order_by('-total_ingresos'):
+            fila['tipo_servicio__nombre'] = fila['tipo_servicio__nombre'] or 'Sin servicio'
+            fila['tipo_servicio__categoria'] = fila['tipo_servicio__categoria'] or 'otros'
+            ingresos_por_servicio.append(fila)
+        
+        # Ingresos por mes (últimos 12 meses) - desde el resumen diario
+        # Decimal y no float para no perder precisión en los montos; json_script lo
+        # serializa con DjangoJSONEncoder (como texto)
+        ingresos_por_mes = [
+            {
+                'mes': fila['inicio'].strftime('%B %Y'),
+                'ingresos': Decimal(fila['ingresos']),
+                'citas': fila['citas'],
+            }
+            for fila in serie_mensual(
+                EstadisticaDiaria.objects.filter(estado='completada'), 'fecha', hoy, 12,
+                ingresos=Sum('monto'), citas=Sum('cantidad_con_precio')
             )
-            
-            ingresos_mes_actual = _calcular_ingresos_citas(citas_mes_actual)
-            
-            ingresos_por_mes.append({
-                'mes': mes_fecha.strftime('%B %Y'),
-                'ingresos': ingresos_mes_actual,
-                'citas': citas_mes_actual.count()
-            })
+        ]
         
         # Precio promedio por cita
         if total_citas_completadas > 0:
@@ -9479,50 +7807,41 @@ def gestor_finanzas(request):
         else:
             precio_promedio = 0
         
-        # Ingresos por dentista (optimizado)
-        ingresos_por_dentista_dict = {}
-        for cita in citas_completadas.filter(dentista__isnull=False):
-            if not cita.dentista:
-                continue
-            dentista_nombre = cita.dentista.nombre_completo
-            
-            if dentista_nombre not in ingresos_por_dentista_dict:
-                ingresos_por_dentista_dict[dentista_nombre] = {
-                    'dentista__nombre_completo': dentista_nombre,
-                    'total_ingresos': 0,
-                    'cantidad_citas': 0
-                }
-            
-            ingresos_por_dentista_dict[dentista_nombre]['cantidad_citas'] += 1
-            ingresos_por_dentista_dict[dentista_nombre]['total_ingresos'] += _calcular_monto_cita(cita)
-        
-        ingresos_por_dentista = sorted(ingresos_por_dentista_dict.values(), key=lambda x: x['total_ingresos'], reverse=True)
+        # Ingresos por dentista (una consulta agrupada)
+        ingresos_por_dentista = list(
+            citas_completadas.filter(dentista__isnull=False).values(
+                'dentista__nombre_completo'
+            ).annotate(
+                total_ingresos=Sum(MONTO_CITA),
+                cantidad_citas=Count('id')
+            ).order_by('-total_ingresos')
+        )
         
-        # Combinar todos los ingresos (citas + manuales) para la tabla
+        # Combinar los últimos ingresos (citas + manuales) para la tabla
+        # Basta con los 50 más recientes de cada origen para obtener los 50 más recientes combinados
         todos_ingresos_list = []
         
-        # Agregar citas completadas (solo las que tienen precio o servicio)
-        for cita in citas_completadas:
-            # Solo incluir citas que tienen precio_cobrado o tipo_servicio (no las eliminadas del historial)
-            if cita.precio_cobrado is not None or (cita.tipo_servicio and cita.tipo_servicio.precio_base):
-                monto_cita = _calcular_monto_cita(cita)
-                
-                todos_ingresos_list.append({
-                    'cita': cita,
-                    'monto': monto_cita,
-                    'tipo': 'cita',
-                    'fecha': cita.fecha_hora
-                })
+        # Agregar citas completadas (solo las que tienen precio o servicio, no las eliminadas del historial)
+        citas_con_monto = citas_completadas.filter(
+            Q(precio_cobrado__isnull=False) | Q(tipo_servicio__precio_base__gt=0)
+        ).annotate(monto=MONTO_CITA)[:50]
+        for cita in citas_con_monto:
+            todos_ingresos_list.append({
+                'cita': cita,
+                'monto': cita.monto,
+                'tipo': 'cita',
+                'fecha': cita.fecha_hora
+            })
         
         # Agregar ingresos manuales
-        for ingreso_manual in ingresos_manuales:
+        for ingreso_manual in ingresos_manuales[:50]:
             from datetime import datetime
             # Crear datetime aware para que sea compatible con los otros
             fecha_naive = datetime.combine(ingreso_manual.fecha, datetime.min.time())
             fecha_ingreso = timezone.make_aware(fecha_naive)
             todos_ingresos_list.append({
                 'ingreso_manual': ingreso_manual,
-                'monto': float(ingreso_manual.monto),
+                'monto': ingreso_manual.monto,
                 'tipo': 'ingreso_manual',
                 'fecha': fecha_ingreso
             })
@@ -9539,65 +7858,42 @@ def gestor_finanzas(request):
         # NO se calculan egresos automáticos basados en movimientos de insumos tipo "entrada"
         # egresos_manuales ya está definido fuera del try
         
-        # Calcular egresos totales (solo manuales)
-        total_egresos = EgresoManual.objects.aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # Egresos del mes (solo manuales)
-        egresos_mes = EgresoManual.objects.filter(
-            fecha__gte=inicio_mes,
-            fecha__lte=fin_mes
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # Egresos del año (solo manuales)
-        egresos_año = EgresoManual.objects.filter(
-            fecha__gte=inicio_año
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        # Egresos por mes (últimos 12 meses) - solo manuales
-        egresos_por_mes = []
-        from calendar import monthrange
-        for i in range(11, -1, -1):
-            mes_fecha = hoy - timedelta(days=30 * i)
-            mes_inicio = mes_fecha.replace(day=1)
-            ultimo_dia = monthrange(mes_fecha.year, mes_fecha.month)[1]
-            mes_fin = mes_fecha.replace(day=ultimo_dia)
-            
-            # Sumar solo egresos manuales del mes
-            egresos_mes_actual = EgresoManual.objects.filter(
-                fecha__gte=mes_inicio,
-                fecha__lte=mes_fin
-            ).aggregate(Sum('monto'))['monto__sum'] or 0
-            
-            egresos_por_mes.append({
-                'mes': mes_fecha.strftime('%B %Y'),
-                'egresos': egresos_mes_actual,
-                'movimientos': EgresoManual.objects.filter(
-                    fecha__gte=mes_inicio,
-                    fecha__lte=mes_fin
-                ).count()
-            })
+        # Egresos totales, del mes y del año (solo manuales) en una sola consulta
+        sumas_egresos = sumar(
+            EgresoManual.objects, 'monto',
+            total=Q(),
+            mes=Q(fecha__gte=inicio_mes, fecha__lte=fin_mes),
+            año=Q(fecha__gte=inicio_año),
+        )
+        total_egresos = sumas_egresos['total']
+        egresos_mes = sumas_egresos['mes']
+        egresos_año = sumas_egresos['año']
+        
+        # Egresos por mes (últimos 12 meses) - solo manuales, desde el resumen diario
+        egresos_por_mes = [
+            {
+                'mes': fila['inicio'].strftime('%B %Y'),
+                'egresos': fila['egresos'],
+                'movimientos': fila['movimientos'],
+            }
+            for fila in serie_mensual(
+                EstadisticaDiaria.objects.filter(estado=EstadisticaDiaria.ESTADO_EGRESO_MANUAL), 'fecha', hoy, 12,
+                egresos=Sum('monto'), movimientos=Sum('cantidad')
+            )
+        ]
         
         # Todos los egresos combinados para la tabla (solo manuales)
         todos_egresos_list = []
         
-        # Agregar solo egresos manuales
-        for egreso_manual in egresos_manuales:
+        # Agregar solo egresos manuales (la consulta ya viene ordenada por fecha, más recientes primero)
+        for egreso_manual in egresos_manuales[:50]:
             todos_egresos_list.append({
                 'egreso_manual': egreso_manual,
-                'total': float(egreso_manual.monto),
+                'total': egreso_manual.monto,
                 'tipo': 'egreso_manual'
             })
         
-        # Ordenar por fecha (más recientes primero) - solo egresos manuales
-        def get_fecha(item):
-            from datetime import datetime
-            # Crear datetime aware para que sea compatible con los otros
-            fecha_naive = datetime.combine(item['egreso_manual'].fecha, datetime.min.time())
-            # Convertir a aware usando timezone.now() como referencia
-            return timezone.make_aware(fecha_naive)
-        
-        todos_egresos_list.sort(key=get_fecha, reverse=True)
-        movimientos_recientes = todos_egresos_list[:50]  # Mostrar los últimos 50
+        movimientos_recientes = todos_egresos_list  # Mostrar los últimos 50
         
         # Balance (Ingresos - Egresos)
         balance_total = total_ingresos - total_egresos
@@ -11777,11 +10073,17 @@ def agregar_radiografia(request, paciente_id):
         return redirect('radiografias_listar')
     
     if request.method == 'POST':
+        from citas.subidas_service import archivo_del_formulario, confirmar_adjunto
         try:
             tipo = request.POST.get('tipo', 'periapical')
             descripcion = request.POST.get('descripcion', '')
             fecha_tomada = request.POST.get('fecha_tomada', '')
-            imagen = request.FILES.get('imagen')
+            # La imagen llega en el formulario o ya subida por fragmentos (citas/subidas_service.py)
+            try:
+                imagen = archivo_del_formulario(request, 'imagen', perfil, 'radiografia')
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('mis_pacientes_seccion', paciente_id=paciente_id, seccion='radiografias')
             
             if not imagen:
                 messages.error(request, 'Debes seleccionar una imagen.')
@@ -11805,6 +10107,7 @@ def agregar_radiografia(request, paciente_id):
                 imagen=imagen,
                 fecha_tomada=fecha_tomada if fecha_tomada else None
             )
+            confirmar_adjunto(imagen)
             
             # Registrar auditoría - Agregar radiografía
             registrar_auditoria(
@@ -11875,12 +10178,17 @@ def editar_radiografia(request, radiografia_id):
         ).order_by('-fecha_hora')[:20]
     
     if request.method == 'POST':
+        from citas.subidas_service import archivo_del_formulario, confirmar_adjunto
         try:
             tipo = request.POST.get('tipo', radiografia.tipo)
             descripcion = request.POST.get('descripcion', '')
             fecha_tomada = request.POST.get('fecha_tomada', '')
             cita_id = request.POST.get('cita', '')
-            imagen = request.FILES.get('imagen')
+            try:
+                imagen = archivo_del_formulario(request, 'imagen', perfil, 'radiografia')
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('editar_radiografia', radiografia_id=radiografia.id)
             
             # Guardar datos antes de actualizar para auditoría
             tipo_anterior = radiografia.tipo
@@ -11906,10 +10214,14 @@ def editar_radiografia(request, radiografia_id):
                 radiografia.imagen = imagen
                 # Si hay nueva imagen, eliminar anotaciones anteriores
                 if radiografia.imagen_anotada:
-                    radiografia.imagen_anotada.delete()
+                    radiografia.imagen_anotada.delete(save=False)
                     radiografia.imagen_anotada = None
+                radiografia.anotaciones = []
+                radiografia.version_anotaciones += 1
             
             radiografia.save()
+            if imagen:
+                confirmar_adjunto(imagen)
             
             # Registrar auditoría - Editar radiografía
             registrar_auditoria(
@@ -11943,7 +10255,16 @@ def editar_radiografia(request, radiografia_id):
 
 @login_required
 def guardar_anotaciones_radiografia(request, radiografia_id):
-    """Vista AJAX para guardar anotaciones de una radiografía"""
+    """
+    Vista AJAX para guardar los cambios de las anotaciones de una radiografía.
+
+    Recibe un JSON con la versión sobre la que trabajó el visualizador y solo los
+    cambios: {"version": 3, "agregar": [figuras], "eliminar": [ids], "limpiar": false}
+    (ver citas/anotaciones_service.py). Si otra sesión guardó antes responde 409
+    con las anotaciones vigentes para que el visualizador las recargue.
+    """
+    from citas.anotaciones_service import aplicar_cambios
+
     try:
         perfil = Perfil.objects.get(user=request.user)
         if not perfil.es_dentista():
@@ -11954,44 +10275,54 @@ def guardar_anotaciones_radiografia(request, radiografia_id):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
     
-    try:
-        radiografia = Radiografia.objects.get(id=radiografia_id, dentista=perfil)
-    except Radiografia.DoesNotExist:
+    if not Radiografia.objects.filter(id=radiografia_id, dentista=perfil).exists():
         return JsonResponse({'success': False, 'error': 'Radiografía no encontrada.'}, status=404)
     
     try:
-        from django.core.files.base import ContentFile
-        import base64
-        
-        # Obtener imagen base64 del canvas
-        imagen_data = request.POST.get('imagen_data', '')
-        if not imagen_data:
-            return JsonResponse({'success': False, 'error': 'No se proporcionó imagen.'}, status=400)
-        
-        # Decodificar imagen base64
-        if ',' in imagen_data:
-            imagen_data = imagen_data.split(',')[1]
-        
-        image_data = base64.b64decode(imagen_data)
-        image_file = ContentFile(image_data, name=f'radiografia_{radiografia_id}_anotada.png')
-        
-        # Eliminar imagen anterior si existe
-        if radiografia.imagen_anotada:
-            radiografia.imagen_anotada.delete()
-        
-        # Guardar nueva imagen con anotaciones
-        radiografia.imagen_anotada = image_file
-        radiografia.save()
-        
-        return JsonResponse({'success': True, 'message': 'Anotaciones guardadas correctamente.'})
-        
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError
+        version = int(data.get('version', -1))
+        agregar = data.get('agregar') or []
+        eliminar = data.get('eliminar') or []
+        if not isinstance(agregar, list) or not isinstance(eliminar, list):
+            raise ValueError
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Datos de anotaciones inválidos.'}, status=400)
+    
+    try:
+        aplicado, radiografia = aplicar_cambios(
+            radiografia_id,
+            version,
+            agregar=agregar,
+            eliminar=eliminar,
+            limpiar=bool(data.get('limpiar')),
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
+        logger.error(f"Error al guardar anotaciones de la radiografía {radiografia_id}: {str(e)}")
         return JsonResponse({'success': False, 'error': f'Error al guardar anotaciones: {str(e)}'}, status=500)
+    
+    if not aplicado:
+        return JsonResponse({
+            'success': False,
+            'error': 'Las anotaciones fueron modificadas en otra sesión.',
+            'version': radiografia.version_anotaciones,
+            'anotaciones': radiografia.anotaciones,
+        }, status=409)
+    
+    return JsonResponse({
+        'success': True,
+        'message': 'Anotaciones guardadas correctamente.',
+        'version': radiografia.version_anotaciones,
+        'total': len(radiografia.anotaciones),
+    })
 
 
 @login_required
 def obtener_anotaciones_radiografia(request, radiografia_id):
-    """Vista AJAX para obtener la imagen con anotaciones de una radiografía"""
+    """Vista AJAX para obtener las anotaciones vectoriales de una radiografía"""
     try:
         perfil = Perfil.objects.get(user=request.user)
         if not perfil.es_dentista():
@@ -12000,23 +10331,59 @@ def obtener_anotaciones_radiografia(request, radiografia_id):
         return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     
     try:
-        radiografia = Radiografia.objects.get(id=radiografia_id, dentista=perfil)
-        
-        if radiografia.imagen_anotada:
-            return JsonResponse({
-                'success': True,
-                'imagen_anotada': radiografia.imagen_anotada.url
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'message': 'No hay anotaciones guardadas'
-            })
-            
+        radiografia = Radiografia.objects.only(
+            'id', 'anotaciones', 'version_anotaciones', 'imagen_anotada', 'ancho', 'alto'
+        ).get(id=radiografia_id, dentista=perfil)
     except Radiografia.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Radiografía no encontrada.'}, status=404)
+    
+    return JsonResponse({
+        'success': True,
+        'version': radiografia.version_anotaciones,
+        'anotaciones': radiografia.anotaciones,
+        'ancho': radiografia.ancho,
+        'alto': radiografia.alto,
+        'imagen_anotada': (
+            reverse('imagen_anotada_radiografia', args=[radiografia.id])
+            if radiografia.tiene_anotaciones else None
+        ),
+    })
+
+
+@login_required
+def imagen_anotada_radiografia(request, radiografia_id):
+    """
+    Imagen de la radiografía con sus anotaciones dibujadas.
+
+    La imagen se genera la primera vez que se pide cada versión de las
+    anotaciones y luego se reutiliza (citas/anotaciones_service.py).
+    """
+    from django.http import Http404
+    from citas.anotaciones_service import obtener_imagen_anotada
+    from citas.media_service import entregar_archivo
+
+    if not Perfil.objects.filter(user=request.user, activo=True).exists():
+        raise Http404
+    radiografia = get_object_or_404(Radiografia, id=radiografia_id)
+    
+    try:
+        nombre = obtener_imagen_anotada(radiografia)
     except Exception as e:
-        return JsonResponse({'success': False, 'error': f'Error: {str(e)}'}, status=500)
+        logger.error(f"Error al generar la imagen anotada de la radiografía {radiografia_id}: {str(e)}")
+        nombre = None
+    if not nombre:
+        raise Http404('La radiografía no tiene anotaciones.')
+    
+    respuesta = entregar_archivo(
+        request,
+        nombre,
+        as_attachment=request.GET.get('descargar') == '1',
+        filename=f'radiografia_{radiografia.id}_anotada.jpg',
+    )
+    if respuesta is None:
+        raise Http404
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
 
 
 @login_required
@@ -12262,19 +10629,13 @@ def enviar_radiografia_por_correo(request, radiografia_id):
         from django.conf import settings
         from django.utils import timezone
         
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
-            direccion_clinica = info_clinica.direccion or ''
-            telefono_clinica = info_clinica.telefono or ''
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = settings.DEFAULT_FROM_EMAIL
-            direccion_clinica = ''
-            telefono_clinica = ''
+        # Información de la clínica (copia en caché)
+        from .email_service import obtener_info_clinica
+        info_clinica = obtener_info_clinica()
+        nombre_clinica = info_clinica['nombre']
+        email_clinica = info_clinica['email']
+        direccion_clinica = info_clinica['direccion']
+        telefono_clinica = info_clinica['telefono']
         
         # Renderizar template HTML
         from django.template.loader import render_to_string
@@ -12306,13 +10667,20 @@ def enviar_radiografia_por_correo(request, radiografia_id):
         try:
             if radiografia.imagen:
                 email.attach_file(radiografia.imagen.path)
+            # Copia con las anotaciones del dentista (se genera solo si cambiaron)
+            from .anotaciones_service import obtener_imagen_anotada
+            nombre_anotada = obtener_imagen_anotada(radiografia)
+            if nombre_anotada:
+                with radiografia.imagen_anotada.storage.open(nombre_anotada, 'rb') as archivo:
+                    email.attach(f'radiografia_{radiografia.id}_anotada.jpg', archivo.read(), 'image/jpeg')
         except Exception as e:
             messages.warning(request, f'Error al adjuntar la imagen: {str(e)}')
         
-        # Enviar el correo
+        # Encolar el correo (lo envía el comando procesar_correos)
         try:
-            email.send(fail_silently=False)
-            messages.success(request, f'Radiografía enviada correctamente al correo {cliente.email}.')
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='radiografia')
+            messages.success(request, f'Radiografía encolada para su envío al correo {cliente.email}. Se enviará en unos momentos.')
         except Exception as e:
             messages.error(request, f'Error al enviar el correo: {str(e)}. Verifique la configuración de email.')
             return redirect('perfil_cliente', cliente_id=cliente.id)
@@ -12759,6 +11127,7 @@ def gestor_horarios(request):
         'dentistas': dentistas,
         'horarios_por_dentista': horarios_por_dentista,
         'dias_semana': HorarioDentista.DIA_SEMANA_CHOICES,
+        'servicios_activos': TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre'),
     }
     return render(request, 'citas/horarios/gestor_horarios.html', context)
 
@@ -12997,6 +11366,103 @@ def eliminar_horarios_ajax(request, dentista_id):
     except Exception as e:
         return JsonResponse({'success': False, 'error': f'Error al eliminar horarios: {str(e)}'}, status=500)
 
+# Vista AJAX para generar horas disponibles en lote desde los horarios
+@login_required
+def generar_horas_disponibles_ajax(request):
+    """
+    Vista AJAX para generar en lote citas disponibles a partir de los horarios de los dentistas.
+    Con dry_run=1 solo devuelve el reporte de lo que se crearía.
+    """
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'error': 'No tienes permisos para realizar esta acción'}, status=403)
+    except Perfil.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'No tienes permisos'}, status=403)
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+
+    try:
+        fecha_desde = datetime.strptime(request.POST.get('fecha_desde', ''), '%Y-%m-%d').date()
+        fecha_hasta = datetime.strptime(request.POST.get('fecha_hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Debe indicar un rango de fechas válido'}, status=400)
+
+    if fecha_hasta < fecha_desde:
+        return JsonResponse({'success': False, 'error': 'La fecha final debe ser igual o posterior a la fecha inicial'}, status=400)
+    if (fecha_hasta - fecha_desde).days > 92:
+        return JsonResponse({'success': False, 'error': 'El rango máximo permitido es de 3 meses'}, status=400)
+
+    dentistas = Perfil.objects.filter(rol='dentista', activo=True)
+    dentistas_ids = [d for d in request.POST.getlist('dentistas') if d.isdigit()]
+    if dentistas_ids:
+        dentistas = dentistas.filter(id__in=dentistas_ids)
+    dentistas = list(dentistas.order_by('nombre_completo'))
+    if not dentistas:
+        return JsonResponse({'success': False, 'error': 'No hay dentistas activos seleccionados'}, status=400)
+
+    tipo_servicio = None
+    tipo_servicio_id = request.POST.get('tipo_servicio', '').strip()
+    if tipo_servicio_id:
+        try:
+            tipo_servicio = TipoServicio.objects.get(id=tipo_servicio_id, activo=True)
+        except (TipoServicio.DoesNotExist, ValueError):
+            return JsonResponse({'success': False, 'error': 'El servicio seleccionado no existe o está inactivo'}, status=400)
+
+    duracion_minutos = None
+    duracion_str = request.POST.get('duracion', '').strip()
+    if duracion_str:
+        try:
+            duracion_minutos = int(duracion_str)
+            if duracion_minutos <= 0:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'La duración debe ser un número de minutos mayor que 0'}, status=400)
+
+    dry_run = request.POST.get('dry_run') in ('1', 'true', 'on')
+
+    from citas.agenda_service import generar_horas_disponibles
+    try:
+        reporte = generar_horas_disponibles(
+            dentistas,
+            fecha_desde,
+            fecha_hasta,
+            tipo_servicio=tipo_servicio,
+            duracion_minutos=duracion_minutos,
+            creada_por=perfil,
+            dry_run=dry_run,
+        )
+    except Exception as e:
+        logger.error(f"Error al generar horas disponibles: {e}")
+        return JsonResponse({'success': False, 'error': f'Error al generar horas: {str(e)}'}, status=500)
+
+    if not dry_run and reporte['creadas']:
+        registrar_auditoria(
+            usuario=perfil,
+            accion='crear',
+            modulo='citas',
+            descripcion=f'Generación masiva de {reporte["creadas"]} horas disponibles',
+            detalles=f'Rango: {fecha_desde.strftime("%d/%m/%Y")} - {fecha_hasta.strftime("%d/%m/%Y")}, Dentistas: {", ".join(reporte["por_dentista"].keys())}',
+            tipo_objeto='Cita',
+            request=request
+        )
+
+    if dry_run:
+        mensaje = f'Se crearían {reporte["creadas"]} horas disponibles.'
+    else:
+        mensaje = f'Se crearon {reporte["creadas"]} horas disponibles.'
+
+    return JsonResponse({
+        'success': True,
+        'dry_run': dry_run,
+        'message': mensaje,
+        'creadas': reporte['creadas'],
+        'omitidas_conflicto': reporte['omitidas_conflicto'],
+        'omitidas_pasado': reporte['omitidas_pasado'],
+        'por_dentista': reporte['por_dentista'],
+    })
+
 @login_required
 def ver_mi_horario(request):
     """Vista para que el dentista vea su horario (solo lectura)"""
@@ -13884,25 +12350,10 @@ def crear_cita_desde_plan(request, plan_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
-            
-            # Verificar que no exista ya una cita en esa fecha/hora exacta
-            if Cita.objects.filter(fecha_hora=fecha_hora).exists():
-                return JsonResponse({'success': False, 'error': 'Ya existe una cita en esa fecha y hora exacta.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # El precio ya fue validado arriba, usar el que viene del formulario
             # Si no se proporcionó precio en el formulario pero hay tipo_servicio, usar el precio base como fallback
@@ -14539,21 +12990,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -14839,323 +13279,70 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 
 
 @login_required
-def enviar_documentos_tratamiento(request, plan_id):
-    """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
+def crear_cita_desde_fase(request, plan_id, fase_id):
+    """Crea una cita específica para una fase de tratamiento"""
     try:
         perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_administrativo() or perfil.es_dentista()):
-            return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
+        if not perfil.activo:
+            return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     
-    # Obtener el plan de tratamiento
+    # Obtener el plan con verificación de permisos
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
+    elif perfil.es_dentista():
+        pacientes_dentista = perfil.get_pacientes_asignados()
+        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        plan = get_object_or_404(
+            PlanTratamiento,
+            id=plan_id,
+            dentista=perfil,
+            cliente_id__in=clientes_ids
+        )
     else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    if request.method != 'POST':
-        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
+        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     
-    # Verificar que el cliente tenga email
-    if not plan.cliente.email:
-        return JsonResponse({'success': False, 'error': 'El cliente no tiene un email registrado.'}, status=400)
+    # Obtener la fase
+    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
     
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from io import BytesIO
-        from datetime import datetime
-        
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
-        
-        # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
-        
-        # Crear el email
-        asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
-        
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
+    # Validar que el plan esté en un estado que permita crear citas
+    if request.method == 'POST':
+        # Verificar que el plan tenga consentimiento firmado y presupuesto aceptado
+        tiene_consentimiento_firmado = plan.consentimientos.filter(estado='firmado').exists()
+        presupuesto_aceptado = plan.presupuesto_aceptado
         
-        # Crear el email
-        email = EmailMultiAlternatives(
-            asunto,
-            mensaje_texto,
-            email_clinica,
-            [plan.cliente.email],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
+        if not tiene_consentimiento_firmado:
+            return JsonResponse({
+                'success': False, 
+                'error': 'No se pueden crear citas. El tratamiento debe tener al menos un consentimiento informado firmado.'
+            }, status=400)
         
-        # Adjuntar presupuesto
-        filename_presupuesto = f"presupuesto_{plan.cliente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
+        if not presupuesto_aceptado:
+            return JsonResponse({
+                'success': False, 
+                'error': 'No se pueden crear citas. El presupuesto del tratamiento debe estar aceptado.'
+            }, status=400)
         
-        # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
+        # Verificar que el plan esté en un estado válido para crear citas
+        if plan.estado != 'en_progreso':
+            # Compatibilidad: si está en 'aprobado' (planes antiguos), cambiarlo a 'en_progreso'
+            if plan.estado == 'aprobado':
+                plan.estado = 'en_progreso'
+                plan.save()
+            else:
+                return JsonResponse({
+                    'success': False, 
+                    'error': f'No se pueden crear citas para un tratamiento en estado "{plan.get_estado_display()}". El tratamiento debe estar en progreso.'
+                }, status=400)
+    
+    if request.method == 'POST':
+        fecha_hora_str = request.POST.get('fecha_hora', '')
+        tipo_servicio_id = request.POST.get('tipo_servicio', '').strip()
+        notas = request.POST.get('notas', '').strip()
         
-        # Enviar email
-        email.send()
-        
-        # Actualizar fecha de envío en documentos relacionados
-        from historial_clinico.models import DocumentoCliente
-        documentos_actualizados = 0
-        for consentimiento in consentimientos:
-            # Actualizar el documento relacionado si existe
-            try:
-                documento = DocumentoCliente.objects.filter(
-                    plan_tratamiento=plan,
-                    tipo='consentimiento',
-                    cliente=plan.cliente
-                ).filter(
-                    titulo__icontains=consentimiento.titulo
-                ).first()
-                
-                if documento:
-                    documento.enviado_por_correo = True
-                    documento.fecha_envio = timezone.now()
-                    documento.email_destinatario = plan.cliente.email
-                    documento.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                    documentos_actualizados += 1
-            except Exception as e:
-                logger.warning(f"No se pudo actualizar documento para consentimiento {consentimiento.id}: {e}")
-        
-        # Actualizar también el documento del presupuesto si existe
-        try:
-            doc_presupuesto = DocumentoCliente.objects.filter(
-                plan_tratamiento=plan,
-                tipo='presupuesto',
-                cliente=plan.cliente
-            ).first()
-            
-            if doc_presupuesto:
-                doc_presupuesto.enviado_por_correo = True
-                doc_presupuesto.fecha_envio = timezone.now()
-                doc_presupuesto.email_destinatario = plan.cliente.email
-                doc_presupuesto.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                documentos_actualizados += 1
-        except Exception as e:
-            logger.warning(f"No se pudo actualizar documento de presupuesto: {e}")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error al enviar documentos del tratamiento: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Error al enviar los documentos: {str(e)}'}, status=500)
-
-    else:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Verificar que el plan puede ser editado
-    if not plan.puede_ser_editado_por(perfil):
-        return JsonResponse({'success': False, 'error': f'No puedes eliminar fases de este plan en estado "{plan.get_estado_display()}".'}, status=400)
-    
-    # Verificar si la fase tiene citas asociadas
-    citas_asociadas = Cita.objects.filter(fase_tratamiento=fase).count()
-    if citas_asociadas > 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'No se puede eliminar la fase porque tiene {citas_asociadas} cita(s) asociada(s).'
-        }, status=400)
-    
-    if request.method == 'POST':
-        try:
-            nombre_fase = fase.nombre
-            fase.delete()
-            
-            # Reordenar las fases restantes
-            fases_restantes = plan.fases.all().order_by('orden')
-            for idx, fase_restante in enumerate(fases_restantes, start=1):
-                fase_restante.orden = idx
-                fase_restante.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Fase "{nombre_fase}" eliminada exitosamente.'
-            })
-            
-        except Exception as e:
-            logger.error(f"Error al eliminar fase: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar la fase: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def crear_cita_desde_fase(request, plan_id, fase_id):
-    """Crea una cita específica para una fase de tratamiento"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.activo:
-            return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener el plan con verificación de permisos
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
-        plan = get_object_or_404(
-            PlanTratamiento,
-            id=plan_id,
-            dentista=perfil,
-            cliente_id__in=clientes_ids
-        )
-    else:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Validar que el plan esté en un estado que permita crear citas
-    if request.method == 'POST':
-        # Verificar que el plan tenga consentimiento firmado y presupuesto aceptado
-        tiene_consentimiento_firmado = plan.consentimientos.filter(estado='firmado').exists()
-        presupuesto_aceptado = plan.presupuesto_aceptado
-        
-        if not tiene_consentimiento_firmado:
-            return JsonResponse({
-                'success': False, 
-                'error': 'No se pueden crear citas. El tratamiento debe tener al menos un consentimiento informado firmado.'
-            }, status=400)
-        
-        if not presupuesto_aceptado:
-            return JsonResponse({
-                'success': False, 
-                'error': 'No se pueden crear citas. El presupuesto del tratamiento debe estar aceptado.'
-            }, status=400)
-        
-        # Verificar que el plan esté en un estado válido para crear citas
-        if plan.estado != 'en_progreso':
-            # Compatibilidad: si está en 'aprobado' (planes antiguos), cambiarlo a 'en_progreso'
-            if plan.estado == 'aprobado':
-                plan.estado = 'en_progreso'
-                plan.save()
-            else:
-                return JsonResponse({
-                    'success': False, 
-                    'error': f'No se pueden crear citas para un tratamiento en estado "{plan.get_estado_display()}". El tratamiento debe estar en progreso.'
-                }, status=400)
-    
-    if request.method == 'POST':
-        fecha_hora_str = request.POST.get('fecha_hora', '')
-        tipo_servicio_id = request.POST.get('tipo_servicio', '').strip()
-        notas = request.POST.get('notas', '').strip()
-        
-        if not fecha_hora_str:
-            return JsonResponse({'success': False, 'error': 'Debe seleccionar una fecha y hora.'}, status=400)
+        if not fecha_hora_str:
+            return JsonResponse({'success': False, 'error': 'Debe seleccionar una fecha y hora.'}, status=400)
         
         try:
             # Convertir fecha y hacerla timezone-aware
@@ -15214,21 +13401,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -15513,259 +13689,6 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
     return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
 
-@login_required
-def enviar_documentos_tratamiento(request, plan_id):
-    """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_administrativo() or perfil.es_dentista()):
-            return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    if request.method != 'POST':
-        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-    
-    # Verificar que el cliente tenga email
-    if not plan.cliente.email:
-        return JsonResponse({'success': False, 'error': 'El cliente no tiene un email registrado.'}, status=400)
-    
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from io import BytesIO
-        from datetime import datetime
-        
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
-        
-        # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
-        
-        # Crear el email
-        asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
-        
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
-        
-        # Crear el email
-        email = EmailMultiAlternatives(
-            asunto,
-            mensaje_texto,
-            email_clinica,
-            [plan.cliente.email],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
-        
-        # Adjuntar presupuesto
-        filename_presupuesto = f"presupuesto_{plan.cliente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
-        
-        # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
-        
-        # Enviar email
-        email.send()
-        
-        # Actualizar fecha de envío en documentos relacionados
-        from historial_clinico.models import DocumentoCliente
-        documentos_actualizados = 0
-        for consentimiento in consentimientos:
-            # Actualizar el documento relacionado si existe
-            try:
-                documento = DocumentoCliente.objects.filter(
-                    plan_tratamiento=plan,
-                    tipo='consentimiento',
-                    cliente=plan.cliente
-                ).filter(
-                    titulo__icontains=consentimiento.titulo
-                ).first()
-                
-                if documento:
-                    documento.enviado_por_correo = True
-                    documento.fecha_envio = timezone.now()
-                    documento.email_destinatario = plan.cliente.email
-                    documento.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                    documentos_actualizados += 1
-            except Exception as e:
-                logger.warning(f"No se pudo actualizar documento para consentimiento {consentimiento.id}: {e}")
-        
-        # Actualizar también el documento del presupuesto si existe
-        try:
-            doc_presupuesto = DocumentoCliente.objects.filter(
-                plan_tratamiento=plan,
-                tipo='presupuesto',
-                cliente=plan.cliente
-            ).first()
-            
-            if doc_presupuesto:
-                doc_presupuesto.enviado_por_correo = True
-                doc_presupuesto.fecha_envio = timezone.now()
-                doc_presupuesto.email_destinatario = plan.cliente.email
-                doc_presupuesto.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                documentos_actualizados += 1
-        except Exception as e:
-            logger.warning(f"No se pudo actualizar documento de presupuesto: {e}")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error al enviar documentos del tratamiento: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Error al enviar los documentos: {str(e)}'}, status=500)
-
-    else:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Verificar que el plan puede ser editado
-    if not plan.puede_ser_editado_por(perfil):
-        return JsonResponse({'success': False, 'error': f'No puedes eliminar fases de este plan en estado "{plan.get_estado_display()}".'}, status=400)
-    
-    # Verificar si la fase tiene citas asociadas
-    citas_asociadas = Cita.objects.filter(fase_tratamiento=fase).count()
-    if citas_asociadas > 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'No se puede eliminar la fase porque tiene {citas_asociadas} cita(s) asociada(s).'
-        }, status=400)
-    
-    if request.method == 'POST':
-        try:
-            nombre_fase = fase.nombre
-            fase.delete()
-            
-            # Reordenar las fases restantes
-            fases_restantes = plan.fases.all().order_by('orden')
-            for idx, fase_restante in enumerate(fases_restantes, start=1):
-                fase_restante.orden = idx
-                fase_restante.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Fase "{nombre_fase}" eliminada exitosamente.'
-            })
-            
-        except Exception as e:
-            logger.error(f"Error al eliminar fase: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar la fase: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
 @login_required
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
@@ -15889,21 +13812,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -16123,320 +14035,67 @@ def registrar_pago_tratamiento(request, plan_id):
                     pass
             
             # Crear el pago
-            pago = PagoTratamiento.objects.create(
-                plan_tratamiento=plan,
-                monto=monto,
-                fecha_pago=fecha_pago,
-                metodo_pago=metodo_pago,
-                numero_comprobante=numero_comprobante if numero_comprobante else None,
-                notas=notas if notas else None,
-                cita=cita,
-                registrado_por=perfil
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Pago de ${monto:,.0f} registrado exitosamente.',
-                'pago': {
-                    'id': pago.id,
-                    'monto': str(pago.monto),
-                    'fecha_pago': pago.fecha_pago.strftime('%d/%m/%Y'),
-                    'metodo_pago': pago.get_metodo_pago_display(),
-                },
-                'total_pagado': str(plan.total_pagado),
-                'saldo_pendiente': str(plan.saldo_pendiente),
-            })
-            
-        except ValueError as e:
-            return JsonResponse({'success': False, 'error': f'Error en los datos: {str(e)}'}, status=400)
-        except Exception as e:
-            logger.error(f"Error al registrar pago: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al registrar el pago: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def eliminar_pago_tratamiento(request, plan_id, pago_id):
-    """Elimina un pago registrado (solo administrativos)"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    pago = get_object_or_404(PagoTratamiento, id=pago_id, plan_tratamiento=plan)
-    
-    if request.method == 'POST':
-        try:
-            monto = pago.monto
-            pago.delete()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Pago de ${monto:,.0f} eliminado exitosamente.',
-                'total_pagado': str(plan.total_pagado),
-                'saldo_pendiente': str(plan.saldo_pendiente),
-            })
-            
-        except Exception as e:
-            logger.error(f"Error al eliminar pago: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar el pago: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def enviar_documentos_tratamiento(request, plan_id):
-    """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_administrativo() or perfil.es_dentista()):
-            return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    if request.method != 'POST':
-        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-    
-    # Verificar que el cliente tenga email
-    if not plan.cliente.email:
-        return JsonResponse({'success': False, 'error': 'El cliente no tiene un email registrado.'}, status=400)
-    
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from io import BytesIO
-        from datetime import datetime
-        
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
-        
-        # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
-        
-        # Crear el email
-        asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
-        
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
-        
-        # Crear el email
-        email = EmailMultiAlternatives(
-            asunto,
-            mensaje_texto,
-            email_clinica,
-            [plan.cliente.email],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
-        
-        # Adjuntar presupuesto
-        filename_presupuesto = f"presupuesto_{plan.cliente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
-        
-        # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
-        
-        # Enviar email
-        email.send()
-        
-        # Actualizar fecha de envío en documentos relacionados
-        from historial_clinico.models import DocumentoCliente
-        documentos_actualizados = 0
-        for consentimiento in consentimientos:
-            # Actualizar el documento relacionado si existe
-            try:
-                documento = DocumentoCliente.objects.filter(
-                    plan_tratamiento=plan,
-                    tipo='consentimiento',
-                    cliente=plan.cliente
-                ).filter(
-                    titulo__icontains=consentimiento.titulo
-                ).first()
-                
-                if documento:
-                    documento.enviado_por_correo = True
-                    documento.fecha_envio = timezone.now()
-                    documento.email_destinatario = plan.cliente.email
-                    documento.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                    documentos_actualizados += 1
-            except Exception as e:
-                logger.warning(f"No se pudo actualizar documento para consentimiento {consentimiento.id}: {e}")
-        
-        # Actualizar también el documento del presupuesto si existe
-        try:
-            doc_presupuesto = DocumentoCliente.objects.filter(
+            pago = PagoTratamiento.objects.create(
                 plan_tratamiento=plan,
-                tipo='presupuesto',
-                cliente=plan.cliente
-            ).first()
+                monto=monto,
+                fecha_pago=fecha_pago,
+                metodo_pago=metodo_pago,
+                numero_comprobante=numero_comprobante if numero_comprobante else None,
+                notas=notas if notas else None,
+                cita=cita,
+                registrado_por=perfil
+            )
             
-            if doc_presupuesto:
-                doc_presupuesto.enviado_por_correo = True
-                doc_presupuesto.fecha_envio = timezone.now()
-                doc_presupuesto.email_destinatario = plan.cliente.email
-                doc_presupuesto.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                documentos_actualizados += 1
+            return JsonResponse({
+                'success': True,
+                'message': f'Pago de ${monto:,.0f} registrado exitosamente.',
+                'pago': {
+                    'id': pago.id,
+                    'monto': str(pago.monto),
+                    'fecha_pago': pago.fecha_pago.strftime('%d/%m/%Y'),
+                    'metodo_pago': pago.get_metodo_pago_display(),
+                },
+                'total_pagado': str(plan.total_pagado),
+                'saldo_pendiente': str(plan.saldo_pendiente),
+            })
+            
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Error en los datos: {str(e)}'}, status=400)
         except Exception as e:
-            logger.warning(f"No se pudo actualizar documento de presupuesto: {e}")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error al enviar documentos del tratamiento: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Error al enviar los documentos: {str(e)}'}, status=500)
+            logger.error(f"Error al registrar pago: {e}")
+            return JsonResponse({'success': False, 'error': f'Error al registrar el pago: {str(e)}'}, status=500)
+    
+    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
-    else:
+
+@login_required
+def eliminar_pago_tratamiento(request, plan_id, pago_id):
+    """Elimina un pago registrado (solo administrativos)"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
+    except Perfil.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Verificar que el plan puede ser editado
-    if not plan.puede_ser_editado_por(perfil):
-        return JsonResponse({'success': False, 'error': f'No puedes eliminar fases de este plan en estado "{plan.get_estado_display()}".'}, status=400)
-    
-    # Verificar si la fase tiene citas asociadas
-    citas_asociadas = Cita.objects.filter(fase_tratamiento=fase).count()
-    if citas_asociadas > 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'No se puede eliminar la fase porque tiene {citas_asociadas} cita(s) asociada(s).'
-        }, status=400)
+    plan = get_object_or_404(PlanTratamiento, id=plan_id)
+    pago = get_object_or_404(PagoTratamiento, id=pago_id, plan_tratamiento=plan)
     
     if request.method == 'POST':
         try:
-            nombre_fase = fase.nombre
-            fase.delete()
-            
-            # Reordenar las fases restantes
-            fases_restantes = plan.fases.all().order_by('orden')
-            for idx, fase_restante in enumerate(fases_restantes, start=1):
-                fase_restante.orden = idx
-                fase_restante.save()
+            monto = pago.monto
+            pago.delete()
             
             return JsonResponse({
                 'success': True,
-                'message': f'Fase "{nombre_fase}" eliminada exitosamente.'
+                'message': f'Pago de ${monto:,.0f} eliminado exitosamente.',
+                'total_pagado': str(plan.total_pagado),
+                'saldo_pendiente': str(plan.saldo_pendiente),
             })
             
         except Exception as e:
-            logger.error(f"Error al eliminar fase: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar la fase: {str(e)}'}, status=500)
+            logger.error(f"Error al eliminar pago: {e}")
+            return JsonResponse({'success': False, 'error': f'Error al eliminar el pago: {str(e)}'}, status=500)
     
     return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
@@ -16564,21 +14223,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -16806,312 +14454,59 @@ def registrar_pago_tratamiento(request, plan_id):
                 numero_comprobante=numero_comprobante if numero_comprobante else None,
                 notas=notas if notas else None,
                 cita=cita,
-                registrado_por=perfil
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Pago de ${monto:,.0f} registrado exitosamente.',
-                'pago': {
-                    'id': pago.id,
-                    'monto': str(pago.monto),
-                    'fecha_pago': pago.fecha_pago.strftime('%d/%m/%Y'),
-                    'metodo_pago': pago.get_metodo_pago_display(),
-                },
-                'total_pagado': str(plan.total_pagado),
-                'saldo_pendiente': str(plan.saldo_pendiente),
-            })
-            
-        except ValueError as e:
-            return JsonResponse({'success': False, 'error': f'Error en los datos: {str(e)}'}, status=400)
-        except Exception as e:
-            logger.error(f"Error al registrar pago: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al registrar el pago: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def eliminar_pago_tratamiento(request, plan_id, pago_id):
-    """Elimina un pago registrado (solo administrativos)"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    pago = get_object_or_404(PagoTratamiento, id=pago_id, plan_tratamiento=plan)
-    
-    if request.method == 'POST':
-        try:
-            monto = pago.monto
-            pago.delete()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Pago de ${monto:,.0f} eliminado exitosamente.',
-                'total_pagado': str(plan.total_pagado),
-                'saldo_pendiente': str(plan.saldo_pendiente),
-            })
-            
-        except Exception as e:
-            logger.error(f"Error al eliminar pago: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar el pago: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def enviar_documentos_tratamiento(request, plan_id):
-    """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_administrativo() or perfil.es_dentista()):
-            return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    if request.method != 'POST':
-        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-    
-    # Verificar que el cliente tenga email
-    if not plan.cliente.email:
-        return JsonResponse({'success': False, 'error': 'El cliente no tiene un email registrado.'}, status=400)
-    
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from io import BytesIO
-        from datetime import datetime
-        
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
-        
-        # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
-        
-        # Crear el email
-        asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
-        
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
-        
-        # Crear el email
-        email = EmailMultiAlternatives(
-            asunto,
-            mensaje_texto,
-            email_clinica,
-            [plan.cliente.email],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
-        
-        # Adjuntar presupuesto
-        filename_presupuesto = f"presupuesto_{plan.cliente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
-        
-        # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
-        
-        # Enviar email
-        email.send()
-        
-        # Actualizar fecha de envío en documentos relacionados
-        from historial_clinico.models import DocumentoCliente
-        documentos_actualizados = 0
-        for consentimiento in consentimientos:
-            # Actualizar el documento relacionado si existe
-            try:
-                documento = DocumentoCliente.objects.filter(
-                    plan_tratamiento=plan,
-                    tipo='consentimiento',
-                    cliente=plan.cliente
-                ).filter(
-                    titulo__icontains=consentimiento.titulo
-                ).first()
-                
-                if documento:
-                    documento.enviado_por_correo = True
-                    documento.fecha_envio = timezone.now()
-                    documento.email_destinatario = plan.cliente.email
-                    documento.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                    documentos_actualizados += 1
-            except Exception as e:
-                logger.warning(f"No se pudo actualizar documento para consentimiento {consentimiento.id}: {e}")
-        
-        # Actualizar también el documento del presupuesto si existe
-        try:
-            doc_presupuesto = DocumentoCliente.objects.filter(
-                plan_tratamiento=plan,
-                tipo='presupuesto',
-                cliente=plan.cliente
-            ).first()
+                registrado_por=perfil
+            )
             
-            if doc_presupuesto:
-                doc_presupuesto.enviado_por_correo = True
-                doc_presupuesto.fecha_envio = timezone.now()
-                doc_presupuesto.email_destinatario = plan.cliente.email
-                doc_presupuesto.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                documentos_actualizados += 1
+            return JsonResponse({
+                'success': True,
+                'message': f'Pago de ${monto:,.0f} registrado exitosamente.',
+                'pago': {
+                    'id': pago.id,
+                    'monto': str(pago.monto),
+                    'fecha_pago': pago.fecha_pago.strftime('%d/%m/%Y'),
+                    'metodo_pago': pago.get_metodo_pago_display(),
+                },
+                'total_pagado': str(plan.total_pagado),
+                'saldo_pendiente': str(plan.saldo_pendiente),
+            })
+            
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Error en los datos: {str(e)}'}, status=400)
         except Exception as e:
-            logger.warning(f"No se pudo actualizar documento de presupuesto: {e}")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error al enviar documentos del tratamiento: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Error al enviar los documentos: {str(e)}'}, status=500)
+            logger.error(f"Error al registrar pago: {e}")
+            return JsonResponse({'success': False, 'error': f'Error al registrar el pago: {str(e)}'}, status=500)
+    
+    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
-    else:
+
+@login_required
+def eliminar_pago_tratamiento(request, plan_id, pago_id):
+    """Elimina un pago registrado (solo administrativos)"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
+    except Perfil.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Verificar que el plan puede ser editado
-    if not plan.puede_ser_editado_por(perfil):
-        return JsonResponse({'success': False, 'error': f'No puedes eliminar fases de este plan en estado "{plan.get_estado_display()}".'}, status=400)
-    
-    # Verificar si la fase tiene citas asociadas
-    citas_asociadas = Cita.objects.filter(fase_tratamiento=fase).count()
-    if citas_asociadas > 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'No se puede eliminar la fase porque tiene {citas_asociadas} cita(s) asociada(s).'
-        }, status=400)
+    plan = get_object_or_404(PlanTratamiento, id=plan_id)
+    pago = get_object_or_404(PagoTratamiento, id=pago_id, plan_tratamiento=plan)
     
     if request.method == 'POST':
         try:
-            nombre_fase = fase.nombre
-            fase.delete()
-            
-            # Reordenar las fases restantes
-            fases_restantes = plan.fases.all().order_by('orden')
-            for idx, fase_restante in enumerate(fases_restantes, start=1):
-                fase_restante.orden = idx
-                fase_restante.save()
+            monto = pago.monto
+            pago.delete()
             
             return JsonResponse({
                 'success': True,
-                'message': f'Fase "{nombre_fase}" eliminada exitosamente.'
+                'message': f'Pago de ${monto:,.0f} eliminado exitosamente.',
+                'total_pagado': str(plan.total_pagado),
+                'saldo_pendiente': str(plan.saldo_pendiente),
             })
             
         except Exception as e:
-            logger.error(f"Error al eliminar fase: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar la fase: {str(e)}'}, status=500)
+            logger.error(f"Error al eliminar pago: {e}")
+            return JsonResponse({'success': False, 'error': f'Error al eliminar el pago: {str(e)}'}, status=500)
     
     return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
@@ -17239,21 +14634,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -17490,303 +14874,50 @@ def registrar_pago_tratamiento(request, plan_id):
                 'pago': {
                     'id': pago.id,
                     'monto': str(pago.monto),
-                    'fecha_pago': pago.fecha_pago.strftime('%d/%m/%Y'),
-                    'metodo_pago': pago.get_metodo_pago_display(),
-                },
-                'total_pagado': str(plan.total_pagado),
-                'saldo_pendiente': str(plan.saldo_pendiente),
-            })
-            
-        except ValueError as e:
-            return JsonResponse({'success': False, 'error': f'Error en los datos: {str(e)}'}, status=400)
-        except Exception as e:
-            logger.error(f"Error al registrar pago: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al registrar el pago: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def eliminar_pago_tratamiento(request, plan_id, pago_id):
-    """Elimina un pago registrado (solo administrativos)"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    pago = get_object_or_404(PagoTratamiento, id=pago_id, plan_tratamiento=plan)
-    
-    if request.method == 'POST':
-        try:
-            monto = pago.monto
-            pago.delete()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Pago de ${monto:,.0f} eliminado exitosamente.',
-                'total_pagado': str(plan.total_pagado),
-                'saldo_pendiente': str(plan.saldo_pendiente),
-            })
-            
-        except Exception as e:
-            logger.error(f"Error al eliminar pago: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar el pago: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
-@login_required
-def enviar_documentos_tratamiento(request, plan_id):
-    """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_administrativo() or perfil.es_dentista()):
-            return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    if request.method != 'POST':
-        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-    
-    # Verificar que el cliente tenga email
-    if not plan.cliente.email:
-        return JsonResponse({'success': False, 'error': 'El cliente no tiene un email registrado.'}, status=400)
-    
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from io import BytesIO
-        from datetime import datetime
-        
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
-        
-        # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
-        
-        # Crear el email
-        asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
-        
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
-        
-        # Crear el email
-        email = EmailMultiAlternatives(
-            asunto,
-            mensaje_texto,
-            email_clinica,
-            [plan.cliente.email],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
-        
-        # Adjuntar presupuesto
-        filename_presupuesto = f"presupuesto_{plan.cliente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
-        
-        # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
-        
-        # Enviar email
-        email.send()
-        
-        # Actualizar fecha de envío en documentos relacionados
-        from historial_clinico.models import DocumentoCliente
-        documentos_actualizados = 0
-        for consentimiento in consentimientos:
-            # Actualizar el documento relacionado si existe
-            try:
-                documento = DocumentoCliente.objects.filter(
-                    plan_tratamiento=plan,
-                    tipo='consentimiento',
-                    cliente=plan.cliente
-                ).filter(
-                    titulo__icontains=consentimiento.titulo
-                ).first()
-                
-                if documento:
-                    documento.enviado_por_correo = True
-                    documento.fecha_envio = timezone.now()
-                    documento.email_destinatario = plan.cliente.email
-                    documento.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                    documentos_actualizados += 1
-            except Exception as e:
-                logger.warning(f"No se pudo actualizar documento para consentimiento {consentimiento.id}: {e}")
-        
-        # Actualizar también el documento del presupuesto si existe
-        try:
-            doc_presupuesto = DocumentoCliente.objects.filter(
-                plan_tratamiento=plan,
-                tipo='presupuesto',
-                cliente=plan.cliente
-            ).first()
-            
-            if doc_presupuesto:
-                doc_presupuesto.enviado_por_correo = True
-                doc_presupuesto.fecha_envio = timezone.now()
-                doc_presupuesto.email_destinatario = plan.cliente.email
-                doc_presupuesto.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                documentos_actualizados += 1
-        except Exception as e:
-            logger.warning(f"No se pudo actualizar documento de presupuesto: {e}")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error al enviar documentos del tratamiento: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Error al enviar los documentos: {str(e)}'}, status=500)
+                    'fecha_pago': pago.fecha_pago.strftime('%d/%m/%Y'),
+                    'metodo_pago': pago.get_metodo_pago_display(),
+                },
+                'total_pagado': str(plan.total_pagado),
+                'saldo_pendiente': str(plan.saldo_pendiente),
+            })
+            
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': f'Error en los datos: {str(e)}'}, status=400)
+        except Exception as e:
+            logger.error(f"Error al registrar pago: {e}")
+            return JsonResponse({'success': False, 'error': f'Error al registrar el pago: {str(e)}'}, status=500)
+    
+    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
-    else:
+
+@login_required
+def eliminar_pago_tratamiento(request, plan_id, pago_id):
+    """Elimina un pago registrado (solo administrativos)"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
+    except Perfil.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Verificar que el plan puede ser editado
-    if not plan.puede_ser_editado_por(perfil):
-        return JsonResponse({'success': False, 'error': f'No puedes eliminar fases de este plan en estado "{plan.get_estado_display()}".'}, status=400)
-    
-    # Verificar si la fase tiene citas asociadas
-    citas_asociadas = Cita.objects.filter(fase_tratamiento=fase).count()
-    if citas_asociadas > 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'No se puede eliminar la fase porque tiene {citas_asociadas} cita(s) asociada(s).'
-        }, status=400)
+    plan = get_object_or_404(PlanTratamiento, id=plan_id)
+    pago = get_object_or_404(PagoTratamiento, id=pago_id, plan_tratamiento=plan)
     
     if request.method == 'POST':
         try:
-            nombre_fase = fase.nombre
-            fase.delete()
-            
-            # Reordenar las fases restantes
-            fases_restantes = plan.fases.all().order_by('orden')
-            for idx, fase_restante in enumerate(fases_restantes, start=1):
-                fase_restante.orden = idx
-                fase_restante.save()
+            monto = pago.monto
+            pago.delete()
             
             return JsonResponse({
                 'success': True,
-                'message': f'Fase "{nombre_fase}" eliminada exitosamente.'
+                'message': f'Pago de ${monto:,.0f} eliminado exitosamente.',
+                'total_pagado': str(plan.total_pagado),
+                'saldo_pendiente': str(plan.saldo_pendiente),
             })
             
         except Exception as e:
-            logger.error(f"Error al eliminar fase: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar la fase: {str(e)}'}, status=500)
+            logger.error(f"Error al eliminar pago: {e}")
+            return JsonResponse({'success': False, 'error': f'Error al eliminar el pago: {str(e)}'}, status=500)
     
     return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
@@ -17914,21 +15045,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -18213,259 +15333,6 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
     return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
 
 
-@login_required
-def enviar_documentos_tratamiento(request, plan_id):
-    """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_administrativo() or perfil.es_dentista()):
-            return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
-    except Perfil.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
-    
-    if request.method != 'POST':
-        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-    
-    # Verificar que el cliente tenga email
-    if not plan.cliente.email:
-        return JsonResponse({'success': False, 'error': 'El cliente no tiene un email registrado.'}, status=400)
-    
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from io import BytesIO
-        from datetime import datetime
-        
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
-        
-        # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
-        
-        # Crear el email
-        asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
-        
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
-        
-        # Crear el email
-        email = EmailMultiAlternatives(
-            asunto,
-            mensaje_texto,
-            email_clinica,
-            [plan.cliente.email],
-        )
-        email.attach_alternative(mensaje_html, "text/html")
-        
-        # Adjuntar presupuesto
-        filename_presupuesto = f"presupuesto_{plan.cliente.nombre_completo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
-        
-        # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
-        
-        # Enviar email
-        email.send()
-        
-        # Actualizar fecha de envío en documentos relacionados
-        from historial_clinico.models import DocumentoCliente
-        documentos_actualizados = 0
-        for consentimiento in consentimientos:
-            # Actualizar el documento relacionado si existe
-            try:
-                documento = DocumentoCliente.objects.filter(
-                    plan_tratamiento=plan,
-                    tipo='consentimiento',
-                    cliente=plan.cliente
-                ).filter(
-                    titulo__icontains=consentimiento.titulo
-                ).first()
-                
-                if documento:
-                    documento.enviado_por_correo = True
-                    documento.fecha_envio = timezone.now()
-                    documento.email_destinatario = plan.cliente.email
-                    documento.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                    documentos_actualizados += 1
-            except Exception as e:
-                logger.warning(f"No se pudo actualizar documento para consentimiento {consentimiento.id}: {e}")
-        
-        # Actualizar también el documento del presupuesto si existe
-        try:
-            doc_presupuesto = DocumentoCliente.objects.filter(
-                plan_tratamiento=plan,
-                tipo='presupuesto',
-                cliente=plan.cliente
-            ).first()
-            
-            if doc_presupuesto:
-                doc_presupuesto.enviado_por_correo = True
-                doc_presupuesto.fecha_envio = timezone.now()
-                doc_presupuesto.email_destinatario = plan.cliente.email
-                doc_presupuesto.save(update_fields=['enviado_por_correo', 'fecha_envio', 'email_destinatario'])
-                documentos_actualizados += 1
-        except Exception as e:
-            logger.warning(f"No se pudo actualizar documento de presupuesto: {e}")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
-        })
-        
-    except Exception as e:
-        logger.error(f"Error al enviar documentos del tratamiento: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Error al enviar los documentos: {str(e)}'}, status=500)
-
-    else:
-        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
-    
-    # Obtener la fase
-    fase = get_object_or_404(FaseTratamiento, id=fase_id, plan=plan)
-    
-    # Verificar que el plan puede ser editado
-    if not plan.puede_ser_editado_por(perfil):
-        return JsonResponse({'success': False, 'error': f'No puedes eliminar fases de este plan en estado "{plan.get_estado_display()}".'}, status=400)
-    
-    # Verificar si la fase tiene citas asociadas
-    citas_asociadas = Cita.objects.filter(fase_tratamiento=fase).count()
-    if citas_asociadas > 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'No se puede eliminar la fase porque tiene {citas_asociadas} cita(s) asociada(s).'
-        }, status=400)
-    
-    if request.method == 'POST':
-        try:
-            nombre_fase = fase.nombre
-            fase.delete()
-            
-            # Reordenar las fases restantes
-            fases_restantes = plan.fases.all().order_by('orden')
-            for idx, fase_restante in enumerate(fases_restantes, start=1):
-                fase_restante.orden = idx
-                fase_restante.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Fase "{nombre_fase}" eliminada exitosamente.'
-            })
-            
-        except Exception as e:
-            logger.error(f"Error al eliminar fase: {e}")
-            return JsonResponse({'success': False, 'error': f'Error al eliminar la fase: {str(e)}'}, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
-
-
 @login_required
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
@@ -18589,21 +15456,10 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
                 return JsonResponse({'success': False, 'error': f'La duración del servicio ({duracion_minutos} minutos) no cabe en el horario seleccionado.'}, status=400)
             
             # Verificar solapamiento con otras citas
-            citas_existentes = Cita.objects.filter(
-                dentista=dentista,
-                fecha_hora__date=fecha_hora.date(),
-                estado__in=['disponible', 'reservada', 'confirmada', 'en_progreso']
-            )
-            
-            for cita_existente in citas_existentes:
-                fecha_hora_existente_fin = cita_existente.fecha_hora
-                if cita_existente.tipo_servicio and cita_existente.tipo_servicio.duracion_estimada:
-                    fecha_hora_existente_fin += timedelta(minutes=cita_existente.tipo_servicio.duracion_estimada)
-                else:
-                    fecha_hora_existente_fin += timedelta(minutes=30)
-                
-                if (fecha_hora < fecha_hora_existente_fin and fecha_hora_fin > cita_existente.fecha_hora):
-                    return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {cita_existente.fecha_hora.strftime("%H:%M")}.'}, status=400)
+            from citas.agenda_service import buscar_solapamiento
+            conflicto = buscar_solapamiento(dentista, fecha_hora, duracion_minutos)
+            if conflicto:
+                return JsonResponse({'success': False, 'error': f'La cita se solapa con otra cita existente a las {timezone.localtime(conflicto.inicio).strftime("%H:%M")}.'}, status=400)
             
             # Obtener precio del servicio
             precio_cobrado = None
@@ -18917,110 +15773,41 @@ def enviar_documentos_tratamiento(request, plan_id):
         from io import BytesIO
         from datetime import datetime
         
-        # Obtener información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-            email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
-        except:
-            nombre_clinica = "Clínica Dental"
-            email_clinica = getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
+        # Información de la clínica (copia en caché)
+        from .email_service import obtener_info_clinica, renderizar_correo
+        info_clinica = obtener_info_clinica()
+        nombre_clinica = info_clinica['nombre']
+        email_clinica = info_clinica['email']
         
-        # Generar PDF del presupuesto
-        presupuesto_response = exportar_presupuesto_pdf(request, plan.id)
-        presupuesto_pdf = presupuesto_response.content
+        from .pdf_service import datos_clinica, preparar_para_pdf, renderizar_lote
         
         # Obtener consentimientos pendientes o no firmados
-        consentimientos = plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
+        consentimientos = list(preparar_para_pdf(
+            'consentimiento',
+            plan.consentimientos.filter(estado__in=['pendiente', 'firmado']).order_by('-fecha_creacion')
+        ))
+        
+        # Generar el presupuesto y los consentimientos en paralelo
+        clinica = datos_clinica()
+        plan_pdf = preparar_para_pdf('presupuesto', PlanTratamiento.objects.filter(id=plan.id)).get()
+        pdfs = renderizar_lote(
+            [('presupuesto', plan_pdf, {'generado_por': perfil.nombre_completo, 'clinica': clinica})] +
+            [('consentimiento', consentimiento, {'clinica': clinica}) for consentimiento in consentimientos]
+        )
+        presupuesto_pdf, consentimientos_pdf = pdfs[0], pdfs[1:]
+        if presupuesto_pdf is None:
+            return JsonResponse({'success': False, 'error': 'No se pudo generar el PDF del presupuesto.'}, status=500)
+        _registrar_documento_presupuesto(plan, perfil)
         
         # Crear el email
         asunto = f"Documentos del Tratamiento - {plan.nombre} - {nombre_clinica}"
         
-        mensaje_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #14b8a6 0%, #0d9488 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 40px 20px;">
-                <!-- Header con logo -->
-                <div style="background: white; border-radius: 12px 12px 0 0; padding: 30px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <div style="display: inline-flex; align-items: center; gap: 12px; margin-bottom: 10px;">
-                        <div style="width: 50px; height: 50px; background: linear-gradient(135deg, #14b8a6, #0d9488); border-radius: 50%; display: flex; align-items: center; justify-content: center; color: white; font-size: 1.8rem;">
-                            <span style="font-size: 1.8rem;">🦷</span>
-                        </div>
-                        <h1 style="margin: 0; color: #0f766e; font-size: 1.75rem; font-weight: 700;">Clínica San Felipe</h1>
-                    </div>
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem;">Victoria, Región de la Araucanía</p>
-                </div>
-                
-                <!-- Contenido del correo -->
-                <div style="background: white; padding: 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    <h2 style="color: #1e293b; margin-top: 0; font-size: 1.5rem;">Estimado/a {plan.cliente.nombre_completo},</h2>
-                    
-                    <p style="color: #475569; line-height: 1.6; font-size: 1rem;">Le enviamos los documentos relacionados con su tratamiento: <strong style="color: #0f766e;">{plan.nombre}</strong></p>
-                    
-                    <div style="background: linear-gradient(135deg, #f0fdfa, #e0f2f1); padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #14b8a6;">
-                        <h3 style="margin-top: 0; color: #0f766e; font-size: 1.1rem; margin-bottom: 12px;">Documentos adjuntos:</h3>
-                        <ul style="margin: 0; padding-left: 20px; color: #475569;">
-                            <li style="margin-bottom: 8px;"><strong style="color: #0f766e;">Presupuesto del Tratamiento</strong></li>
-        """
-        
-        if consentimientos.exists():
-            mensaje_html += f"<li style='margin-bottom: 8px;'><strong style='color: #0f766e;'>Consentimientos Informados</strong> ({consentimientos.count()} documento(s))</li>"
-        
-        mensaje_html += f"""
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
-                    
-                    <div style="background: #fef3c7; padding: 18px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #f59e0b;">
-                        <p style="margin: 0 0 12px 0; color: #92400e; font-weight: 600; font-size: 1rem;"><strong>Importante:</strong> Para proceder con el tratamiento, necesitamos que:</p>
-                        <ul style="margin: 0; padding-left: 20px; color: #92400e;">
-                            <li style="margin-bottom: 6px;">Acepte el presupuesto</li>
-                            <li style="margin-bottom: 6px;">Firme el consentimiento informado</li>
-                        </ul>
-                    </div>
-                    
-                    <p style="color: #475569; line-height: 1.6;">Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.</p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background: white; border-radius: 0 0 12px 12px; padding: 25px 30px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); border-top: 1px solid #e0f2f1;">
-                    <p style="margin: 0; color: #64748b; font-size: 0.9rem; line-height: 1.6;">
-                        Saludos cordiales,<br>
-                        <strong style="color: #0f766e; font-size: 1rem;">{nombre_clinica}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        mensaje_texto = f"""
-        Estimado/a {plan.cliente.nombre_completo},
-        
-        Le enviamos los documentos relacionados con su tratamiento: {plan.nombre}
-        
-        Documentos adjuntos:
-        - Presupuesto del Tratamiento
-        - Consentimientos Informados
-        
-        Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.
-        
-        Importante: Para proceder con el tratamiento, necesitamos que:
-        - Acepte el presupuesto
-        - Firme el consentimiento informado
-        
-        Puede hacerlo desde su panel de cliente en nuestra página web o contactándonos directamente.
-        
-        Saludos cordiales,
-        {nombre_clinica}
-        """
+        mensaje_texto, mensaje_html = renderizar_correo('citas/emails/documentos_tratamiento', {
+            'cliente_nombre': plan.cliente.nombre_completo,
+            'plan_nombre': plan.nombre,
+            'total_consentimientos': len(consentimientos),
+            'nombre_clinica': nombre_clinica,
+        })
         
         # Crear el email
         email = EmailMultiAlternatives(
@@ -19036,18 +15823,17 @@ def enviar_documentos_tratamiento(request, plan_id):
         email.attach(filename_presupuesto, presupuesto_pdf, 'application/pdf')
         
         # Adjuntar consentimientos
-        for consentimiento in consentimientos:
-            try:
-                consentimiento_response = exportar_consentimiento_pdf(request, consentimiento.id)
-                consentimiento_pdf = consentimiento_response.content
-                filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
-            except Exception as e:
-                logger.error(f"Error al generar PDF del consentimiento {consentimiento.id}: {e}")
-                # Continuar con los demás documentos
+        for consentimiento, consentimiento_pdf in zip(consentimientos, consentimientos_pdf):
+            if consentimiento_pdf is None:
+                # El error ya quedó registrado en el log: continuar con los demás documentos
+                continue
+            _registrar_documento_consentimiento(consentimiento, perfil)
+            filename_consentimiento = f"consentimiento_{consentimiento.titulo.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
+            email.attach(filename_consentimiento, consentimiento_pdf, 'application/pdf')
         
-        # Enviar email
-        email.send()
+        # Encolar email (lo envía el comando procesar_correos)
+        from .correos_service import encolar_correo
+        encolar_correo(email, origen='documentos_tratamiento')
         
         # Actualizar fecha de envío en documentos relacionados
         from historial_clinico.models import DocumentoCliente
@@ -19091,7 +15877,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         
         return JsonResponse({
             'success': True,
-            'message': f'Documentos enviados exitosamente a {plan.cliente.email}. Se enviaron {1 + consentimientos.count()} documento(s).'
+            'message': f'{1 + len(consentimientos)} documento(s) encolado(s) para su envío a {plan.cliente.email}. Se enviarán en unos momentos.'
         })
         
     except Exception as e:
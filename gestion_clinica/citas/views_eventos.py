@@ -0,0 +1,229 @@
+"""
+Canal de eventos en tiempo real (Server-Sent Events).
+
+Reemplaza el polling periódico de citas del día y mensajes: el navegador abre una
+conexión EventSource y recibe los cambios de estado de citas y los mensajes nuevos
+apenas se publican. Los eventos se leen de la tabla EventoTiempoReal, por lo que
+funciona igual con uno o varios procesos del servidor.
+
+El flujo se sirve por ASGI (gunicorn con workers uvicorn, ver Procfile): cada
+conexión es una corrutina que espera sin ocupar un hilo. Además las conexiones de
+un proceso no consultan la tabla cada una por su cuenta: un único difusor la lee
+cada INTERVALO_CONSULTA_SEGUNDOS y reparte los eventos nuevos a todas.
+
+Bajo WSGI (runserver, gunicorn sin uvicorn) un flujo asíncrono se consumiría
+completo antes del primer byte, así que la vista responde 204: el navegador no
+reconecta y las pantallas usan su polling de respaldo.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.db.models import Max, Q
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+
+from citas.models import EventoTiempoReal
+from personal.models import Perfil
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto el difusor del proceso consulta la tabla de eventos (segundos)
+INTERVALO_CONSULTA_SEGUNDOS = 1
+# Comentario keep-alive para que proxies no cierren la conexión inactiva
+INTERVALO_LATIDO_SEGUNDOS = 15
+# Duración máxima de una conexión; el navegador reconecta solo con Last-Event-ID
+DURACION_MAXIMA_SEGUNDOS = 300
+# Tiempo de reconexión sugerido al navegador (milisegundos)
+REINTENTO_MILISEGUNDOS = 3000
+# Eventos recientes que el difusor guarda para las conexiones que se quedaron atrás
+MAX_EVENTOS_EN_MEMORIA = 500
+
+
+def _formatear_evento(evento):
+    """Serializa un EventoTiempoReal en formato text/event-stream"""
+    datos = json.dumps(evento.datos, ensure_ascii=False)
+    return f"id: {evento.id}\nevent: {evento.tipo}\ndata: {datos}\n\n"
+
+
+def _ultimo_id_recibido(request):
+    """ID del último evento que tiene el navegador (cabecera Last-Event-ID o ?ultimo=)"""
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('ultimo')
+    try:
+        return int(valor) if valor else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _es_visible(evento, perfil_id):
+    return evento.destinatario_id is None or evento.destinatario_id == perfil_id
+
+
+class _Difusor:
+    """
+    Lee EventoTiempoReal una vez por intervalo para todas las conexiones del proceso.
+
+    La consulta corre en una tarea que existe solo mientras haya conexiones
+    abiertas. Guarda los últimos MAX_EVENTOS_EN_MEMORIA eventos: los ids en
+    (desde_id, ultimo_id] están completos en memoria; una conexión que pide
+    eventos anteriores (reconexión tras un corte largo) los lee de la tabla.
+    """
+
+    def __init__(self):
+        self.recientes = deque()
+        self.desde_id = 0
+        self.ultimo_id = 0
+        self.conexiones = 0
+        self._tarea = None
+        self._iniciado = None
+        self._nuevos = None
+
+    async def conectar(self):
+        self.conexiones += 1
+        if self._tarea is None:
+            self._iniciado = asyncio.Event()
+            self._nuevos = asyncio.Event()
+            # Contexto vacío: la tarea sobrevive a la petición que la inició y sus
+            # consultas no usan el hilo de esa petición
+            self._tarea = asyncio.get_running_loop().create_task(
+                self._consultar(), context=contextvars.Context()
+            )
+        await self._iniciado.wait()
+
+    def desconectar(self):
+        self.conexiones -= 1
+
+    async def esperar(self, segundos):
+        """Espera hasta que lleguen eventos nuevos o pasen los segundos indicados"""
+        try:
+            await asyncio.wait_for(self._nuevos.wait(), timeout=segundos)
+        except asyncio.TimeoutError:
+            pass
+
+    async def eventos_entre(self, ultimo_id, hasta_id, perfil_id):
+        """Eventos visibles para el perfil con id en (ultimo_id, hasta_id]"""
+        if ultimo_id >= self.desde_id:
+            return [
+                evento for evento in self.recientes
+                if ultimo_id < evento.id <= hasta_id and _es_visible(evento, perfil_id)
+            ]
+        visibles = Q(destinatario__isnull=True) | Q(destinatario_id=perfil_id)
+        return [
+            evento async for evento in EventoTiempoReal.objects.filter(
+                visibles, id__gt=ultimo_id, id__lte=hasta_id
+            ).order_by('id')[:100]
+        ]
+
+    async def _leer_nuevos(self):
+        if not self._iniciado.is_set():
+            resumen = await EventoTiempoReal.objects.aaggregate(mayor_id=Max('id'))
+            self.ultimo_id = self.desde_id = resumen['mayor_id'] or 0
+            self.recientes.clear()
+            self._iniciado.set()
+            return
+
+        nuevos = [
+            evento async for evento in EventoTiempoReal.objects.filter(
+                id__gt=self.ultimo_id
+            ).order_by('id')[:MAX_EVENTOS_EN_MEMORIA]
+        ]
+        if not nuevos:
+            return
+        self.recientes.extend(nuevos)
+        while len(self.recientes) > MAX_EVENTOS_EN_MEMORIA:
+            self.desde_id = self.recientes.popleft().id
+        self.ultimo_id = nuevos[-1].id
+        # Despertar a todas las conexiones y preparar la próxima espera
+        self._nuevos.set()
+        self._nuevos = asyncio.Event()
+
+    async def _consultar(self):
+        try:
+            while self.conexiones > 0:
+                try:
+                    await self._leer_nuevos()
+                except Exception as e:
+                    logger.error(f"Error al consultar eventos en tiempo real: {str(e)}")
+                    # Descartar la conexión a la base de datos si quedó inutilizable
+                    await sync_to_async(close_old_connections)()
+                await asyncio.sleep(INTERVALO_CONSULTA_SEGUNDOS)
+        finally:
+            self._tarea = None
+
+
+_difusor = _Difusor()
+
+
+async def _flujo_eventos(perfil_id, ultimo_id):
+    """Generador asíncrono que entrega los eventos nuevos para el perfil conectado"""
+    try:
+        await _difusor.conectar()
+        if ultimo_id is None:
+            # Conexión nueva: solo interesan los eventos que ocurran desde ahora
+            ultimo_id = _difusor.ultimo_id
+
+        # El id inicial asegura que la reconexión envíe Last-Event-ID aunque no llegue ningún evento
+        yield f"retry: {REINTENTO_MILISEGUNDOS}\nid: {ultimo_id}\n\n"
+
+        inicio = time.monotonic()
+        ultimo_envio = inicio
+        while time.monotonic() - inicio < DURACION_MAXIMA_SEGUNDOS:
+            hasta_id = _difusor.ultimo_id
+            eventos = await _difusor.eventos_entre(ultimo_id, hasta_id, perfil_id)
+            for evento in eventos:
+                yield _formatear_evento(evento)
+            # Con menos eventos que el límite de la consulta ya se revisó todo hasta hasta_id
+            # (los eventos para otros destinatarios también se dejan atrás)
+            ultimo_id = eventos[-1].id if len(eventos) >= 100 else max(ultimo_id, hasta_id)
+
+            ahora = time.monotonic()
+            if eventos:
+                ultimo_envio = ahora
+            elif ahora - ultimo_envio >= INTERVALO_LATIDO_SEGUNDOS:
+                ultimo_envio = ahora
+                yield ": latido\n\n"
+
+            if ultimo_id >= _difusor.ultimo_id:
+                await _difusor.esperar(INTERVALO_LATIDO_SEGUNDOS)
+    except asyncio.CancelledError:
+        # El navegador cerró la conexión
+        logger.debug(f"Conexión de eventos cerrada (perfil {perfil_id})")
+        raise
+    finally:
+        _difusor.desconectar()
+
+
+async def stream_eventos(request):
+    """
+    Stream SSE con los cambios de estado de citas y los mensajes internos nuevos.
+
+    Eventos:
+        cita: {id, estado, estado_anterior, fecha, hora, dentista_id, paciente}
+        mensaje: {id, asunto, tipo, remitente} (solo para el destinatario)
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden('Debes iniciar sesión.')
+
+    perfil = await Perfil.objects.filter(user_id=user.id, activo=True).only('id').afirst()
+    if perfil is None:
+        return HttpResponseForbidden('Perfil no encontrado.')
+
+    if not isinstance(request, ASGIRequest):
+        # Sin servidor ASGI el flujo no llegaría evento por evento: 204 hace que
+        # EventSource no reconecte y la pantalla use su polling
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(
+        _flujo_eventos(perfil.id, _ultimo_id_recibido(request)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Desactiva el buffer de nginx para que cada evento llegue de inmediato
+    response['X-Accel-Buffering'] = 'no'
+    return response
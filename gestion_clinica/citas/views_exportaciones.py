@@ -0,0 +1,114 @@
+"""
+Vistas de las exportaciones en segundo plano.
+
+El botón de exportación llama a solicitar_exportacion (POST), que solo encola el
+trabajo y responde de inmediato; luego el navegador consulta estado_exportacion
+cada pocos segundos y, cuando el archivo está listo, lo baja desde
+descargar_exportacion. El archivo lo genera el comando procesar_exportaciones.
+"""
+import logging
+
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from citas.models import TrabajoExportacion, registrar_auditoria
+from citas.exportaciones_service import datos_trabajo, encolar_exportacion
+from personal.models import Perfil
+
+logger = logging.getLogger(__name__)
+
+# Módulo de auditoría de cada tipo de exportación
+MODULO_AUDITORIA = {
+    'excel_finanzas': 'finanzas',
+    'excel_planes_tratamiento': 'planes_tratamiento',
+    'pdf_insumos': 'inventario',
+    'pdf_estadisticas': 'sistema',
+}
+
+# Valores aceptados para el parámetro 'tipo' del Excel de finanzas
+TIPOS_FINANZAS = ('', 'ingresos', 'egresos')
+
+
+def _perfil_administrativo(request):
+    """Perfil del usuario si es administrativo, o None"""
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+    except Perfil.DoesNotExist:
+        return None
+    return perfil if perfil.es_administrativo() else None
+
+
+@login_required
+@require_POST
+def solicitar_exportacion(request, tipo):
+    """Encola una exportación y retorna el trabajo creado (o el que ya estaba en curso)"""
+    perfil = _perfil_administrativo(request)
+    if perfil is None:
+        return JsonResponse({'success': False, 'message': 'No tienes permisos para exportar.'}, status=403)
+
+    parametros = {}
+    if tipo == 'excel_finanzas':
+        tipo_finanzas = request.POST.get('tipo', '').lower()
+        if tipo_finanzas not in TIPOS_FINANZAS:
+            return JsonResponse({'success': False, 'message': 'Tipo de reporte financiero no válido.'}, status=400)
+        if tipo_finanzas:
+            parametros['tipo'] = tipo_finanzas
+
+    try:
+        trabajo = encolar_exportacion(tipo, perfil, parametros)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error al encolar exportación {tipo}: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error al solicitar la exportación.'}, status=500)
+
+    registrar_auditoria(
+        usuario=perfil,
+        accion='exportar',
+        modulo=MODULO_AUDITORIA.get(tipo, 'otro'),
+        descripcion=f'Exportación solicitada: {trabajo.get_tipo_display()}',
+        detalles=f'Trabajo #{trabajo.id}. Parámetros: {parametros or "ninguno"}',
+        objeto_id=trabajo.id,
+        tipo_objeto='TrabajoExportacion',
+        request=request
+    )
+
+    return JsonResponse({'success': True, 'trabajo': datos_trabajo(trabajo)})
+
+
+@login_required
+@require_GET
+def estado_exportacion(request, trabajo_id):
+    """Estado y progreso de una exportación del usuario"""
+    perfil = _perfil_administrativo(request)
+    if perfil is None:
+        return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
+
+    trabajo = TrabajoExportacion.objects.filter(id=trabajo_id, solicitado_por=perfil).first()
+    if trabajo is None:
+        return JsonResponse({'success': False, 'message': 'La exportación no existe o ya venció.'}, status=404)
+
+    return JsonResponse({'success': True, 'trabajo': datos_trabajo(trabajo)})
+
+
+@login_required
+@require_GET
+def descargar_exportacion(request, trabajo_id):
+    """Descarga el archivo de una exportación terminada"""
+    perfil = _perfil_administrativo(request)
+    if perfil is None:
+        raise Http404
+
+    trabajo = TrabajoExportacion.objects.filter(
+        id=trabajo_id, solicitado_por=perfil, estado='completado'
+    ).first()
+    if trabajo is None or not trabajo.archivo:
+        raise Http404('La exportación no existe o ya venció.')
+
+    try:
+        archivo = trabajo.archivo.open('rb')
+    except FileNotFoundError:
+        raise Http404('El archivo de la exportación ya no está disponible.')
+
+    return FileResponse(archivo, as_attachment=True, filename=trabajo.archivo.name.rsplit('/', 1)[-1])
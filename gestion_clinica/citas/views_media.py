@@ -0,0 +1,28 @@
+"""
+Vista que sirve los archivos de MEDIA_ROOT verificando quién los pide
+"""
+from django.http import Http404
+from django.views.decorators.http import require_safe
+
+from .media_service import entregar_archivo, es_media_publica, normalizar_ruta_media, puede_acceder_archivo
+
+
+@require_safe
+def servir_media(request, ruta):
+    """
+    Sirve un archivo de media solo si el usuario tiene acceso a su registro dueño.
+
+    Responde 404 tanto si el archivo no existe como si el usuario no tiene acceso,
+    para no revelar qué archivos existen.
+    """
+    nombre = normalizar_ruta_media(ruta)
+    if nombre is None or not puede_acceder_archivo(request.user, nombre):
+        raise Http404
+
+    respuesta = entregar_archivo(request, nombre, as_attachment=request.GET.get('descargar') == '1')
+    if respuesta is None:
+        raise Http404
+
+    # Los archivos de pacientes no deben quedar en cachés compartidas (proxies, CDN)
+    respuesta['Cache-Control'] = 'public, max-age=86400' if es_media_publica(nombre) else 'private, max-age=3600'
+    return respuesta
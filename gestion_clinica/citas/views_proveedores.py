@@ -540,15 +540,16 @@ def enviar_solicitud_insumo(request):
                 )
                 email.attach_alternative(mensaje_html, "text/html")
                 
-                # Enviar el correo
-                email.send(fail_silently=False)
+                # Encolar el correo (lo envía el comando procesar_correos)
+                from .correos_service import encolar_correo
+                encolar_correo(email, origen='solicitud_insumo')
                 
-                logger.info(f'Correo enviado exitosamente a {proveedor.email}')
+                logger.info(f'Correo encolado para {proveedor.email}')
                 
                 # Las solicitudes se quedan como "pendiente" hasta que se marquen como recibidas
                 # No se cambian a "enviada" automáticamente
                 
-                messages.success(request, f'✅ {len(solicitudes_creadas)} solicitud(es) creada(s) y correo enviado a {proveedor.nombre} ({proveedor.email}). Las solicitudes quedaron como pendientes hasta su recepción.')
+                messages.success(request, f'✅ {len(solicitudes_creadas)} solicitud(es) creada(s) y correo encolado para su envío a {proveedor.nombre} ({proveedor.email}). Las solicitudes quedaron como pendientes hasta su recepción.')
                 
             except Exception as e:
                 # Si falla el envío, NO marcar como enviada, dejar como pendiente
@@ -983,7 +984,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -993,7 +996,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
@@ -1446,7 +1449,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -1456,7 +1461,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
@@ -1909,7 +1914,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -1919,7 +1926,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
@@ -2372,7 +2379,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -2382,7 +2391,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
@@ -2835,7 +2844,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -2845,7 +2856,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
@@ -3298,7 +3309,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -3308,7 +3321,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
@@ -3761,7 +3774,9 @@ Clínica San Felipe
             )
             email.content_subtype = "html"  # Indicar que es HTML
             
-            email.send(fail_silently=False)
+            # Encolar el correo (lo envía el comando procesar_correos)
+            from .correos_service import encolar_correo
+            encolar_correo(email, origen='pedido_proveedor')
             
             # Actualizar pedido
             pedido.correo_enviado = True
@@ -3771,7 +3786,7 @@ Clínica San Felipe
             
             return JsonResponse({
                 'success': True,
-                'message': f'Pedido {pedido.numero_pedido} enviado correctamente a {pedido.proveedor.email}.'
+                'message': f'Pedido {pedido.numero_pedido} encolado para su envío a {pedido.proveedor.email}. Se enviará en unos momentos.'
             })
             
         except Exception as e:
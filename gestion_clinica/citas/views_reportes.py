@@ -2,12 +2,9 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponse
-from django.db.models import Count, Sum, Q, Avg, F
+from django.db.models import Count, Sum, Q, Avg, F, DecimalField, ExpressionWrapper
 from django.utils import timezone
 from datetime import datetime, timedelta
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 import logging
 
 # PDF generation imports
@@ -21,7 +18,7 @@ from io import BytesIO
 
 logger = logging.getLogger(__name__)
 
-from .models import Cita, TipoServicio
+from .models import Cita, TipoServicio, EstadisticaDiaria
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
 from personal.models import Perfil
@@ -29,12 +26,11 @@ from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from historial_clinico.models import PlanTratamiento
 from finanzas.models import IngresoManual, EgresoManual
 from .models_auditoria import registrar_auditoria
-
-# Color turquesa para Excel: #14B8A6 (primary) y #0D9488 (dark)
-TURQUESA_PRIMARY = "14B8A6"
-TURQUESA_DARK = "0D9488"
-TURQUESA_LIGHT = "2DD4BF"
-TURQUESA_BG = "F0FDFA"
+from .estadisticas_service import (
+    ESTADOS_MANUALES, MESES_NOMBRES, MONTO_CITA, contar, contar_citas_resumen, limites_mes, q_fechas,
+    serie_mensual, sumar,
+)
+from .excel_service import TAMANO_LOTE_EXPORTACION, HojaExcel, crear_libro, respuesta_excel
 
 @login_required
 def reportes(request):
@@ -84,63 +80,237 @@ def reportes(request):
 
 
 # ========== FUNCIONES DE EXPORTACIÓN A EXCEL CON DISEÑO TURQUESA ==========
+# Los libros se escriben en modo write_only (ver citas/excel_service.py): las filas se
+# leen de la base de datos por lotes con .iterator() y se escriben apenas se generan.
 
-def _crear_encabezado_excel(ws, titulo, subtitulo=None):
-    """Crea un encabezado profesional con diseño turquesa"""
-    # Título principal
-    ws['A1'] = titulo
-    ws['A1'].font = Font(bold=True, size=16, color=TURQUESA_DARK)
-    ws['A1'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A1:J1')
-    
-    # Subtítulo con fecha
-    fecha_gen = datetime.now().strftime("%d/%m/%Y %H:%M")
-    if subtitulo:
-        ws['A2'] = f"{subtitulo} - Generado el {fecha_gen}"
-    else:
-        ws['A2'] = f"Generado el {fecha_gen}"
-    ws['A2'].font = Font(size=11, color="666666")
-    ws['A2'].alignment = Alignment(horizontal='center')
-    ws.merge_cells('A2:J2')
+def _verificar_permiso_exportacion(request, nombre_vista):
+    """
+    Verifica que el usuario pueda exportar reportes.
+
+    Returns:
+        (perfil, None) si tiene permiso, o (None, HttpResponse de error)
+    """
+    try:
+        perfil = Perfil.objects.get(user=request.user)
+        if not perfil.es_administrativo():
+            return None, HttpResponse('No tienes permisos', status=403)
+        return perfil, None
+    except Perfil.DoesNotExist:
+        return None, HttpResponse('No autorizado', status=403)
+    except Exception as e:
+        logger.error(f"Error al verificar permisos en {nombre_vista}: {str(e)}")
+        return None, HttpResponse('Error al procesar la solicitud', status=500)
+
+
+def _nombre_o(objeto, por_defecto):
+    """nombre_completo de un Perfil/Cliente relacionado, o el texto por defecto"""
+    return objeto.nombre_completo if objeto and hasattr(objeto, 'nombre_completo') else por_defecto
+
+
+def _escribir_ingresos(hoja):
+    """
+    Escribe las citas completadas con monto y los ingresos manuales.
+
+    Returns:
+        Total de los montos escritos
+    """
+    total = 0
+    
+    # Citas completadas (excluir las eliminadas del historial); el monto se calcula en SQL
+    citas_completadas = Cita.objects.filter(
+        estado='completada'
+    ).exclude(
+        precio_cobrado__isnull=True,
+        tipo_servicio__isnull=True
+    ).annotate(
+        monto=MONTO_CITA
+    ).filter(
+        monto__gt=0  # Solo incluir si tiene monto
+    ).select_related('tipo_servicio', 'cliente', 'dentista').order_by('-fecha_hora')
+    
+    for cita in citas_completadas.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
+        try:
+            monto_cita = float(cita.monto)
+            descripcion = cita.tipo_servicio.nombre if cita.tipo_servicio else (cita.tipo_consulta or 'Cita')
+            cliente_info = ''
+            if cita.cliente:
+                cliente_info = cita.cliente.nombre_completo or 'Sin cliente'
+            if cita.dentista:
+                cliente_info += f' - Dr/a. {cita.dentista.nombre_completo}' if cliente_info else f'Dr/a. {cita.dentista.nombre_completo}'
+            hoja.agregar_fila([
+                'CITA',
+                cita.fecha_hora.strftime('%d/%m/%Y %H:%M') if cita.fecha_hora else 'N/A',
+                monto_cita,
+                str(descripcion),
+                cliente_info or 'N/A',
+                'Sistema',
+            ])
+            total += monto_cita
+        except Exception as e:
+            logger.error(f"Error al procesar cita ID {cita.id}: {str(e)}")
+            continue
+    
+    # Ingresos manuales
+    ingresos_manuales = IngresoManual.objects.select_related('creado_por').order_by('-fecha', '-creado_el')
+    for ingreso in ingresos_manuales.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
+        try:
+            monto = float(ingreso.monto) if ingreso.monto else 0
+            hoja.agregar_fila([
+                'MANUAL',
+                ingreso.fecha.strftime('%d/%m/%Y') if ingreso.fecha else 'N/A',
+                monto,
+                str(ingreso.descripcion) if ingreso.descripcion else '',
+                '-',
+                _nombre_o(ingreso.creado_por, 'N/A'),
+            ])
+            total += monto
+        except Exception as e:
+            logger.error(f"Error al procesar ingreso ID {ingreso.id}: {str(e)}")
+            continue
     
-    # Espacio
-    return 4  # Retorna la fila donde empezar los datos
+    return total
 
 
-def _aplicar_estilo_turquesa(ws, fila_inicio, headers):
-    """Aplica estilo turquesa a los encabezados"""
-    header_fill = PatternFill(start_color=TURQUESA_PRIMARY, end_color=TURQUESA_DARK, fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True, size=12)
-    border = Border(
-        left=Side(style='thin', color='CCCCCC'),
-        right=Side(style='thin', color='CCCCCC'),
-        top=Side(style='thin', color='CCCCCC'),
-        bottom=Side(style='thin', color='CCCCCC')
+def _escribir_egresos(hoja, limite_automaticos=None):
+    """
+    Escribe las compras de inventario, las solicitudes con egreso y los egresos manuales.
+
+    Args:
+        hoja: HojaExcel de destino
+        limite_automaticos: Máximo de compras y de solicitudes (las más recientes); None para todas
+
+    Returns:
+        Total de los montos escritos
+    """
+    total = 0
+    
+    # Movimientos de insumos tipo "entrada" (compras) como egresos
+    movimientos_entrada = MovimientoInsumo.objects.filter(
+        tipo='entrada',
+        insumo__precio_unitario__isnull=False
+    ).select_related('insumo', 'realizado_por').order_by('-fecha_movimiento')
+    if limite_automaticos:
+        movimientos_entrada = movimientos_entrada[:limite_automaticos]
+    
+    for movimiento in movimientos_entrada.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
+        try:
+            monto_movimiento = float(movimiento.insumo.precio_unitario) * movimiento.cantidad
+            if monto_movimiento > 0:
+                hoja.agregar_fila([
+                    'COMPRA',
+                    movimiento.fecha_movimiento.strftime('%d/%m/%Y %H:%M') if movimiento.fecha_movimiento else 'N/A',
+                    monto_movimiento,
+                    movimiento.insumo.nombre or 'Sin nombre',
+                    f"{movimiento.cantidad} {movimiento.insumo.unidad_medida or ''}",
+                    _nombre_o(movimiento.realizado_por, 'Sistema'),
+                ])
+                total += monto_movimiento
+        except Exception as e:
+            logger.error(f"Error al procesar movimiento ID {movimiento.id}: {str(e)}")
+            continue
+    
+    # Solicitudes de insumos marcadas como egreso automático
+    solicitudes_egreso = SolicitudInsumo.objects.filter(
+        monto_egreso__isnull=False
+    ).exclude(
+        monto_egreso=0
+    ).select_related('insumo', 'solicitado_por').order_by('-fecha_solicitud')
+    if limite_automaticos:
+        solicitudes_egreso = solicitudes_egreso[:limite_automaticos]
+    
+    for solicitud in solicitudes_egreso.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
+        try:
+            monto = float(solicitud.monto_egreso)
+            hoja.agregar_fila([
+                'SOLICITUD',
+                solicitud.fecha_solicitud.strftime('%d/%m/%Y %H:%M') if solicitud.fecha_solicitud else 'N/A',
+                monto,
+                solicitud.insumo.nombre if solicitud.insumo else 'Sin insumo',
+                f"{solicitud.cantidad_solicitada} {solicitud.insumo.unidad_medida if solicitud.insumo else ''}",
+                _nombre_o(solicitud.solicitado_por, 'Sistema'),
+            ])
+            total += monto
+        except Exception as e:
+            logger.error(f"Error al procesar solicitud ID {solicitud.id}: {str(e)}")
+            continue
+    
+    # Egresos manuales
+    egresos_manuales = EgresoManual.objects.select_related('creado_por').order_by('-fecha', '-creado_el')
+    for egreso in egresos_manuales.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
+        try:
+            monto = float(egreso.monto) if egreso.monto else 0
+            hoja.agregar_fila([
+                'MANUAL',
+                egreso.fecha.strftime('%d/%m/%Y') if egreso.fecha else 'N/A',
+                monto,
+                str(egreso.descripcion) if egreso.descripcion else '',
+                '-',
+                _nombre_o(egreso.creado_por, 'N/A'),
+            ])
+            total += monto
+        except Exception as e:
+            logger.error(f"Error al procesar egreso ID {egreso.id}: {str(e)}")
+            continue
+    
+    return total
+
+
+def _resumen_financiero(hoy):
+    """
+    Totales históricos y del mes de ingresos y egresos calculados en SQL.
+
+    Returns:
+        (total_ingresos, ingresos_mes, total_egresos, egresos_mes) como Decimal
+    """
+    inicio_mes, fin_mes = limites_mes(hoy)
+    
+    # ===== INGRESOS: citas completadas + ingresos manuales =====
+    ingresos_citas = sumar(
+        Cita.objects.filter(estado='completada'), MONTO_CITA,
+        total=Q(),
+        mes=q_fechas('fecha_hora', inicio_mes, fin_mes),
+    )
+    ingresos_manuales = sumar(
+        IngresoManual.objects, 'monto',
+        total=Q(),
+        mes=Q(fecha__gte=inicio_mes, fecha__lte=fin_mes),
     )
     
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=fila_inicio, column=col_num)
-        cell.value = header
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        cell.border = border
+    # ===== EGRESOS: compras de inventario + solicitudes + egresos manuales =====
+    compras = sumar(
+        MovimientoInsumo.objects.filter(tipo='entrada'),
+        ExpressionWrapper(
+            F('insumo__precio_unitario') * F('cantidad'),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        ),
+        total=Q(),
+        mes=q_fechas('fecha_movimiento', inicio_mes, fin_mes),
+    )
+    solicitudes = sumar(
+        SolicitudInsumo.objects.filter(monto_egreso__isnull=False), 'monto_egreso',
+        total=Q(),
+        mes=q_fechas('fecha_solicitud', inicio_mes, fin_mes),
+    )
+    egresos_manuales = sumar(
+        EgresoManual.objects, 'monto',
+        total=Q(),
+        mes=Q(fecha__gte=inicio_mes, fecha__lte=fin_mes),
+    )
     
-    return fila_inicio + 1, border  # Retorna la siguiente fila y el estilo de borde
+    return (
+        ingresos_citas['total'] + ingresos_manuales['total'],
+        ingresos_citas['mes'] + ingresos_manuales['mes'],
+        compras['total'] + solicitudes['total'] + egresos_manuales['total'],
+        compras['mes'] + solicitudes['mes'] + egresos_manuales['mes'],
+    )
 
 
 @login_required
 def exportar_excel_citas(request):
     """Exporta todas las citas a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_citas: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_citas')
+    if error:
+        return error
     
     # Registrar en auditoría
     registrar_auditoria(
@@ -153,59 +323,33 @@ def exportar_excel_citas(request):
     )
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Citas"
-        
-        # Encabezado
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE CITAS", "Clínica San Felipe")
-        
-        # Encabezados de columna
-        headers = ['ID', 'Fecha', 'Hora', 'Tipo Consulta', 'Estado', 'Paciente', 'Email', 'Teléfono', 'Dentista', 'Notas']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Citas", "REPORTE DE CITAS",
+            ['ID', 'Fecha', 'Hora', 'Tipo Consulta', 'Estado', 'Paciente', 'Email', 'Teléfono', 'Dentista', 'Notas'],
+            [8, 12, 10, 20, 12, 25, 30, 15, 25, 40],
+        )
         
-        # Datos
-        citas = Cita.objects.select_related('dentista').all().order_by('-fecha_hora')
-        for cita in citas:
+        citas = Cita.objects.select_related('dentista').order_by('-fecha_hora')
+        for cita in citas.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=cita.id)
-                ws.cell(row=fila_actual, column=2, value=cita.fecha_hora.strftime('%d/%m/%Y') if cita.fecha_hora else 'N/A')
-                ws.cell(row=fila_actual, column=3, value=cita.fecha_hora.strftime('%H:%M') if cita.fecha_hora else 'N/A')
-                ws.cell(row=fila_actual, column=4, value=str(cita.tipo_consulta) if cita.tipo_consulta else 'N/A')
-                ws.cell(row=fila_actual, column=5, value=cita.get_estado_display() if cita.estado else 'N/A')
-                ws.cell(row=fila_actual, column=6, value=str(cita.paciente_nombre) if cita.paciente_nombre else 'Sin asignar')
-                ws.cell(row=fila_actual, column=7, value=str(cita.paciente_email) if cita.paciente_email else '')
-                ws.cell(row=fila_actual, column=8, value=str(cita.paciente_telefono) if cita.paciente_telefono else '')
-                ws.cell(row=fila_actual, column=9, value=cita.dentista.nombre_completo if cita.dentista and hasattr(cita.dentista, 'nombre_completo') else 'Sin asignar')
-                ws.cell(row=fila_actual, column=10, value=str(cita.notas) if cita.notas else '')
-                
-                # Aplicar bordes y estilo alternado
-                for col in range(1, 11):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                hoja.agregar_fila([
+                    cita.id,
+                    cita.fecha_hora.strftime('%d/%m/%Y') if cita.fecha_hora else 'N/A',
+                    cita.fecha_hora.strftime('%H:%M') if cita.fecha_hora else 'N/A',
+                    str(cita.tipo_consulta) if cita.tipo_consulta else 'N/A',
+                    cita.get_estado_display() if cita.estado else 'N/A',
+                    str(cita.paciente_nombre) if cita.paciente_nombre else 'Sin asignar',
+                    str(cita.paciente_email) if cita.paciente_email else '',
+                    str(cita.paciente_telefono) if cita.paciente_telefono else '',
+                    _nombre_o(cita.dentista, 'Sin asignar'),
+                    str(cita.notas) if cita.notas else '',
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar cita ID {cita.id}: {str(e)}")
                 continue
         
-        # Ajustar anchos
-        column_widths = [8, 12, 10, 20, 12, 25, 30, 15, 25, 40]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        # Altura de fila de encabezado
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=citas_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'citas')
     except Exception as e:
         logger.error(f"Error al generar Excel de citas: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -214,15 +358,9 @@ def exportar_excel_citas(request):
 @login_required
 def exportar_excel_clientes(request):
     """Exporta todos los clientes a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_clientes: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_clientes')
+    if error:
+        return error
     
     # Registrar en auditoría
     registrar_auditoria(
@@ -235,52 +373,32 @@ def exportar_excel_clientes(request):
     )
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Clientes"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE CLIENTES", "Clínica San Felipe")
-        
-        headers = ['ID', 'Nombre Completo', 'Email', 'Teléfono', 'Fecha Registro', 'Activo', 'Dentista Asignado', 'Total Citas', 'Notas']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Clientes", "REPORTE DE CLIENTES",
+            ['ID', 'Nombre Completo', 'Email', 'Teléfono', 'Fecha Registro', 'Activo', 'Dentista Asignado', 'Total Citas', 'Notas'],
+            [8, 30, 35, 15, 20, 10, 25, 12, 40],
+        )
         
         clientes = Cliente.objects.select_related('dentista_asignado').annotate(num_citas=Count('citas')).order_by('nombre_completo')
-        for cliente in clientes:
+        for cliente in clientes.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=cliente.id)
-                ws.cell(row=fila_actual, column=2, value=str(cliente.nombre_completo) if cliente.nombre_completo else 'N/A')
-                ws.cell(row=fila_actual, column=3, value=str(cliente.email) if cliente.email else '')
-                ws.cell(row=fila_actual, column=4, value=str(cliente.telefono) if cliente.telefono else '')
-                ws.cell(row=fila_actual, column=5, value=cliente.fecha_registro.strftime('%d/%m/%Y %H:%M') if cliente.fecha_registro else 'N/A')
-                ws.cell(row=fila_actual, column=6, value='Sí' if cliente.activo else 'No')
-                ws.cell(row=fila_actual, column=7, value=cliente.dentista_asignado.nombre_completo if cliente.dentista_asignado and hasattr(cliente.dentista_asignado, 'nombre_completo') else 'Sin asignar')
-                ws.cell(row=fila_actual, column=8, value=cliente.num_citas or 0)
-                ws.cell(row=fila_actual, column=9, value=str(cliente.notas) if cliente.notas else '')
-                
-                for col in range(1, 10):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                hoja.agregar_fila([
+                    cliente.id,
+                    str(cliente.nombre_completo) if cliente.nombre_completo else 'N/A',
+                    str(cliente.email) if cliente.email else '',
+                    str(cliente.telefono) if cliente.telefono else '',
+                    cliente.fecha_registro.strftime('%d/%m/%Y %H:%M') if cliente.fecha_registro else 'N/A',
+                    'Sí' if cliente.activo else 'No',
+                    _nombre_o(cliente.dentista_asignado, 'Sin asignar'),
+                    cliente.num_citas or 0,
+                    str(cliente.notas) if cliente.notas else '',
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar cliente ID {cliente.id}: {str(e)}")
                 continue
         
-        column_widths = [8, 30, 35, 15, 20, 10, 25, 12, 40]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=clientes_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'clientes')
     except Exception as e:
         logger.error(f"Error al generar Excel de clientes: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -289,15 +407,9 @@ def exportar_excel_clientes(request):
 @login_required
 def exportar_excel_insumos(request):
     """Exporta todos los insumos a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_insumos: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_insumos')
+    if error:
+        return error
     
     # Registrar en auditoría
     registrar_auditoria(
@@ -310,70 +422,133 @@ def exportar_excel_insumos(request):
     )
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Insumos"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE INSUMOS", "Clínica San Felipe")
-        
-        headers = ['ID', 'Nombre', 'Categoría', 'Cantidad Actual', 'Cantidad Mínima', 'Unidad', 'Precio Unitario', 'Estado', 'Proveedor', 'Ubicación']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Insumos", "REPORTE DE INSUMOS",
+            ['ID', 'Nombre', 'Categoría', 'Cantidad Actual', 'Cantidad Mínima', 'Unidad', 'Precio Unitario', 'Estado', 'Proveedor', 'Ubicación'],
+            [8, 30, 20, 15, 15, 12, 15, 15, 25, 20],
+        )
         
-        insumos = Insumo.objects.select_related('proveedor_principal').all().order_by('nombre')
-        for insumo in insumos:
+        insumos = Insumo.objects.select_related('proveedor_principal').order_by('nombre')
+        for insumo in insumos.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=insumo.id)
-                ws.cell(row=fila_actual, column=2, value=str(insumo.nombre) if insumo.nombre else 'Sin nombre')
-                ws.cell(row=fila_actual, column=3, value=insumo.get_categoria_display() if insumo.categoria else 'N/A')
-                ws.cell(row=fila_actual, column=4, value=insumo.cantidad_actual if insumo.cantidad_actual is not None else 0)
-                ws.cell(row=fila_actual, column=5, value=insumo.cantidad_minima if insumo.cantidad_minima is not None else 0)
-                ws.cell(row=fila_actual, column=6, value=str(insumo.unidad_medida) if insumo.unidad_medida else 'N/A')
-                ws.cell(row=fila_actual, column=7, value=float(insumo.precio_unitario) if insumo.precio_unitario else 0)
-                ws.cell(row=fila_actual, column=8, value=insumo.get_estado_display() if insumo.estado else 'N/A')
-                ws.cell(row=fila_actual, column=9, value=insumo.proveedor_principal.nombre if insumo.proveedor_principal and hasattr(insumo.proveedor_principal, 'nombre') else (str(insumo.proveedor_texto) if insumo.proveedor_texto else 'Sin proveedor'))
-                ws.cell(row=fila_actual, column=10, value=str(insumo.ubicacion) if insumo.ubicacion else '')
-                
-                for col in range(1, 11):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                if insumo.proveedor_principal and getattr(insumo.proveedor_principal, 'nombre', None):
+                    proveedor = insumo.proveedor_principal.nombre
+                else:
+                    proveedor = str(insumo.proveedor_texto) if insumo.proveedor_texto else 'Sin proveedor'
+                hoja.agregar_fila([
+                    insumo.id,
+                    str(insumo.nombre) if insumo.nombre else 'Sin nombre',
+                    insumo.get_categoria_display() if insumo.categoria else 'N/A',
+                    insumo.cantidad_actual if insumo.cantidad_actual is not None else 0,
+                    insumo.cantidad_minima if insumo.cantidad_minima is not None else 0,
+                    str(insumo.unidad_medida) if insumo.unidad_medida else 'N/A',
+                    float(insumo.precio_unitario) if insumo.precio_unitario else 0,
+                    insumo.get_estado_display() if insumo.estado else 'N/A',
+                    proveedor,
+                    str(insumo.ubicacion) if insumo.ubicacion else '',
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar insumo ID {insumo.id}: {str(e)}")
                 continue
         
-        column_widths = [8, 30, 20, 15, 15, 12, 15, 15, 25, 20]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=insumos_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'insumos')
     except Exception as e:
         logger.error(f"Error al generar Excel de insumos: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
 
 
+def construir_excel_finanzas(tipo_exportacion='', progreso=None):
+    """
+    Arma el libro del reporte financiero.
+
+    Args:
+        tipo_exportacion: 'ingresos', 'egresos' o '' para el reporte completo
+        progreso: Función opcional progreso(porcentaje, mensaje) (exportación en segundo plano)
+
+    Returns:
+        (libro, nombre_base del archivo)
+    """
+    libro = crear_libro()
+    
+    # Si se solicita solo ingresos, generar solo esa hoja (TODAS las citas e ingresos, sin límite)
+    if tipo_exportacion == 'ingresos':
+        hoja = HojaExcel(
+            libro, "Ingresos", "LISTADO DE INGRESOS",
+            ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cliente/Dentista', 'Creado por'],
+            [10, 16, 15, 40, 30, 25],
+        )
+        if progreso:
+            progreso(10, 'Escribiendo ingresos')
+        total_ingresos = _escribir_ingresos(hoja)
+        hoja.agregar_total(['TOTAL', '', total_ingresos, '', '', ''])
+        return libro, 'ingresos'
+    
+    # Si se solicita solo egresos, generar solo esa hoja (TODOS los egresos, sin límite)
+    elif tipo_exportacion == 'egresos':
+        hoja = HojaExcel(
+            libro, "Egresos", "LISTADO DE EGRESOS",
+            ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cantidad', 'Creado por'],
+            [12, 16, 15, 40, 15, 25],
+        )
+        if progreso:
+            progreso(10, 'Escribiendo egresos')
+        total_egresos = _escribir_egresos(hoja)
+        hoja.agregar_total(['TOTAL', '', total_egresos, '', '', ''])
+        return libro, 'egresos'
+    
+    # Si no se especifica tipo, generar reporte completo
+    # Hoja 1: Resumen (usando la misma lógica que gestor_finanzas)
+    total_ingresos, ingresos_mes, total_egresos, egresos_mes = _resumen_financiero(timezone.now().date())
+    balance_total = total_ingresos - total_egresos
+    balance_mes = ingresos_mes - egresos_mes
+    
+    hoja_resumen = HojaExcel(
+        libro, "Resumen", "REPORTE FINANCIERO",
+        ['Concepto', 'Valor'],
+        [25, 20],
+    )
+    for concepto, valor in (
+        ('Total Ingresos', total_ingresos),
+        ('Total Egresos', total_egresos),
+        ('Balance Total', balance_total),
+        ('Ingresos del Mes', ingresos_mes),
+        ('Egresos del Mes', egresos_mes),
+        ('Balance del Mes', balance_mes),
+    ):
+        hoja_resumen.agregar_fila([concepto, f'${float(valor):,.0f}'])
+    
+    if progreso:
+        progreso(10, 'Escribiendo ingresos')
+    
+    # Hoja 2: Ingresos (Citas + Manuales)
+    hoja_ingresos = HojaExcel(
+        libro, "Ingresos", "INGRESOS",
+        ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cliente/Dentista', 'Creado por'],
+        [10, 16, 15, 40, 30, 25],
+    )
+    _escribir_ingresos(hoja_ingresos)
+    
+    if progreso:
+        progreso(55, 'Escribiendo egresos')
+    
+    # Hoja 3: Egresos (Compras + Solicitudes + Manuales), con las 100 compras y solicitudes más recientes
+    hoja_egresos = HojaExcel(
+        libro, "Egresos", "EGRESOS",
+        ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cantidad', 'Creado por'],
+        [12, 16, 15, 40, 15, 25],
+    )
+    _escribir_egresos(hoja_egresos, limite_automaticos=100)
+    
+    return libro, 'finanzas'
+
+
 @login_required
 def exportar_excel_finanzas(request):
     """Exporta reporte financiero a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_finanzas: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_finanzas')
+    if error:
+        return error
     
     # Verificar si se solicita solo ingresos o egresos
     tipo_exportacion = request.GET.get('tipo', '').lower()
@@ -390,523 +565,8 @@ def exportar_excel_finanzas(request):
     )
     
     try:
-        wb = Workbook()
-        
-        # Si se solicita solo ingresos, generar solo esa hoja
-        if tipo_exportacion == 'ingresos':
-            ws = wb.active
-            ws.title = "Ingresos"
-            fila_datos = _crear_encabezado_excel(ws, "LISTADO DE INGRESOS", "Clínica San Felipe")
-            
-            headers = ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cliente/Dentista', 'Creado por']
-            fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
-            
-            # Obtener citas completadas (excluir las eliminadas del historial)
-            citas_completadas = Cita.objects.filter(
-                estado='completada'
-            ).exclude(
-                precio_cobrado__isnull=True,
-                tipo_servicio__isnull=True
-            ).select_related('tipo_servicio', 'cliente', 'dentista').order_by('-fecha_hora')
-            
-            # Agregar TODAS las citas completadas (sin límite)
-            for cita in citas_completadas:
-                try:
-                    monto_cita = 0
-                    if cita.precio_cobrado:
-                        monto_cita = float(cita.precio_cobrado)
-                    elif cita.tipo_servicio and cita.tipo_servicio.precio_base:
-                        monto_cita = float(cita.tipo_servicio.precio_base)
-                    
-                    if monto_cita > 0:  # Solo incluir si tiene monto
-                        ws.cell(row=fila_actual, column=1, value='CITA')
-                        ws.cell(row=fila_actual, column=2, value=cita.fecha_hora.strftime('%d/%m/%Y %H:%M') if cita.fecha_hora else 'N/A')
-                        ws.cell(row=fila_actual, column=3, value=monto_cita)
-                        descripcion = cita.tipo_servicio.nombre if cita.tipo_servicio else (cita.tipo_consulta or 'Cita')
-                        ws.cell(row=fila_actual, column=4, value=str(descripcion))
-                        cliente_info = ''
-                        if cita.cliente:
-                            cliente_info = cita.cliente.nombre_completo or 'Sin cliente'
-                        if cita.dentista:
-                            cliente_info += f' - Dr/a. {cita.dentista.nombre_completo}' if cliente_info else f'Dr/a. {cita.dentista.nombre_completo}'
-                        ws.cell(row=fila_actual, column=5, value=cliente_info or 'N/A')
-                        ws.cell(row=fila_actual, column=6, value='Sistema')
-                        
-                        for col in range(1, 7):
-                            cell = ws.cell(row=fila_actual, column=col)
-                            cell.border = border
-                            if fila_actual % 2 == 0:
-                                cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                        
-                        fila_actual += 1
-                except Exception as e:
-                    logger.error(f"Error al procesar cita ID {cita.id}: {str(e)}")
-                    continue
-            
-            # Agregar TODOS los ingresos manuales (sin límite)
-            ingresos_manuales = IngresoManual.objects.select_related('creado_por').order_by('-fecha', '-creado_el')
-            for ingreso in ingresos_manuales:
-                try:
-                    ws.cell(row=fila_actual, column=1, value='MANUAL')
-                    ws.cell(row=fila_actual, column=2, value=ingreso.fecha.strftime('%d/%m/%Y') if ingreso.fecha else 'N/A')
-                    ws.cell(row=fila_actual, column=3, value=float(ingreso.monto) if ingreso.monto else 0)
-                    ws.cell(row=fila_actual, column=4, value=str(ingreso.descripcion) if ingreso.descripcion else '')
-                    ws.cell(row=fila_actual, column=5, value='-')
-                    ws.cell(row=fila_actual, column=6, value=ingreso.creado_por.nombre_completo if ingreso.creado_por and hasattr(ingreso.creado_por, 'nombre_completo') else 'N/A')
-                    
-                    for col in range(1, 7):
-                        cell = ws.cell(row=fila_actual, column=col)
-                        cell.border = border
-                        if fila_actual % 2 == 0:
-                            cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                    
-                    fila_actual += 1
-                except Exception as e:
-                    logger.error(f"Error al procesar ingreso ID {ingreso.id}: {str(e)}")
-                    continue
-            
-            # Agregar fila de totales
-            fila_totales = fila_actual + 1
-            ws.cell(row=fila_totales, column=1, value='TOTAL').font = Font(bold=True)
-            ws.cell(row=fila_totales, column=2, value='')
-            total_ingresos = sum([float(ws.cell(row=i, column=3).value or 0) for i in range(fila_datos + 1, fila_actual)])
-            ws.cell(row=fila_totales, column=3, value=total_ingresos).font = Font(bold=True)
-            ws.cell(row=fila_totales, column=4, value='')
-            ws.cell(row=fila_totales, column=5, value='')
-            ws.cell(row=fila_totales, column=6, value='')
-            
-            for col in range(1, 7):
-                cell = ws.cell(row=fila_totales, column=col)
-                cell.border = border
-                cell.fill = PatternFill(start_color=TURQUESA_PRIMARY, end_color=TURQUESA_PRIMARY, fill_type="solid")
-                cell.font = Font(color="FFFFFF", bold=True)
-            
-            column_widths = [10, 16, 15, 40, 30, 25]
-            for i, width in enumerate(column_widths, 1):
-                ws.column_dimensions[get_column_letter(i)].width = width
-            ws.row_dimensions[fila_datos].height = 25
-            
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename=ingresos_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-            wb.save(response)
-            return response
-        
-        # Si se solicita solo egresos, generar solo esa hoja
-        elif tipo_exportacion == 'egresos':
-            ws = wb.active
-            ws.title = "Egresos"
-            fila_datos = _crear_encabezado_excel(ws, "LISTADO DE EGRESOS", "Clínica San Felipe")
-            
-            headers = ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cantidad', 'Creado por']
-            fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
-            
-            # Obtener movimientos de insumos tipo "entrada" (compras) como egresos
-            movimientos_entrada = MovimientoInsumo.objects.filter(tipo='entrada').select_related('insumo', 'realizado_por').order_by('-fecha_movimiento')
-            
-            # Obtener solicitudes de insumos marcadas como egreso automático
-            solicitudes_egreso = SolicitudInsumo.objects.filter(
-                monto_egreso__isnull=False
-            ).select_related('insumo', 'solicitado_por').order_by('-fecha_solicitud')
-            
-            # Obtener egresos manuales
-            egresos_manuales = EgresoManual.objects.select_related('creado_por').order_by('-fecha', '-creado_el')
-            
-            # Agregar TODAS las compras (sin límite)
-            for movimiento in movimientos_entrada:
-                try:
-                    if movimiento.insumo and movimiento.insumo.precio_unitario:
-                        monto_movimiento = float(movimiento.insumo.precio_unitario) * movimiento.cantidad
-                        if monto_movimiento > 0:
-                            ws.cell(row=fila_actual, column=1, value='COMPRA')
-                            ws.cell(row=fila_actual, column=2, value=movimiento.fecha_movimiento.strftime('%d/%m/%Y %H:%M') if movimiento.fecha_movimiento else 'N/A')
-                            ws.cell(row=fila_actual, column=3, value=monto_movimiento)
-                            ws.cell(row=fila_actual, column=4, value=movimiento.insumo.nombre or 'Sin nombre')
-                            ws.cell(row=fila_actual, column=5, value=f"{movimiento.cantidad} {movimiento.insumo.unidad_medida or ''}")
-                            creado_por = movimiento.realizado_por.nombre_completo if movimiento.realizado_por and hasattr(movimiento.realizado_por, 'nombre_completo') else 'Sistema'
-                            ws.cell(row=fila_actual, column=6, value=creado_por)
-                            
-                            for col in range(1, 7):
-                                cell = ws.cell(row=fila_actual, column=col)
-                                cell.border = border
-                                if fila_actual % 2 == 0:
-                                    cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                            
-                            fila_actual += 1
-                except Exception as e:
-                    logger.error(f"Error al procesar movimiento ID {movimiento.id}: {str(e)}")
-                    continue
-            
-            # Agregar TODAS las solicitudes (sin límite)
-            for solicitud in solicitudes_egreso:
-                try:
-                    if solicitud.monto_egreso:
-                        ws.cell(row=fila_actual, column=1, value='SOLICITUD')
-                        ws.cell(row=fila_actual, column=2, value=solicitud.fecha_solicitud.strftime('%d/%m/%Y %H:%M') if solicitud.fecha_solicitud else 'N/A')
-                        ws.cell(row=fila_actual, column=3, value=float(solicitud.monto_egreso))
-                        ws.cell(row=fila_actual, column=4, value=solicitud.insumo.nombre if solicitud.insumo else 'Sin insumo')
-                        ws.cell(row=fila_actual, column=5, value=f"{solicitud.cantidad_solicitada} {solicitud.insumo.unidad_medida if solicitud.insumo else ''}")
-                        creado_por = solicitud.solicitado_por.nombre_completo if solicitud.solicitado_por and hasattr(solicitud.solicitado_por, 'nombre_completo') else 'Sistema'
-                        ws.cell(row=fila_actual, column=6, value=creado_por)
-                        
-                        for col in range(1, 7):
-                            cell = ws.cell(row=fila_actual, column=col)
-                            cell.border = border
-                            if fila_actual % 2 == 0:
-                                cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                        
-                        fila_actual += 1
-                except Exception as e:
-                    logger.error(f"Error al procesar solicitud ID {solicitud.id}: {str(e)}")
-                    continue
-            
-            # Agregar TODOS los egresos manuales (sin límite)
-            for egreso in egresos_manuales:
-                try:
-                    ws.cell(row=fila_actual, column=1, value='MANUAL')
-                    ws.cell(row=fila_actual, column=2, value=egreso.fecha.strftime('%d/%m/%Y') if egreso.fecha else 'N/A')
-                    ws.cell(row=fila_actual, column=3, value=float(egreso.monto) if egreso.monto else 0)
-                    ws.cell(row=fila_actual, column=4, value=str(egreso.descripcion) if egreso.descripcion else '')
-                    ws.cell(row=fila_actual, column=5, value='-')
-                    ws.cell(row=fila_actual, column=6, value=egreso.creado_por.nombre_completo if egreso.creado_por and hasattr(egreso.creado_por, 'nombre_completo') else 'N/A')
-                    
-                    for col in range(1, 7):
-                        cell = ws.cell(row=fila_actual, column=col)
-                        cell.border = border
-                        if fila_actual % 2 == 0:
-                            cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                    
-                    fila_actual += 1
-                except Exception as e:
-                    logger.error(f"Error al procesar egreso ID {egreso.id}: {str(e)}")
-                    continue
-            
-            # Agregar fila de totales
-            fila_totales = fila_actual + 1
-            ws.cell(row=fila_totales, column=1, value='TOTAL').font = Font(bold=True)
-            ws.cell(row=fila_totales, column=2, value='')
-            total_egresos = sum([float(ws.cell(row=i, column=3).value or 0) for i in range(fila_datos + 1, fila_actual)])
-            ws.cell(row=fila_totales, column=3, value=total_egresos).font = Font(bold=True)
-            ws.cell(row=fila_totales, column=4, value='')
-            ws.cell(row=fila_totales, column=5, value='')
-            ws.cell(row=fila_totales, column=6, value='')
-            
-            for col in range(1, 7):
-                cell = ws.cell(row=fila_totales, column=col)
-                cell.border = border
-                cell.fill = PatternFill(start_color=TURQUESA_PRIMARY, end_color=TURQUESA_PRIMARY, fill_type="solid")
-                cell.font = Font(color="FFFFFF", bold=True)
-            
-            column_widths = [12, 16, 15, 40, 15, 25]
-            for i, width in enumerate(column_widths, 1):
-                ws.column_dimensions[get_column_letter(i)].width = width
-            ws.row_dimensions[fila_datos].height = 25
-            
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename=egresos_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-            wb.save(response)
-            return response
-        
-        # Si no se especifica tipo, generar reporte completo
-        # Hoja 1: Resumen
-        ws1 = wb.active
-        ws1.title = "Resumen"
-        
-        fila_datos = _crear_encabezado_excel(ws1, "REPORTE FINANCIERO", "Clínica San Felipe")
-        
-        # Estadísticas financieras (usando la misma lógica que gestor_finanzas)
-        hoy = timezone.now().date()
-        inicio_mes = hoy.replace(day=1)
-        fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        # ===== INGRESOS =====
-        # Obtener citas completadas (excluir las eliminadas del historial)
-        citas_completadas = Cita.objects.filter(
-            estado='completada'
-        ).exclude(
-            precio_cobrado__isnull=True,
-            tipo_servicio__isnull=True
-        ).select_related('tipo_servicio')
-        
-        # Calcular ingresos totales (citas + manuales)
-        total_ingresos = 0
-        for cita in citas_completadas:
-            if cita.precio_cobrado:
-                total_ingresos += float(cita.precio_cobrado)
-            elif cita.tipo_servicio and cita.tipo_servicio.precio_base:
-                total_ingresos += float(cita.tipo_servicio.precio_base)
-        
-        # Sumar ingresos manuales
-        ingresos_manuales = IngresoManual.objects.all()
-        for ingreso_manual in ingresos_manuales:
-            total_ingresos += float(ingreso_manual.monto)
-        
-        # Ingresos del mes
-        citas_mes = citas_completadas.filter(
-            fecha_hora__date__gte=inicio_mes,
-            fecha_hora__date__lte=fin_mes
-        )
-        ingresos_mes = 0
-        for cita in citas_mes:
-            if cita.precio_cobrado:
-                ingresos_mes += float(cita.precio_cobrado)
-            elif cita.tipo_servicio and cita.tipo_servicio.precio_base:
-                ingresos_mes += float(cita.tipo_servicio.precio_base)
-        
-        # Sumar ingresos manuales del mes
-        ingresos_manuales_mes = ingresos_manuales.filter(
-            fecha__gte=inicio_mes,
-            fecha__lte=fin_mes
-        )
-        for ingreso_manual in ingresos_manuales_mes:
-            ingresos_mes += float(ingreso_manual.monto)
-        
-        # ===== EGRESOS =====
-        # Obtener movimientos de insumos tipo "entrada" (compras) como egresos
-        movimientos_entrada = MovimientoInsumo.objects.filter(tipo='entrada').select_related('insumo')
-        
-        # Obtener solicitudes de insumos marcadas como egreso automático
-        solicitudes_egreso = SolicitudInsumo.objects.filter(
-            monto_egreso__isnull=False
-        )
-        
-        # Obtener egresos manuales
-        egresos_manuales = EgresoManual.objects.all()
-        
-        # Calcular egresos totales
-        total_egresos = 0
-        for movimiento in movimientos_entrada:
-            if movimiento.insumo and movimiento.insumo.precio_unitario:
-                total_egresos += float(movimiento.insumo.precio_unitario) * movimiento.cantidad
-        
-        # Sumar egresos automáticos de solicitudes
-        for solicitud in solicitudes_egreso:
-            if solicitud.monto_egreso:
-                total_egresos += float(solicitud.monto_egreso)
-        
-        # Sumar egresos manuales
-        for egreso_manual in egresos_manuales:
-            total_egresos += float(egreso_manual.monto)
-        
-        # Egresos del mes
-        movimientos_mes = movimientos_entrada.filter(
-            fecha_movimiento__date__gte=inicio_mes,
-            fecha_movimiento__date__lte=fin_mes
-        )
-        egresos_mes = 0
-        for movimiento in movimientos_mes:
-            if movimiento.insumo and movimiento.insumo.precio_unitario:
-                egresos_mes += float(movimiento.insumo.precio_unitario) * movimiento.cantidad
-        
-        # Sumar egresos automáticos del mes
-        solicitudes_mes = solicitudes_egreso.filter(
-            fecha_solicitud__date__gte=inicio_mes,
-            fecha_solicitud__date__lte=fin_mes
-        )
-        for solicitud in solicitudes_mes:
-            if solicitud.monto_egreso:
-                egresos_mes += float(solicitud.monto_egreso)
-        
-        # Sumar egresos manuales del mes
-        egresos_manuales_mes = egresos_manuales.filter(
-            fecha__gte=inicio_mes,
-            fecha__lte=fin_mes
-        )
-        for egreso_manual in egresos_manuales_mes:
-            egresos_mes += float(egreso_manual.monto)
-        
-        # Balance
-        balance_total = total_ingresos - total_egresos
-        balance_mes = ingresos_mes - egresos_mes
-        
-        # Encabezados
-        headers = ['Concepto', 'Valor']
-        fila_actual, border = _aplicar_estilo_turquesa(ws1, fila_datos, headers)
-        
-        # Datos
-        datos_financieros = [
-            ('Total Ingresos', f'${float(total_ingresos):,.0f}'),
-            ('Total Egresos', f'${float(total_egresos):,.0f}'),
-            ('Balance Total', f'${float(balance_total):,.0f}'),
-            ('Ingresos del Mes', f'${float(ingresos_mes):,.0f}'),
-            ('Egresos del Mes', f'${float(egresos_mes):,.0f}'),
-            ('Balance del Mes', f'${float(balance_mes):,.0f}'),
-        ]
-        
-        for concepto, valor in datos_financieros:
-            ws1.cell(row=fila_actual, column=1, value=concepto)
-            ws1.cell(row=fila_actual, column=2, value=valor)
-            
-            for col in range(1, 3):
-                cell = ws1.cell(row=fila_actual, column=col)
-                cell.border = border
-                if fila_actual % 2 == 0:
-                    cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-            
-            fila_actual += 1
-        
-        ws1.column_dimensions['A'].width = 25
-        ws1.column_dimensions['B'].width = 20
-        ws1.row_dimensions[fila_datos].height = 25
-        
-        # Hoja 2: Ingresos (Citas + Manuales)
-        ws2 = wb.create_sheet("Ingresos")
-        fila_datos2 = _crear_encabezado_excel(ws2, "INGRESOS", "Clínica San Felipe")
-        
-        headers2 = ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cliente/Dentista', 'Creado por']
-        fila_actual2, border2 = _aplicar_estilo_turquesa(ws2, fila_datos2, headers2)
-        
-        # Agregar citas completadas (sin límite para reporte completo)
-        for cita in citas_completadas.order_by('-fecha_hora'):
-            try:
-                monto_cita = 0
-                if cita.precio_cobrado:
-                    monto_cita = float(cita.precio_cobrado)
-                elif cita.tipo_servicio and cita.tipo_servicio.precio_base:
-                    monto_cita = float(cita.tipo_servicio.precio_base)
-                
-                if monto_cita > 0:  # Solo incluir si tiene monto
-                    ws2.cell(row=fila_actual2, column=1, value='CITA')
-                    ws2.cell(row=fila_actual2, column=2, value=cita.fecha_hora.strftime('%d/%m/%Y %H:%M') if cita.fecha_hora else 'N/A')
-                    ws2.cell(row=fila_actual2, column=3, value=monto_cita)
-                    descripcion = cita.tipo_servicio.nombre if cita.tipo_servicio else (cita.tipo_consulta or 'Cita')
-                    ws2.cell(row=fila_actual2, column=4, value=str(descripcion))
-                    cliente_info = ''
-                    if cita.cliente:
-                        cliente_info = cita.cliente.nombre_completo or 'Sin cliente'
-                    if cita.dentista:
-                        cliente_info += f' - Dr/a. {cita.dentista.nombre_completo}' if cliente_info else f'Dr/a. {cita.dentista.nombre_completo}'
-                    ws2.cell(row=fila_actual2, column=5, value=cliente_info or 'N/A')
-                    ws2.cell(row=fila_actual2, column=6, value='Sistema')
-                    
-                    for col in range(1, 7):
-                        cell = ws2.cell(row=fila_actual2, column=col)
-                        cell.border = border2
-                        if fila_actual2 % 2 == 0:
-                            cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                    
-                    fila_actual2 += 1
-            except Exception as e:
-                logger.error(f"Error al procesar cita ID {cita.id}: {str(e)}")
-                continue
-        
-        # Agregar ingresos manuales
-        for ingreso in ingresos_manuales.select_related('creado_por').order_by('-fecha', '-creado_el'):
-            try:
-                ws2.cell(row=fila_actual2, column=1, value='MANUAL')
-                ws2.cell(row=fila_actual2, column=2, value=ingreso.fecha.strftime('%d/%m/%Y') if ingreso.fecha else 'N/A')
-                ws2.cell(row=fila_actual2, column=3, value=float(ingreso.monto) if ingreso.monto else 0)
-                ws2.cell(row=fila_actual2, column=4, value=str(ingreso.descripcion) if ingreso.descripcion else '')
-                ws2.cell(row=fila_actual2, column=5, value='-')
-                ws2.cell(row=fila_actual2, column=6, value=ingreso.creado_por.nombre_completo if ingreso.creado_por and hasattr(ingreso.creado_por, 'nombre_completo') else 'N/A')
-                
-                for col in range(1, 7):
-                    cell = ws2.cell(row=fila_actual2, column=col)
-                    cell.border = border2
-                    if fila_actual2 % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual2 += 1
-            except Exception as e:
-                logger.error(f"Error al procesar ingreso ID {ingreso.id}: {str(e)}")
-                continue
-        
-        column_widths2 = [10, 16, 15, 40, 30, 25]
-        for i, width in enumerate(column_widths2, 1):
-            ws2.column_dimensions[get_column_letter(i)].width = width
-        ws2.row_dimensions[fila_datos2].height = 25
-        
-        # Hoja 3: Egresos (Compras + Solicitudes + Manuales)
-        ws3 = wb.create_sheet("Egresos")
-        fila_datos3 = _crear_encabezado_excel(ws3, "EGRESOS", "Clínica San Felipe")
-        
-        headers3 = ['Tipo', 'Fecha', 'Monto', 'Descripción', 'Cantidad', 'Creado por']
-        fila_actual3, border3 = _aplicar_estilo_turquesa(ws3, fila_datos3, headers3)
-        
-        # Agregar compras de inventario
-        for movimiento in movimientos_entrada.order_by('-fecha_movimiento')[:100]:  # Limitar a 100 más recientes
-            try:
-                if movimiento.insumo and movimiento.insumo.precio_unitario:
-                    monto_movimiento = float(movimiento.insumo.precio_unitario) * movimiento.cantidad
-                    if monto_movimiento > 0:
-                        ws3.cell(row=fila_actual3, column=1, value='COMPRA')
-                        ws3.cell(row=fila_actual3, column=2, value=movimiento.fecha_movimiento.strftime('%d/%m/%Y %H:%M') if movimiento.fecha_movimiento else 'N/A')
-                        ws3.cell(row=fila_actual3, column=3, value=monto_movimiento)
-                        ws3.cell(row=fila_actual3, column=4, value=movimiento.insumo.nombre or 'Sin nombre')
-                        ws3.cell(row=fila_actual3, column=5, value=f"{movimiento.cantidad} {movimiento.insumo.unidad_medida or ''}")
-                        creado_por = movimiento.realizado_por.nombre_completo if movimiento.realizado_por and hasattr(movimiento.realizado_por, 'nombre_completo') else 'Sistema'
-                        ws3.cell(row=fila_actual3, column=6, value=creado_por)
-                        
-                        for col in range(1, 7):
-                            cell = ws3.cell(row=fila_actual3, column=col)
-                            cell.border = border3
-                            if fila_actual3 % 2 == 0:
-                                cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                        
-                        fila_actual3 += 1
-            except Exception as e:
-                logger.error(f"Error al procesar movimiento ID {movimiento.id}: {str(e)}")
-                continue
-        
-        # Agregar solicitudes de proveedores
-        for solicitud in solicitudes_egreso.order_by('-fecha_solicitud')[:100]:
-            try:
-                if solicitud.monto_egreso:
-                    ws3.cell(row=fila_actual3, column=1, value='SOLICITUD')
-                    ws3.cell(row=fila_actual3, column=2, value=solicitud.fecha_solicitud.strftime('%d/%m/%Y %H:%M') if solicitud.fecha_solicitud else 'N/A')
-                    ws3.cell(row=fila_actual3, column=3, value=float(solicitud.monto_egreso))
-                    ws3.cell(row=fila_actual3, column=4, value=solicitud.insumo.nombre if solicitud.insumo else 'Sin insumo')
-                    ws3.cell(row=fila_actual3, column=5, value=f"{solicitud.cantidad_solicitada} {solicitud.insumo.unidad_medida if solicitud.insumo else ''}")
-                    creado_por = solicitud.solicitado_por.nombre_completo if solicitud.solicitado_por and hasattr(solicitud.solicitado_por, 'nombre_completo') else 'Sistema'
-                    ws3.cell(row=fila_actual3, column=6, value=creado_por)
-                    
-                    for col in range(1, 7):
-                        cell = ws3.cell(row=fila_actual3, column=col)
-                        cell.border = border3
-                        if fila_actual3 % 2 == 0:
-                            cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                    
-                    fila_actual3 += 1
-            except Exception as e:
-                logger.error(f"Error al procesar solicitud ID {solicitud.id}: {str(e)}")
-                continue
-        
-        # Agregar egresos manuales
-        for egreso in egresos_manuales.select_related('creado_por').order_by('-fecha', '-creado_el'):
-            try:
-                ws3.cell(row=fila_actual3, column=1, value='MANUAL')
-                ws3.cell(row=fila_actual3, column=2, value=egreso.fecha.strftime('%d/%m/%Y') if egreso.fecha else 'N/A')
-                ws3.cell(row=fila_actual3, column=3, value=float(egreso.monto) if egreso.monto else 0)
-                ws3.cell(row=fila_actual3, column=4, value=str(egreso.descripcion) if egreso.descripcion else '')
-                ws3.cell(row=fila_actual3, column=5, value='-')
-                ws3.cell(row=fila_actual3, column=6, value=egreso.creado_por.nombre_completo if egreso.creado_por and hasattr(egreso.creado_por, 'nombre_completo') else 'N/A')
-                
-                for col in range(1, 7):
-                    cell = ws3.cell(row=fila_actual3, column=col)
-                    cell.border = border3
-                    if fila_actual3 % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual3 += 1
-            except Exception as e:
-                logger.error(f"Error al procesar egreso ID {egreso.id}: {str(e)}")
-                continue
-        
-        column_widths3 = [12, 16, 15, 40, 15, 25]
-        for i, width in enumerate(column_widths3, 1):
-            ws3.column_dimensions[get_column_letter(i)].width = width
-        ws3.row_dimensions[fila_datos3].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=finanzas_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        libro, nombre_base = construir_excel_finanzas(tipo_exportacion)
+        return respuesta_excel(libro, nombre_base)
     except Exception as e:
         logger.error(f"Error al generar Excel de finanzas: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -915,67 +575,41 @@ def exportar_excel_finanzas(request):
 @login_required
 def exportar_excel_proveedores(request):
     """Exporta todos los proveedores a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_proveedores: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_proveedores')
+    if error:
+        return error
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Proveedores"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE PROVEEDORES", "Clínica San Felipe")
-        
-        headers = ['ID', 'Nombre', 'RUT', 'Email', 'Teléfono', 'Dirección', 'Contacto', 'Sitio Web', 'Activo', 'Total Solicitudes']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Proveedores", "REPORTE DE PROVEEDORES",
+            ['ID', 'Nombre', 'RUT', 'Email', 'Teléfono', 'Dirección', 'Contacto', 'Sitio Web', 'Activo', 'Total Solicitudes'],
+            [8, 30, 15, 30, 15, 30, 20, 25, 10, 15],
+        )
         
         proveedores = Proveedor.objects.annotate(
             total_solicitudes=Count('solicitudes')
         ).order_by('nombre')
         
-        for proveedor in proveedores:
+        for proveedor in proveedores.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=proveedor.id)
-                ws.cell(row=fila_actual, column=2, value=str(proveedor.nombre) if proveedor.nombre else 'Sin nombre')
-                ws.cell(row=fila_actual, column=3, value=str(proveedor.rut) if proveedor.rut else '')
-                ws.cell(row=fila_actual, column=4, value=str(proveedor.email) if proveedor.email else '')
-                ws.cell(row=fila_actual, column=5, value=str(proveedor.telefono) if proveedor.telefono else '')
-                ws.cell(row=fila_actual, column=6, value=str(proveedor.direccion) if proveedor.direccion else '')
-                ws.cell(row=fila_actual, column=7, value=str(proveedor.contacto_nombre) if proveedor.contacto_nombre else '')
-                ws.cell(row=fila_actual, column=8, value=str(proveedor.sitio_web) if proveedor.sitio_web else '')
-                ws.cell(row=fila_actual, column=9, value='Sí' if proveedor.activo else 'No')
-                ws.cell(row=fila_actual, column=10, value=proveedor.total_solicitudes or 0)
-                
-                for col in range(1, 11):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                hoja.agregar_fila([
+                    proveedor.id,
+                    str(proveedor.nombre) if proveedor.nombre else 'Sin nombre',
+                    str(proveedor.rut) if proveedor.rut else '',
+                    str(proveedor.email) if proveedor.email else '',
+                    str(proveedor.telefono) if proveedor.telefono else '',
+                    str(proveedor.direccion) if proveedor.direccion else '',
+                    str(proveedor.contacto_nombre) if proveedor.contacto_nombre else '',
+                    str(proveedor.sitio_web) if proveedor.sitio_web else '',
+                    'Sí' if proveedor.activo else 'No',
+                    proveedor.total_solicitudes or 0,
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar proveedor ID {proveedor.id}: {str(e)}")
                 continue
         
-        column_widths = [8, 30, 15, 30, 15, 30, 20, 25, 10, 15]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=proveedores_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'proveedores')
     except Exception as e:
         logger.error(f"Error al generar Excel de proveedores: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -984,65 +618,39 @@ def exportar_excel_proveedores(request):
 @login_required
 def exportar_excel_solicitudes(request):
     """Exporta todas las solicitudes a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_solicitudes: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_solicitudes')
+    if error:
+        return error
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Solicitudes"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE SOLICITUDES", "Clínica San Felipe")
-        
-        headers = ['ID', 'Fecha Solicitud', 'Proveedor', 'Insumo', 'Cantidad', 'Unidad', 'Fecha Entrega', 'Estado', 'Precio Unitario', 'Monto Total']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Solicitudes", "REPORTE DE SOLICITUDES",
+            ['ID', 'Fecha Solicitud', 'Proveedor', 'Insumo', 'Cantidad', 'Unidad', 'Fecha Entrega', 'Estado', 'Precio Unitario', 'Monto Total'],
+            [8, 18, 25, 25, 12, 10, 15, 15, 15, 15],
+        )
         
         solicitudes = SolicitudInsumo.objects.select_related('proveedor', 'insumo', 'solicitado_por').order_by('-fecha_solicitud')
         
-        for solicitud in solicitudes:
+        for solicitud in solicitudes.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=solicitud.id)
-                ws.cell(row=fila_actual, column=2, value=solicitud.fecha_solicitud.strftime('%d/%m/%Y %H:%M') if solicitud.fecha_solicitud else 'N/A')
-                ws.cell(row=fila_actual, column=3, value=solicitud.proveedor.nombre if solicitud.proveedor else 'Sin proveedor')
-                ws.cell(row=fila_actual, column=4, value=solicitud.insumo.nombre if solicitud.insumo else 'Sin insumo')
-                ws.cell(row=fila_actual, column=5, value=solicitud.cantidad_solicitada or 0)
-                ws.cell(row=fila_actual, column=6, value=solicitud.insumo.unidad_medida if solicitud.insumo and solicitud.insumo.unidad_medida else 'N/A')
-                ws.cell(row=fila_actual, column=7, value=solicitud.fecha_entrega_esperada.strftime('%d/%m/%Y') if solicitud.fecha_entrega_esperada else 'N/A')
-                ws.cell(row=fila_actual, column=8, value=solicitud.get_estado_display() if solicitud.estado else 'N/A')
-                ws.cell(row=fila_actual, column=9, value=float(solicitud.precio_unitario) if solicitud.precio_unitario else 0)
-                ws.cell(row=fila_actual, column=10, value=float(solicitud.monto_egreso) if solicitud.monto_egreso else 0)
-                
-                for col in range(1, 11):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                hoja.agregar_fila([
+                    solicitud.id,
+                    solicitud.fecha_solicitud.strftime('%d/%m/%Y %H:%M') if solicitud.fecha_solicitud else 'N/A',
+                    solicitud.proveedor.nombre if solicitud.proveedor else 'Sin proveedor',
+                    solicitud.insumo.nombre if solicitud.insumo else 'Sin insumo',
+                    solicitud.cantidad_solicitada or 0,
+                    solicitud.insumo.unidad_medida if solicitud.insumo and solicitud.insumo.unidad_medida else 'N/A',
+                    solicitud.fecha_entrega_esperada.strftime('%d/%m/%Y') if solicitud.fecha_entrega_esperada else 'N/A',
+                    solicitud.get_estado_display() if solicitud.estado else 'N/A',
+                    float(solicitud.precio_unitario) if solicitud.precio_unitario else 0,
+                    float(solicitud.monto_egreso) if solicitud.monto_egreso else 0,
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar solicitud ID {solicitud.id}: {str(e)}")
                 continue
         
-        column_widths = [8, 18, 25, 25, 12, 10, 15, 15, 15, 15]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=solicitudes_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'solicitudes')
     except Exception as e:
         logger.error(f"Error al generar Excel de solicitudes: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -1051,65 +659,39 @@ def exportar_excel_solicitudes(request):
 @login_required
 def exportar_excel_personal(request):
     """Exporta todo el personal a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_personal: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_personal')
+    if error:
+        return error
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Personal"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE PERSONAL", "Clínica San Felipe")
-        
-        headers = ['ID', 'Nombre Completo', 'Email', 'Teléfono', 'Rol', 'Especialidad', 'Activo', 'Total Citas']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Personal", "REPORTE DE PERSONAL",
+            ['ID', 'Nombre Completo', 'Email', 'Teléfono', 'Rol', 'Especialidad', 'Activo', 'Total Citas'],
+            [8, 30, 30, 15, 15, 20, 10, 12],
+        )
         
         personal = Perfil.objects.annotate(
             total_citas=Count('citas_asignadas')
         ).order_by('rol', 'nombre_completo')
         
-        for persona in personal:
+        for persona in personal.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=persona.id)
-                ws.cell(row=fila_actual, column=2, value=str(persona.nombre_completo) if persona.nombre_completo else 'Sin nombre')
-                ws.cell(row=fila_actual, column=3, value=str(persona.email) if persona.email else '')
-                ws.cell(row=fila_actual, column=4, value=str(persona.telefono) if persona.telefono else '')
-                ws.cell(row=fila_actual, column=5, value=persona.get_rol_display() if persona.rol else 'N/A')
-                ws.cell(row=fila_actual, column=6, value=str(persona.especialidad) if persona.especialidad else '')
-                ws.cell(row=fila_actual, column=7, value='Sí' if persona.activo else 'No')
-                ws.cell(row=fila_actual, column=8, value=persona.total_citas or 0)
-                
-                for col in range(1, 9):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                hoja.agregar_fila([
+                    persona.id,
+                    str(persona.nombre_completo) if persona.nombre_completo else 'Sin nombre',
+                    str(persona.email) if persona.email else '',
+                    str(persona.telefono) if persona.telefono else '',
+                    persona.get_rol_display() if persona.rol else 'N/A',
+                    str(persona.especialidad) if persona.especialidad else '',
+                    'Sí' if persona.activo else 'No',
+                    persona.total_citas or 0,
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar personal ID {persona.id}: {str(e)}")
                 continue
         
-        column_widths = [8, 30, 30, 15, 15, 20, 10, 12]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=personal_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'personal')
     except Exception as e:
         logger.error(f"Error al generar Excel de personal: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -1118,130 +700,92 @@ def exportar_excel_personal(request):
 @login_required
 def exportar_excel_servicios(request):
     """Exporta todos los servicios a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_servicios: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_servicios')
+    if error:
+        return error
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Servicios"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE SERVICIOS", "Clínica San Felipe")
-        
-        headers = ['ID', 'Nombre', 'Categoría', 'Descripción', 'Precio Base', 'Duración (min)', 'Requiere Dentista', 'Activo', 'Fecha Creación']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
+        libro = crear_libro()
+        hoja = HojaExcel(
+            libro, "Servicios", "REPORTE DE SERVICIOS",
+            ['ID', 'Nombre', 'Categoría', 'Descripción', 'Precio Base', 'Duración (min)', 'Requiere Dentista', 'Activo', 'Fecha Creación'],
+            [8, 30, 20, 40, 15, 15, 15, 10, 15],
+        )
         
         servicios = TipoServicio.objects.order_by('categoria', 'nombre')
         
-        for servicio in servicios:
+        for servicio in servicios.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
             try:
-                ws.cell(row=fila_actual, column=1, value=servicio.id)
-                ws.cell(row=fila_actual, column=2, value=str(servicio.nombre) if servicio.nombre else 'Sin nombre')
-                ws.cell(row=fila_actual, column=3, value=servicio.get_categoria_display() if servicio.categoria else 'N/A')
-                ws.cell(row=fila_actual, column=4, value=str(servicio.descripcion) if servicio.descripcion else '')
-                ws.cell(row=fila_actual, column=5, value=float(servicio.precio_base) if servicio.precio_base else 0)
-                ws.cell(row=fila_actual, column=6, value=servicio.duracion_estimada if servicio.duracion_estimada else 'N/A')
-                ws.cell(row=fila_actual, column=7, value='Sí' if servicio.requiere_dentista else 'No')
-                ws.cell(row=fila_actual, column=8, value='Sí' if servicio.activo else 'No')
-                ws.cell(row=fila_actual, column=9, value=servicio.creado_el.strftime('%d/%m/%Y') if servicio.creado_el else 'N/A')
-                
-                for col in range(1, 10):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
+                hoja.agregar_fila([
+                    servicio.id,
+                    str(servicio.nombre) if servicio.nombre else 'Sin nombre',
+                    servicio.get_categoria_display() if servicio.categoria else 'N/A',
+                    str(servicio.descripcion) if servicio.descripcion else '',
+                    float(servicio.precio_base) if servicio.precio_base else 0,
+                    servicio.duracion_estimada if servicio.duracion_estimada else 'N/A',
+                    'Sí' if servicio.requiere_dentista else 'No',
+                    'Sí' if servicio.activo else 'No',
+                    servicio.creado_el.strftime('%d/%m/%Y') if servicio.creado_el else 'N/A',
+                ])
             except Exception as e:
                 logger.error(f"Error al procesar servicio ID {servicio.id}: {str(e)}")
                 continue
         
-        column_widths = [8, 30, 20, 40, 15, 15, 15, 10, 15]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=servicios_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        return respuesta_excel(libro, 'servicios')
     except Exception as e:
         logger.error(f"Error al generar Excel de servicios: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
 
 
+def construir_excel_planes_tratamiento(progreso=None):
+    """
+    Arma el libro del reporte de planes de tratamiento.
+
+    Args:
+        progreso: Función opcional progreso(porcentaje, mensaje) (exportación en segundo plano)
+    """
+    libro = crear_libro()
+    hoja = HojaExcel(
+        libro, "Planes Tratamiento", "REPORTE DE PLANES DE TRATAMIENTO",
+        ['ID', 'Nombre', 'Cliente', 'Dentista', 'Estado', 'Presupuesto Total', 'Precio Final', 'Progreso %', 'Fecha Creación'],
+        [8, 30, 25, 25, 20, 18, 12, 15, 12, 15],
+    )
+    
+    planes = PlanTratamiento.objects.select_related('cliente', 'dentista').order_by('-creado_el')
+    total_planes = planes.count() if progreso else 0
+    
+    for indice, plan in enumerate(planes.iterator(chunk_size=TAMANO_LOTE_EXPORTACION), 1):
+        if progreso and indice % 100 == 0:
+            progreso(int(indice * 95 / max(total_planes, 1)), f'{indice} de {total_planes} planes')
+        try:
+            hoja.agregar_fila([
+                plan.id,
+                str(plan.nombre) if plan.nombre else 'Sin nombre',
+                _nombre_o(plan.cliente, 'Sin cliente'),
+                _nombre_o(plan.dentista, 'Sin dentista'),
+                plan.get_estado_display() if plan.estado else 'N/A',
+                float(plan.presupuesto_total) if plan.presupuesto_total else 0,
+                float(plan.precio_final) if plan.precio_final else 0,
+                f"{plan.progreso_porcentaje}%" if plan.progreso_porcentaje is not None else "0%",
+                plan.creado_el.strftime('%d/%m/%Y') if plan.creado_el else 'N/A',
+            ])
+        except Exception as e:
+            logger.error(f"Error al procesar plan ID {plan.id}: {str(e)}")
+            continue
+    
+    return libro
+
+
 @login_required
 def exportar_excel_planes_tratamiento(request):
     """Exporta todos los planes de tratamiento a Excel con diseño turquesa"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            return HttpResponse('No tienes permisos', status=403)
-    except Perfil.DoesNotExist:
-        return HttpResponse('No autorizado', status=403)
-    except Exception as e:
-        logger.error(f"Error al verificar permisos en exportar_excel_planes_tratamiento: {str(e)}")
-        return HttpResponse('Error al procesar la solicitud', status=500)
+    perfil, error = _verificar_permiso_exportacion(request, 'exportar_excel_planes_tratamiento')
+    if error:
+        return error
     
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Planes Tratamiento"
-        
-        fila_datos = _crear_encabezado_excel(ws, "REPORTE DE PLANES DE TRATAMIENTO", "Clínica San Felipe")
-        
-        headers = ['ID', 'Nombre', 'Cliente', 'Dentista', 'Estado', 'Presupuesto Total', 'Precio Final', 'Progreso %', 'Fecha Creación']
-        fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
-        
-        planes = PlanTratamiento.objects.select_related('cliente', 'dentista').order_by('-creado_el')
-        
-        for plan in planes:
-            try:
-                ws.cell(row=fila_actual, column=1, value=plan.id)
-                ws.cell(row=fila_actual, column=2, value=str(plan.nombre) if plan.nombre else 'Sin nombre')
-                ws.cell(row=fila_actual, column=3, value=plan.cliente.nombre_completo if plan.cliente and hasattr(plan.cliente, 'nombre_completo') else 'Sin cliente')
-                ws.cell(row=fila_actual, column=4, value=plan.dentista.nombre_completo if plan.dentista and hasattr(plan.dentista, 'nombre_completo') else 'Sin dentista')
-                ws.cell(row=fila_actual, column=5, value=plan.get_estado_display() if plan.estado else 'N/A')
-                ws.cell(row=fila_actual, column=6, value=float(plan.presupuesto_total) if plan.presupuesto_total else 0)
-                ws.cell(row=fila_actual, column=7, value=float(plan.precio_final) if plan.precio_final else 0)
-                ws.cell(row=fila_actual, column=8, value=f"{plan.progreso_porcentaje}%" if plan.progreso_porcentaje is not None else "0%")
-                ws.cell(row=fila_actual, column=9, value=plan.creado_el.strftime('%d/%m/%Y') if plan.creado_el else 'N/A')
-                
-                for col in range(1, 10):
-                    cell = ws.cell(row=fila_actual, column=col)
-                    cell.border = border
-                    if fila_actual % 2 == 0:
-                        cell.fill = PatternFill(start_color=TURQUESA_BG, end_color=TURQUESA_BG, fill_type="solid")
-                
-                fila_actual += 1
-            except Exception as e:
-                logger.error(f"Error al procesar plan ID {plan.id}: {str(e)}")
-                continue
-        
-        column_widths = [8, 30, 25, 25, 20, 18, 12, 15, 12, 15]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        ws.row_dimensions[fila_datos].height = 25
-        
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename=planes_tratamiento_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
-        wb.save(response)
-        
-        return response
+        libro = construir_excel_planes_tratamiento()
+        return respuesta_excel(libro, 'planes_tratamiento')
     except Exception as e:
         logger.error(f"Error al generar Excel de planes de tratamiento: {str(e)}")
         return HttpResponse('Error al generar el archivo Excel', status=500)
@@ -1282,51 +826,44 @@ def estadisticas(request):
             fecha_desde = hoy.replace(day=1)
             fecha_hasta = hoy
         
-        inicio_mes = fecha_desde if fecha_desde == hoy.replace(day=1) else fecha_desde
-        fin_mes = fecha_hasta
-        hace_30_dias = hoy - timedelta(days=30)
-        hace_7_dias = hoy - timedelta(days=7)
-        
-        # ===== ESTADÍSTICAS GENERALES (optimizadas con agregaciones) =====
-        # Estadísticas básicas
-        total_citas = Cita.objects.count()
-        total_clientes = Cliente.objects.count()
-        clientes_activos = Cliente.objects.filter(activo=True).count()
-        total_personal = Perfil.objects.filter(activo=True).count()
-        total_insumos = Insumo.objects.count()
-        
-        # Citas por estado (una sola consulta con agregación)
-        citas_por_estado = Cita.objects.values('estado').annotate(
-            total=Count('id')
+        # Comparativas con el mes anterior al inicio del período
+        mes_anterior_inicio = (fecha_desde - timedelta(days=1)).replace(day=1)
+        mes_anterior_fin = fecha_desde - timedelta(days=1)
+        
+        # ===== ESTADÍSTICAS GENERALES (agregados condicionales, una consulta por tabla) =====
+        # Las citas se leen del resumen diario (EstadisticaDiaria), no de la tabla de citas
+        conteo_citas = contar_citas_resumen(fecha_desde, fecha_hasta, hoy, mes_anterior_inicio, mes_anterior_fin)
+        conteo_clientes = contar(
+            Cliente.objects,
+            total=Q(),
+            activos=Q(activo=True),
+            nuevos_mes=q_fechas('fecha_registro', fecha_desde, fecha_hasta),
+            nuevos_mes_anterior=q_fechas('fecha_registro', mes_anterior_inicio, mes_anterior_fin),
         )
-        citas_estado_dict = {item['estado']: item['total'] for item in citas_por_estado}
-        citas_disponibles = citas_estado_dict.get('disponible', 0)
-        citas_reservadas = citas_estado_dict.get('reservada', 0)
-        citas_completadas = citas_estado_dict.get('completada', 0)
-        citas_canceladas = citas_estado_dict.get('cancelada', 0)
-        
-        # Citas del período seleccionado
-        citas_mes = Cita.objects.filter(
-            fecha_hora__date__gte=fecha_desde,
-            fecha_hora__date__lte=fecha_hasta
-        ).count()
-        
-        citas_semana = Cita.objects.filter(
-            fecha_hora__date__gte=hace_7_dias
-        ).count()
-        
-        citas_hoy = Cita.objects.filter(fecha_hora__date=hoy).count()
-        
-        citas_completadas_mes = Cita.objects.filter(
-            estado='completada',
-            fecha_hora__date__gte=inicio_mes,
-            fecha_hora__date__lte=fin_mes
-        ).count()
+        conteo_insumos = contar(
+            Insumo.objects,
+            total=Q(),
+            bajo_stock=Q(cantidad_actual__lte=F('cantidad_minima')),
+        )
+        total_personal = Perfil.objects.filter(activo=True).count()
         
-        # Insumos con stock bajo
-        insumos_bajo_stock = Insumo.objects.filter(
-            cantidad_actual__lte=F('cantidad_minima')
-        ).count()
+        total_citas = conteo_citas['total']
+        citas_disponibles = conteo_citas['disponibles']
+        citas_reservadas = conteo_citas['reservadas']
+        citas_completadas = conteo_citas['completadas']
+        citas_canceladas = conteo_citas['canceladas']
+        citas_mes = conteo_citas['mes']
+        citas_semana = conteo_citas['semana']
+        citas_hoy = conteo_citas['hoy']
+        citas_completadas_mes = conteo_citas['completadas_mes']
+        citas_canceladas_mes = conteo_citas['canceladas_mes']
+        citas_mes_anterior = conteo_citas['mes_anterior']
+        total_clientes = conteo_clientes['total']
+        clientes_activos = conteo_clientes['activos']
+        clientes_nuevos_mes = conteo_clientes['nuevos_mes']
+        clientes_nuevos_mes_anterior = conteo_clientes['nuevos_mes_anterior']
+        total_insumos = conteo_insumos['total']
+        insumos_bajo_stock = conteo_insumos['bajo_stock']
         
         # Dentistas más activos (optimizado)
         dentistas_activos = Perfil.objects.filter(
@@ -1336,88 +873,40 @@ def estadisticas(request):
             num_citas=Count('citas_asignadas')
         ).order_by('-num_citas')[:5]
         
-        # Clientes nuevos en el período seleccionado
-        clientes_nuevos_mes = Cliente.objects.filter(
-            fecha_registro__date__gte=fecha_desde,
-            fecha_registro__date__lte=fecha_hasta
-        ).count()
-        
-        # Citas por mes (últimos 6 meses) - optimizado
-        from calendar import monthrange
-        citas_por_mes = []
-        meses_nombres = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 
-                        'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-        for i in range(5, -1, -1):  # Iterar hacia atrás es más eficiente
-            mes_fecha = hoy - timedelta(days=30*i)
-            inicio = mes_fecha.replace(day=1)
-            ultimo_dia = monthrange(mes_fecha.year, mes_fecha.month)[1]
-            fin = mes_fecha.replace(day=ultimo_dia)
-            count = Cita.objects.filter(
-                fecha_hora__date__gte=inicio,
-                fecha_hora__date__lte=fin
-            ).count()
-            citas_por_mes.append({
-                'mes': meses_nombres[inicio.month - 1],
-                'total': count
-            })
-        
-        # Finanzas (usando período seleccionado) - optimizado
-        total_ingresos = IngresoManual.objects.aggregate(Sum('monto'))['monto__sum'] or 0
-        total_egresos = EgresoManual.objects.aggregate(Sum('monto'))['monto__sum'] or 0
-        ingresos_mes = IngresoManual.objects.filter(
-            fecha__gte=fecha_desde, 
-            fecha__lte=fecha_hasta
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        egresos_mes = EgresoManual.objects.filter(
-            fecha__gte=fecha_desde, 
-            fecha__lte=fecha_hasta
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
+        # Citas, ingresos y egresos por mes (últimos 6 meses) - una consulta agrupada del resumen
+        serie = serie_mensual(
+            EstadisticaDiaria.objects, 'fecha', hoy, 6,
+            citas=Sum('cantidad', filter=~Q(estado__in=ESTADOS_MANUALES)),
+            ingresos=Sum('monto', filter=Q(estado=EstadisticaDiaria.ESTADO_INGRESO_MANUAL)),
+            egresos=Sum('monto', filter=Q(estado=EstadisticaDiaria.ESTADO_EGRESO_MANUAL)),
+        )
+        citas_por_mes = [
+            {'mes': MESES_NOMBRES[fila['inicio'].month - 1], 'total': fila['citas']}
+            for fila in serie
+        ]
+        ingresos_por_mes = [float(fila['ingresos']) for fila in serie]
+        egresos_por_mes = [float(fila['egresos']) for fila in serie]
+        
+        # Finanzas (usando período seleccionado)
+        del_periodo = Q(fecha__gte=fecha_desde, fecha__lte=fecha_hasta)
+        es_ingreso = Q(estado=EstadisticaDiaria.ESTADO_INGRESO_MANUAL)
+        es_egreso = Q(estado=EstadisticaDiaria.ESTADO_EGRESO_MANUAL)
+        sumas_manuales = sumar(
+            EstadisticaDiaria.objects.filter(estado__in=ESTADOS_MANUALES), 'monto',
+            total_ingresos=es_ingreso,
+            total_egresos=es_egreso,
+            ingresos_mes=es_ingreso & del_periodo,
+            egresos_mes=es_egreso & del_periodo,
+            ingresos_mes_anterior=es_ingreso & Q(fecha__gte=mes_anterior_inicio, fecha__lte=mes_anterior_fin),
+        )
+        total_ingresos = sumas_manuales['total_ingresos']
+        total_egresos = sumas_manuales['total_egresos']
+        ingresos_mes = sumas_manuales['ingresos_mes']
+        egresos_mes = sumas_manuales['egresos_mes']
+        ingresos_mes_anterior = sumas_manuales['ingresos_mes_anterior']
         balance_mes = ingresos_mes - egresos_mes
         
-        # Ingresos y egresos por mes (últimos 6 meses) - optimizado
-        ingresos_por_mes = []
-        egresos_por_mes = []
-        for i in range(5, -1, -1):
-            mes_fecha = hoy - timedelta(days=30*i)
-            inicio = mes_fecha.replace(day=1)
-            ultimo_dia = monthrange(mes_fecha.year, mes_fecha.month)[1]
-            fin = mes_fecha.replace(day=ultimo_dia)
-            ingreso = IngresoManual.objects.filter(
-                fecha__gte=inicio, 
-                fecha__lte=fin
-            ).aggregate(Sum('monto'))['monto__sum'] or 0
-            egreso = EgresoManual.objects.filter(
-                fecha__gte=inicio, 
-                fecha__lte=fin
-            ).aggregate(Sum('monto'))['monto__sum'] or 0
-            ingresos_por_mes.append(float(ingreso))
-            egresos_por_mes.append(float(egreso))
-        
-        # Comparativas con mes anterior (solo lo necesario)
-        mes_anterior_inicio = (inicio_mes - timedelta(days=1)).replace(day=1)
-        mes_anterior_fin = inicio_mes - timedelta(days=1)
-        
-        citas_mes_anterior = Cita.objects.filter(
-            fecha_hora__date__gte=mes_anterior_inicio,
-            fecha_hora__date__lte=mes_anterior_fin
-        ).count()
-        
-        ingresos_mes_anterior = IngresoManual.objects.filter(
-            fecha__gte=mes_anterior_inicio,
-            fecha__lte=mes_anterior_fin
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-        
-        clientes_nuevos_mes_anterior = Cliente.objects.filter(
-            fecha_registro__date__gte=mes_anterior_inicio,
-            fecha_registro__date__lte=mes_anterior_fin
-        ).count()
-        
         # Tasa de cancelación (canceladas del período / total citas del período)
-        citas_canceladas_mes = Cita.objects.filter(
-            estado='cancelada',
-            fecha_hora__date__gte=fecha_desde,
-            fecha_hora__date__lte=fecha_hasta
-        ).count()
         tasa_cancelacion = (citas_canceladas_mes / citas_mes * 100) if citas_mes > 0 else 0
         
         # Tasa de ocupación (citas completadas vs total)
@@ -1472,7 +961,7 @@ def estadisticas(request):
             # Fechas
             'fecha_desde': fecha_desde,
             'fecha_hasta': fecha_hasta,
-            'mes_actual': fecha_desde.strftime('%B %Y') if fecha_desde else inicio_mes.strftime('%B %Y'),
+            'mes_actual': fecha_desde.strftime('%B %Y'),
             'hoy': hoy.strftime('%d/%m/%Y'),
         }
         
@@ -1484,6 +973,283 @@ def estadisticas(request):
         return redirect('panel_trabajador')
 
 
+def construir_pdf_estadisticas(destino, progreso=None):
+    """
+    Genera el PDF del resumen ejecutivo de estadísticas.
+
+    Args:
+        destino: Archivo o buffer donde se escribe el PDF
+        progreso: Función opcional progreso(porcentaje, mensaje) (exportación en segundo plano)
+
+    Returns:
+        Nombre sugerido para el archivo
+    """
+    # Obtener datos (similar a la vista estadisticas)
+    hoy = timezone.now().date()
+    fecha_desde = hoy.replace(day=1)
+    fecha_hasta = hoy
+    mes_anterior_inicio = (fecha_desde - timedelta(days=1)).replace(day=1)
+    mes_anterior_fin = fecha_desde - timedelta(days=1)
+    
+    # Citas desde el resumen diario (una sola consulta)
+    conteo_citas = contar_citas_resumen(fecha_desde, fecha_hasta, hoy, mes_anterior_inicio, mes_anterior_fin)
+    total_citas = conteo_citas['total']
+    citas_disponibles = conteo_citas['disponibles']
+    citas_reservadas = conteo_citas['reservadas']
+    citas_completadas = conteo_citas['completadas']
+    citas_canceladas = conteo_citas['canceladas']
+    citas_mes = conteo_citas['mes']
+    citas_semana = conteo_citas['semana']
+    citas_hoy = conteo_citas['hoy']
+    citas_completadas_mes = conteo_citas['completadas_mes']
+    citas_canceladas_mes = conteo_citas['canceladas_mes']
+    citas_mes_anterior = conteo_citas['mes_anterior']
+    
+    # Clientes, personal e insumos
+    conteo_clientes = contar(
+        Cliente.objects,
+        activos=Q(activo=True),
+        nuevos_mes=q_fechas('fecha_registro', fecha_desde, fecha_hasta),
+    )
+    conteo_insumos = contar(
+        Insumo.objects,
+        total=Q(),
+        bajo_stock=Q(cantidad_actual__lte=F('cantidad_minima')),
+    )
+    total_clientes = conteo_clientes['activos']
+    clientes_nuevos_mes = conteo_clientes['nuevos_mes']
+    total_personal = Perfil.objects.filter(activo=True).count()
+    total_insumos = conteo_insumos['total']
+    insumos_bajo_stock = conteo_insumos['bajo_stock']
+    
+    # Tasa de ocupación y cancelación
+    tasa_ocupacion = (citas_completadas_mes / citas_mes * 100) if citas_mes > 0 else 0
+    tasa_cancelacion = (citas_canceladas_mes / citas_mes * 100) if citas_mes > 0 else 0
+    
+    # Comparativa con mes anterior
+    cambio_citas = ((citas_mes - citas_mes_anterior) / citas_mes_anterior * 100) if citas_mes_anterior > 0 else 0
+    
+    # Información de la clínica
+    try:
+        from configuracion.models import InformacionClinica
+        info_clinica = InformacionClinica.obtener()
+        nombre_clinica = info_clinica.nombre_clinica
+    except:
+        nombre_clinica = "Clínica San Felipe"
+    
+    if progreso:
+        progreso(40, 'Armando el documento')
+    
+    # Crear el documento PDF
+    doc = SimpleDocTemplate(
+        destino,
+        pagesize=A4,
+        rightMargin=40,
+        leftMargin=40,
+        topMargin=50,
+        bottomMargin=40
+    )
+    
+    # Estilos
+    styles = getSampleStyleSheet()
+    
+    # Colores
+    primary_color = colors.HexColor('#14b8a6')
+    dark_color = colors.HexColor('#0f766e')
+    gray_color = colors.HexColor('#64748b')
+    
+    # Estilos personalizados
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=dark_color,
+        spaceAfter=12,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+    
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=16,
+        textColor=primary_color,
+        spaceAfter=10,
+        spaceBefore=16,
+        fontName='Helvetica-Bold'
+    )
+    
+    body_style = ParagraphStyle(
+        'CustomBody',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.HexColor('#1e293b'),
+        spaceAfter=8,
+        alignment=TA_JUSTIFY,
+        leading=14
+    )
+    
+    # Contenido del PDF
+    story = []
+    
+    # Título
+    title = Paragraph(f"<b>RESUMEN EJECUTIVO DE ESTADÍSTICAS</b><br/>{nombre_clinica}", title_style)
+    story.append(title)
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Fecha de generación
+    fecha_gen = Paragraph(
+        f"<i>Generado el {hoy.strftime('%d de %B de %Y')}</i>",
+        ParagraphStyle('FechaStyle', parent=styles['Normal'], fontSize=9, textColor=gray_color, alignment=TA_CENTER)
+    )
+    story.append(fecha_gen)
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Resumen Ejecutivo
+    resumen_texto = f"""
+    Este reporte presenta un resumen ejecutivo de las estadísticas operativas de {nombre_clinica} 
+    correspondiente al período del {fecha_desde.strftime('%d/%m/%Y')} al {fecha_hasta.strftime('%d/%m/%Y')}. 
+    El análisis incluye métricas clave sobre citas, clientes, personal e inventario, proporcionando 
+    una visión general del desempeño de la clínica.
+    """
+    story.append(Paragraph("<b>RESUMEN EJECUTIVO</b>", heading_style))
+    story.append(Paragraph(resumen_texto.strip(), body_style))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Tabla de KPIs principales
+    kpi_data = [
+        ['Métrica', 'Valor'],
+        ['Total de Citas', str(total_citas)],
+        ['Citas del Mes', str(citas_mes)],
+        ['Citas Hoy', str(citas_hoy)],
+        ['Citas Completadas (Mes)', str(citas_completadas_mes)],
+        ['Total Clientes Activos', str(total_clientes)],
+        ['Clientes Nuevos (Mes)', str(clientes_nuevos_mes)],
+        ['Personal Activo', str(total_personal)],
+        ['Total Insumos', str(total_insumos)],
+        ['Insumos con Stock Bajo', str(insumos_bajo_stock)],
+    ]
+    
+    kpi_table = Table(kpi_data, colWidths=[4*inch, 2*inch])
+    kpi_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), primary_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8fafc')]),
+    ]))
+    
+    story.append(Paragraph("<b>INDICADORES PRINCIPALES</b>", heading_style))
+    story.append(kpi_table)
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Análisis de Citas
+    analisis_citas = f"""
+    Durante el período analizado, se registraron <b>{citas_mes}</b> citas en total. De estas, 
+    <b>{citas_completadas_mes}</b> fueron completadas exitosamente, lo que representa una tasa de 
+    ocupación del <b>{tasa_ocupacion:.1f}%</b>. 
+    
+    El estado actual del sistema muestra <b>{citas_reservadas}</b> citas reservadas y 
+    <b>{citas_disponibles}</b> citas disponibles. Se registraron <b>{citas_canceladas_mes}</b> 
+    cancelaciones, lo que representa una tasa de cancelación del <b>{tasa_cancelacion:.1f}%</b>.
+    """
+    
+    if cambio_citas != 0:
+        direccion = "aumento" if cambio_citas > 0 else "disminución"
+        analisis_citas += f"""
+        
+        En comparación con el mes anterior, se observa un <b>{direccion} del {abs(cambio_citas):.1f}%</b> 
+        en el número de citas, lo que indica una {'tendencia positiva' if cambio_citas > 0 else 'tendencia a la baja'} 
+        en la actividad de la clínica.
+        """
+    
+    story.append(Paragraph("<b>ANÁLISIS DE CITAS</b>", heading_style))
+    story.append(Paragraph(analisis_citas.strip(), body_style))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Distribución de Citas por Estado
+    distrib_data = [
+        ['Estado', 'Cantidad'],
+        ['Disponibles', str(citas_disponibles)],
+        ['Reservadas', str(citas_reservadas)],
+        ['Completadas', str(citas_completadas)],
+        ['Canceladas', str(citas_canceladas)],
+    ]
+    
+    distrib_table = Table(distrib_data, colWidths=[3*inch, 2*inch])
+    distrib_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), dark_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ]))
+    
+    story.append(distrib_table)
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Análisis de Clientes
+    analisis_clientes = f"""
+    La base de clientes activos de la clínica asciende a <b>{total_clientes}</b> pacientes. 
+    Durante el mes actual, se registraron <b>{clientes_nuevos_mes}</b> nuevos clientes, 
+    lo que refleja el crecimiento continuo de la cartera de pacientes.
+    """
+    story.append(Paragraph("<b>ANÁLISIS DE CLIENTES</b>", heading_style))
+    story.append(Paragraph(analisis_clientes.strip(), body_style))
+    story.append(Spacer(1, 0.2*inch))
+    
+    # Análisis de Inventario
+    if insumos_bajo_stock > 0:
+        alerta_inventario = f"""
+        <b>Atención:</b> Se detectaron <b>{insumos_bajo_stock}</b> insumos con stock bajo. 
+        Se recomienda revisar el inventario y realizar las solicitudes de reposición necesarias 
+        para mantener la operación sin interrupciones.
+        """
+        story.append(Paragraph("<b>ESTADO DE INVENTARIO</b>", heading_style))
+        story.append(Paragraph(alerta_inventario.strip(), body_style))
+    else:
+        inventario_ok = """
+        El inventario se encuentra en niveles adecuados. No se detectaron insumos con stock bajo 
+        que requieran atención inmediata.
+        """
+        story.append(Paragraph("<b>ESTADO DE INVENTARIO</b>", heading_style))
+        story.append(Paragraph(inventario_ok.strip(), body_style))
+    
+    story.append(Spacer(1, 0.3*inch))
+    
+    # Conclusiones
+    conclusiones = f"""
+    En resumen, la clínica muestra una operación activa con <b>{citas_mes}</b> citas programadas 
+    en el mes actual y una tasa de ocupación del <b>{tasa_ocupacion:.1f}%</b>. La base de clientes 
+    continúa creciendo con <b>{clientes_nuevos_mes}</b> nuevos registros. El equipo de trabajo 
+    está compuesto por <b>{total_personal}</b> miembros activos.
+    """
+    story.append(Paragraph("<b>CONCLUSIONES</b>", heading_style))
+    story.append(Paragraph(conclusiones.strip(), body_style))
+    
+    # Pie de página
+    story.append(Spacer(1, 0.4*inch))
+    footer = Paragraph(
+        f"<i>Reporte generado automáticamente el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}</i>",
+        ParagraphStyle('FooterStyle', parent=styles['Normal'], fontSize=8, textColor=gray_color, alignment=TA_CENTER)
+    )
+    story.append(footer)
+    
+    # Construir el PDF
+    doc.build(story)
+    
+    return f"resumen_estadisticas_{hoy.strftime('%Y%m%d')}.pdf"
+
+
 @login_required
 def exportar_estadisticas_pdf(request):
     """Exporta un resumen ejecutivo de estadísticas a PDF"""
@@ -1500,295 +1266,13 @@ def exportar_estadisticas_pdf(request):
         return redirect('estadisticas')
     
     try:
-        # Obtener datos (similar a la vista estadisticas)
-        hoy = timezone.now().date()
-        fecha_desde = hoy.replace(day=1)
-        fecha_hasta = hoy
-        inicio_mes = fecha_desde
-        fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        hace_7_dias = hoy - timedelta(days=7)
-        
-        # Estadísticas básicas
-        total_citas = Cita.objects.count()
-        total_clientes = Cliente.objects.filter(activo=True).count()
-        total_personal = Perfil.objects.filter(activo=True).count()
-        total_insumos = Insumo.objects.count()
-        
-        # Citas por estado
-        citas_por_estado = Cita.objects.values('estado').annotate(total=Count('id'))
-        citas_estado_dict = {item['estado']: item['total'] for item in citas_por_estado}
-        citas_disponibles = citas_estado_dict.get('disponible', 0)
-        citas_reservadas = citas_estado_dict.get('reservada', 0)
-        citas_completadas = citas_estado_dict.get('completada', 0)
-        citas_canceladas = citas_estado_dict.get('cancelada', 0)
-        
-        # Citas del período
-        citas_mes = Cita.objects.filter(
-            fecha_hora__date__gte=fecha_desde,
-            fecha_hora__date__lte=fecha_hasta
-        ).count()
-        citas_semana = Cita.objects.filter(fecha_hora__date__gte=hace_7_dias).count()
-        citas_hoy = Cita.objects.filter(fecha_hora__date=hoy).count()
-        citas_completadas_mes = Cita.objects.filter(
-            estado='completada',
-            fecha_hora__date__gte=inicio_mes,
-            fecha_hora__date__lte=fin_mes
-        ).count()
-        
-        # Insumos
-        insumos_bajo_stock = Insumo.objects.filter(
-            cantidad_actual__lte=F('cantidad_minima')
-        ).count()
-        
-        # Clientes nuevos
-        clientes_nuevos_mes = Cliente.objects.filter(
-            fecha_registro__date__gte=fecha_desde,
-            fecha_registro__date__lte=fecha_hasta
-        ).count()
-        
-        # Tasa de ocupación y cancelación
-        tasa_ocupacion = (citas_completadas_mes / citas_mes * 100) if citas_mes > 0 else 0
-        citas_canceladas_mes = Cita.objects.filter(
-            estado='cancelada',
-            fecha_hora__date__gte=fecha_desde,
-            fecha_hora__date__lte=fecha_hasta
-        ).count()
-        tasa_cancelacion = (citas_canceladas_mes / citas_mes * 100) if citas_mes > 0 else 0
-        
-        # Comparativa con mes anterior
-        mes_anterior_inicio = (inicio_mes - timedelta(days=1)).replace(day=1)
-        mes_anterior_fin = inicio_mes - timedelta(days=1)
-        citas_mes_anterior = Cita.objects.filter(
-            fecha_hora__date__gte=mes_anterior_inicio,
-            fecha_hora__date__lte=mes_anterior_fin
-        ).count()
-        cambio_citas = ((citas_mes - citas_mes_anterior) / citas_mes_anterior * 100) if citas_mes_anterior > 0 else 0
-        
-        # Información de la clínica
-        try:
-            from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
-            nombre_clinica = info_clinica.nombre_clinica
-        except:
-            nombre_clinica = "Clínica San Felipe"
-        
-        # Crear el buffer para el PDF
         buffer = BytesIO()
-        
-        # Crear el documento PDF
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=40,
-            leftMargin=40,
-            topMargin=50,
-            bottomMargin=40
-        )
-        
-        # Estilos
-        styles = getSampleStyleSheet()
-        
-        # Colores
-        primary_color = colors.HexColor('#14b8a6')
-        dark_color = colors.HexColor('#0f766e')
-        gray_color = colors.HexColor('#64748b')
-        
-        # Estilos personalizados
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=dark_color,
-            spaceAfter=12,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=16,
-            textColor=primary_color,
-            spaceAfter=10,
-            spaceBefore=16,
-            fontName='Helvetica-Bold'
-        )
-        
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#1e293b'),
-            spaceAfter=8,
-            alignment=TA_JUSTIFY,
-            leading=14
-        )
-        
-        # Contenido del PDF
-        story = []
-        
-        # Título
-        title = Paragraph(f"<b>RESUMEN EJECUTIVO DE ESTADÍSTICAS</b><br/>{nombre_clinica}", title_style)
-        story.append(title)
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Fecha de generación
-        fecha_gen = Paragraph(
-            f"<i>Generado el {hoy.strftime('%d de %B de %Y')}</i>",
-            ParagraphStyle('FechaStyle', parent=styles['Normal'], fontSize=9, textColor=gray_color, alignment=TA_CENTER)
-        )
-        story.append(fecha_gen)
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Resumen Ejecutivo
-        resumen_texto = f"""
-        Este reporte presenta un resumen ejecutivo de las estadísticas operativas de {nombre_clinica} 
-        correspondiente al período del {fecha_desde.strftime('%d/%m/%Y')} al {fecha_hasta.strftime('%d/%m/%Y')}. 
-        El análisis incluye métricas clave sobre citas, clientes, personal e inventario, proporcionando 
-        una visión general del desempeño de la clínica.
-        """
-        story.append(Paragraph("<b>RESUMEN EJECUTIVO</b>", heading_style))
-        story.append(Paragraph(resumen_texto.strip(), body_style))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Tabla de KPIs principales
-        kpi_data = [
-            ['Métrica', 'Valor'],
-            ['Total de Citas', str(total_citas)],
-            ['Citas del Mes', str(citas_mes)],
-            ['Citas Hoy', str(citas_hoy)],
-            ['Citas Completadas (Mes)', str(citas_completadas_mes)],
-            ['Total Clientes Activos', str(total_clientes)],
-            ['Clientes Nuevos (Mes)', str(clientes_nuevos_mes)],
-            ['Personal Activo', str(total_personal)],
-            ['Total Insumos', str(total_insumos)],
-            ['Insumos con Stock Bajo', str(insumos_bajo_stock)],
-        ]
-        
-        kpi_table = Table(kpi_data, colWidths=[4*inch, 2*inch])
-        kpi_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), primary_color),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8fafc')]),
-        ]))
-        
-        story.append(Paragraph("<b>INDICADORES PRINCIPALES</b>", heading_style))
-        story.append(kpi_table)
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Análisis de Citas
-        analisis_citas = f"""
-        Durante el período analizado, se registraron <b>{citas_mes}</b> citas en total. De estas, 
-        <b>{citas_completadas_mes}</b> fueron completadas exitosamente, lo que representa una tasa de 
-        ocupación del <b>{tasa_ocupacion:.1f}%</b>. 
-        
-        El estado actual del sistema muestra <b>{citas_reservadas}</b> citas reservadas y 
-        <b>{citas_disponibles}</b> citas disponibles. Se registraron <b>{citas_canceladas_mes}</b> 
-        cancelaciones, lo que representa una tasa de cancelación del <b>{tasa_cancelacion:.1f}%</b>.
-        """
-        
-        if cambio_citas != 0:
-            direccion = "aumento" if cambio_citas > 0 else "disminución"
-            analisis_citas += f"""
-            
-            En comparación con el mes anterior, se observa un <b>{direccion} del {abs(cambio_citas):.1f}%</b> 
-            en el número de citas, lo que indica una {'tendencia positiva' if cambio_citas > 0 else 'tendencia a la baja'} 
-            en la actividad de la clínica.
-            """
-        
-        story.append(Paragraph("<b>ANÁLISIS DE CITAS</b>", heading_style))
-        story.append(Paragraph(analisis_citas.strip(), body_style))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Distribución de Citas por Estado
-        distrib_data = [
-            ['Estado', 'Cantidad'],
-            ['Disponibles', str(citas_disponibles)],
-            ['Reservadas', str(citas_reservadas)],
-            ['Completadas', str(citas_completadas)],
-            ['Canceladas', str(citas_canceladas)],
-        ]
-        
-        distrib_table = Table(distrib_data, colWidths=[3*inch, 2*inch])
-        distrib_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), dark_color),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ]))
-        
-        story.append(distrib_table)
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Análisis de Clientes
-        analisis_clientes = f"""
-        La base de clientes activos de la clínica asciende a <b>{total_clientes}</b> pacientes. 
-        Durante el mes actual, se registraron <b>{clientes_nuevos_mes}</b> nuevos clientes, 
-        lo que refleja el crecimiento continuo de la cartera de pacientes.
-        """
-        story.append(Paragraph("<b>ANÁLISIS DE CLIENTES</b>", heading_style))
-        story.append(Paragraph(analisis_clientes.strip(), body_style))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Análisis de Inventario
-        if insumos_bajo_stock > 0:
-            alerta_inventario = f"""
-            <b>Atención:</b> Se detectaron <b>{insumos_bajo_stock}</b> insumos con stock bajo. 
-            Se recomienda revisar el inventario y realizar las solicitudes de reposición necesarias 
-            para mantener la operación sin interrupciones.
-            """
-            story.append(Paragraph("<b>ESTADO DE INVENTARIO</b>", heading_style))
-            story.append(Paragraph(alerta_inventario.strip(), body_style))
-        else:
-            inventario_ok = """
-            El inventario se encuentra en niveles adecuados. No se detectaron insumos con stock bajo 
-            que requieran atención inmediata.
-            """
-            story.append(Paragraph("<b>ESTADO DE INVENTARIO</b>", heading_style))
-            story.append(Paragraph(inventario_ok.strip(), body_style))
-        
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Conclusiones
-        conclusiones = f"""
-        En resumen, la clínica muestra una operación activa con <b>{citas_mes}</b> citas programadas 
-        en el mes actual y una tasa de ocupación del <b>{tasa_ocupacion:.1f}%</b>. La base de clientes 
-        continúa creciendo con <b>{clientes_nuevos_mes}</b> nuevos registros. El equipo de trabajo 
-        está compuesto por <b>{total_personal}</b> miembros activos.
-        """
-        story.append(Paragraph("<b>CONCLUSIONES</b>", heading_style))
-        story.append(Paragraph(conclusiones.strip(), body_style))
-        
-        # Pie de página
-        story.append(Spacer(1, 0.4*inch))
-        footer = Paragraph(
-            f"<i>Reporte generado automáticamente el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}</i>",
-            ParagraphStyle('FooterStyle', parent=styles['Normal'], fontSize=8, textColor=gray_color, alignment=TA_CENTER)
-        )
-        story.append(footer)
-        
-        # Construir el PDF
-        doc.build(story)
-        
-        # Obtener el contenido del buffer
+        filename = construir_pdf_estadisticas(buffer)
         pdf_content = buffer.getvalue()
         buffer.close()
         
         # Crear respuesta HTTP
         response = HttpResponse(content_type='application/pdf')
-        filename = f"resumen_estadisticas_{hoy.strftime('%Y%m%d')}.pdf"
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         response.write(pdf_content)
         
@@ -0,0 +1,141 @@
+"""
+Vistas de las subidas fragmentadas y reanudables (ver citas/subidas_service.py).
+
+El componente subida_fragmentada.html crea la subida con crear_subida (POST),
+envía cada fragmento con enviar_fragmento (PUT, cuerpo binario y cabecera
+X-Desplazamiento) y, si la conexión se corta, consulta estado_subida para
+continuar desde el último byte recibido. Al terminar, el formulario original se
+envía con el identificador de la subida en vez del archivo.
+"""
+import json
+import logging
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from citas.models import SubidaFragmentada
+from citas.subidas_service import (
+    FragmentoFueraDeOrden,
+    cancelar_subida,
+    crear_subida,
+    datos_subida,
+    recibir_fragmento,
+)
+from personal.models import Perfil
+
+logger = logging.getLogger(__name__)
+
+# Quién puede subir archivos a cada destino (los mismos permisos de las vistas que los adjuntan)
+PERMISO_DESTINO = {
+    'radiografia': lambda perfil: perfil.es_dentista(),
+    'consentimiento_firmado': lambda perfil: perfil.es_administrativo(),
+}
+
+
+def _perfil_activo(request):
+    """Perfil activo del trabajador, o None"""
+    return Perfil.objects.filter(user=request.user, activo=True).first()
+
+
+def _subida_del_usuario(request, identificador):
+    """Subida creada por el usuario, o None"""
+    perfil = _perfil_activo(request)
+    if perfil is None:
+        return None
+    return SubidaFragmentada.objects.filter(identificador=identificador, creado_por=perfil).first()
+
+
+@login_required
+@require_POST
+def crear_subida_fragmentada(request):
+    """
+    Crea una subida. Recibe JSON {destino, nombre, tamano, sha256?, tipo?}
+    y retorna el identificador y el tamaño de fragmento a usar.
+    """
+    perfil = _perfil_activo(request)
+    if perfil is None:
+        return JsonResponse({'success': False, 'message': 'No tienes permisos para subir archivos.'}, status=403)
+
+    try:
+        datos = json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'message': 'Datos no válidos.'}, status=400)
+    if not isinstance(datos, dict):
+        return JsonResponse({'success': False, 'message': 'Datos no válidos.'}, status=400)
+
+    destino = datos.get('destino')
+    permiso = PERMISO_DESTINO.get(destino)
+    if permiso is None:
+        return JsonResponse({'success': False, 'message': 'Destino de subida no válido.'}, status=400)
+    if not permiso(perfil):
+        return JsonResponse({'success': False, 'message': 'No tienes permisos para subir este archivo.'}, status=403)
+
+    try:
+        subida = crear_subida(
+            perfil,
+            destino,
+            datos.get('nombre'),
+            datos.get('tamano'),
+            sha256_esperado=datos.get('sha256') or '',
+            tipo_contenido=datos.get('tipo') or '',
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error al crear subida fragmentada: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error al iniciar la subida.'}, status=500)
+
+    return JsonResponse({'success': True, 'subida': datos_subida(subida)}, status=201)
+
+
+@login_required
+@require_GET
+def estado_subida_fragmentada(request, identificador):
+    """Estado de la subida; 'recibido' es el byte desde donde se debe continuar"""
+    subida = _subida_del_usuario(request, identificador)
+    if subida is None:
+        return JsonResponse({'success': False, 'message': 'La subida no existe o ya venció.'}, status=404)
+    return JsonResponse({'success': True, 'subida': datos_subida(subida)})
+
+
+@login_required
+@require_http_methods(['PUT', 'DELETE'])
+def enviar_fragmento(request, identificador):
+    """
+    PUT: recibe un fragmento (cuerpo binario) que empieza en el byte X-Desplazamiento.
+    Si el desplazamiento no coincide con lo recibido responde 409 con 'recibido'.
+    Opcionalmente X-Fragmento-SHA256 con el hash del fragmento.
+
+    DELETE: cancela la subida y elimina el archivo temporal.
+    """
+    subida = _subida_del_usuario(request, identificador)
+    if subida is None:
+        return JsonResponse({'success': False, 'message': 'La subida no existe o ya venció.'}, status=404)
+
+    if request.method == 'DELETE':
+        cancelar_subida(subida)
+        return JsonResponse({'success': True})
+
+    try:
+        desplazamiento = int(request.headers.get('X-Desplazamiento', ''))
+        largo = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Desplazamiento no válido.'}, status=400)
+
+    try:
+        # El cuerpo se lee directo del socket por bloques: no pasa por request.body ni por el parser multipart
+        subida = recibir_fragmento(
+            subida, desplazamiento, request, largo,
+            sha256_fragmento=request.headers.get('X-Fragmento-SHA256', ''),
+        )
+    except FragmentoFueraDeOrden as e:
+        return JsonResponse({'success': False, 'message': str(e), 'recibido': e.recibido}, status=409)
+    except ValueError as e:
+        subida.refresh_from_db()
+        return JsonResponse({'success': False, 'message': str(e), 'subida': datos_subida(subida)}, status=400)
+    except Exception as e:
+        logger.error(f"Error al recibir fragmento de la subida {identificador}: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error al recibir el fragmento.'}, status=500)
+
+    return JsonResponse({'success': True, 'subida': datos_subida(subida)})
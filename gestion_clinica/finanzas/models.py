@@ -11,6 +11,16 @@ class IngresoManual(models.Model):
     creado_por = models.ForeignKey(Perfil, on_delete=models.SET_NULL, null=True, blank=True, related_name='ingresos_manuales_creados')
     creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Recordar fecha y monto cargados para actualizar las estadísticas diarias al guardar
+        cargados = dict(zip(field_names, values))
+        instancia._fecha_monto_original = (
+            (cargados['fecha'], cargados['monto']) if 'fecha' in cargados and 'monto' in cargados else None
+        )
+        return instancia
+
     def __str__(self):
         return f"Ingreso Manual - ${self.monto} - {self.fecha}"
     
@@ -29,6 +39,16 @@ class EgresoManual(models.Model):
     creado_por = models.ForeignKey(Perfil, on_delete=models.SET_NULL, null=True, blank=True, related_name='egresos_manuales_creados')
     creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Recordar fecha y monto cargados para actualizar las estadísticas diarias al guardar
+        cargados = dict(zip(field_names, values))
+        instancia._fecha_monto_original = (
+            (cargados['fecha'], cargados['monto']) if 'fecha' in cargados and 'monto' in cargados else None
+        )
+        return instancia
+
     def __str__(self):
         return f"Egreso Manual - ${self.monto} - {self.fecha}"
     
@@ -77,6 +77,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'gestion_clinica.wsgi.application'
+# El canal de eventos en tiempo real (SSE) mantiene conexiones abiertas: gunicorn sirve la
+# aplicación ASGI con workers uvicorn (Procfile) para que cada conexión no ocupe un hilo
+ASGI_APPLICATION = 'gestion_clinica.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -150,6 +153,35 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Entrega de media protegida (ver citas/media_service.py):
+# '' = la sirve Django con FileResponse; 'nginx' = X-Accel-Redirect; 'apache' o 'lighttpd' = X-Sendfile
+MEDIA_SERVIDOR_FRONTAL = config('MEDIA_SERVIDOR_FRONTAL', default='')
+# Location interna de nginx que apunta a MEDIA_ROOT (solo con MEDIA_SERVIDOR_FRONTAL='nginx')
+MEDIA_PREFIJO_INTERNO = config('MEDIA_PREFIJO_INTERNO', default='/media-protegida/')
+
+# Almacenamiento de media deduplicado por contenido (ver citas/almacenamiento.py): cada
+# archivo se guarda una vez en MEDIA_ROOT/.contenido y los FileField son enlaces duros a él.
+# MEDIA_DEDUPLICAR=False vuelve a FileSystemStorage (por ejemplo en discos sin enlaces duros).
+MEDIA_DEDUPLICAR = config('MEDIA_DEDUPLICAR', default=True, cast=bool)
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'citas.almacenamiento.AlmacenamientoDeduplicado' if MEDIA_DEDUPLICAR
+        else 'django.core.files.storage.FileSystemStorage',
+    },
+    # Igual que hasta ahora: desde Django 5.1 STATICFILES_STORAGE ya no se lee
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Subidas fragmentadas reanudables (ver citas/subidas_service.py). Los archivos temporales
+# quedan dentro de MEDIA_ROOT para que al adjuntarlos se muevan sin copiarse; la vista de
+# media niega esa carpeta por no pertenecer a ningún modelo.
+SUBIDAS_DIRECTORIO = config('SUBIDAS_DIRECTORIO', default=str(MEDIA_ROOT / 'subidas_temporales'))
+# Tamaño máximo de una imagen de radiografía (las tomografías pesan varios cientos de MB)
+SUBIDAS_MAX_RADIOGRAFIA = config('SUBIDAS_MAX_RADIOGRAFIA', default=2 * 1024 * 1024 * 1024, cast=int)  # 2 GB
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -20,6 +20,7 @@ from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
 from citas.views_health import health_check
+from citas.views_media import servir_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -41,17 +42,13 @@ urlpatterns = [
     path('api/', include('citas.api_urls'))
 ]
 
-# Servir archivos multimedia en desarrollo
-# En producción, estos archivos deben ser servidos por el servidor web (Nginx, Apache, etc.)
-# o un servicio de almacenamiento (S3, etc.)
+# Archivos multimedia: pasan por servir_media, que verifica el acceso al registro dueño
+# (radiografías, consentimientos, documentos, adjuntos) y entrega la transferencia a
+# nginx/Apache si MEDIA_SERVIDOR_FRONTAL está configurado
+urlpatterns += [
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:ruta>", servir_media, name='servir_media'),
+]
+
+# Servir archivos estáticos en desarrollo (en producción los sirve WhiteNoise)
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-else:
-    # En producción, servir media files también (para demostración)
-    # NOTA: Para producción real a largo plazo, usar S3 o similar
-    from django.views.static import serve
-    from django.urls import re_path
-    urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-    ]
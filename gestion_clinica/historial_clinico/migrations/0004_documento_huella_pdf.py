@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0003_cambiar_cascade_a_set_null_para_preservar_historial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentocliente',
+            name='huella_pdf',
+            field=models.CharField(blank=True, default='', help_text='Hash de los datos con que se generó archivo_pdf (si cambia, el PDF se regenera)', max_length=64, verbose_name='Huella del PDF'),
+        ),
+    ]
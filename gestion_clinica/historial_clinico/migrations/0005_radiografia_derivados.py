@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0004_documento_huella_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='radiografia',
+            name='alto',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Alto (px)'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='ancho',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ancho (px)'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='derivados_de',
+            field=models.CharField(blank=True, default='', help_text='Nombre de la imagen con que se generaron las versiones livianas (si cambia, se regeneran)', max_length=255, verbose_name='Derivados generados desde'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='miniatura',
+            field=models.ImageField(blank=True, help_text='Miniatura para las grillas (se genera automáticamente)', null=True, upload_to='radiografias/teselas/', verbose_name='Miniatura'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='teselas_dzi',
+            field=models.CharField(blank=True, default='', help_text='Ruta del archivo .dzi de la pirámide de teselas para el zoom profundo', max_length=255, verbose_name='Descriptor DZI'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='vista_previa',
+            field=models.ImageField(blank=True, help_text='Imagen reducida para el visualizador y el lienzo de anotaciones (se genera automáticamente)', null=True, upload_to='radiografias/teselas/', verbose_name='Vista Previa'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0005_radiografia_derivados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='radiografia',
+            name='anotaciones',
+            field=models.JSONField(blank=True, default=list, help_text='Figuras dibujadas sobre la radiografía', verbose_name='Anotaciones'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='imagen_anotada_version',
+            field=models.PositiveIntegerField(default=0, help_text='Versión de las anotaciones con que se generó la imagen anotada (si cambia, se regenera)', verbose_name='Versión de la Imagen con Anotaciones'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='version_anotaciones',
+            field=models.PositiveIntegerField(default=0, help_text='Aumenta con cada cambio de las anotaciones', verbose_name='Versión de las Anotaciones'),
+        ),
+    ]
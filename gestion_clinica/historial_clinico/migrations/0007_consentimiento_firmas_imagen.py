@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0006_radiografia_anotaciones_vectoriales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consentimientoinformado',
+            name='firma_paciente_imagen',
+            field=models.ImageField(blank=True, null=True, upload_to='consentimientos/firmas/%Y/%m/%d/', verbose_name='Imagen de la Firma del Paciente'),
+        ),
+        migrations.AddField(
+            model_name='consentimientoinformado',
+            name='firma_paciente_pdf',
+            field=models.ImageField(blank=True, null=True, upload_to='consentimientos/firmas/%Y/%m/%d/', verbose_name='Firma del Paciente para PDF'),
+        ),
+        migrations.AddField(
+            model_name='consentimientoinformado',
+            name='firma_testigo_imagen',
+            field=models.ImageField(blank=True, null=True, upload_to='consentimientos/firmas/%Y/%m/%d/', verbose_name='Imagen de la Firma del Testigo'),
+        ),
+        migrations.AddField(
+            model_name='consentimientoinformado',
+            name='firma_testigo_pdf',
+            field=models.ImageField(blank=True, null=True, upload_to='consentimientos/firmas/%Y/%m/%d/', verbose_name='Firma del Testigo para PDF'),
+        ),
+    ]
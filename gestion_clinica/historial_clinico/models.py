@@ -185,7 +185,20 @@ class Radiografia(models.Model):
         upload_to='radiografias/%Y/%m/%d/', 
         verbose_name="Imagen de la Radiografía"
     )
-    # Imagen con anotaciones persistentes (guardada como imagen procesada)
+    # Anotaciones vectoriales (trazos, flechas, mediciones y textos) en coordenadas
+    # relativas a la imagen (citas/anotaciones_service.py)
+    anotaciones = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Anotaciones",
+        help_text="Figuras dibujadas sobre la radiografía"
+    )
+    version_anotaciones = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Versión de las Anotaciones",
+        help_text="Aumenta con cada cambio de las anotaciones"
+    )
+    # Imagen con anotaciones rasterizada bajo demanda (PDF, correo, descarga)
     imagen_anotada = models.ImageField(
         upload_to='radiografias/anotadas/%Y/%m/%d/',
         blank=True,
@@ -193,6 +206,42 @@ class Radiografia(models.Model):
         verbose_name="Imagen con Anotaciones",
         help_text="Imagen con las anotaciones guardadas (se genera automáticamente)"
     )
+    imagen_anotada_version = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Versión de la Imagen con Anotaciones",
+        help_text="Versión de las anotaciones con que se generó la imagen anotada (si cambia, se regenera)"
+    )
+    # Versiones livianas generadas al subir la imagen (citas/teselas_service.py)
+    miniatura = models.ImageField(
+        upload_to='radiografias/teselas/',
+        blank=True,
+        null=True,
+        verbose_name="Miniatura",
+        help_text="Miniatura para las grillas (se genera automáticamente)"
+    )
+    vista_previa = models.ImageField(
+        upload_to='radiografias/teselas/',
+        blank=True,
+        null=True,
+        verbose_name="Vista Previa",
+        help_text="Imagen reducida para el visualizador y el lienzo de anotaciones (se genera automáticamente)"
+    )
+    teselas_dzi = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name="Descriptor DZI",
+        help_text="Ruta del archivo .dzi de la pirámide de teselas para el zoom profundo"
+    )
+    ancho = models.PositiveIntegerField(null=True, blank=True, verbose_name="Ancho (px)")
+    alto = models.PositiveIntegerField(null=True, blank=True, verbose_name="Alto (px)")
+    derivados_de = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name="Derivados generados desde",
+        help_text="Nombre de la imagen con que se generaron las versiones livianas (si cambia, se regeneran)"
+    )
     descripcion = models.TextField(
         blank=True, 
         null=True, 
@@ -211,7 +260,41 @@ class Radiografia(models.Model):
     
     def __str__(self):
         return f"Radiografía {self.get_tipo_display()} - {self.paciente_nombre} ({self.fecha_carga.strftime('%d/%m/%Y')})"
-    
+
+    @property
+    def derivados_vigentes(self):
+        """True si la miniatura, la vista previa y las teselas corresponden a la imagen actual"""
+        return bool(self.imagen and self.teselas_dzi and self.derivados_de == self.imagen.name)
+
+    @property
+    def url_miniatura(self):
+        """URL de la miniatura, o de la imagen original si aún no se genera"""
+        if self.derivados_vigentes and self.miniatura:
+            return self.miniatura.url
+        return self.imagen.url if self.imagen else ''
+
+    @property
+    def url_vista_previa(self):
+        """URL de la vista previa, o de la imagen original si aún no se genera"""
+        if self.derivados_vigentes and self.vista_previa:
+            return self.vista_previa.url
+        return self.imagen.url if self.imagen else ''
+
+    @property
+    def url_dzi(self):
+        """URL del descriptor DZI para el visor de zoom profundo ('' si no hay teselas)"""
+        if not self.derivados_vigentes:
+            return ''
+        from django.core.files.storage import default_storage
+        return default_storage.url(self.teselas_dzi)
+
+    @property
+    def tiene_anotaciones(self):
+        """True si hay anotaciones vectoriales o una imagen anotada anterior a ellas"""
+        if self.anotaciones:
+            return True
+        return bool(self.version_anotaciones == 0 and self.imagen_anotada)
+
     class Meta:
         verbose_name = "Radiografía"
         verbose_name_plural = "Radiografías"
@@ -712,6 +795,13 @@ class DocumentoCliente(models.Model):
         null=True,
         verbose_name="Archivo PDF"
     )
+    huella_pdf = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        verbose_name="Huella del PDF",
+        help_text="Hash de los datos con que se generó archivo_pdf (si cambia, el PDF se regenera)"
+    )
     
     # Información de generación
     generado_por = models.ForeignKey(
@@ -1041,6 +1131,34 @@ class ConsentimientoInformado(models.Model):
         verbose_name="Firma del Testigo"
     )
     
+    # Firmas dibujadas (canvas): se decodifican una sola vez al firmar y se guardan como PNG,
+    # el original y una versión ya escalada para el PDF (citas/firmas_service.py). En ese caso
+    # firma_paciente/firma_testigo quedan vacíos y solo guardan las firmas escritas como texto.
+    firma_paciente_imagen = models.ImageField(
+        upload_to='consentimientos/firmas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Imagen de la Firma del Paciente"
+    )
+    firma_paciente_pdf = models.ImageField(
+        upload_to='consentimientos/firmas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Firma del Paciente para PDF"
+    )
+    firma_testigo_imagen = models.ImageField(
+        upload_to='consentimientos/firmas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Imagen de la Firma del Testigo"
+    )
+    firma_testigo_pdf = models.ImageField(
+        upload_to='consentimientos/firmas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Firma del Testigo para PDF"
+    )
+    
     # Declaración de Comprensión (Ley 20.584)
     declaracion_comprension = models.BooleanField(
         default=False,
@@ -1198,7 +1316,7 @@ class ConsentimientoInformado(models.Model):
     @property
     def esta_firmado(self):
         """Verifica si el consentimiento está firmado"""
-        return self.estado == 'firmado' and self.firma_paciente is not None
+        return self.estado == 'firmado' and (self.firma_paciente is not None or bool(self.firma_paciente_imagen))
     
     @property
     def esta_vencido(self):
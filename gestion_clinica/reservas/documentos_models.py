@@ -111,6 +111,11 @@ class Radiografia(models.Model):
     paciente_nombre = models.CharField(max_length=150, blank=True, null=True)
     tipo = models.CharField(max_length=20, blank=True, null=True)
     imagen = models.CharField(max_length=100, blank=True, null=True)  # Ruta al archivo
+    # Versiones livianas generadas por el sistema de gestión (citas/teselas_service.py)
+    miniatura = models.CharField(max_length=100, blank=True, null=True)
+    vista_previa = models.CharField(max_length=100, blank=True, null=True)
+    teselas_dzi = models.CharField(max_length=255, blank=True, default='')
+    derivados_de = models.CharField(max_length=255, blank=True, default='')
     descripcion = models.TextField(blank=True, null=True)
     fecha_tomada = models.DateField(blank=True, null=True)
     fecha_carga = models.DateTimeField(blank=True, null=True)
@@ -125,6 +130,28 @@ class Radiografia(models.Model):
     def get_tipo_display_value(self):
         """Retorna el tipo de radiografía formateado"""
         return dict(self.TIPO_CHOICES).get(self.tipo, self.tipo or 'Sin tipo')
+    
+    def ruta_version(self, version):
+        """
+        Ruta del archivo a mostrar según la versión pedida.
+        
+        Args:
+            version: 'miniatura', 'vista_previa' u otra cosa para la imagen original
+        
+        Returns:
+            Ruta de la versión liviana si está al día con la imagen; si no, la de la imagen original
+        """
+        if version in ('miniatura', 'vista_previa') and self.imagen and self.derivados_de == self.imagen:
+            return getattr(self, version) or self.imagen
+        return self.imagen
+    
+    @property
+    def url_dzi(self):
+        """URL del descriptor DZI para el visor de zoom ('' si aún no hay teselas)"""
+        if not self.teselas_dzi or not self.imagen or self.derivados_de != self.imagen:
+            return ''
+        from django.core.files.storage import default_storage
+        return default_storage.url(self.teselas_dzi)
 
 
 class InformacionClinica(models.Model):
@@ -3,6 +3,7 @@ Funciones helper para simplificar y unificar la lógica de búsqueda de citas
 """
 from django.db.models import Q
 from django.db import connections
+from citas.media_service import normalizar_ruta_media
 from citas.models import Cita
 from pacientes.models import Cliente
 from cuentas.models import PerfilCliente
@@ -99,3 +100,22 @@ def obtener_dentistas_activos():
     
     return dentistas
 
+
+def nombre_archivo_media(ruta):
+    """
+    Nombre en el almacenamiento de un archivo de media guardado en la base de datos.
+    
+    Las tablas del sistema de gestión guardan la ruta relativa a MEDIA_ROOT
+    (por ejemplo radiografias/2025/11/02/radiografia_1.png); algunos registros
+    antiguos la tienen con el prefijo media/.
+    
+    Args:
+        ruta: Ruta del archivo tal como está guardada en la base de datos
+    
+    Returns:
+        Nombre relativo a MEDIA_ROOT, o None si la ruta está vacía o sale de MEDIA_ROOT
+    """
+    nombre = (ruta or '').strip().lstrip('/')
+    if nombre.startswith('media/'):
+        nombre = nombre[len('media/'):]
+    return normalizar_ruta_media(nombre)
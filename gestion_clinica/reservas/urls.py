@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('panel/', views.panel_cliente, name="panel_cliente"),
     path('reservar/<int:cita_id>/', views.reservar_cita, name="reservar_cita"),
+    path('reservar-hora/', views.reservar_hora, name="reservar_hora"),
     # Enlaces públicos de confirmación
     path('confirmar/<int:cita_id>/', views.confirmar_cita, name="confirmar_cita"),
     path('citas-fecha/', views.obtener_citas_fecha, name="obtener_citas_fecha"),
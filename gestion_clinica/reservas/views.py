@@ -13,18 +13,22 @@ from citas.models import Cita
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 import os
-import requests
-from urllib.parse import urljoin
 
 # Solo se usa correo electrónico para notificaciones. WhatsApp y SMS no están implementados.
 import logging
 
 logger = logging.getLogger(__name__)
 from cuentas.models import PerfilCliente
-from .helpers import obtener_citas_cliente, obtener_dentistas_activos
+from citas.media_service import entregar_archivo
+from .helpers import nombre_archivo_media, obtener_citas_cliente, obtener_dentistas_activos
 from .documentos_models import Odontograma, Radiografia, ClienteDocumento
 from .servicios_models import TipoServicio
 
+# Días hacia adelante en que el panel del paciente busca horas calculadas
+DIAS_HORAS_PANEL = 30
+# Máximo de horas calculadas que muestra el panel
+LIMITE_HORAS_PANEL = 40
+
 
 def login_required_cliente(view_func):
     """
@@ -52,199 +56,219 @@ def login_required_cliente(view_func):
             return redirect('login_cliente')
     return wrapper
 
+def _datos_paciente(request):
+    """Nombre completo, email y teléfono del paciente para la reserva (desde su perfil)"""
+    try:
+        perfil = PerfilCliente.objects.get(user=request.user)
+        return perfil.nombre_completo, perfil.email or request.user.email, perfil.telefono
+    except PerfilCliente.DoesNotExist:
+        # Si no hay perfil, usar datos del User
+        nombre_completo = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
+        return nombre_completo, request.user.email or '', ''
+
+
+def _notificar_reserva(request, cita):
+    """Envía el correo de confirmación de una cita reservada desde el panel y deja el mensaje para el paciente"""
+    try:
+        # Usar el servicio de mensajería de gestion_clinica (ahora está unificado)
+        from citas.mensajeria_service import enviar_notificaciones_cita
+        logger.info(f"[DEBUG] Enviando notificaciones por correo para cita {cita.id} desde página web cliente")
+        resultado = enviar_notificaciones_cita(cita)
+        
+        if resultado.get('email', {}).get('enviado'):
+            messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}. Se envió confirmación por correo electrónico.")
+        else:
+            error_email = resultado.get('email', {}).get('error', 'Error desconocido')
+            logger.warning(f"No se pudo enviar correo de confirmación para cita {cita.id}: {error_email}")
+            messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}.")
+    except (ImportError, ModuleNotFoundError) as e:
+        logger.warning(f"No se pudo usar servicio de mensajería de gestion_clinica: {e}")
+        messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}.")
+    except Exception as e:
+        logger.error(f"Error al enviar notificaciones para cita {cita.id}: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}. No se pudieron enviar las notificaciones automáticas.")
+
+
 @login_required_cliente
 def reservar_cita(request, cita_id):
     if request.method == 'POST':
-        # Verificar que el usuario no tenga ya una cita reservada
-        # Buscar por email y cliente_id (más confiable que username)
-        try:
-            perfil_temp = PerfilCliente.objects.get(user=request.user)
-            email_temp = perfil_temp.email or request.user.email
-        except PerfilCliente.DoesNotExist:
-            email_temp = request.user.email
-        
-        # Buscar por email
-        citas_existentes = Cita.objects.filter(
-            paciente_email=email_temp,
-            estado__in=['reservada', 'confirmada']
-        ).count()
+        # Obtener datos de perfil del usuario para usar nombre completo
+        nombre_completo, email, telefono = _datos_paciente(request)
         
-        # También buscar por cliente_id si existe
-        if citas_existentes == 0:
-            try:
-                from django.db import connections
-                with connections['default'].cursor() as cursor:
-                    cursor.execute("""
-                        SELECT id FROM pacientes_cliente
-                        WHERE email = %s AND activo = TRUE
-                        LIMIT 1
-                    """, [email_temp])
-                    cliente_row = cursor.fetchone()
-                    if cliente_row:
-                        cliente_id = cliente_row[0]
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM citas_cita
-                            WHERE cliente_id = %s 
-                            AND estado IN ('reservada', 'confirmada')
-                        """, [cliente_id])
-                        count_row = cursor.fetchone()
-                        if count_row:
-                            citas_existentes = count_row[0]
-            except Exception as e:
-                logger.warning(f"Error al verificar citas existentes por cliente_id: {e}")
-                # Continuar con la verificación por email
-        
-        if citas_existentes > 0:
+        # Reservar de forma atómica: el Cliente se crea/actualiza y la hora se toma con un
+        # UPDATE condicional en la misma transacción, así dos pacientes no pueden tomar la misma hora.
+        # Se guarda el username en las notas para referencia (formato: "username: juanperez")
+        from citas.reserva_service import reservar_cita_disponible, CitaNoDisponible, ClienteConCitaActiva
+        try:
+            cita = reservar_cita_disponible(
+                cita_id,
+                nombre_completo,
+                email,
+                telefono=telefono,
+                nota=f"username: {request.user.username}",
+                una_cita_activa=True,
+            )
+        except ClienteConCitaActiva:
             messages.error(request, '❌ Ya tienes una cita activa. Solo puedes reservar una cita a la vez.')
             return redirect('panel_cliente')
-        
-        cita = get_object_or_404(Cita.objects.select_related('dentista', 'tipo_servicio', 'cliente'), id=cita_id)
-        if cita.estado == 'disponible':
-            # Obtener datos de perfil del usuario para usar nombre completo
-            try:
-                perfil = PerfilCliente.objects.get(user=request.user)
-                nombre_completo = perfil.nombre_completo
-                email = perfil.email or request.user.email
-                telefono = perfil.telefono
-            except PerfilCliente.DoesNotExist:
-                # Si no hay perfil, usar datos del User
-                nombre_completo = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
-                email = request.user.email or ''
-                telefono = ''
-            
-            # Buscar o crear el Cliente en el sistema de gestión usando SQL directo
-            from django.db import connections
-            cliente_id = None
-            
-            with connections['default'].cursor() as cursor:
-                # Primero intentar buscar en pacientes_cliente (tabla correcta)
-                cursor.execute("""
-                    SELECT id, nombre_completo, telefono, activo
-                    FROM pacientes_cliente
-                    WHERE email = %s
-                    LIMIT 1
-                """, [email])
-                
-                cliente_existente = cursor.fetchone()
-                
-                # Si no existe en pacientes_cliente, crear nuevo cliente
-                if not cliente_existente:
-                    # Crear nuevo cliente en pacientes_cliente
-                    telefono_cliente = telefono if telefono else '+56900000000'
-                    cursor.execute("""
-                        INSERT INTO pacientes_cliente (nombre_completo, email, telefono, activo, fecha_registro)
-                        VALUES (%s, %s, %s, %s, NOW())
-                        RETURNING id
-                    """, [nombre_completo, email, telefono_cliente, True])
-                    
-                    cliente_id = cursor.fetchone()[0]
-                else:
-                    # Cliente existe en pacientes_cliente, actualizar si es necesario
-                    cliente_id, nombre_existente, telefono_existente, activo = cliente_existente
-                    
-                    # Actualizar información si es necesario
-                    actualizar = False
-                    nuevos_valores = {}
-                    
-                    if nombre_completo and nombre_completo != nombre_existente:
-                        nuevos_valores['nombre_completo'] = nombre_completo
-                        actualizar = True
-                    
-                    if telefono and telefono != telefono_existente:
-                        nuevos_valores['telefono'] = telefono
-                        actualizar = True
-                    
-                    # Asegurar que el cliente esté activo
-                    if not activo:
-                        nuevos_valores['activo'] = True
-                        actualizar = True
+        except CitaNoDisponible:
+            messages.error(request, "Esta cita ya no está disponible")
+            return redirect('panel_cliente')
                     
-                    if actualizar:
-                        # Construir SET clause de forma segura
-                        set_parts = []
-                        valores_update = []
-                        for key, value in nuevos_valores.items():
-                            set_parts.append(f"{key} = %s")
-                            valores_update.append(value)
-                        valores_update.append(cliente_id)
-                        
-                        cursor.execute(f"""
-                            UPDATE pacientes_cliente
-                            SET {', '.join(set_parts)}
-                            WHERE id = %s
-                        """, valores_update)
-            
-            # Actualizar la cita con el cliente_id y los datos del paciente
-            # Guardar tanto el nombre completo como el username para facilitar búsquedas
-            # El nombre completo se guarda en paciente_nombre, y el username se puede usar en notas o como respaldo
-            cita.paciente_nombre = nombre_completo
-            cita.paciente_email = email
-            cita.paciente_telefono = telefono if telefono else None
-            cita.estado = 'reservada'
-            # Guardar el username en las notas para referencia (formato: "username: juanperez")
-            notas_actuales = cita.notas or ''
-            if f"username: {request.user.username}" not in notas_actuales:
-                cita.notas = f"{notas_actuales}\nusername: {request.user.username}".strip() if notas_actuales else f"username: {request.user.username}"
-            
-            # Actualizar cliente_id usando SQL directo (ya que el modelo de cliente_web no tiene este campo)
-            with connections['default'].cursor() as cursor:
-                cursor.execute("""
-                    UPDATE citas_cita
-                    SET cliente_id = %s,
-                        paciente_nombre = %s,
-                        paciente_email = %s,
-                        paciente_telefono = %s,
-                        estado = %s,
-                        notas = %s
-                    WHERE id = %s
-                """, [cliente_id, nombre_completo, email, telefono if telefono else None, 'reservada', cita.notas, cita.id])
-            
-            # Actualizar también el objeto en memoria para que refleje los cambios
-            # No usar refresh_from_db() para evitar JOINs automáticos que puedan causar problemas
-            # En su lugar, actualizar manualmente los campos
-            cita.paciente_nombre = nombre_completo
-            cita.paciente_email = email
-            cita.paciente_telefono = telefono if telefono else None
-            cita.estado = 'reservada'
-            
-            # IMPORTANTE: Asegurar que el objeto tenga cliente_id para que las relaciones funcionen
-            if hasattr(cita, 'cliente_id'):
-                cita.cliente_id = cliente_id
+        # Enviar notificaciones por correo electrónico
+        _notificar_reserva(request, cita)
+        return redirect('panel_cliente')
+    return redirect('panel_cliente')
 
-            # IMPORTANTE: Refrescar el objeto cita desde la BD para obtener todas las relaciones
-            # (dentista, tipo_servicio, precio_cobrado, etc.) antes de enviar el correo
-            try:
-                cita.refresh_from_db()
-            except Exception as e:
-                logger.warning(f"No se pudo refrescar cita desde BD: {e}. Continuando con datos en memoria.")
-                    
-            # Enviar notificaciones por correo electrónico
-            try:
-                # Usar el servicio de mensajería de gestion_clinica (ahora está unificado)
-                from citas.mensajeria_service import enviar_notificaciones_cita
-                logger.info(f"[DEBUG] Enviando notificaciones por correo para cita {cita.id} desde página web cliente")
-                resultado = enviar_notificaciones_cita(cita)
-                
-                if resultado.get('email', {}).get('enviado'):
-                    messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}. Se envió confirmación por correo electrónico.")
-                else:
-                    error_email = resultado.get('email', {}).get('error', 'Error desconocido')
-                    logger.warning(f"No se pudo enviar correo de confirmación para cita {cita.id}: {error_email}")
-                    messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}.")
-            except (ImportError, ModuleNotFoundError) as e:
-                logger.warning(f"No se pudo usar servicio de mensajería de gestion_clinica: {e}")
-                messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}.")
-            except Exception as e:
-                logger.error(f"Error al enviar notificaciones para cita {cita.id}: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
-                messages.success(request, f"Cita reservada exitosamente para {cita.fecha_hora}. No se pudieron enviar las notificaciones automáticas.")
-        else:
-            messages.error(request, "Esta cita ya no está disponible")
+
+@login_required_cliente
+def reservar_hora(request):
+    """
+    Reserva una hora calculada por el motor de disponibilidad (ver panel_cliente).
+
+    Espera por POST dentista_id, inicio (ISO 8601) y, opcionalmente, servicio. No
+    hay una cita 'disponible' que tomar: reservar_hora_calculada crea la cita y
+    vuelve a validar el horario y los solapamientos dentro de la transacción.
+    """
+    if request.method != 'POST':
+        return redirect('panel_cliente')
+
+    from django.utils.dateparse import parse_datetime
+    from citas.models import TipoServicio as TipoServicioCita
+    from citas.reserva_service import reservar_hora_calculada, CitaNoDisponible, ClienteConCitaActiva
+    from personal.models import Perfil
+
+    inicio = parse_datetime(request.POST.get('inicio', ''))
+    try:
+        dentista_id = int(request.POST.get('dentista_id', ''))
+        servicio_id = int(request.POST['servicio']) if request.POST.get('servicio') else None
+    except ValueError:
+        inicio = None
+    if inicio is None:
+        messages.error(request, "La hora seleccionada no es válida")
+        return redirect('panel_cliente')
+    if timezone.is_naive(inicio):
+        inicio = timezone.make_aware(inicio)
+
+    dentista = Perfil.objects.filter(id=dentista_id, rol='dentista', activo=True).first()
+    tipo_servicio = TipoServicioCita.objects.filter(id=servicio_id, activo=True).first() if servicio_id else None
+    if dentista is None or (servicio_id and tipo_servicio is None):
+        messages.error(request, "Esta hora ya no está disponible")
         return redirect('panel_cliente')
+
+    nombre_completo, email, telefono = _datos_paciente(request)
+    try:
+        cita = reservar_hora_calculada(
+            dentista,
+            inicio,
+            nombre_completo,
+            email,
+            telefono=telefono,
+            tipo_servicio=tipo_servicio,
+            nota=f"username: {request.user.username}",
+            una_cita_activa=True,
+        )
+    except ClienteConCitaActiva:
+        messages.error(request, '❌ Ya tienes una cita activa. Solo puedes reservar una cita a la vez.')
+        return redirect('panel_cliente')
+    except CitaNoDisponible:
+        messages.error(request, "Esta hora ya no está disponible")
+        return redirect('panel_cliente')
+
+    _notificar_reserva(request, cita)
     return redirect('panel_cliente')
 
 
+def _info_servicio(tipo_servicio, precio_cobrado=None):
+    """Datos del servicio que muestra una tarjeta de horario del panel"""
+    if not tipo_servicio:
+        return None
+    precio = precio_cobrado if precio_cobrado else tipo_servicio.precio_base
+    return {
+        'nombre': tipo_servicio.nombre,
+        'precio': precio,
+        'precio_formateado': f'${precio:,.0f}' if precio else None,
+        'precio_cobrado_formateado': f'${precio_cobrado:,.0f}' if precio_cobrado else None,
+        'duracion_estimada': tipo_servicio.duracion_estimada if hasattr(tipo_servicio, 'duracion_estimada') else None,
+    }
+
+
+def _info_dentista(dentista):
+    """Datos del dentista que muestra una tarjeta de horario del panel"""
+    if not dentista:
+        return None
+    return {
+        'nombre': dentista.nombre_completo,
+        'especialidad': getattr(dentista, 'especialidad', 'Odontología General'),
+        'foto': getattr(dentista, 'foto', ''),
+        'numero_colegio': getattr(dentista, 'numero_colegio', 'N/A'),
+    }
+
+
+def _horas_calculadas_panel(tipo_consulta, fecha_filtro, dentista_id):
+    """
+    Horas libres calculadas desde los horarios de los dentistas para el panel.
+
+    Aplica los mismos filtros que las citas publicadas. Cada hora se entrega con
+    los atributos que usa la tarjeta de una cita (fecha_hora, servicio_info,
+    dentista_info...) más dentista_id, tipo_servicio_id e inicio_iso para
+    reservarla con reservar_hora.
+    """
+    from types import SimpleNamespace
+    from citas.disponibilidad_service import buscar_horas_disponibles
+    from citas.models import TipoServicio as TipoServicioCita
+    from personal.models import Perfil
+
+    tipo_servicio = None
+    if tipo_consulta:
+        try:
+            tipo_servicio = TipoServicioCita.objects.filter(id=int(tipo_consulta), activo=True).first()
+        except ValueError:
+            tipo_servicio = None
+        if tipo_servicio is None:
+            # Filtro por un tipo de consulta antiguo (texto) o un servicio inactivo: solo aplica a citas publicadas
+            return []
+
+    hoy = timezone.localdate()
+    fecha_desde, fecha_hasta = hoy, hoy + timedelta(days=DIAS_HORAS_PANEL)
+    if fecha_filtro:
+        try:
+            fecha_desde = fecha_hasta = datetime.strptime(fecha_filtro, '%Y-%m-%d').date()
+        except ValueError:
+            pass
+
+    dentistas = Perfil.objects.filter(rol='dentista', activo=True)
+    if dentista_id:
+        try:
+            dentistas = dentistas.filter(id=int(dentista_id))
+        except ValueError:
+            pass
+
+    resultado = buscar_horas_disponibles(
+        fecha_desde,
+        fecha_hasta,
+        tipo_servicio=tipo_servicio,
+        dentistas=dentistas,
+        limite=LIMITE_HORAS_PANEL,
+    )
+    return [
+        SimpleNamespace(
+            id=None,
+            fecha_hora=timezone.localtime(hora['inicio']),
+            inicio_iso=timezone.localtime(hora['inicio']).isoformat(),
+            dentista_id=hora['dentista'].id,
+            tipo_servicio_id=tipo_servicio.id if tipo_servicio else None,
+            tipo_consulta=tipo_servicio.nombre if tipo_servicio else None,
+            precio_cobrado=None,
+            servicio_info=_info_servicio(tipo_servicio),
+            dentista_info=_info_dentista(hora['dentista']),
+        )
+        for hora in resultado['horas']
+    ]
+
+
 @login_required_cliente
 def panel_cliente(request):
     # Obtener parámetros de filtro
@@ -293,33 +317,16 @@ def panel_cliente(request):
     # Preparar información adicional para cada cita
     citas_preparadas = []
     for cita in citas_disponibles:
-        # Preparar información del servicio
-        servicio_info = None
-        if cita.tipo_servicio:
-            precio = cita.precio_cobrado if cita.precio_cobrado else cita.tipo_servicio.precio_base
-            servicio_info = {
-                'nombre': cita.tipo_servicio.nombre,
-                'precio': precio,
-                'precio_formateado': f'${precio:,.0f}' if precio else None,
-                'precio_cobrado_formateado': f'${cita.precio_cobrado:,.0f}' if cita.precio_cobrado else None,
-                'duracion_estimada': cita.tipo_servicio.duracion_estimada if hasattr(cita.tipo_servicio, 'duracion_estimada') else None,
-            }
-        
-        # Preparar información del dentista
-        dentista_info = None
-        if cita.dentista:
-            dentista_info = {
-                'nombre': cita.dentista.nombre_completo,
-                'especialidad': getattr(cita.dentista, 'especialidad', 'Odontología General'),
-                'foto': getattr(cita.dentista, 'foto', ''),
-                'numero_colegio': getattr(cita.dentista, 'numero_colegio', 'N/A'),
-            }
-        
         # Agregar información a la cita (usando atributos dinámicos)
-        cita.servicio_info = servicio_info
-        cita.dentista_info = dentista_info
+        cita.servicio_info = _info_servicio(cita.tipo_servicio, cita.precio_cobrado)
+        cita.dentista_info = _info_dentista(cita.dentista)
         citas_preparadas.append(cita)
     
+    # Sumar las horas libres calculadas desde los horarios de los dentistas
+    # (disponibilidad_service): no requieren citas 'disponible' insertadas de antemano
+    citas_preparadas.extend(_horas_calculadas_panel(tipo_consulta, fecha_filtro, dentista_id))
+    citas_preparadas.sort(key=lambda cita: cita.fecha_hora)
+    
     # Obtener citas reservadas usando función helper centralizada
     citas_reservadas = obtener_citas_cliente(request.user, estados=['reservada', 'confirmada'])
     
@@ -772,80 +779,18 @@ def ver_pdf_odontograma(request, odontograma_id):
         except Odontograma.DoesNotExist:
             return HttpResponse('Acceso denegado', status=403)
     
-    # Ya no necesitamos URL externa, todo está unificado
-    # Usar la URL base del sitio actual
-    base_url = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
-    
-    # Intentar primero desde API endpoints (si existen)
-    api_endpoints = [
-        f"{base_url}/api/odontogramas/{odontograma_id}/pdf/",
-        f"{base_url}/api/fichas/{odontograma_id}/pdf/",
-        f"{base_url}/trabajadores/odontogramas/{odontograma_id}/exportar-pdf/",
-        f"{base_url}/odontogramas/{odontograma_id}/pdf/",
-        f"{base_url}/fichas/{odontograma_id}/pdf/",
-    ]
-    
-    for api_url in api_endpoints:
-        try:
-            response = requests.get(api_url, timeout=10, stream=True, allow_redirects=True)
-            if response.status_code == 200:
-                content = response.content
-                # Verificar que sea PDF válido
-                if content and (content[:4] == b'%PDF' or 'pdf' in response.headers.get('Content-Type', '').lower()):
-                    http_response = HttpResponse(content, content_type='application/pdf')
-                    http_response['Content-Disposition'] = 'inline; filename="odontograma.pdf"'
-                    http_response['Cache-Control'] = 'public, max-age=3600'
-                    return http_response
-        except Exception as e:
-            continue
-    
-    # Si no funciona API, probar rutas de archivos estáticos/media
-    from datetime import datetime
-    fecha_creacion = odontograma.fecha_creacion
-    if fecha_creacion:
-        year = fecha_creacion.year
-        month = fecha_creacion.month
-        day = fecha_creacion.day
-    else:
-        fecha_actual = datetime.now()
-        year = fecha_actual.year
-        month = fecha_actual.month
-        day = fecha_actual.day
-    
-    possible_paths = [
-        f"media/odontogramas/{year}/{month:02d}/{day:02d}/odontograma_{odontograma_id}.pdf",
-        f"media/odontogramas/{year}/{month:02d}/{day:02d}/ficha_{odontograma_id}.pdf",
-        f"media/fichas/{year}/{month:02d}/{day:02d}/odontograma_{odontograma_id}.pdf",
-        f"media/fichas/{year}/{month:02d}/{day:02d}/ficha_{odontograma_id}.pdf",
-        f"media/odontogramas/{odontograma_id}.pdf",
-        f"media/odontogramas/odontograma_{odontograma_id}.pdf",
-        f"media/fichas/{odontograma_id}.pdf",
-        f"media/fichas/ficha_{odontograma_id}.pdf",
-        f"media/pdf/odontograma_{odontograma_id}.pdf",
-        f"media/pdf/ficha_{odontograma_id}.pdf",
-        f"odontogramas/{year}/{month:02d}/{day:02d}/odontograma_{odontograma_id}.pdf",
-        f"odontogramas/{odontograma_id}.pdf",
-        f"fichas/{odontograma_id}.pdf",
-        f"fichas/ficha_{odontograma_id}.pdf",
-    ]
-    
-    # Intentar cada ruta posible
-    for pdf_path in possible_paths:
-        pdf_url = urljoin(base_url + '/', pdf_path)
-        try:
-            response = requests.get(pdf_url, timeout=10, stream=True, allow_redirects=True)
-            if response.status_code == 200:
-                content = response.content
-                # Verificar que sea PDF válido (magic bytes %PDF o tamaño razonable)
-                if content and (content[:4] == b'%PDF' or len(content) > 1000):
-                    http_response = HttpResponse(content, content_type='application/pdf')
-                    http_response['Content-Disposition'] = 'inline; filename="odontograma.pdf"'
-                    http_response['Cache-Control'] = 'public, max-age=3600'
-                    return http_response
-        except Exception as e:
-            continue
+    # Ficha generada por el sistema de gestión: se sirve el PDF guardado (se regenera solo si la ficha cambió)
+    try:
+        from historial_clinico.models import Odontograma as OdontogramaGestion
+        from citas.odontograma_pdf_service import obtener_pdf_odontograma
+        ficha = OdontogramaGestion.objects.select_related('dentista').get(id=odontograma.id)
+        documento = obtener_pdf_odontograma(ficha)
+        http_response = FileResponse(documento.archivo_pdf.open('rb'), content_type='application/pdf')
+        http_response['Content-Disposition'] = 'inline; filename="odontograma.pdf"'
+        return http_response
+    except Exception as e:
+        logger.error(f"Error al obtener el PDF guardado del odontograma {odontograma.id}: {str(e)}")
     
-    # Si no se encuentra el PDF, retornar 404
     return HttpResponse('PDF no disponible', status=404)
 
 
@@ -934,43 +879,15 @@ def descargar_radiografia(request, radiografia_id):
         messages.error(request, 'Esta radiografía no tiene imagen disponible.')
         return redirect('ver_radiografias')
     
-    # Ya no necesitamos URL externa, todo está unificado
-    # Usar la URL base del sitio actual
-    base_url = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
-    
-    # Determinar la ruta correcta según el formato
-    if radiografia.imagen.startswith('http://') or radiografia.imagen.startswith('https://'):
-        # URL completa
-        image_url = radiografia.imagen
-    elif radiografia.imagen.startswith('media/'):
-        # Ya incluye media/
-        image_url = urljoin(base_url + '/', radiografia.imagen)
-    else:
-        # Formato esperado: radiografias/2025/11/02/radiografia_1.png
-        # Agregar media/ al inicio
-        image_url = urljoin(base_url + '/', f"media/{radiografia.imagen}")
-    
-    try:
-        response = requests.get(image_url, timeout=10, stream=True)
-        if response.status_code == 200:
-            # Determinar tipo de contenido
-            content_type = response.headers.get('Content-Type', 'image/jpeg')
-            extension = '.jpg'
-            if 'png' in content_type.lower():
-                extension = '.png'
-            elif 'pdf' in content_type.lower():
-                extension = '.pdf'
-            
-            filename = f"radiografia_{radiografia_id}_{radiografia.get_tipo_display_value().replace(' ', '_')}{extension}"
-            response_http = HttpResponse(response.content, content_type=content_type)
-            response_http['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response_http
-    except Exception as e:
-        pass
-    
-    # Si no se puede descargar, redirigir a ver la imagen
-    messages.info(request, 'No se pudo descargar la imagen. Puedes verla en la galería.')
-    return redirect('ver_radiografias')
+    # Entregar el archivo desde el almacenamiento o el servidor frontal (sin pedirlo por HTTP al propio servidor)
+    nombre = nombre_archivo_media(radiografia.imagen)
+    extension = os.path.splitext(nombre or '')[1].lower() or '.jpg'
+    filename = f"radiografia_{radiografia_id}_{radiografia.get_tipo_display_value().replace(' ', '_')}{extension}"
+    response_http = entregar_archivo(request, nombre, as_attachment=True, filename=filename) if nombre else None
+    if response_http is None:
+        messages.info(request, 'No se pudo descargar la imagen. Puedes verla en la galería.')
+        return redirect('ver_radiografias')
+    return response_http
 
 
 # ============================================================================
@@ -1286,11 +1203,20 @@ def firmar_consentimiento_cliente(request, consentimiento_id):
                 timezone.now(),
                 consentimiento_id
             ])
-            
-            return JsonResponse({
-                'success': True,
-                'message': 'Consentimiento firmado exitosamente.'
-            })
+        
+        # Las firmas dibujadas se guardan como PNG (original y escalada para el PDF); si falla,
+        # la firma ya quedó registrada y se convierte al exportar el PDF
+        from historial_clinico.models import ConsentimientoInformado
+        from citas.firmas_service import asegurar_imagenes_firma
+        try:
+            asegurar_imagenes_firma(ConsentimientoInformado.objects.get(id=consentimiento_id))
+        except Exception as e:
+            logger.error(f"Error al guardar las imágenes de firma del consentimiento {consentimiento_id}: {str(e)}")
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Consentimiento firmado exitosamente.'
+        })
             
     except Exception as e:
         logger.error(f"Error al firmar consentimiento desde cliente_web: {str(e)}")
@@ -1788,75 +1714,13 @@ def ver_imagen_radiografia(request, radiografia_id):
     if not radiografia.imagen:
         return HttpResponse('Imagen no disponible', status=404)
     
-    # Ya no necesitamos URL externa, todo está unificado
-    # Usar la URL base del sitio actual
-    base_url = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
-    
-    # Construir URL de la imagen - probar múltiples formatos
-    image_path = radiografia.imagen.strip()
-    
-    # Rutas posibles para probar
-    possible_urls = []
-    
-    if image_path.startswith('http://') or image_path.startswith('https://'):
-        possible_urls.append(image_path)
-    elif image_path.startswith('media/'):
-        possible_urls.append(urljoin(base_url + '/', image_path))
-    else:
-        # Formato esperado: radiografias/2025/11/02/radiografia_1.png
-        # Agregar media/ al inicio
-        possible_urls.append(urljoin(base_url + '/', f"media/{image_path}"))
-        # También probar sin media/
-        possible_urls.append(urljoin(base_url + '/', image_path))
-    
-    # Intentar cada URL posible
-    last_error = None
-    for image_url in possible_urls:
-        try:
-            response = requests.get(image_url, timeout=10, stream=True, allow_redirects=True)
-            if response.status_code == 200:
-                content = response.content
-                # Verificar que tenga contenido válido
-                if content and len(content) > 100:  # Mínimo 100 bytes para ser una imagen válida
-                    # Determinar tipo de contenido
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    # Si no tiene content-type, intentar detectarlo por extensión o magic bytes
-                    if not content_type or 'text' in content_type.lower():
-                        # Detectar por extensión
-                        if image_path.lower().endswith('.png') or content[:8] == b'\x89PNG\r\n\x1a\n':
-                            content_type = 'image/png'
-                        elif image_path.lower().endswith('.jpg') or image_path.lower().endswith('.jpeg') or content[:2] == b'\xff\xd8':
-                            content_type = 'image/jpeg'
-                        elif image_path.lower().endswith('.gif') or content[:6] == b'GIF89a':
-                            content_type = 'image/gif'
-                        else:
-                            content_type = 'image/jpeg'  # Default
-                    
-                    http_response = HttpResponse(content, content_type=content_type)
-                    http_response['Cache-Control'] = 'public, max-age=3600'
-                    return http_response
-                else:
-                    last_error = f"Contenido vacío o muy pequeño ({len(content) if content else 0} bytes)"
-            else:
-                last_error = f"Status code: {response.status_code}"
-        except requests.exceptions.ConnectionError as e:
-            last_error = f"No se pudo conectar: {str(e)}"
-        except requests.exceptions.Timeout as e:
-            last_error = f"Timeout: {str(e)}"
-        except Exception as e:
-            last_error = f"Error: {str(e)}"
-            continue
-    
-    # Si ninguna URL funciona, log el error y retornar 404 con mensaje descriptivo
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.error(f"No se pudo cargar imagen radiografia_id={radiografia_id}, imagen={image_path}, URLs probadas={possible_urls}, último error={last_error}")
-    
-    # Si el sistema de gestión no está corriendo, mostrar mensaje más claro
-    if last_error and 'Connection' in last_error:
-        error_msg = f'El sistema de gestión no está disponible en {base_url}. Por favor, inicia el sistema de gestión para poder ver las imágenes.'
-    else:
-        error_msg = f'No se pudo cargar la imagen. {last_error or "Error desconocido"}'
+    # Entregar el archivo desde el almacenamiento o el servidor frontal (sin pedirlo por HTTP al propio servidor).
+    # ?version=miniatura o ?version=vista_previa entrega la versión liviana para la grilla y el modal
+    nombre = nombre_archivo_media(radiografia.ruta_version(request.GET.get('version')))
+    http_response = entregar_archivo(request, nombre) if nombre else None
+    if http_response is None:
+        logger.error(f"No se encontró la imagen de radiografia_id={radiografia_id}, imagen={radiografia.imagen}")
+        return HttpResponse('Imagen no disponible', status=404)
     
-    return HttpResponse(error_msg, status=404)
+    http_response['Cache-Control'] = 'private, max-age=3600'
+    return http_response